@@ -0,0 +1,60 @@
+import argparse
+import logging
+import os
+import sys
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pandas as pd
+
+from harness import compare, measure, print_results, save_results
+from synthetic import SyntheticMeetingGenerator
+from src.services.backtester import Backtester, strategy_grid
+
+
+def history_frame(start: str, end: str, seed: int = 2024) -> pd.DataFrame:
+    """合成赛果, 骑师/练马师名称换成整数代理键 (与 get_race_frame 相同)"""
+    frame = pd.DataFrame(SyntheticMeetingGenerator(seed).records(start, end))
+    frame['jockey_id'] = pd.factorize(frame['jockey'])[0]
+    frame['trainer_id'] = pd.factorize(frame['trainer'])[0]
+    return frame[['race_id', 'race_date', 'finish_position', 'odds', 'jockey_id', 'trainer_id']]
+
+
+def run(start: str, end: str, repeat: int = 3, seed: int = 2024) -> Dict[str, Dict[str, Any]]:
+    """Backtester 回测 10,000 个策略的耗时"""
+    history = history_frame(start, end, seed)
+    # 10 x 10 x 5 x 20 = 10,000 个策略
+    grid = strategy_grid(
+        odds_min=np.round(np.linspace(1.5, 15, 10), 1),
+        odds_max=np.round(np.geomspace(5, 99, 10), 1),
+        max_favourite_rank=[0, 1, 2, 3, 5],
+        jockey_id=[-1] + list(range(19)),
+    )
+    backtester = Backtester(history)
+    return {
+        'backtester.init': measure(lambda: Backtester(history), repeat, items=len(history)),
+        'backtester.run': measure(lambda: backtester.run(grid), repeat, items=len(grid)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtester 基准 (合成数据)")
+    parser.add_argument('--start', default='2014-09-01')
+    parser.add_argument('--end', default='2024-07-15')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', help="结果 JSON 路径")
+    parser.add_argument('--compare', help="与之前的结果 JSON 比较")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args.start, args.end, args.repeat)
+    print_results(results)
+    print(f"结果已保存: {save_results(results, args.out)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
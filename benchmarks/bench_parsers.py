@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from harness import compare, measure, print_results, save_results
+from synthetic import SyntheticMeetingGenerator, results_page
+from src.services.parsing import parse_horse_profile, parse_results_page, race_content_hash
+from src.services.preprocessor import RaceDataPreprocessor
+
+PROFILE_FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'horse_profile.html')
+
+
+def run(meetings: int = 20, repeat: int = 5, seed: int = 2024) -> Dict[str, Dict[str, Any]]:
+    """赛果页面及马匹资料页面的解析耗时"""
+    generator = SyntheticMeetingGenerator(seed)
+    pages = []
+    for race_date, racecourse in generator.fixtures('2023-09-01', '2024-07-15')[:meetings]:
+        for race_no, runners in generator.meeting(race_date, racecourse).items():
+            pages.append((race_date, racecourse, results_page(race_no, runners), len(runners)))
+
+    # 解析结果须与生成的场数一致
+    parsed = [parse_results_page(page, race_date, course) for race_date, course, page, _ in pages]
+    if [len(records) for records in parsed] != [runners for *_, runners in pages]:
+        raise AssertionError("赛果页面解析结果与合成数据不一致")
+
+    preprocessor = RaceDataPreprocessor()
+    with open(PROFILE_FIXTURE, 'r', encoding='utf-8') as f:
+        profile = f.read()
+
+    return {
+        'parsers.parse_results_page': measure(
+            lambda: [parse_results_page(page, d, c) for d, c, page, _ in pages], repeat, items=len(pages)),
+        'parsers.race_content_hash': measure(
+            lambda: [race_content_hash(records) for records in parsed], repeat, items=len(parsed)),
+        'parsers.preprocess_batch': measure(
+            lambda: [preprocessor.process_batch(records) for records in parsed], repeat,
+            items=sum(len(records) for records in parsed)),
+        'parsers.parse_horse_profile': measure(lambda: parse_horse_profile(profile), repeat * 20, items=1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML 解析基准 (合成赛果页面)")
+    parser.add_argument('--meetings', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', help="结果 JSON 路径")
+    parser.add_argument('--compare', help="与之前的结果 JSON 比较")
+    args = parser.parse_args()
+
+    results = run(args.meetings, args.repeat)
+    print_results(results)
+    print(f"结果已保存: {save_results(results, args.out)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
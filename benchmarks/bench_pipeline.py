@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiohttp import web
+
+from harness import compare, print_results, save_results
+from synthetic import SyntheticMeetingGenerator, results_page
+from src.scripts.live_stub_server import RESULTS_PATH, _EMPTY_PAGE
+from src.services.batch_processor import BatchProcessor
+from src.services.http_scraper import HttpRaceScraper
+from src.services.storage import DataStorage
+
+
+def create_results_app(meetings: Dict[Tuple[str, str], Dict[int, List[Dict[str, Any]]]],
+                       latency: float = 0.0) -> web.Application:
+    """按 RaceDate / Racecourse / RaceNo 提供合成赛果页面的本地服务, 可模拟网络延迟"""
+    pages = {
+        (race_date, course, race_no): results_page(race_no, runners)
+        for (race_date, course), races in meetings.items()
+        for race_no, runners in races.items()
+    }
+
+    async def handle(request: web.Request) -> web.Response:
+        if latency:
+            await asyncio.sleep(latency)
+        key = (request.query.get('RaceDate', '').replace('/', '-'), request.query.get('Racecourse', ''),
+               int(request.query.get('RaceNo', '1')))
+        return web.Response(text=pages.get(key, _EMPTY_PAGE), content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get(RESULTS_PATH, handle)
+    return app
+
+
+async def _run_pipeline(start: str, end: str, port: int, latency: float, concurrent: int, seed: int) -> Dict[str, Any]:
+    generator = SyntheticMeetingGenerator(seed)
+    meetings = {(d, c): generator.meeting(d, c) for d, c in generator.fixtures(start, end)}
+    records = sum(len(runners) for races in meetings.values() for runners in races.values())
+
+    runner = web.AppRunner(create_results_app(meetings, latency))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            storage = DataStorage({'TYPE': 'sqlite', 'PATH': os.path.join(directory, 'bench.db')})
+            scraper = HttpRaceScraper({
+                'RESULTS_URL': f"http://127.0.0.1:{port}{RESULTS_PATH}",
+                'RACECOURSES': [{'code': 'ST'}, {'code': 'HV'}],
+            })
+            await scraper.init()
+            try:
+                processor = BatchProcessor(scraper, storage, {'MAX_CONCURRENT': concurrent})
+                started = time.perf_counter()
+                await processor.process_date_range(start, end)
+                elapsed = time.perf_counter() - started
+                stored = sum(storage.count_race_results(d) for d, _ in meetings)
+            finally:
+                await scraper.close()
+                storage.close()
+    finally:
+        await runner.cleanup()
+
+    if stored != records:
+        raise AssertionError(f"入库记录 {stored} 与合成数据 {records} 不一致")
+    days = (date.fromisoformat(end) - date.fromisoformat(start)).days + 1
+    return {
+        'repeat': 1,
+        'median_s': round(elapsed, 6),
+        'min_s': round(elapsed, 6),
+        'max_s': round(elapsed, 6),
+        'items': records,
+        'items_per_s': round(records / elapsed, 1),
+        'dates': days,
+        'meetings': len(meetings),
+    }
+
+
+def run(start: str = '2024-01-01', end: str = '2024-02-29', port: int = 8098, latency: float = 0.005,
+        concurrent: int = 5, seed: int = 2024) -> Dict[str, Dict[str, Any]]:
+    """BatchProcessor + HttpRaceScraper + SQLite 针对本地服务的端到端耗时"""
+    return {
+        'pipeline.batch_processor': asyncio.run(_run_pipeline(start, end, port, latency, concurrent, seed)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BatchProcessor 端到端基准 (本地合成赛果服务)")
+    parser.add_argument('--start', default='2024-01-01')
+    parser.add_argument('--end', default='2024-02-29')
+    parser.add_argument('--port', type=int, default=8098)
+    parser.add_argument('--latency', type=float, default=0.005, help="模拟每个请求的网络延迟 (秒)")
+    parser.add_argument('--concurrent', type=int, default=5)
+    parser.add_argument('--out', help="结果 JSON 路径")
+    parser.add_argument('--compare', help="与之前的结果 JSON 比较")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args.start, args.end, args.port, args.latency, args.concurrent)
+    print_results(results)
+    print(f"结果已保存: {save_results(results, args.out)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bs4 import BeautifulSoup
+
+from src.services.parsing import parse_horse_profile
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'horse_profile.html')
+
+
+def parse_horse_profile_bs4(page: str) -> dict:
+    """原有的 BeautifulSoup 解析器 (每个字段各自扫描一次表格), 作为对照"""
+    soup = BeautifulSoup(page, 'html.parser')
+    info_table = soup.find_all('table')[0]
+    basic_info = {
+        'origin_age': info_table.find(text=lambda t: '出生地 / 馬齡' in str(t)).find_next(text=True).strip(),
+        'color_sex': info_table.find(text=lambda t: '毛色 / 性別' in str(t)).find_next(text=True).strip(),
+        'import_type': info_table.find(text=lambda t: '進口類別' in str(t)).find_next(text=True).strip(),
+        'season_stakes': info_table.find(text=lambda t: '今季獎金' in str(t)).find_next(text=True).strip(),
+        'total_stakes': info_table.find(text=lambda t: '總獎金' in str(t)).find_next(text=True).strip(),
+        'record': info_table.find(text=lambda t: '冠-亞-季-總出賽次數' in str(t)).find_next(text=True).strip(),
+        'trainer': info_table.find('a', href=lambda h: 'Trainers' in str(h)).text.strip(),
+        'owner': info_table.find('a', href=lambda h: 'OwnerSearch' in str(h)).text.strip(),
+        'current_rating': info_table.find(text=lambda t: '現時評分' in str(t)).find_next(text=True).strip(),
+        'season_start_rating': info_table.find(text=lambda t: '季初評分' in str(t)).find_next(text=True).strip(),
+        'sire': info_table.find(text=lambda t: '父系' in str(t)).find_next('a').text.strip(),
+        'dam': info_table.find(text=lambda t: '母系' in str(t)).find_next(text=True).strip(),
+        'dam_sire': info_table.find(text=lambda t: '外祖父' in str(t)).find_next(text=True).strip()
+    }
+    race_history = []
+    history_table = soup.find('table', {'class': 'performance'})
+    if history_table:
+        for row in history_table.find_all('tr')[1:]:
+            cols = row.find_all('td')
+            if len(cols) >= 15:
+                race_history.append({
+                    'season': cols[0].text.strip(),
+                    'race_no': cols[1].text.strip(),
+                    'date': cols[2].text.strip(),
+                    'track': cols[3].text.strip(),
+                    'distance': cols[4].text.strip(),
+                    'track_condition': cols[5].text.strip(),
+                    'class': cols[6].text.strip(),
+                    'draw': cols[7].text.strip(),
+                    'rating': cols[8].text.strip(),
+                    'trainer': cols[9].text.strip(),
+                    'jockey': cols[10].text.strip(),
+                    'finish_position': cols[11].text.strip(),
+                    'win_odds': cols[12].text.strip(),
+                    'actual_weight': cols[13].text.strip(),
+                    'running_position': cols[14].text.strip(),
+                    'finish_time': cols[15].text.strip() if len(cols) > 15 else '',
+                    'body_weight': cols[16].text.strip() if len(cols) > 16 else '',
+                    'gear': cols[17].text.strip() if len(cols) > 17 else ''
+                })
+    return {'basic_info': basic_info, 'race_history': race_history}
+
+
+def time_parser(parser, page: str, repeat: int) -> float:
+    """每页平均解析时间 (毫秒)"""
+    parser(page)  # 预热
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parser(page)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="马匹资料页面解析基准")
+    parser.add_argument('--fixture', default=FIXTURE)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    # 对照组沿用旧写法 find(text=...)
+    warnings.simplefilter('ignore', DeprecationWarning)
+
+    with open(args.fixture, 'r', encoding='utf-8') as f:
+        page = f.read()
+
+    before, after = parse_horse_profile_bs4(page), parse_horse_profile(page)
+    if before != after:
+        mismatched = [k for k in before['basic_info'] if before['basic_info'][k] != after['basic_info'].get(k)]
+        print(f"警告: 解析结果不一致, 基本资料字段 {mismatched}, "
+              f"往绩 {len(before['race_history'])} / {len(after['race_history'])} 行")
+
+    bs4_ms = time_parser(parse_horse_profile_bs4, page, args.repeat)
+    lxml_ms = time_parser(parse_horse_profile, page, args.repeat)
+    print(f"页面 {len(page) / 1024:.1f} KB, 往绩 {len(after['race_history'])} 行, 重复 {args.repeat} 次")
+    print(f"BeautifulSoup: {bs4_ms:.2f} ms/页")
+    print(f"lxml 单次遍历: {lxml_ms:.2f} ms/页 ({bs4_ms / lxml_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from harness import compare, measure, print_results, save_results
+from synthetic import SyntheticMeetingGenerator
+from src.services.storage import DataStorage
+
+
+def run(start: str, end: str, repeat: int = 5, seed: int = 2024) -> Dict[str, Dict[str, Any]]:
+    """SQLite 上的入库及查询耗时"""
+    meetings = defaultdict(list)
+    for record in SyntheticMeetingGenerator(seed).records(start, end):
+        meetings[record['race_date']].append(record)
+    n = sum(len(rows) for rows in meetings.values())
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage = DataStorage({'TYPE': 'sqlite', 'PATH': os.path.join(directory, 'bench.db')})
+        try:
+            # 每个赛马日一个事务, 与回填时相同; 第二遍全部为更新
+            def ingest():
+                for rows in meetings.values():
+                    storage.save_race_results(rows)
+
+            results['storage.ingest'] = measure(ingest, repeat=1, warmup=0, items=n)
+            results['storage.upsert'] = measure(ingest, repeat=1, warmup=0, items=n)
+
+            def page_races():
+                cursor, pages = None, 0
+                while True:
+                    items = storage.query_races(cursor, limit=200)
+                    if not items:
+                        return pages
+                    last = items[-1]
+                    cursor, pages = (last['race_date'], last['race_number']), pages + 1
+
+            results['storage.get_race_results'] = measure(lambda: storage.get_race_results(start, end), repeat, items=n)
+            results['storage.get_race_frame'] = measure(lambda: storage.get_race_frame(start, end), repeat, items=n)
+            results['storage.iter_table'] = measure(
+                lambda: sum(len(chunk) for chunk in storage.iter_table('race_results', start_date=start, end_date=end)),
+                repeat, items=n)
+            results['storage.query_races.paged'] = measure(page_races, repeat)
+            results['storage.count_race_results'] = measure(
+                lambda: [storage.count_race_results(d) for d in meetings], repeat, items=len(meetings))
+        finally:
+            storage.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataStorage 基准 (SQLite, 合成数据)")
+    parser.add_argument('--start', default='2023-09-01')
+    parser.add_argument('--end', default='2024-07-15')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', help="结果 JSON 路径")
+    parser.add_argument('--compare', help="与之前的结果 JSON 比较")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args.start, args.end, args.repeat)
+    print_results(results)
+    print(f"结果已保存: {save_results(results, args.out)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
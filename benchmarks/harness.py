@@ -0,0 +1,81 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def measure(func: Callable[[], Any], repeat: int = 5, warmup: int = 1, items: Optional[int] = None) -> Dict[str, Any]:
+    """重复执行并统计耗时 (秒); 给出 items 时附每秒处理量 (按中位数计)"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    result = {
+        'repeat': repeat,
+        'median_s': round(statistics.median(timings), 6),
+        'min_s': round(min(timings), 6),
+        'max_s': round(max(timings), 6),
+    }
+    if items:
+        result['items'] = items
+        result['items_per_s'] = round(items / result['median_s'], 1) if result['median_s'] else None
+    return result
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def save_results(results: Dict[str, Dict[str, Any]], path: Optional[str] = None) -> str:
+    """保存为 JSON (默认 benchmarks/results/<时间>.json)"""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'results': results}, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare(baseline_path: str, results: Dict[str, Dict[str, Any]], threshold: float = 0.1) -> Dict[str, float]:
+    """与之前的结果比较中位耗时, 返回变慢超过 threshold 的项目 {名称: 比例}"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = {}
+    print(f"\n与 {baseline_path} 比较 (中位耗时):")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before.get('median_s') or 'median_s' not in result:
+            continue
+        ratio = result['median_s'] / before['median_s']
+        flag = '  变慢' if ratio > 1 + threshold else ('  变快' if ratio < 1 - threshold else '')
+        print(f"  {name:<40} {before['median_s'] * 1000:10.2f} ms -> {result['median_s'] * 1000:10.2f} ms "
+              f"({ratio:5.2f}x){flag}")
+        if ratio > 1 + threshold:
+            regressions[name] = round(ratio, 3)
+    return regressions
+
+
+def print_results(results: Dict[str, Dict[str, Any]]):
+    for name, result in results.items():
+        rate = f"  {result['items_per_s']:>12,.0f} /s" if result.get('items_per_s') else ''
+        print(f"  {name:<40} {result['median_s'] * 1000:10.2f} ms{rate}")
@@ -0,0 +1,57 @@
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import bench_analyzer
+import bench_backtester
+import bench_parsers
+import bench_pipeline
+import bench_storage
+from harness import compare, print_results, save_results
+
+SUITES = ('analyzer', 'backtester', 'storage', 'parsers', 'pipeline')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="运行全部基准并保存为 JSON, 可与之前的结果比较")
+    parser.add_argument('--only', nargs='+', choices=SUITES, help="只运行指定的基准")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help="缩小数据量 (约一个月), 供快速检查")
+    parser.add_argument('--out', help="结果 JSON 路径 (默认 benchmarks/results/<时间>.json)")
+    parser.add_argument('--compare', help="与之前的结果 JSON 比较")
+    parser.add_argument('--threshold', type=float, default=0.1, help="中位耗时变慢超过此比例视为退步")
+    parser.add_argument('--fail-on-regression', action='store_true', help="有退步时以非零状态退出")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    suites = args.only or SUITES
+    season = ('2024-01-01', '2024-01-31') if args.quick else ('2023-09-01', '2024-07-15')
+    results = {}
+    if 'analyzer' in suites:
+        results.update(bench_analyzer.run(*(season if args.quick else ('2022-09-01', '2024-07-15')), args.repeat))
+    if 'backtester' in suites:
+        # 约十个马季 (quick 时一个月)
+        results.update(bench_backtester.run(*(season if args.quick else ('2014-09-01', '2024-07-15')), args.repeat))
+    if 'storage' in suites:
+        results.update(bench_storage.run(*season, args.repeat))
+    if 'parsers' in suites:
+        results.update(bench_parsers.run(5 if args.quick else 20, args.repeat))
+    if 'pipeline' in suites:
+        results.update(bench_pipeline.run(*(('2024-01-01', '2024-01-14') if args.quick else ('2024-01-01', '2024-02-29'))))
+
+    print("\n基准结果 (中位耗时):")
+    print_results(results)
+    print(f"\n结果已保存: {save_results(results, args.out)}")
+
+    if args.compare:
+        regressions = compare(args.compare, results, args.threshold)
+        if regressions and args.fail_on_regression:
+            print(f"\n退步: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
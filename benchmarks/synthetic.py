@@ -0,0 +1,157 @@
+import os
+import sys
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.scripts.live_stub_server import render_results_page
+
+# 马场: 沙田 (星期六/日, 场次多、马匹多) 及 跑马地 (星期三夜赛)
+VENUES = {
+    'ST': {'races': (10, 11), 'field': (12, 14), 'distances': (1000, 1200, 1400, 1600, 1800, 2000, 2400)},
+    'HV': {'races': (8, 9), 'field': (10, 12), 'distances': (1000, 1200, 1650, 1800, 2200)},
+}
+GOINGS = ('好地', '好地', '好地', '好至快', '好至黏', '黏地')
+CLASS_WEIGHTS = {'1': 0.05, '2': 0.1, '3': 0.25, '4': 0.35, '5': 0.25}
+TAKEOUT = 0.175  # 独赢彩池抽佣
+# 赔率跳价 (与马会赔率的最小变动一致)
+ODDS_STEPS = ((4.0, 0.1), (10.0, 0.5), (20.0, 1.0), (50.0, 2.0), (99.0, 5.0))
+SECONDS_PER_METRE = 0.0595
+
+
+def round_odds(odds: float) -> float:
+    odds = min(max(odds, 1.1), 99.0)
+    for limit, step in ODDS_STEPS:
+        if odds <= limit:
+            return min(round(round(odds / step) * step, 1), 99.0)
+    return 99.0
+
+
+class SyntheticMeetingGenerator:
+    """按香港赛事的结构生成合成赛马日
+
+    骑师/练马师/马匹各有固定的能力值, 能力越高越常胜出; 赔率由能力换算的
+    胜出概率扣除抽佣而得, 名次按 Plackett-Luce 模型 (Gumbel 噪声) 抽样。
+    同一种子生成的数据完全相同, 基准结果可跨次比较。
+    """
+
+    def __init__(self, seed: int = 2024, jockeys: int = 28, trainers: int = 24, horses: int = 1300):
+        self.rng = np.random.default_rng(seed)
+        self.jockeys = [f"騎師{i:02d}" for i in range(jockeys)]
+        self.trainers = [f"練馬師{i:02d}" for i in range(trainers)]
+        # 头部骑师更受青睐 (坐骑较多)
+        self.jockey_skill = self.rng.normal(0, 0.35, jockeys)
+        self.jockey_weight = np.exp(self.jockey_skill * 2)
+        self.jockey_weight /= self.jockey_weight.sum()
+        self.trainer_skill = self.rng.normal(0, 0.25, trainers)
+        self.horse_names = [f"合成{i:04d}" for i in range(horses)]
+        self.horse_codes = [f"{'ABCDEGHJ'[i % 8]}{100 + i % 900:03d}" for i in range(horses)]
+        # 资料页面的 HorseId 含入口年份 (不能由烙号推算)
+        self.horse_page_ids = [f"HK_{2016 + i % 8}_{code}" for i, code in enumerate(self.horse_codes)]
+        self.horse_ability = self.rng.normal(0, 1.0, horses)
+        self.horse_trainer = self.rng.integers(0, trainers, horses)
+        self.race_index = 0
+
+    def fixtures(self, start: str, end: str) -> List[Tuple[str, str]]:
+        """日期范围内的赛马日: 星期三跑马地, 星期日沙田 (每隔一周星期六亦在沙田)"""
+        current, last = date.fromisoformat(start), date.fromisoformat(end)
+        meetings = []
+        while current <= last:
+            weekday = current.weekday()
+            if weekday == 2:
+                meetings.append((current.isoformat(), 'HV'))
+            elif weekday == 6 or (weekday == 5 and current.isocalendar()[1] % 2 == 0):
+                meetings.append((current.isoformat(), 'ST'))
+            current += timedelta(days=1)
+        return meetings
+
+    def meeting(self, race_date: str, racecourse: str) -> Dict[int, List[Dict[str, Any]]]:
+        """一个赛马日: {场次: 出赛记录 (与 parse_results_page 的输出格式相同)}"""
+        venue = VENUES[racecourse]
+        races = int(self.rng.integers(venue['races'][0], venue['races'][1] + 1))
+        going = GOINGS[int(self.rng.integers(len(GOINGS)))]
+        return {race_no: self._race(race_date, racecourse, race_no, going) for race_no in range(1, races + 1)}
+
+    def _race(self, race_date: str, racecourse: str, race_no: int, going: str) -> List[Dict[str, Any]]:
+        venue = VENUES[racecourse]
+        self.race_index += 1
+        field = int(self.rng.integers(venue['field'][0], venue['field'][1] + 1))
+        distance = int(self.rng.choice(venue['distances']))
+        race_class = str(self.rng.choice(list(CLASS_WEIGHTS), p=list(CLASS_WEIGHTS.values())))
+
+        horses = self.rng.choice(len(self.horse_names), field, replace=False)
+        jockeys = self.rng.choice(len(self.jockeys), field, replace=False, p=self.jockey_weight)
+        strength = (self.horse_ability[horses] + self.jockey_skill[jockeys]
+                    + self.trainer_skill[self.horse_trainer[horses]])
+        win_prob = np.exp(strength) / np.exp(strength).sum()
+        # 公众判断有误差: 赔率按带噪声的概率计算
+        public = win_prob * np.exp(self.rng.normal(0, 0.25, field))
+        public /= public.sum()
+        odds = [round_odds((1 - TAKEOUT) / p) for p in public]
+
+        order = np.argsort(-(strength + self.rng.gumbel(size=field)))
+        positions = np.empty(field, dtype=int)
+        positions[order] = np.arange(1, field + 1)
+        winner_time = distance * SECONDS_PER_METRE * (1 + self.rng.normal(0, 0.01))
+        draws = self.rng.permutation(field) + 1
+
+        runners = []
+        for i in range(field):
+            seconds = winner_time + (positions[i] - 1) * 0.16 + abs(self.rng.normal(0, 0.05))
+            runners.append({
+                'race_id': str(self.race_index),
+                'race_date': race_date,
+                'horse_no': self.horse_codes[horses[i]],
+                'horse_name': self.horse_names[horses[i]],
+                'horse_page_id': self.horse_page_ids[horses[i]],
+                'draw': int(draws[i]),
+                'finish_position': int(positions[i]),
+                'jockey': self.jockeys[jockeys[i]],
+                'trainer': self.trainers[self.horse_trainer[horses[i]]],
+                'finish_time': f"{int(seconds // 60)}:{seconds % 60:05.2f}",
+                'odds': odds[i],
+                'distance': distance,
+                'racecourse': racecourse,
+                'race_class': race_class,
+                'going': going,
+            })
+        return runners
+
+    def records(self, start: str, end: str) -> Iterator[Dict[str, Any]]:
+        """日期范围内全部出赛记录"""
+        for race_date, racecourse in self.fixtures(start, end):
+            for runners in self.meeting(race_date, racecourse).values():
+                yield from runners
+
+
+def results_page(race_no: int, runners: List[Dict[str, Any]]) -> str:
+    """赛果页面 HTML (与 live_stub_server 渲染的页面相同)"""
+    return render_results_page(race_no, runners)
+
+
+def write_fixtures(directory: str, seed: int = 2024, meetings: int = 2) -> List[str]:
+    """把若干赛马日的赛果页面写为 HTML 测试素材"""
+    generator = SyntheticMeetingGenerator(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for race_date, racecourse in generator.fixtures('2024-09-08', '2024-12-31')[:meetings]:
+        for race_no, runners in generator.meeting(race_date, racecourse).items():
+            path = os.path.join(directory, f"results_{race_date}_{racecourse}_{race_no:02d}.html")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(results_page(race_no, runners))
+            paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="生成合成赛果页面素材")
+    parser.add_argument('--dir', default=os.path.join(os.path.dirname(__file__), 'fixtures', 'results'))
+    parser.add_argument('--meetings', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=2024)
+    args = parser.parse_args()
+    print(f"已生成 {len(write_fixtures(args.dir, args.seed, args.meetings))} 个页面")
@@ -1,59 +1,50 @@
-import asyncio
+import argparse
+import json
 import logging
-from datetime import datetime, timedelta
-import signal
-import sys
-from src.services.scraper import RaceScraper
-from src.services.analyzer import RaceAnalyzer
-from src.services.storage import DataStorage
-from src.services.batch_processor import BatchProcessor
-from src.services.visualizer import RaceVisualizer
-from src.utils.logger import setup_logger
-from src.utils.formatter import format_analysis_results
 import os
-import yaml
-from src.services.resource_manager import ResourceManager
-from typing import Dict, Any
-import mysql.connector
-
-# 設置日誌
-logger = setup_logger()
-
-# 讀取設定檔 - 使用 utf-8 編碼
-try:
-    with open('config/settings.yaml', 'r', encoding='utf-8') as file:
-        config = yaml.safe_load(file)
-except FileNotFoundError:
-    logger.error("找不到 settings.yaml 文件")
-    sys.exit(1)
-except Exception as e:
-    logger.error(f"讀取配置文件時發生錯誤: {e}")
-    sys.exit(1)
-
-# 建立資料庫連接
-db = mysql.connector.connect(
-    host="localhost",
-    user="root",
-    password="root",
-    database="racing_db",
-    port=3306
-)
-
-# 測試連接
-try:
-    cursor = db.cursor()
-    cursor.execute("SELECT VERSION()")
-    version = cursor.fetchone()
-    print(f"Database version: {version[0]}")
-    logger.info(f"Database version: {version[0]}")
-except Exception as e:
-    logger.error(f"資料庫連接失敗: {e}")
-    sys.exit(1)
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+# 第三方库及 src.services 只在子命令中按需导入, 导入本模块不连接数据库
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = 'config/settings.yaml'
+_config: Optional[Dict[str, Any]] = None
+
+# 各子命令需要的模块 (执行该命令时才导入, 亦供 src/scripts/import_report.py 检查)
+COMMAND_IMPORTS = {
+    'backfill': ('src.services.scraper', 'src.services.storage', 'src.services.batch_processor',
+                 'src.services.analyzer', 'src.services.backfill'),
+    'verify': ('src.services.storage', 'src.services.batch_processor', 'src.services.backfill'),
+    'calendar': ('src.services.storage', 'src.services.race_calendar'),
+    'replay': ('src.services.storage', 'src.services.spool'),
+    'migrate': ('src.services.storage',),
+    'analyze': ('src.services.storage', 'src.services.analyzer', 'src.services.visualizer',
+                'src.services.speed_figures'),
+    'backtest': ('src.services.storage', 'src.services.backtester'),
+    'export': ('src.scripts.export_data',),
+    'serve': ('src.web.app',),
+}
+
+# 年度统计只需读取的列
+YEARLY_STATS_COLUMNS = ['race_id', 'race_date', 'finish_position', 'odds', 'jockey_id']
+
+DEFAULT_START = '2024-01-01'
+DEFAULT_END = '2025-01-01'
 
 def load_config():
-    """加载配置文件"""
-    with open('config/settings.yaml', 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+    """加载配置文件 (只读取一次)"""
+    global _config
+    if _config is None:
+        import yaml
+        try:
+            with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+                _config = yaml.safe_load(f)
+        except FileNotFoundError:
+            logger.error("找不到 settings.yaml 文件")
+            sys.exit(1)
+    return _config
 
 def display_yearly_stats(stats: Dict[str, Any], start_date: str, end_date: str):
     """显示年度统计数据"""
@@ -69,6 +60,11 @@ def display_yearly_stats(stats: Dict[str, Any], start_date: str, end_date: str):
     logger.info(f"- 现役骑师: {summary['active_jockeys']:,} 人")
     logger.info(f"- 日均赛事: {summary['avg_races_per_day']:.1f} 场")
     
+    if stats.get('partitions'):
+        logger.info("\n各分区记录数:")
+        for partition in stats['partitions']:
+            logger.info(f"- {partition['partition']}: {partition['total_races']:,} 条")
+
     # 显示胜率最高的骑师
     logger.info("\n胜率最高骑师 (前5名):")
     logger.info(f"{'骑师':<8} | {'总赛事':>6} | {'总胜场':>6} | {'胜率':>6} | {'平均名次':>6}")
@@ -122,102 +118,331 @@ def display_yearly_stats(stats: Dict[str, Any], start_date: str, end_date: str):
     
     logger.info("\n" + "="*70 + "\n")
 
-async def main():
+async def backfill(args, config):
+    """抓取日期范围内的赛果 (已入库的日期会跳过), 并按季度分析骑师数据"""
+    import asyncio
+
+    # 命令行未指定时按 BACKFILL 配置决定是否分片回填
+    settings = config.get('BACKFILL') or {}
+    args.workers = args.workers or settings.get('WORKERS', 1)
+    args.client = args.client or settings.get('CLIENT', 'browser')
+    if args.workers > 1 or args.client == 'http':
+        await asyncio.to_thread(sharded_backfill, args, config)
+        return
+
+    from src.services.analyzer import RaceAnalyzer
+    from src.services.batch_processor import BatchProcessor
+    from src.services.resource_manager import ResourceManager
+    from src.services.scraper import RaceScraper
+    from src.services.storage import DataStorage
+
     async with ResourceManager() as rm:
-        config = load_config()
-        logger.info("初始化系统组件...")
-        
-        try:
-            # 初始化存储和分析器
-            rm.storage = DataStorage(config['DATABASE'])
-            analyzer = RaceAnalyzer()
-            
-            # 设置固定的日期范围
-            start_date = datetime(2024, 1, 1)
-            end_date = datetime(2025, 1, 1)
-            
-            # 直接检查数据库中的数据
-            existing_data = rm.storage.get_race_results(
-                start_date.strftime("%Y-%m-%d"),
-                end_date.strftime("%Y-%m-%d")
-            )
-            
-            if existing_data:
-                logger.info(f"数据库中已有 {len(existing_data)} 条记录，直接进行分析")
-                # ... 继续分析流程
-            else:
-                # 只有在没有数据时才初始化爬虫
-                rm.scraper = RaceScraper(config['SCRAPER'])
-                await rm.scraper.init()
-                batch_processor = BatchProcessor(rm.scraper, rm.storage, config)
-                
-                # 按季度分批处理
-                current_date = start_date
-                while current_date < end_date:
-                    try:
-                        # 计算当前批次的结束日期（3个月）
-                        batch_end = min(
-                            current_date + timedelta(days=90),  # 一个季度
-                            end_date
-                        )
-                        
-                        batch_start_str = current_date.strftime("%Y-%m-%d")
-                        batch_end_str = batch_end.strftime("%Y-%m-%d")
-                        
-                        logger.info(f"\n处理季度数据: {batch_start_str} 至 {batch_end_str}")
-                        
-                        # 使用并发处理
-                        await batch_processor.process_date_range(
-                            batch_start_str,
-                            batch_end_str
-                        )
-                        
-                        # 分析当前季度数据
-                        existing_data = rm.storage.get_race_results(
+        rm.metrics_server = await start_metrics_server(config)
+        rm.storage = DataStorage(config['DATABASE'])
+        analyzer = RaceAnalyzer(config.get('ANALYZER'), rm.storage.dimensions)
+        rm.scraper = RaceScraper(config['SCRAPER'])
+        await rm.scraper.init()
+        batch_processor = BatchProcessor(rm.scraper, rm.storage, config)
+
+        start_date = datetime.strptime(args.start, "%Y-%m-%d")
+        end_date = datetime.strptime(args.end, "%Y-%m-%d")
+
+        # 按季度分批处理
+        current_date = start_date
+        while current_date < end_date:
+            try:
+                # 计算当前批次的结束日期（3个月）
+                batch_end = min(
+                    current_date + timedelta(days=90),  # 一个季度
+                    end_date
+                )
+
+                batch_start_str = current_date.strftime("%Y-%m-%d")
+                batch_end_str = batch_end.strftime("%Y-%m-%d")
+
+                logger.info(f"\n处理季度数据: {batch_start_str} 至 {batch_end_str}")
+
+                # 使用并发处理
+                await batch_processor.process_date_range(
+                    batch_start_str,
+                    batch_end_str
+                )
+
+                # 分析当前季度数据
+                existing_data = rm.storage.get_race_results(
+                    batch_start_str,
+                    batch_end_str
+                )
+
+                if existing_data:
+                    analysis_results = analyzer.analyze_races(existing_data)
+                    if analysis_results:
+                        rm.storage.save_analysis_results(analysis_results)
+                        display_analysis_results(
+                            analysis_results,
                             batch_start_str,
                             batch_end_str
                         )
-                        
-                        if existing_data:
-                            analysis_results = analyzer.analyze_races(existing_data)
-                            if analysis_results:
-                                rm.storage.save_analysis_results(analysis_results)
-                                display_analysis_results(
-                                    analysis_results, 
-                                    batch_start_str, 
-                                    batch_end_str
-                                )
-                    
-                    except Exception as e:
-                        logger.error(f"处理季度出错: {e}")
-                        continue
-                    
-                    finally:
-                        # 移动到下一个季度
-                        current_date = batch_end + timedelta(days=1)
-                        await asyncio.sleep(1)
-            
-            # 获取并分析年度数据
-            yearly_data = rm.storage.get_race_results(
-                start_date.strftime("%Y-%m-%d"),
-                end_date.strftime("%Y-%m-%d")
+
+            except Exception as e:
+                logger.error(f"处理季度出错: {e}")
+                continue
+
+            finally:
+                # 移动到下一个季度
+                current_date = batch_end + timedelta(days=1)
+                await asyncio.sleep(1)
+
+async def verify(args, config):
+    """重抓最近几个赛马日并与场次摘要比较, 只写入有变化 (更正) 的场次"""
+    from src.services.backfill import _make_scraper
+    from src.services.batch_processor import BatchProcessor
+    from src.services.resource_manager import ResourceManager
+    from src.services.storage import DataStorage
+    from src.utils.rate_limit import RateLimiter
+
+    verify_config = config.get('VERIFY') or {}
+    async with ResourceManager() as rm:
+        rm.metrics_server = await start_metrics_server(config)
+        rm.storage = DataStorage(config['DATABASE'])
+        dates = sorted(rm.storage.recent_race_dates(args.meetings or verify_config.get('MEETINGS', 4)))
+        if not dates:
+            logger.warning("没有已入库的赛马日, 请先运行 backfill")
+            return
+        client = args.client or verify_config.get('CLIENT', 'browser')
+        rm.scraper = _make_scraper(config, client, RateLimiter(verify_config.get('MAX_PAGES_PER_SECOND', 0)))
+        await rm.scraper.init()
+
+        logger.info(f"重新核对 {len(dates)} 个赛马日: {', '.join(dates)}")
+        events = await BatchProcessor(rm.scraper, rm.storage, config).reverify(dates)
+        for event in events:
+            logger.info(f"{event['race_date']} 第 {event['race_number']} 场 ({event['type']}): {event['runners']} 匹")
+        logger.info(f"核对完成, {len(events)} 场有变化")
+
+async def calendar(args, config):
+    """更新赛马日历 (由已入库赛果学得, 可导入马会赛期表) 并显示日期范围内的抓取计划"""
+    import aiohttp
+    from src.services.race_calendar import RaceCalendar, fetch_fixtures
+    from src.services.storage import DataStorage
+
+    storage = DataStorage(config['DATABASE'])
+    try:
+        calendar_config = config.get('CALENDAR') or {}
+        race_calendar = RaceCalendar(storage, calendar_config)
+        logger.info(f"由已入库赛果学得 {race_calendar.learn()} 个赛马日")
+        for season in args.fixtures or []:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+                fixtures = await fetch_fixtures(session, season, calendar_config.get('FIXTURES_URL')
+                                                or RaceCalendar.FIXTURES_URL)
+            logger.info(f"{season}/{(season + 1) % 100:02d} 马季赛期表: {race_calendar.seed_fixtures(fixtures)} 个赛马日")
+
+        courses = [c['code'] for c in config['SCRAPER'].get('RACECOURSES', []) if c.get('code')] or ['ST']
+        plan = race_calendar.plan(args.start, args.end, courses)
+        days = (datetime.strptime(args.end, "%Y-%m-%d") - datetime.strptime(args.start, "%Y-%m-%d")).days + 1
+        logger.info(f"{args.start} 至 {args.end}: 抓取 {len(plan)}/{days} 日")
+    finally:
+        storage.close()
+
+def migrate(args, config):
+    """升级已存在的数据库: 补加新增的列及索引, 并为旧记录补填代理键及完成时间"""
+    from src.services.storage import DataStorage
+
+    storage = DataStorage(config['DATABASE'])
+    try:
+        result = storage.migrate()
+        logger.info(f"数据库升级完成: {len(result['schema'])} 项结构变更, "
+                    f"补填代理键 {result['dimension_ids']} 条, 完成时间 {result['finish_times']} 条")
+    finally:
+        storage.close()
+
+def replay(args, config):
+    """把本地预写日志中待回放的分段写入数据库 (上次运行时数据库不可用)"""
+    from src.services.spool import SpoolReplayer, WriteAheadSpool
+    from src.services.storage import DataStorage
+    from src.utils.exceptions import SpoolBusyError
+
+    spool_config = dict(config.get('SPOOL') or {}, ENABLED=True)
+    try:
+        spool = WriteAheadSpool.from_config(spool_config)
+    except SpoolBusyError as e:
+        # 抓取进程自身会回放, 不可与之争用分段
+        logger.error(f"{e}, 请待抓取结束后再运行")
+        return
+    try:
+        if not spool.segments():
+            logger.info("没有待回放的预写日志")
+            return
+        storage = DataStorage(config['DATABASE'])
+        try:
+            replayed = SpoolReplayer(spool, storage, spool_config.get('REPLAY_BATCH_ROWS', 20000)).replay_once()
+            pending = spool.segments()
+            logger.info(f"回放 {replayed} 条记录" + (f", 仍有 {len(pending)} 个分段待回放" if pending else ""))
+        finally:
+            storage.close()
+    finally:
+        spool.close()
+
+async def start_metrics_server(config):
+    """METRICS.PORT 已配置时在抓取期间提供 /metrics 端点"""
+    from src.utils import metrics
+
+    metrics_config = config.get('METRICS') or {}
+    if not metrics.REGISTRY.enabled or not metrics_config.get('PORT'):
+        return None
+    return await metrics.start_metrics_server(metrics_config.get('HOST', '127.0.0.1'), metrics_config['PORT'])
+
+def sharded_backfill(args, config):
+    """多进程分片回填, 完成后分析整个日期范围"""
+    from src.services.analyzer import RaceAnalyzer
+    from src.services.backfill import ShardedBackfill
+    from src.services.storage import DataStorage
+
+    sharded = ShardedBackfill(config, workers=args.workers, client=args.client)
+    sharded.run(args.start, args.end)
+
+    storage = DataStorage(config['DATABASE'])
+    try:
+        existing_data = storage.get_race_results(args.start, args.end)
+        if existing_data:
+            analysis_results = RaceAnalyzer(config.get('ANALYZER'), storage.dimensions).analyze_races(existing_data)
+            if analysis_results:
+                storage.save_analysis_results(analysis_results)
+                display_analysis_results(analysis_results, args.start, args.end)
+    finally:
+        storage.close()
+    # 各工作进程的指标随摘要一并输出
+    args.worker_metrics = sharded.worker_metrics
+
+def analyze(args, config):
+    """分析已入库的数据 (不启动浏览器)"""
+    from src.services.analyzer import RaceAnalyzer
+    from src.services.speed_figures import par_table, refresh_par_times
+    from src.services.storage import DataStorage
+    from src.services.visualizer import RaceVisualizer
+
+    storage = DataStorage(config['DATABASE'])
+    try:
+        # 以代理键统计, 骑师名称在输出时由维度表查出
+        analyzer = RaceAnalyzer(config.get('ANALYZER'), storage.dimensions)
+
+        if args.partitioned:
+            # 多季数据按马季/月份分区 (ANALYZER.PARTITION_BY), 以 ANALYZER.MAX_WORKERS 个进程并行聚合
+            frame = storage.get_race_frame(args.start, args.end, YEARLY_STATS_COLUMNS)
+            yearly_stats = analyzer.analyze_partitioned(frame)
+        else:
+            # 分块读取并累加年度统计 (以代理键读取, 名称为 categorical), 内存不随日期范围增长
+            chunks = storage.iter_race_frames(
+                args.start, args.end, YEARLY_STATS_COLUMNS,
+                chunk_size=(config.get('ANALYZER') or {}).get('CHUNK_SIZE', 50000)
             )
-            
-            if yearly_data:
-                yearly_stats = analyzer.analyze_yearly_stats(
-                    [result.__dict__ for result in yearly_data]
-                )
-                display_yearly_stats(
-                    yearly_stats,
-                    start_date.strftime("%Y-%m-%d"),
-                    end_date.strftime("%Y-%m-%d")
-                )
-            
-            logger.info("\n=== 年度数据处理完成 ===")
-            
-        except Exception as e:
-            logger.error(f"处理过程出错: {e}")
-            raise
+            yearly_stats = analyzer.analyze_yearly_stats_chunked(chunks)
+
+        if not yearly_stats:
+            logger.warning(f"{args.start} 至 {args.end} 没有数据, 请先运行 backfill")
+            return
+
+        display_yearly_stats(yearly_stats, args.start, args.end)
+
+        # 标准时间表 (速度指数的基准), 供网页 API 计算每匹马的速度指数
+        pars = refresh_par_times(storage, args.start, args.end)
+        display_par_table(par_table(pars))
+
+        if not args.no_charts:
+            # 预渲染网页图表 (按数据版本保存)
+            RaceVisualizer().render_charts(storage, args.start, args.end)
+
+        logger.info("\n=== 年度数据处理完成 ===")
+    finally:
+        storage.close()
+
+def backtest(args, config):
+    """以参数网格回测投注策略, 显示 ROI 最高的策略"""
+    from src.services.backtester import run_backtest, strategy_grid
+    from src.services.storage import DataStorage
+
+    storage = DataStorage(config['DATABASE'])
+    try:
+        params = {'odds_min': args.odds_min, 'odds_max': args.odds_max,
+                  'max_favourite_rank': args.max_rank, 'kelly_fraction': args.kelly}
+        # 骑师/练马师以名称指定, 回测按代理键筛选
+        for entity, names in (('jockey', args.jockeys), ('trainer', args.trainers)):
+            if names:
+                ids = [storage.dimensions.id_of(entity, name) for name in names]
+                unknown = [name for name, entity_id in zip(names, ids) if entity_id is None]
+                if unknown:
+                    logger.warning(f"未知的{entity}: {', '.join(unknown)}")
+                params[f'{entity}_id'] = [entity_id for entity_id in ids if entity_id is not None] or [-1]
+        grid = strategy_grid(**{name: values for name, values in params.items() if values})
+
+        result = run_backtest(storage, args.start, args.end, grid)
+        result = result[result['bets'] >= args.min_bets].sort_values('roi', ascending=False)
+        if args.output:
+            result.to_csv(args.output, index=False)
+            logger.info(f"已保存 {len(result)} 个策略的回测结果: {args.output}")
+        display_backtest(result.head(args.top), storage.dimensions, len(grid), args.start, args.end)
+    finally:
+        storage.close()
+
+def display_par_table(rows: List[Dict[str, Any]]):
+    """显示标准时间表 (距离 × 马场 × 场地)"""
+    if not rows:
+        return
+    logger.info("\n标准时间 (头马完成时间中位数):")
+    logger.info(f"{'距离':>6} | {'马场':<4} | {'场地':<6} | {'标准时间':>8}")
+    for row in sorted(rows, key=lambda r: (r['racecourse'], r['distance'], str(r['going']))):
+        seconds = row['par_time_cs'] / 100
+        logger.info(f"{row['distance']:>6} | {row['racecourse']:<4} | {row['going']:<6} | "
+                    f"{int(seconds // 60)}:{seconds % 60:05.2f}")
+
+def display_backtest(result, dimensions, total: int, start_date: str, end_date: str):
+    """显示回测结果 (代理键在此换回名称)"""
+    logger.info("\n" + "="*70)
+    logger.info(f"策略回测 ({start_date} 至 {end_date}, 共 {total:,} 个策略)")
+    logger.info("="*70)
+    logger.info(f"{'赔率':>11} | {'热门':>4} | {'骑师':<8} | {'练马师':<8} | {'凯利':>4} | "
+                f"{'投注':>6} | {'ROI':>7} | {'命中率':>6} | {'最大回撤':>8}")
+    for row in result.itertuples():
+        jockey = dimensions.name_of('jockey', row.jockey_id) if row.jockey_id >= 0 else '-'
+        trainer = dimensions.name_of('trainer', row.trainer_id) if row.trainer_id >= 0 else '-'
+        logger.info(
+            f"{row.odds_min:>5.1f}-{row.odds_max:<5.1f} | {row.max_favourite_rank or '-':>4} | "
+            f"{jockey:<8} | {trainer:<8} | {row.kelly_fraction:>4.2f} | {int(row.bets):>6,d} | "
+            f"{row.roi:>6.2f}% | {row.hit_rate:>5.1f}% | {row.max_drawdown:>8.2f}"
+        )
+
+def export(args, config):
+    """流式导出 (参数与 src/scripts/export_data.py 相同)"""
+    from src.scripts.export_data import build_parser, run_export
+
+    parser = build_parser(argparse.ArgumentParser(prog='main.py export', description="流式导出赛事数据"))
+    run_export(parser.parse_args(args.export_args), config)
+
+def serve(args, config):
+    """启动 HTTP 服务"""
+    from aiohttp import web
+    from src.web.app import create_app
+
+    web_config = config.get('WEB', {})
+    web.run_app(
+        create_app(config),
+        host=args.host or web_config.get('HOST', '127.0.0.1'),
+        port=args.port or web_config.get('PORT', 8080)
+    )
+
+async def run_all(args, config):
+    """未指定子命令: 数据库没有数据时先抓取, 然后分析"""
+    from src.services.storage import DataStorage
+
+    storage = DataStorage(config['DATABASE'])
+    try:
+        has_data = storage.has_results()
+    finally:
+        storage.close()
+    if has_data:
+        logger.info("数据库中已有记录，直接进行分析")
+    else:
+        await backfill(args, config)
+    analyze(args, config)
 
 def display_analysis_results(results, start_date, end_date):
     """显示分析结果"""
@@ -269,65 +494,125 @@ def display_jockey_odds_analysis(jockey_odds):
                 f"{jockey['win_rate']:>5.1f}%"
             )
 
-if __name__ == "__main__":
-    rm = ResourceManager()  # 创建资源管理器实例
-    try:
-        # 禁用 ResourceWarning
-        import warnings
-        warnings.filterwarnings("ignore", category=ResourceWarning)
-        
+def report_metrics(config, extra: Optional[Dict[str, Any]] = None):
+    """运行结束时输出指标摘要 (METRICS.ENABLED 时), 并写入 METRICS.SUMMARY_PATH"""
+    from src.utils import metrics
+
+    if not metrics.REGISTRY.enabled:
+        return
+    summary = metrics.REGISTRY.summary()
+    if extra:
+        summary.update(extra)
+    logger.info("指标摘要:\n" + json.dumps(summary, ensure_ascii=False, indent=2, default=str))
+    path = (config.get('METRICS') or {}).get('SUMMARY_PATH')
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        metrics.REGISTRY.write_summary(path, extra)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="香港赛马数据抓取及分析")
+    parser.add_argument('--config', default=CONFIG_PATH, help="配置文件路径")
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_range(sub):
+        sub.add_argument('--start', default=DEFAULT_START, help="开始日期 YYYY-MM-DD")
+        sub.add_argument('--end', default=DEFAULT_END, help="结束日期 YYYY-MM-DD")
+
+    backfill_parser = subparsers.add_parser('backfill', help="抓取历史赛果")
+    add_range(backfill_parser)
+    backfill_parser.add_argument('--workers', type=int, help="分片回填的进程数 (大于1时启用, 默认 BACKFILL.WORKERS)")
+    backfill_parser.add_argument('--client', choices=('browser', 'http'), help="抓取方式: 浏览器或直接HTTP请求 (默认 BACKFILL.CLIENT)")
+
+    verify_parser = subparsers.add_parser('verify', help="重新核对最近的赛马日, 只写入有变化的场次")
+    verify_parser.add_argument('--meetings', type=int, help="核对的赛马日数 (默认见 VERIFY.MEETINGS)")
+    verify_parser.add_argument('--client', choices=('browser', 'http'), help="抓取方式: 浏览器或直接HTTP请求")
+
+    calendar_parser = subparsers.add_parser('calendar', help="更新赛马日历并显示抓取计划")
+    add_range(calendar_parser)
+    calendar_parser.add_argument('--fixtures', type=int, nargs='*', help="导入这些马季 (开始年份) 的马会赛期表")
+
+    subparsers.add_parser('replay', help="把本地预写日志回放入库")
+    subparsers.add_parser('migrate', help="升级已存在的数据库 (新增列/索引/唯一键并补填旧记录)")
+
+    analyze_parser = subparsers.add_parser('analyze', help="分析已入库的数据")
+    add_range(analyze_parser)
+    analyze_parser.add_argument('--no-charts', action='store_true', help="不预渲染网页图表")
+    analyze_parser.add_argument('--partitioned', action='store_true',
+                                help="按 ANALYZER.PARTITION_BY 分区并行分析 (多季数据)")
+
+    backtest_parser = subparsers.add_parser('backtest', help="以参数网格回测投注策略")
+    add_range(backtest_parser)
+    backtest_parser.add_argument('--odds-min', type=float, nargs='+', help="赔率下限 (可多个)")
+    backtest_parser.add_argument('--odds-max', type=float, nargs='+', help="赔率上限 (可多个)")
+    backtest_parser.add_argument('--max-rank', type=int, nargs='+', help="只投注热门排名在此之内的马 (0 = 不限)")
+    backtest_parser.add_argument('--jockeys', nargs='+', help="只投注这些骑师 (名称)")
+    backtest_parser.add_argument('--trainers', nargs='+', help="只投注这些练马师 (名称)")
+    backtest_parser.add_argument('--kelly', type=float, nargs='+', help="凯利分数 (0 = 平注)")
+    backtest_parser.add_argument('--min-bets', type=int, default=30, help="投注数少于此值的策略不显示")
+    backtest_parser.add_argument('--top', type=int, default=20, help="显示 ROI 最高的前N个策略")
+    backtest_parser.add_argument('--output', help="全部策略的结果另存为 CSV")
+
+    # 导出参数由 export_data.py 定义, 执行时才导入
+    export_parser = subparsers.add_parser('export', help="流式导出数据 (参数见 main.py export --help)",
+                                          add_help=False)
+    export_parser.add_argument('export_args', nargs=argparse.REMAINDER)
+
+    serve_parser = subparsers.add_parser('serve', help="启动 HTTP 服务")
+    serve_parser.add_argument('--host')
+    serve_parser.add_argument('--port', type=int)
+    return parser
+
+def main(argv: Optional[List[str]] = None):
+    global CONFIG_PATH
+    args = build_parser().parse_args(argv)
+    CONFIG_PATH = args.config
+
+    from src.utils.logger import setup_logger
+    from src.utils import metrics
+    config = load_config()
+    setup_logger(config.get('LOGGER'))
+    metrics.REGISTRY.configure(config.get('METRICS'))
+
+    if args.command == 'export':
+        export(args, config)
+    elif args.command == 'serve':
+        serve(args, config)
+    elif args.command == 'analyze':
+        analyze(args, config)
+        report_metrics(config)
+    elif args.command == 'backtest':
+        backtest(args, config)
+        report_metrics(config)
+    elif args.command == 'replay':
+        replay(args, config)
+    elif args.command == 'migrate':
+        migrate(args, config)
+    else:
+        import asyncio
+
         # Windows 上使用 ProactorEventLoop
         if sys.platform.startswith('win'):
-            loop = asyncio.ProactorEventLoop()
-            asyncio.set_event_loop(loop)
-        else:
-            loop = asyncio.get_event_loop()
-        
-        # 測試日誌系統
-        logger = setup_logger()
-        logger.info("=== Starting Program ===")
-        logger.info("Testing logging system...")
-        
-        # 檢查日誌文件
-        log_dir = 'logs'
-        if os.path.exists(log_dir):
-            files = os.listdir(log_dir)
-            logger.info(f"Log files found: {files}")
+            asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+        if args.command == 'backfill':
+            asyncio.run(backfill(args, config))
+        elif args.command == 'verify':
+            asyncio.run(verify(args, config))
+        elif args.command == 'calendar':
+            asyncio.run(calendar(args, config))
         else:
-            logger.warning("Logs directory not found!")
-            
-        # 設置信號處理
-        for sig in (signal.SIGINT, signal.SIGTERM):
-            signal.signal(sig, lambda s, _: asyncio.create_task(rm.cleanup(s)))
-        
-        # 運行主程序
-        loop.run_until_complete(main())
-        
+            args.start, args.end, args.no_charts, args.partitioned = DEFAULT_START, DEFAULT_END, False, False
+            args.workers, args.client = None, None
+            asyncio.run(run_all(args, config))
+        worker_metrics = getattr(args, 'worker_metrics', None)
+        report_metrics(config, {'workers': worker_metrics} if worker_metrics else None)
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.info("已中断")
     finally:
-        try:
-            # 确保事件循环正确关闭
-            if loop and loop.is_running():
-                loop.run_until_complete(rm.cleanup())  # 使用 rm.cleanup
-                loop.run_until_complete(asyncio.sleep(0.1))
-            
-            # 关闭所有待处理的任务
-            if loop and not loop.is_closed():
-                pending = asyncio.all_tasks(loop)
-                for task in pending:
-                    task.cancel()
-                
-                if pending:
-                    loop.run_until_complete(asyncio.wait(pending, timeout=5))
-                
-                # 关闭事件循环
-                loop.close()
-            
-        except Exception as e:
-            logger.error(f"關閉事件循環時出錯: {e}")
-        finally:
-            # 清理全局引用
-            loop = None
-            scraper = None
-            storage = None
-            # 确保日志正确关闭
-            logging.shutdown() 
\ No newline at end of file
+        # 确保日志正确关闭 (先写出队列中剩余的日志)
+        from src.utils.logger import shutdown_logger
+        shutdown_logger()
+        logging.shutdown()
@@ -1,16 +1,26 @@
+import asyncio
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
+from typing import Dict, Iterable, List, Optional
 import yaml
 import logging
 
+from src.services.parsing import parse_horse_page_id, parse_horse_profile
+from src.services.profile_fetcher import ProfileFetcher
+
 class HorseRacingScraper:
-    def __init__(self):
+    def __init__(self, config: Optional[Dict] = None):
         self.base_url = "https://racing.hkjc.com/racing/information/Chinese/racing/LocalResults.aspx"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
         }
+        # 同步请求共用连接 (Keep-Alive), 不再每次重新建立 TCP/TLS 连接
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # 马匹资料: 整批去重后并发抓取, 并按 TTL / ETag 缓存
+        self.profile_fetcher = ProfileFetcher((config or {}).get('PROFILES'), self.headers)
         self.setup_logging()
 
     def setup_logging(self):
@@ -26,7 +36,7 @@ class HorseRacingScraper:
             params = {
                 'date': race_date.strftime('%Y/%m/%d')
             }
-            response = requests.get(self.base_url, params=params, headers=self.headers)
+            response = self.session.get(self.base_url, params=params)
             soup = BeautifulSoup(response.text, 'html.parser')
             return soup
         except Exception as e:
@@ -39,6 +49,9 @@ class HorseRacingScraper:
             return {
                 'horse_no': horse_row.find('td', {'class': 'horse_no'}).text.strip(),
                 'horse_name': horse_row.find('td', {'class': 'horse_name'}).text.strip(),
+                'horse_page_id': parse_horse_page_id(
+                    (horse_row.find('a', href=lambda href: href and 'HorseId=' in href) or {}).get('href')
+                ),
                 'jockey': horse_row.find('td', {'class': 'jockey'}).text.strip(),
                 'trainer': horse_row.find('td', {'class': 'trainer'}).text.strip(),
                 'actual_weight': horse_row.find('td', {'class': 'weight'}).text.strip(),
@@ -55,7 +68,7 @@ class HorseRacingScraper:
         """获取马匹历史成绩"""
         try:
             url = f"https://racing.hkjc.com/racing/information/Chinese/Horse/HorseResults.aspx?Horse={horse_code}"
-            response = requests.get(url, headers=self.headers)
+            response = self.session.get(url)
             soup = BeautifulSoup(response.text, 'html.parser')
             
             history_data = []
@@ -89,71 +102,54 @@ class HorseRacingScraper:
     def get_horse_profile(self, horse_id):
         """获取马匹详细资料和往绩"""
         try:
-            url = f"https://racing.hkjc.com/racing/information/Chinese/Horse/Horse.aspx?HorseId={horse_id}"
-            response = requests.get(url, headers=self.headers)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 获取基本信息
-            basic_info = {}
-            info_table = soup.find_all('table')[0]  # 第一个表格包含基本信息
-            
-            # 解析基本信息
-            basic_info = {
-                'origin_age': info_table.find(text=lambda t: '出生地 / 馬齡' in str(t)).find_next(text=True).strip(),
-                'color_sex': info_table.find(text=lambda t: '毛色 / 性別' in str(t)).find_next(text=True).strip(),
-                'import_type': info_table.find(text=lambda t: '進口類別' in str(t)).find_next(text=True).strip(),
-                'season_stakes': info_table.find(text=lambda t: '今季獎金' in str(t)).find_next(text=True).strip(),
-                'total_stakes': info_table.find(text=lambda t: '總獎金' in str(t)).find_next(text=True).strip(),
-                'record': info_table.find(text=lambda t: '冠-亞-季-總出賽次數' in str(t)).find_next(text=True).strip(),
-                'trainer': info_table.find('a', href=lambda h: 'Trainers' in str(h)).text.strip(),
-                'owner': info_table.find('a', href=lambda h: 'OwnerSearch' in str(h)).text.strip(),
-                'current_rating': info_table.find(text=lambda t: '現時評分' in str(t)).find_next(text=True).strip(),
-                'season_start_rating': info_table.find(text=lambda t: '季初評分' in str(t)).find_next(text=True).strip(),
-                'sire': info_table.find(text=lambda t: '父系' in str(t)).find_next('a').text.strip(),
-                'dam': info_table.find(text=lambda t: '母系' in str(t)).find_next(text=True).strip(),
-                'dam_sire': info_table.find(text=lambda t: '外祖父' in str(t)).find_next(text=True).strip()
-            }
-
-            # 获取往绩记录
-            race_history = []
-            history_table = soup.find('table', {'class': 'performance'})
-            if history_table:
-                for row in history_table.find_all('tr')[1:]:  # 跳过表头
-                    cols = row.find_all('td')
-                    if len(cols) >= 15:  # 确保行有足够的列
-                        race_record = {
-                            'season': cols[0].text.strip(),
-                            'race_no': cols[1].text.strip(),
-                            'date': cols[2].text.strip(),
-                            'track': cols[3].text.strip(),
-                            'distance': cols[4].text.strip(),
-                            'track_condition': cols[5].text.strip(),
-                            'class': cols[6].text.strip(),
-                            'draw': cols[7].text.strip(),
-                            'rating': cols[8].text.strip(),
-                            'trainer': cols[9].text.strip(),
-                            'jockey': cols[10].text.strip(),
-                            'finish_position': cols[11].text.strip(),
-                            'win_odds': cols[12].text.strip(),
-                            'actual_weight': cols[13].text.strip(),
-                            'running_position': cols[14].text.strip(),
-                            'finish_time': cols[15].text.strip() if len(cols) > 15 else '',
-                            'body_weight': cols[16].text.strip() if len(cols) > 16 else '',
-                            'gear': cols[17].text.strip() if len(cols) > 17 else ''
-                        }
-                        race_history.append(race_record)
-
-            return {
-                'basic_info': basic_info,
-                'race_history': race_history
-            }
-            
+            page = self.fetch_horse_pages([horse_id]).get(horse_id)
+            if page is None:
+                return None
+            return self.parse_horse_profile(page)
         except Exception as e:
             logging.error(f"获取马匹资料失败 - {horse_id}: {str(e)}")
             return None
 
+    def fetch_horse_pages(self, horse_ids: Iterable[str], revalidate: bool = False) -> Dict[str, str]:
+        """去重后并发抓取一批马匹资料页面 (有效期内的缓存不再请求)"""
+        return asyncio.run(self.profile_fetcher.fetch_many(horse_ids, revalidate))
+
+    def get_horse_profiles(self, horse_ids: Iterable[str]) -> Dict[str, Dict]:
+        """获取一批马匹的资料, 同一匹马只抓取及解析一次"""
+        profiles = {}
+        for horse_id, page in self.fetch_horse_pages(horse_ids).items():
+            try:
+                profiles[horse_id] = self.parse_horse_profile(page)
+            except Exception as e:
+                logging.error(f"获取马匹资料失败 - {horse_id}: {str(e)}")
+        return profiles
+
+    @staticmethod
+    def parse_horse_profile(page: str) -> Dict:
+        """解析马匹资料页面 (单次遍历的 lxml 解析器)"""
+        return parse_horse_profile(page)
+
     def process_race_day(self, race_date):
         """处理一个赛马日的所有数据"""
+        return self.process_race_days([race_date]).get(race_date)
+
+    def process_race_days(self, race_dates: Iterable[datetime]) -> Dict[datetime, Optional[List[Dict]]]:
+        """处理多个赛马日: 先解析全部赛果, 出赛马匹去重后一次并发抓取资料"""
+        days = {race_date: self._collect_race_day(race_date) for race_date in race_dates}
+        runners = [
+            horse for races in days.values() if races
+            for race in races for horse in race['horses']
+        ]
+        # 资料页面的 HorseId 取自赛果页面马名的链接, 没有链接的马匹不抓取资料
+        profiles = self.get_horse_profiles(horse['horse_page_id'] for horse in runners if horse['horse_page_id'])
+        for horse in runners:
+            profile = profiles.get(horse['horse_page_id'])
+            if profile:
+                horse.update(profile)
+        return days
+
+    def _collect_race_day(self, race_date):
+        """解析一个赛马日的赛果 (不含马匹资料)"""
         race_data = []
         soup = self.get_race_results(race_date)
         
@@ -173,10 +169,6 @@ class HorseRacingScraper:
                 for horse_row in horse_rows:
                     horse_info = self.parse_horse_info(horse_row)
                     if horse_info:
-                        horse_id = f"HK_2023_{horse_info['horse_no']}"
-                        horse_profile = self.get_horse_profile(horse_id)
-                        if horse_profile:
-                            horse_info.update(horse_profile)
                         race_info['horses'].append(horse_info)
                 
                 if race_info['horses']:
@@ -1,6 +1,6 @@
 import logging
 from typing import List, Dict
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, select, and_
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, UniqueConstraint, select, and_
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
@@ -13,6 +13,9 @@ Base = declarative_base()
 
 class RaceResult(Base):
     __tablename__ = 'race_results'
+    # 同一场赛事的同一匹马只有一行 (UPSERT 的冲突键)
+    UNIQUE_KEY = ('race_date', 'race_number', 'horse_name')
+    __table_args__ = (UniqueConstraint(*UNIQUE_KEY, name='uq_race_runner'),)
     
     id = Column(Integer, primary_key=True)
     race_id = Column(String(50))
@@ -25,9 +28,17 @@ class RaceResult(Base):
     jockey = Column(String(50))
     trainer = Column(String(50))
     finish_time = Column(String(20))
+    finish_time_cs = Column(Integer)  # 完成时间 (百分之一秒), 无效为 -1
     odds = Column(Float)
     distance = Column(Integer)
     race_info = Column(Text)
+    racecourse = Column(String(5))   # ST / HV
+    race_class = Column(String(10))  # 1-5 / G1-G3
+    going = Column(String(20))       # 场地状况
+    # 维度表代理键, 入库时由 DimensionRegistry 填充
+    jockey_id = Column(Integer, index=True)
+    trainer_id = Column(Integer, index=True)
+    horse_id = Column(Integer, index=True)
 
     def __repr__(self):
         return f"<RaceResult(race_id={self.race_id}, horse_name={self.horse_name})>" 
@@ -43,6 +54,166 @@ class JockeyStats(Base):
     win_rate = Column(Float)
     avg_position = Column(Float) 
 
+class DataVersion(Base):
+    """数据版本号, 每次写入赛果时递增, 供缓存判断是否失效"""
+    __tablename__ = 'data_versions'
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now)
+
+class ChartPayload(Base):
+    """按数据版本预渲染的图表 JSON"""
+    __tablename__ = 'chart_payloads'
+    __table_args__ = (UniqueConstraint('name', 'data_version'),)
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), nullable=False)
+    data_version = Column(Integer, nullable=False)
+    payload = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+
+class Jockey(Base):
+    __tablename__ = 'jockeys'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), unique=True, nullable=False)
+
+class Trainer(Base):
+    __tablename__ = 'trainers'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), unique=True, nullable=False)
+
+class Horse(Base):
+    __tablename__ = 'horses'
+
+    id = Column(Integer, primary_key=True)
+    code = Column(String(100), unique=True, nullable=False)  # 有烙号时为烙号, 否则为马名
+    name = Column(String(100))
+    page_id = Column(String(30))  # 马匹资料页面的 HorseId (取自赛果页面的链接)
+
+class NameAlias(Base):
+    """名称异写对照, 所有拼写变体在此统一解析"""
+    __tablename__ = 'name_aliases'
+    __table_args__ = (UniqueConstraint('entity', 'alias'),)
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String(20), nullable=False)  # jockey / trainer / horse
+    alias = Column(String(100), nullable=False)
+    canonical = Column(String(100), nullable=False)
+
+class HorseHistory(Base):
+    """马匹往绩 (来自马匹资料页面), 按 马匹 + 日期 + 场次 唯一"""
+    __tablename__ = 'horse_history'
+    UNIQUE_KEY = ('horse_code', 'race_date', 'race_no')
+    __table_args__ = (UniqueConstraint(*UNIQUE_KEY),)
+
+    id = Column(Integer, primary_key=True)
+    horse_code = Column(String(20), nullable=False, index=True)
+    race_date = Column(String(10), nullable=False)  # YYYY-MM-DD
+    race_no = Column(String(10))
+    season = Column(String(10))
+    track = Column(String(50))
+    distance = Column(String(10))
+    track_condition = Column(String(20))
+    race_class = Column(String(10))
+    draw = Column(String(5))
+    rating = Column(String(10))
+    trainer = Column(String(50))
+    jockey = Column(String(50))
+    finish_position = Column(String(10))
+    win_odds = Column(String(10))
+    actual_weight = Column(String(10))
+    running_position = Column(String(50))
+    finish_time = Column(String(20))
+    body_weight = Column(String(10))
+    gear = Column(String(50))
+    row_hash = Column(String(40))
+
+class HorseSyncState(Base):
+    """每匹马往绩的同步进度: 最近一次同步到的赛事日期及该行的摘要"""
+    __tablename__ = 'horse_sync_state'
+
+    horse_code = Column(String(20), primary_key=True)
+    last_race_date = Column(String(10))
+    last_row_hash = Column(String(40))
+    rows = Column(Integer, default=0)
+    synced_at = Column(DateTime, default=datetime.now)
+
+class RaceHash(Base):
+    """每场赛事内容的摘要 (race_content_hash), 重抓时只写入摘要有变的场次"""
+    __tablename__ = 'race_hashes'
+    UNIQUE_KEY = ('race_date', 'race_number')
+    __table_args__ = (UniqueConstraint(*UNIQUE_KEY),)
+
+    id = Column(Integer, primary_key=True)
+    race_date = Column(String(10), nullable=False)
+    race_number = Column(Integer, nullable=False)
+    racecourse = Column(String(5))
+    content_hash = Column(String(64), nullable=False)
+    runners = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.now)
+
+class RaceMeeting(Base):
+    """赛马日历: 已知的赛马日及马场 (source 为 learned / fixtures)"""
+    __tablename__ = 'race_meetings'
+
+    race_date = Column(String(10), primary_key=True)  # YYYY-MM-DD
+    racecourse = Column(String(5))
+    races = Column(Integer)
+    source = Column(String(10), nullable=False)
+    updated_at = Column(DateTime, default=datetime.now)
+
+class ParTime(Base):
+    """标准时间表: 头马完成时间的中位数, 粗层级的 racecourse / going 为空字符串"""
+    __tablename__ = 'par_times'
+    UNIQUE_KEY = ('distance', 'racecourse', 'going')
+    __table_args__ = (UniqueConstraint(*UNIQUE_KEY),)
+
+    id = Column(Integer, primary_key=True)
+    distance = Column(Integer, nullable=False)
+    racecourse = Column(String(5), nullable=False, default='')
+    going = Column(String(20), nullable=False, default='')
+    par_time_cs = Column(Float, nullable=False)  # 百分之一秒
+    updated_at = Column(DateTime, default=datetime.now)
+
+class QuarantinedRecord(Base):
+    """预处理拒收的赛果记录, 保留原始内容及原因代码, 供核对后重新入库"""
+    __tablename__ = 'quarantined_records'
+
+    id = Column(Integer, primary_key=True)
+    race_date = Column(String(10), index=True)
+    racecourse = Column(String(5))
+    race_id = Column(String(50))
+    horse_name = Column(String(100))
+    reason = Column(String(30), nullable=False, index=True)  # missing_field / bad_odds / duplicate ...
+    detail = Column(Text)
+    payload = Column(Text)  # 原始记录 JSON
+    created_at = Column(DateTime, default=datetime.now)
+
+class WorkUnit(Base):
+    """分片回填的工作单元 (日期 × 马场) 及其租约
+
+    工作进程以条件 UPDATE 领取单元并设定租约到期时间; 进程崩溃后租约
+    过期, 单元自动可被其他进程重新领取。
+    """
+    __tablename__ = 'work_units'
+    UNIQUE_KEY = ('job', 'race_date', 'racecourse')
+    __table_args__ = (UniqueConstraint(*UNIQUE_KEY),)
+
+    id = Column(Integer, primary_key=True)
+    job = Column(String(50), nullable=False)
+    race_date = Column(String(10), nullable=False)  # YYYY-MM-DD
+    racecourse = Column(String(5), nullable=False)
+    status = Column(String(10), nullable=False, default='pending', index=True)  # pending / leased / done / failed
+    owner = Column(String(64))
+    lease_expires = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)
+    records = Column(Integer, default=0)
+    error = Column(Text)
+    updated_at = Column(DateTime, default=datetime.now)
+
 class DataStorage:
     def __init__(self, db_config: dict):
         """初始化数据存储"""
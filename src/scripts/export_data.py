@@ -0,0 +1,67 @@
+import argparse
+import logging
+import os
+import sys
+
+import yaml
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from src.services.storage import DataStorage
+from src.services import exporter
+from src.utils.logger import setup_logger
+
+logger = logging.getLogger(__name__)
+
+def load_config():
+    """加载配置文件"""
+    with open('config/settings.yaml', 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+def build_parser(parser=None):
+    """导出参数 (亦供主程序的 export 子命令使用)"""
+    parser = parser or argparse.ArgumentParser(description="流式导出赛事数据")
+    parser.add_argument('--table', default='race_results', choices=sorted(DataStorage.EXPORT_TABLES))
+    parser.add_argument('--format', dest='fmt', default='csv', choices=exporter.FORMATS)
+    parser.add_argument('--compression', default='none',
+                        help="csv/jsonl: none/gzip/bz2; parquet: none/snappy/gzip/zstd")
+    parser.add_argument('--start-date')
+    parser.add_argument('--end-date')
+    parser.add_argument('--racecourse', choices=['ST', 'HV'])
+    parser.add_argument('--jockey')
+    parser.add_argument('--trainer')
+    parser.add_argument('--horse', help="马匹烙号")
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--output', '-o', help="输出文件, 默认按表名及格式命名; '-' 为标准输出")
+    return parser
+
+def run_export(args, config):
+    """执行导出"""
+    filters = {
+        name: getattr(args, name)
+        for name in ('start_date', 'end_date', 'racecourse', 'jockey', 'trainer', 'horse')
+        if getattr(args, name)
+    }
+    storage = DataStorage(config['DATABASE'])
+    try:
+        if args.output == '-':
+            for data in exporter.export_stream(storage, args.table, args.fmt, args.compression,
+                                               args.chunk_size, **filters):
+                sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+        else:
+            output = args.output or f"{args.table}{exporter.file_extension(args.fmt, args.compression)}"
+            exporter.export_to_file(storage, output, args.table, args.fmt, args.compression,
+                                    args.chunk_size, **filters)
+    finally:
+        storage.close()
+
+def main():
+    args = build_parser().parse_args()
+    config = load_config()
+    # 日志在运行时设置 (main.py export 导入本模块时沿用主程序的队列日志)
+    setup_logger(config.get('LOGGER'))
+    run_export(args, config)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+sys.path.insert(0, ROOT)
+
+# 导入 main 时不应加载的重型依赖
+FORBIDDEN_AT_IMPORT = ('playwright', 'pandas', 'numpy', 'sqlalchemy', 'tqdm', 'aiohttp', 'mysql', 'pymysql')
+
+# 各子命令的导入时间上限 (毫秒), 含解释器启动; 留有约 30% 余量以免测量波动误报
+# storage 不在导入时加载 pandas, 只需数据库的子命令 (calendar / replay / migrate /
+# export) 约 0.4-0.6 秒; analyze / backfill / verify 本身需要 pandas 及 numpy
+BUDGETS_MS = {
+    'main': 100,
+    'calendar': 800,
+    'replay': 800,
+    'migrate': 800,
+    'export': 900,
+    'analyze': 1300,
+    'backtest': 1300,
+    'backfill': 1300,
+    'verify': 1300,
+    'serve': 1600,
+}
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(statement: str) -> List[Tuple[str, int, int, int]]:
+    """以 -X importtime 执行语句, 返回 (模块, 自身微秒, 累计微秒, 层级)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"执行失败: {statement}\n{result.stderr[-2000:]}")
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return modules
+
+
+def report(name: str, statement: str, top: int) -> Dict[str, object]:
+    modules = measure(statement)
+    # 只统计顶层导入的累计时间, 避免重复计算
+    total_us = sum(cumulative for _, _, cumulative, level in modules if level == 0)
+    print(f"\n[{name}] {statement}")
+    print(f"  共导入 {len(modules)} 个模块, 累计 {total_us / 1000:.1f} ms")
+    for module, own, cumulative, _ in sorted(modules, key=lambda m: m[2], reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {own / 1000:7.1f} ms  {module}")
+    return {'modules': {m[0] for m in modules}, 'total_ms': total_us / 1000}
+
+
+def main():
+    import main as cli
+
+    parser = argparse.ArgumentParser(description="各子命令的导入时间报告 (回归检查)")
+    parser.add_argument('--top', type=int, default=10, help="显示累计耗时最多的前N个模块")
+    parser.add_argument('--strict', action='store_true', help="超出时间上限亦视为失败")
+    args = parser.parse_args()
+
+    failures = []
+    base = report('main', 'import main', args.top)
+    loaded = sorted(m for m in base['modules'] if m.split('.')[0] in FORBIDDEN_AT_IMPORT)
+    if loaded:
+        failures.append(f"导入 main 时加载了重型依赖: {', '.join(loaded)}")
+    budgets = {'main': base['total_ms']}
+
+    for command, modules in cli.COMMAND_IMPORTS.items():
+        result = report(command, 'import main; ' + '; '.join(f'import {m}' for m in modules), args.top)
+        budgets[command] = result['total_ms']
+
+    print("\n子命令导入时间:")
+    for name, total_ms in budgets.items():
+        limit = BUDGETS_MS.get(name)
+        over = limit is not None and total_ms > limit
+        print(f"  {name:<10} {total_ms:8.1f} ms  (上限 {limit} ms){'  超出' if over else ''}")
+        if over and args.strict:
+            failures.append(f"{name} 导入时间 {total_ms:.0f} ms 超出上限 {limit} ms")
+
+    if failures:
+        print("\n检查失败:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\n检查通过")
+
+
+if __name__ == "__main__":
+    main()
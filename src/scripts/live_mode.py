@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+import aiohttp
+import yaml
+from aiohttp import web
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from src.services.batch_processor import BatchProcessor
+from src.services.live import LiveRaceMonitor, latency_summary
+from src.services.race_calendar import RaceCalendar
+from src.web.app import create_app
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_config():
+    """加载配置文件"""
+    with open('config/settings.yaml', 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+
+async def subscribe(url: str, latencies: List[float], stop: asyncio.Event):
+    """SSE 订阅者: 在接收端计算 页面更新 -> 收到推送 的延迟"""
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+        async with session.get(url) as response:
+            async for line in response.content:
+                if stop.is_set():
+                    break
+                if line.startswith(b'data: '):
+                    event = json.loads(line[6:])
+                    latencies.append(time.time() - event['changed_at'])
+                    logger.info(f"收到第 {event['race_no']} 场推送 ({event['type']}), "
+                                f"延迟 {latencies[-1] * 1000:.0f} ms")
+
+
+async def run(args, config):
+    live_config = dict(config.get('LIVE', {}))
+    web_config = config.get('WEB', {})
+    host, port = web_config.get('HOST', '127.0.0.1'), web_config.get('PORT', 8080)
+    runners = []
+
+    if args.replay:
+        # 本地回放服务器代替马会网站
+        from src.scripts.live_stub_server import RESULTS_PATH, create_stub_app, load_meeting
+        meetings = load_meeting(args.replay)
+        race_date = args.date or min(meetings)
+        races = meetings[race_date]
+        stub = web.AppRunner(create_stub_app(races, args.interval))
+        await stub.setup()
+        await web.TCPSite(stub, '127.0.0.1', args.stub_port).start()
+        runners.append(stub)
+        live_config['BASE_URL'] = f'http://127.0.0.1:{args.stub_port}{RESULTS_PATH}'
+        live_config['MAX_RACES'] = max(races)
+        args.date = race_date
+        args.racecourse = args.racecourse or races[min(races)][0].get('racecourse') or 'ST'
+
+    app = create_app(config)
+    calendar_config = config.get('CALENDAR') or {}
+    if not args.replay and calendar_config.get('ENABLED', True):
+        # 按赛马日历确定马场; 确定不是赛马日时不轮询
+        calendar = RaceCalendar(app['storage'], calendar_config)
+        race_date = args.date or datetime.now().strftime("%Y-%m-%d")
+        if calendar.is_non_meeting(race_date):
+            logger.warning(f"{race_date} 不是赛马日 (赛马日历), 不启动实时模式")
+            return
+        args.racecourse = args.racecourse or calendar.meeting_course(race_date)
+
+    server = web.AppRunner(app)
+    await server.setup()
+    await web.TCPSite(server, host, port).start()
+    runners.append(server)
+
+    stop = asyncio.Event()
+    # 与抓取相同的写入流程 (校验及隔离、预写日志、特征库及偏差立方体)
+    processor = BatchProcessor(None, app['storage'], config)
+    monitor = LiveRaceMonitor(app['storage'], app['broadcaster'], live_config, args.date, args.racecourse,
+                              processor=processor)
+    tasks = [asyncio.create_task(monitor.run(stop))]
+    latencies: List[float] = []
+    if args.replay:
+        tasks.append(asyncio.create_task(subscribe(f'http://{host}:{port}/api/live/stream', latencies, stop)))
+
+    try:
+        if args.duration:
+            await asyncio.sleep(args.duration)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        stop.set()
+        for task in tasks[1:]:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        print(f"轮询统计: {monitor.stats}")
+        report = app['broadcaster'].latency_report()
+        for stage in ('detect', 'ingest', 'deliver'):
+            print(f"服务端 {stage}: {report[stage]}")
+        if latencies:
+            print(f"订阅端 页面更新 -> 收到推送: {latency_summary(latencies)}")
+        for runner in reversed(runners):
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="赛马日实时模式 (轮询赛果并推送变更)")
+    parser.add_argument('--date', help="赛马日 YYYY-MM-DD, 默认为今日")
+    parser.add_argument('--racecourse', choices=['ST', 'HV'])
+    parser.add_argument('--duration', type=float, default=0, help="运行秒数, 0 表示一直运行")
+    parser.add_argument('--replay', help="以本地回放服务器回放导出的 JSONL 赛果 (测试用)")
+    parser.add_argument('--interval', type=float, default=10.0, help="回放时每场公布间隔 (秒)")
+    parser.add_argument('--stub-port', type=int, default=8090)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args, load_config()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from email.utils import formatdate
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+RESULTS_PATH = '/racing/information/Chinese/Racing/LocalResults.aspx'
+HORSE_PATH = '/racing/information/Chinese/Horse/Horse.aspx'
+
+_EMPTY_PAGE = "<html><body><div class='localResults'>沒有相關資料。</div></body></html>"
+
+
+def _rank_text(position) -> str:
+    position = int(position or 99)
+    return 'WV' if position >= 99 else str(position)
+
+
+def render_results_page(race_no: int, runners: List[Dict[str, Any]]) -> str:
+    """按赛果页面的结构渲染一场赛事 (与 parsing.parse_results_page 的选择器对应)"""
+    first = runners[0] if runners else {}
+    race_id = first.get('race_id') or race_no
+    race_class = first.get('race_class') or ''
+    class_text = f"第{'一二三四五'[int(race_class) - 1]}班" if race_class.isdigit() and 1 <= int(race_class) <= 5 else '其他'
+    escape = lambda value: html.escape(str(value if value is not None else ''))
+
+    rows = []
+    for runner in sorted(runners, key=lambda r: int(r.get('finish_position') or 99)):
+        cells = [escape(c) for c in (
+            runner.get('draw', 0),
+            _rank_text(runner.get('finish_position')),
+            f"{runner.get('horse_name', '')} ({runner.get('horse_no', '')})",
+            runner.get('jockey', ''),
+            runner.get('trainer', ''),
+            '', '', '', '', '',
+            runner.get('finish_time', ''),
+            runner.get('odds', ''),
+        )]
+        if runner.get('horse_page_id'):
+            # 马名链接到马匹资料页面 (HorseId)
+            cells[2] = f"<a href='{HORSE_PATH}?HorseId={escape(runner['horse_page_id'])}'>{cells[2]}</a>"
+        rows.append('<tr>' + ''.join(f'<td>{c}</td>' for c in cells) + '</tr>')
+
+    return (
+        "<html><body>"
+        "<div class='race_tab'><table><tbody>"
+        f"<tr><td class='f_title'>場次 {race_no} ({escape(race_id)})</td></tr>"
+        f"<tr><td>{class_text} - {escape(first.get('distance', 0))}米 - ({escape(race_class)})</td>"
+        f"<td>場地狀況 :</td><td>{escape(first.get('going', ''))}</td></tr>"
+        "</tbody></table></div>"
+        "<table class='table_bd draggable'>"
+        "<thead><tr class='bg_blue'><td>檔位</td><td>名次</td><td>馬名</td></tr></thead>"
+        f"<tbody>{''.join(rows)}</tbody></table>"
+        "</body></html>"
+    )
+
+
+def load_meeting(path: str) -> Dict[str, Dict[int, List[Dict[str, Any]]]]:
+    """读取导出的 JSONL 赛果 (export_data.py --format jsonl), 按 日期 -> 场次 分组"""
+    meetings: Dict[str, Dict[int, List[Dict[str, Any]]]] = defaultdict(lambda: defaultdict(list))
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                race_no = int(row.get('race_number') or row.get('race_id') or 0)
+                meetings[str(row['race_date'])[:10]][race_no].append(row)
+    return meetings
+
+
+class MeetingReplay:
+    """按时间逐场公布赛果的回放服务器
+
+    第 n 场在启动后 offset + n × interval 秒公布; 未公布的场次返回没有
+    赛果表格的页面。响应带 ETag / Last-Modified 及条件请求, X-Changed-At
+    为页面最近一次变化的时间, 供实时模式计算端到端延迟。
+    """
+
+    def __init__(self, races: Dict[int, List[Dict[str, Any]]], interval: float = 10.0, offset: float = 2.0):
+        self.races = races
+        self.interval = interval
+        self.started = time.time() + offset
+        self._pages: Dict[int, bytes] = {
+            race_no: render_results_page(race_no, runners).encode('utf-8')
+            for race_no, runners in races.items()
+        }
+        self._empty = _EMPTY_PAGE.encode('utf-8')
+        self.requests = 0
+
+    def released_at(self, race_no: int) -> float:
+        return self.started + (race_no - 1) * self.interval
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        try:
+            race_no = int(request.query.get('RaceNo', '1'))
+        except ValueError:
+            raise web.HTTPBadRequest()
+
+        now = time.time()
+        released = race_no in self._pages and now >= self.released_at(race_no)
+        body = self._pages[race_no] if released else self._empty
+        changed_at = self.released_at(race_no) if released else self.started
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        headers = {
+            'ETag': etag,
+            'Last-Modified': formatdate(changed_at, usegmt=True),
+            'X-Changed-At': f'{changed_at:.6f}',
+            'Cache-Control': 'no-cache',
+        }
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type='text/html', charset='utf-8', headers=headers)
+
+
+def create_stub_app(races: Dict[int, List[Dict[str, Any]]], interval: float = 10.0,
+                    offset: float = 2.0) -> web.Application:
+    replay = MeetingReplay(races, interval, offset)
+    app = web.Application()
+    app['replay'] = replay
+    app.router.add_get(RESULTS_PATH, replay.handle)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放一个赛马日的赛果页面 (供实时模式测试)")
+    parser.add_argument('records', help="导出的 JSONL 赛果")
+    parser.add_argument('--date', help="回放的日期, 默认为文件中的第一个赛马日")
+    parser.add_argument('--interval', type=float, default=10.0, help="每场公布间隔 (秒)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    args = parser.parse_args()
+
+    meetings = load_meeting(args.records)
+    race_date = args.date or min(meetings)
+    races = meetings[race_date]
+    print(f"回放 {race_date}: {len(races)} 场, 每 {args.interval:.0f} 秒公布一场")
+    web.run_app(create_stub_app(races, args.interval), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
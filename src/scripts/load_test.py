@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, List
+
+import aiohttp
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+DEFAULT_PATHS = [
+    '/api/jockeys',
+    '/api/trainers',
+    '/api/horses?limit=100',
+    '/api/races?limit=100',
+]
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+async def client(session: aiohttp.ClientSession, base_url: str, paths: List[str], deadline: float,
+                 latencies: List[float], stats: Dict[str, int], conditional: bool):
+    """单个客户端: 循环请求直到截止时间"""
+    etags: Dict[str, str] = {}
+    i = 0
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        headers = {'Accept-Encoding': 'gzip'}
+        if conditional and path in etags:
+            headers['If-None-Match'] = etags[path]
+        started = time.perf_counter()
+        try:
+            async with session.get(base_url + path, headers=headers) as response:
+                await response.read()
+                latencies.append((time.perf_counter() - started) * 1000)
+                stats[str(response.status)] = stats.get(str(response.status), 0) + 1
+                if 'ETag' in response.headers:
+                    etags[path] = response.headers['ETag']
+        except aiohttp.ClientError:
+            stats['error'] = stats.get('error', 0) + 1
+
+async def run(base_url: str, clients: int, duration: float, paths: List[str], conditional: bool):
+    latencies: List[float] = []
+    stats: Dict[str, int] = {}
+    deadline = time.monotonic() + duration
+    connector = aiohttp.TCPConnector(limit=clients)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*[
+            client(session, base_url, paths, deadline, latencies, stats, conditional)
+            for _ in range(clients)
+        ])
+
+    print(f"并发客户端: {clients}, 持续 {duration:.0f} 秒, 共 {len(latencies)} 个请求")
+    print(f"吞吐量: {len(latencies) / duration:.1f} 请求/秒")
+    print(f"状态码: {stats}")
+    for q in (50, 90, 99):
+        print(f"p{q}: {percentile(latencies, q):.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API 本地压力测试")
+    parser.add_argument('--url', default='http://127.0.0.1:8080', help="服务地址")
+    parser.add_argument('--clients', type=int, default=50, help="并发客户端数")
+    parser.add_argument('--duration', type=float, default=30, help="持续秒数")
+    parser.add_argument('--conditional', action='store_true', help="带 If-None-Match 重复请求")
+    parser.add_argument('paths', nargs='*', help="请求路径, 默认为各列表接口")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.clients, args.duration, args.paths or DEFAULT_PATHS, args.conditional))
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,11 @@
+import argparse
 import os
 import sys
 import logging
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.orm import sessionmaker
-import mysql.connector
 import yaml
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,9 +15,10 @@ def load_config():
     with open('config/settings.yaml', 'r', encoding='utf-8') as f:
         return yaml.safe_load(f)
 
-def create_mysql_database():
+def create_mysql_database(config):
     """创建 MySQL 数据库"""
-    config = load_config()['DATABASE']
+    import mysql.connector
+
     try:
         conn = mysql.connector.connect(
             host=config['HOST'],
@@ -25,11 +26,11 @@ def create_mysql_database():
             password=config['PASSWORD']
         )
         cursor = conn.cursor()
-        
+
         # 创建数据库
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {config['NAME']}")
-        logger.info(f"数据库 {config['NAME']} 创建成功")
-        
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {config['DATABASE']}")
+        logger.info(f"数据库 {config['DATABASE']} 创建成功")
+
     except Exception as e:
         logger.error(f"创建数据库失败: {e}")
         raise
@@ -37,38 +38,40 @@ def create_mysql_database():
         if 'conn' in locals():
             conn.close()
 
-def migrate_database():
-    """数据库迁移"""
+def migrate_database(reset: bool = False):
+    """数据库迁移
+
+    默认就地升级 (与 main.py migrate 相同): 补加新增的列、索引及唯一键,
+    并为旧记录补填代理键及完成时间, 可重复执行。reset 时删除全部表后重建。
+    """
     try:
-        # 加载配置
         config = load_config()['DATABASE']
-        
-        # 创建数据库
-        create_mysql_database()
-        
-        # 创建数据库连接
-        db_url = (f"mysql+mysqlconnector://{config['USER']}:{config['PASSWORD']}@"
-                 f"{config['HOST']}:{config['PORT']}/{config['NAME']}")
-        
-        engine = create_engine(db_url, echo=True)
-        
-        # 导入数据库模型
-        sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
-        from src.models.database import Base, RaceResult
-        
-        # 删除旧表
-        logger.info("正在删除旧表...")
-        Base.metadata.drop_all(engine)
-        
-        # 创建新表
-        logger.info("正在创建新表结构...")
-        Base.metadata.create_all(engine)
-        
-        logger.info("数据库迁移完成！")
-        
+        if config.get('TYPE', 'mysql') == 'mysql':
+            create_mysql_database(config)
+
+        from src.models.database import Base
+        from src.services.storage import DataStorage
+
+        if reset:
+            storage = DataStorage(config)
+            logger.info("正在删除旧表...")
+            Base.metadata.drop_all(storage.engine)
+            storage.close()
+
+        # 建立缺少的表, 再升级已存在的表
+        storage = DataStorage(config)
+        try:
+            result = storage.migrate()
+        finally:
+            storage.close()
+
+        logger.info(f"数据库迁移完成: {result}")
+
     except Exception as e:
         logger.error(f"数据库迁移失败: {e}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    migrate_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="数据库迁移")
+    parser.add_argument('--reset', action='store_true', help="删除全部表后重建 (会丢失数据)")
+    migrate_database(parser.parse_args().reset)
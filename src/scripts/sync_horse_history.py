@@ -0,0 +1,47 @@
+import argparse
+import logging
+import os
+import sys
+
+import yaml
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from src.horse_scraper import HorseRacingScraper
+from src.services.feature_store import HorseFeatureStore
+from src.services.horse_sync import HorseHistorySync
+from src.services.storage import DataStorage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def load_config():
+    """加载配置文件"""
+    with open('config/settings.yaml', 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="增量同步马匹往绩 (只处理上次同步后再有出赛的马匹)")
+    parser.add_argument('--since', help="只考虑此日期 (YYYY-MM-DD) 之后的赛果")
+    parser.add_argument('--horse', action='append', help="指定马匹烙号 (可重复), 不论是否到期")
+    parser.add_argument('--batch-size', type=int, default=200)
+    args = parser.parse_args()
+
+    config = load_config()
+    storage = DataStorage(config['DATABASE'])
+    # 往绩的评分及体重写入特征库 (评分走势、体重变化)
+    features_config = config.get('FEATURES') or {}
+    store = None
+    if features_config.get('PATH'):
+        store = HorseFeatureStore.load(features_config['PATH'], form_length=features_config.get('FORM_LENGTH', 6))
+    try:
+        sync = HorseHistorySync(storage, HorseRacingScraper(config), args.batch_size, feature_store=store)
+        stats = sync.sync(since=args.since, horse_codes=args.horse)
+        logger.info(f"同步统计: {stats}")
+        if store is not None:
+            store.save(features_config['PATH'])
+    finally:
+        storage.close()
+
+if __name__ == "__main__":
+    main()
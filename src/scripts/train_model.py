@@ -0,0 +1,58 @@
+import argparse
+import logging
+import os
+import sys
+
+import yaml
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from src.services.storage import DataStorage
+from src.services.training import ConditionalLogit, FeatureMatrix, build_feature_matrix, cross_validate
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def load_config():
+    """加载配置文件"""
+    with open('config/settings.yaml', 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="训练胜出概率模型")
+    parser.add_argument('--start', help="开始日期 YYYY-MM-DD (生成特征矩阵时必填)")
+    parser.add_argument('--end', help="结束日期 YYYY-MM-DD (生成特征矩阵时必填)")
+    parser.add_argument('--skip-build', action='store_true', help="沿用已生成的特征矩阵")
+    parser.add_argument('--folds', type=int, default=None, help="交叉验证折数, 0 表示不做")
+    args = parser.parse_args()
+    if not args.skip_build and not (args.start and args.end):
+        parser.error("生成特征矩阵需要 --start 及 --end (或以 --skip-build 沿用已生成的矩阵)")
+
+    config = load_config()
+    training = config.get('TRAINING', {})
+    matrix_dir = training.get('MATRIX_DIR', 'data/feature_matrix')
+    folds = args.folds if args.folds is not None else training.get('FOLDS', 5)
+    params = {
+        'epochs': training.get('EPOCHS', 5),
+        'learning_rate': training.get('LEARNING_RATE', 0.05),
+        'l2': training.get('L2', 1e-3),
+    }
+
+    if args.skip_build:
+        matrix = FeatureMatrix(matrix_dir)
+    else:
+        storage = DataStorage(config['DATABASE'])
+        try:
+            matrix = build_feature_matrix(storage, args.start, args.end, matrix_dir)
+        finally:
+            storage.close()
+
+    if folds > 1:
+        cross_validate(matrix_dir, folds=folds, max_workers=training.get('MAX_WORKERS'), **params)
+
+    model = ConditionalLogit(**params).fit(matrix)
+    model.save(training.get('MODEL_PATH', 'data/models/conditional_logit.npz'))
+    logger.info("模型训练完成")
+
+if __name__ == "__main__":
+    main()
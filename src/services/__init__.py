@@ -1,4 +1,15 @@
-from .scraper import RaceScraper
-from .analyzer import RaceAnalyzer
+import importlib
 
-__all__ = ['RaceScraper', 'RaceAnalyzer']
+# 按需导入: 导入 src.services 下的任何模块都不会连带加载 Playwright / pandas
+_EXPORTS = {
+    'RaceScraper': '.scraper',
+    'RaceAnalyzer': '.analyzer',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,10 +1,14 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional
 import pandas as pd
 import logging
 from dataclasses import dataclass
 
+from src.utils import metrics
+
 logger = logging.getLogger(__name__)
 
+KERNEL_SECONDS = metrics.histogram('analyzer_kernel_seconds', "分析各计算耗时 (秒)", ('kernel',))
+
 @dataclass
 class AnalysisResult:
     """分析结果数据结构"""
@@ -16,6 +20,70 @@ class AnalysisResult:
     avg_position: float
 
 class RaceAnalyzer:
+    def __init__(self, config: Optional[Dict] = None, dimensions=None):
+        self.config = config or {}
+        # DimensionRegistry: 以代理键分组, 显示时才换成名称
+        self.dimensions = dimensions
+
+    def _group_by_jockey(self, df: pd.DataFrame):
+        """按骑师分组: 有代理键时以整数 jockey_id 分组, 否则以 categorical 名称分组"""
+        from src.services.partitioned import has_jockey_ids
+
+        if has_jockey_ids(df):
+            df['jockey_id'] = pd.to_numeric(df['jockey_id'], errors='coerce')
+            df['jockey_id'] = df['jockey_id'].where(df['jockey_id'] >= 0)
+            return df.groupby('jockey_id')
+        df['jockey'] = df['jockey'].astype('category')
+        return df.groupby('jockey', observed=True)
+
+    def _with_jockey_names(self, df: pd.DataFrame, stats: pd.DataFrame) -> pd.DataFrame:
+        """分组结果的索引 (代理键或名称) 换成 jockey 名称列"""
+        if stats.index.name != 'jockey_id':
+            return stats.reset_index()
+        from src.services.partitioned import jockey_index
+
+        _, names = jockey_index(df, self.dimensions)
+        ids = stats.index.astype(int).tolist()
+        stats = stats.reset_index(drop=True)
+        stats.insert(0, 'jockey', [names.get(i, '') for i in ids])
+        return stats
+
+    @KERNEL_SECONDS.timed(kernel='analyze_partitioned')
+    def analyze_partitioned(self, race_data: List[Any], partition_by: Optional[str] = None,
+                            max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """按马季/月份分区并行分析多季数据"""
+        from src.services.partitioned import PartitionedExecutor
+
+        try:
+            if isinstance(race_data, pd.DataFrame):
+                df = race_data
+            else:
+                df = pd.DataFrame([
+                    race if isinstance(race, dict) else {
+                        'race_date': race.race_date,
+                        'jockey': race.jockey,
+                        'jockey_id': getattr(race, 'jockey_id', None),
+                        'finish_position': race.finish_position,
+                        'odds': race.odds
+                    }
+                    for race in race_data
+                ])
+            if df.empty:
+                return {}
+
+            executor = PartitionedExecutor(
+                partition_by=partition_by or self.config.get('PARTITION_BY', 'season'),
+                max_workers=max_workers or self.config.get('MAX_WORKERS'),
+                dimensions=self.dimensions
+            )
+            return executor.run(df)
+
+        except Exception as e:
+            logger.error(f"分区分析出错: {e}")
+            logger.exception(e)
+            return {}
+
+    @KERNEL_SECONDS.timed(kernel='analyze_races')
     def analyze_races(self, race_data: List[Any]) -> List[Dict[str, Any]]:
         """分析赛事数据"""
         try:
@@ -28,31 +96,29 @@ class RaceAnalyzer:
                 data.append({
                     'race_date': race.race_date,
                     'jockey': race.jockey,
+                    'jockey_id': getattr(race, 'jockey_id', None),
                     'race_id': race.race_id,
                     'finish_position': race.finish_position
                 })
             
             logger.info(f"转换后数据条数: {len(data)}")
             
-            # 转换为 DataFrame
+            # 转换为 DataFrame, 骑师以代理键 (整数) 分组
             df = pd.DataFrame(data)
-            logger.info(f"唯一骑师数量: {df['jockey'].nunique()}")
+            df['win'] = df['finish_position'] == 1
+            grouped = self._group_by_jockey(df)
+            logger.info(f"唯一骑师数量: {grouped.ngroups}")
             
             # 按骑师分组分析
-            jockey_stats = df.groupby('jockey').agg({
-                'race_id': 'count',  # 总赛事数
-                'finish_position': ['mean', lambda x: (x == 1).mean() * 100]  # 平均名次和胜率
+            jockey_stats = pd.DataFrame({
+                'total_races': grouped['race_id'].count(),  # 总赛事数
+                'avg_position': grouped['finish_position'].mean(),  # 平均名次
+                'win_rate': grouped['win'].mean() * 100,  # 胜率
+                'wins': grouped['win'].sum()  # 胜场数
             }).round(2)
             
-            # 重命名列
-            jockey_stats.columns = ['total_races', 'avg_position', 'win_rate']
-            
-            # 计算胜场数
-            wins = df[df['finish_position'] == 1]['jockey'].value_counts()
-            jockey_stats['wins'] = wins
-            
-            # 重置索引
-            jockey_stats = jockey_stats.reset_index()
+            # 代理键换成骑师名称
+            jockey_stats = self._with_jockey_names(df, jockey_stats)
             
             # 转换为字典列表
             results = []
@@ -75,6 +141,19 @@ class RaceAnalyzer:
             logger.exception(e)  # 打印详细错误信息
             return [] 
 
+    @KERNEL_SECONDS.timed(kernel='analyze_yearly_stats_chunked')
+    def analyze_yearly_stats_chunked(self, chunks: Iterable[pd.DataFrame]) -> Dict[str, Any]:
+        """逐块累加的年度统计 (与 analyze_yearly_stats 相同口径), 内存不随日期范围增长"""
+        from src.services.chunked_stats import yearly_stats_from_chunks
+
+        try:
+            return yearly_stats_from_chunks(chunks, relative_accuracy=self.config.get('QUANTILE_ACCURACY', 0.01),
+                                            dimensions=self.dimensions)
+        except Exception as e:
+            logger.error(f"年度统计分析出错: {e}")
+            return {}
+
+    @KERNEL_SECONDS.timed(kernel='analyze_yearly_stats')
     def analyze_yearly_stats(self, all_results: List[Dict]) -> Dict[str, Any]:
         """分析年度统计数据"""
         try:
@@ -83,15 +162,18 @@ class RaceAnalyzer:
             # 确保赔率列为数值类型
             df['odds'] = pd.to_numeric(df['odds'], errors='coerce')
             
+            # 骑师以代理键 (或 categorical) 分组, 避免对字符串列做哈希
+            df['win'] = df['finish_position'] == 1
+            grouped = self._group_by_jockey(df)
+            
             # 骑师基础统计
-            jockey_stats = df.groupby('jockey').agg({
-                'race_id': 'count',  # 总赛事
-                'finish_position': ['mean', lambda x: (x == 1).sum(), lambda x: (x == 1).mean() * 100]
+            jockey_stats = pd.DataFrame({
+                'total_races': grouped['race_id'].count(),  # 总赛事
+                'avg_position': grouped['finish_position'].mean(),
+                'total_wins': grouped['win'].sum(),
+                'win_rate': grouped['win'].mean() * 100
             }).round(2)
-            
-            # 重命名列
-            jockey_stats.columns = ['total_races', 'avg_position', 'total_wins', 'win_rate']
-            jockey_stats = jockey_stats.reset_index()
+            jockey_stats = self._with_jockey_names(df, jockey_stats)
             
             # 计算赔率分析
             odds_analysis = {
@@ -113,14 +195,13 @@ class RaceAnalyzer:
             }
             
             # 骑师赔率分析
-            jockey_odds = df.groupby('jockey').agg({
-                'odds': ['mean', 'min', 'max'],
-                'finish_position': lambda x: (x == 1).mean() * 100
+            jockey_odds = pd.DataFrame({
+                'mean': grouped['odds'].mean(),
+                'min': grouped['odds'].min(),
+                'max': grouped['odds'].max(),
+                'win_rate': grouped['win'].mean() * 100
             }).round(2)
-            
-            # 重置索引并重命名列
-            jockey_odds.columns = ['mean', 'min', 'max', 'win_rate'] 
-            jockey_odds = jockey_odds.reset_index()
+            jockey_odds = self._with_jockey_names(df, jockey_odds)
             
             odds_analysis['jockey_odds'] = jockey_odds.to_dict('records')
             
@@ -128,7 +209,7 @@ class RaceAnalyzer:
                 'summary': {
                     'total_races': len(df),
                     'total_race_days': df['race_date'].nunique(),
-                    'active_jockeys': df['jockey'].nunique(),
+                    'active_jockeys': grouped.ngroups,
                     'avg_races_per_day': round(len(df) / df['race_date'].nunique(), 2),
                     'avg_odds': odds_analysis['overall']['avg_odds'],
                     'avg_winning_odds': odds_analysis['winners']['avg_winning_odds']
@@ -0,0 +1,224 @@
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.services.preprocessor import RaceDataPreprocessor
+from src.services.race_calendar import RaceCalendar
+from src.services.storage import DataStorage
+from src.utils import metrics
+from src.utils.logger import setup_logger
+from src.utils.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+CLIENTS = ('browser', 'http')
+
+
+def build_units(start_date: str, end_date: str, racecourses: List[str],
+                calendar: Optional[RaceCalendar] = None) -> List[Tuple[str, str]]:
+    """日期范围 × 马场 的工作单元; 有赛马日历时只含已知或预测的赛马日及其马场"""
+    if calendar is not None:
+        return [(race_date, course) for race_date, courses in calendar.plan(start_date, end_date, racecourses)
+                for course in courses]
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    units = []
+    current = start
+    while current <= end:
+        units.extend((current.strftime("%Y-%m-%d"), course) for course in racecourses)
+        current += timedelta(days=1)
+    return units
+
+
+def _make_scraper(config: Dict, client: str, rate_limiter: RateLimiter):
+    if client == 'http':
+        from src.services.http_scraper import HttpRaceScraper
+        return HttpRaceScraper(config['SCRAPER'], rate_limiter)
+    from src.services.scraper import RaceScraper
+    return RaceScraper(config['SCRAPER'], rate_limiter)
+
+
+class BackfillWorker:
+    """回填工作进程: 反复领取工作单元直至全部完成
+
+    领取单元时设定租约, 处理期间定期续租; 进程崩溃后租约过期, 单元由其他
+    进程重新领取。其他进程仍持有租约时等待, 以便接手过期的单元。
+    """
+
+    def __init__(self, config: Dict, job: str, worker_id: int = 0, client: str = 'browser',
+                 pages_per_second: float = 0):
+        settings = config.get('BACKFILL') or {}
+        self.config = config
+        self.job = job
+        self.client = client
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{worker_id}"
+        self.lease_seconds = settings.get('LEASE_SECONDS', 300)
+        self.max_attempts = settings.get('MAX_ATTEMPTS', 3)
+        self.rate_limiter = RateLimiter(pages_per_second)
+        self.worker_id = worker_id
+        self.stats = {'units': 0, 'records': 0, 'skipped': 0, 'errors': 0, 'quarantined': 0}
+        validation_config = config.get('VALIDATION') or {}
+        self.preprocessor = RaceDataPreprocessor(validation_config) if validation_config.get('ENABLED', True) else None
+
+    async def _start_metrics_server(self):
+        """各工作进程的指标端点依次使用 METRICS.PORT 之后的端口"""
+        metrics_config = self.config.get('METRICS') or {}
+        if not metrics.REGISTRY.enabled or not metrics_config.get('PORT'):
+            return None
+        return await metrics.start_metrics_server(
+            metrics_config.get('HOST', '127.0.0.1'), metrics_config['PORT'] + 1 + self.worker_id
+        )
+
+    async def run(self) -> Dict[str, int]:
+        metrics_server = await self._start_metrics_server()
+        storage = DataStorage(self.config['DATABASE'])
+        scraper = _make_scraper(self.config, self.client, self.rate_limiter)
+        await scraper.init()
+        try:
+            while True:
+                units = await asyncio.to_thread(
+                    storage.claim_work_units, self.job, self.owner, self.lease_seconds
+                )
+                if units:
+                    await self._process(storage, scraper, units[0])
+                    continue
+                progress = await asyncio.to_thread(storage.work_unit_progress, self.job)
+                if not progress['leased']:
+                    break
+                # 其余单元由其他进程处理中, 租约过期后可接手
+                await asyncio.sleep(min(self.lease_seconds / 4, 15))
+        finally:
+            await scraper.close()
+            storage.close()
+            if metrics_server is not None:
+                await metrics_server.cleanup()
+        logger.info(f"工作进程 {self.owner} 完成: {self.stats}")
+        return self.stats
+
+    async def _renew(self, storage: DataStorage, unit_id: int):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await asyncio.to_thread(storage.renew_work_unit, unit_id, self.owner, self.lease_seconds):
+                logger.warning(f"工作单元 {unit_id} 的租约已被其他进程接手")
+                return
+
+    async def _process(self, storage: DataStorage, scraper, unit: Dict[str, Any]):
+        race_date, racecourse = unit['race_date'], unit['racecourse']
+        renew = asyncio.create_task(self._renew(storage, unit['id']))
+        try:
+            existing = await asyncio.to_thread(storage.count_race_results, race_date, racecourse)
+            if existing:
+                self.stats['skipped'] += 1
+                records = existing
+            else:
+                race_data = await scraper.scrape_single_date(race_date.replace('-', '/'), racecourse)
+                for item in race_data:
+                    item['race_date'] = race_date
+                if race_data and self.preprocessor is not None:
+                    race_data, rejects = self.preprocessor.process_batch(race_data)
+                    if rejects:
+                        await asyncio.to_thread(storage.save_quarantine, rejects)
+                        self.stats['quarantined'] += len(rejects)
+                if race_data:
+                    await asyncio.to_thread(storage.save_changed_races, race_data)
+                records = len(race_data)
+                self.stats['records'] += records
+            self.stats['units'] += 1
+            await asyncio.to_thread(storage.finish_work_unit, unit['id'], self.owner, records)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"处理 {race_date} {racecourse} 时出错: {e}")
+            await asyncio.to_thread(storage.finish_work_unit, unit['id'], self.owner, 0, str(e),
+                                    self.max_attempts)
+        finally:
+            renew.cancel()
+
+
+def _worker_main(config: Dict, job: str, worker_id: int, client: str, pages_per_second: float) -> Dict[str, int]:
+    """工作进程入口"""
+    # 工作进程只输出到控制台 (继承自协调进程), 避免多个进程写同一日志文件
+    setup_logger(dict(config.get('LOGGER') or {}, FILE_PATH=None,
+                      FORMAT='%(asctime)s - %(processName)s - %(levelname)s - %(message)s'))
+    metrics.REGISTRY.configure(config.get('METRICS'))
+    stats = asyncio.run(BackfillWorker(config, job, worker_id, client, pages_per_second).run())
+    if metrics.REGISTRY.enabled:
+        stats['metrics'] = metrics.REGISTRY.summary()
+    return stats
+
+
+class ShardedBackfill:
+    """多进程分片回填
+
+    日期范围按 (日期, 马场) 拆分为工作单元登记在 work_units 表, N 个进程
+    各自持有浏览器或 HTTP 客户端并行领取。总请求速率受 MAX_PAGES_PER_SECOND
+    限制, 平均分配给各进程。同一任务名重复运行时只处理未完成的单元。
+    """
+
+    def __init__(self, config: Dict, workers: Optional[int] = None, client: Optional[str] = None):
+        settings = config.get('BACKFILL') or {}
+        self.config = config
+        self.workers = workers or settings.get('WORKERS', 4)
+        self.client = client or settings.get('CLIENT', 'browser')
+        if self.client not in CLIENTS:
+            raise ValueError(f"不支持的抓取方式: {self.client}")
+        self.max_pages_per_second = settings.get('MAX_PAGES_PER_SECOND', 0)
+        self.progress_interval = settings.get('PROGRESS_INTERVAL', 30)
+        courses = [c['code'] for c in config['SCRAPER'].get('RACECOURSES', []) if c.get('code')]
+        self.racecourses = courses or ['ST']
+        self.worker_metrics: List[Dict[str, Any]] = []
+
+    def run(self, start_date: str, end_date: str, job: Optional[str] = None) -> Dict[str, int]:
+        job = job or f"backfill:{start_date}:{end_date}"
+        storage = DataStorage(self.config['DATABASE'])
+        try:
+            calendar_config = self.config.get('CALENDAR') or {}
+            calendar = RaceCalendar(storage, calendar_config) if calendar_config.get('ENABLED', True) else None
+            total = storage.seed_work_units(job, build_units(start_date, end_date, self.racecourses, calendar))
+            rate = self.max_pages_per_second / self.workers if self.max_pages_per_second else 0
+            logger.info(f"分片回填 {job}: {total} 个单元, {self.workers} 个进程 ({self.client}), "
+                        f"每进程 {rate or '不限'} 页/秒")
+
+            context = multiprocessing.get_context('spawn')
+            with concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+                futures = [
+                    pool.submit(_worker_main, self.config, job, i, self.client, rate)
+                    for i in range(self.workers)
+                ]
+                pending = set(futures)
+                while pending:
+                    _, pending = concurrent.futures.wait(pending, timeout=self.progress_interval)
+                    logger.info(f"回填进度: {storage.work_unit_progress(job)}")
+                for future in futures:
+                    try:
+                        result = future.result()
+                        if 'metrics' in result:
+                            self.worker_metrics.append(result['metrics'])
+                    except Exception as e:
+                        logger.error(f"工作进程异常退出: {e}")
+
+            progress = storage.work_unit_progress(job)
+            logger.info(f"分片回填完成: {progress}")
+            if calendar is not None:
+                calendar.learn(start_date, end_date)
+            quarantined = storage.quarantine_counts(start_date, end_date)
+            if quarantined:
+                logger.info(f"隔离记录 (按原因): {quarantined}")
+            self._update_precomputed(storage, start_date, end_date)
+            return progress
+        finally:
+            storage.close()
+
+    def _update_precomputed(self, storage: DataStorage, start_date: str, end_date: str):
+        """工作进程只写数据库; 特征库及偏差立方体在此统一按日期顺序更新"""
+        if not (self.config.get('FEATURES') or {}).get('PATH') and not (self.config.get('CUBE') or {}).get('PATH'):
+            return
+        from src.services.batch_processor import BatchProcessor
+
+        rows = [row for chunk in storage.iter_table('race_results', start_date=start_date, end_date=end_date)
+                for row in chunk]
+        BatchProcessor(None, storage, self.config).ingest_precomputed(rows)
@@ -0,0 +1,170 @@
+import itertools
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 策略参数及默认值 (-1 / 0 表示不限)
+STRATEGY_PARAMS = {
+    'odds_min': 1.0,
+    'odds_max': 999.0,
+    'max_favourite_rank': 0,   # 只投注热门排名在此之内的马, 0 = 不限
+    'jockey_id': -1,
+    'trainer_id': -1,
+    'kelly_fraction': 0.0,     # 0 = 每注 1 单位平注, >0 = 按胜出概率的分数凯利
+}
+
+
+def strategy_grid(**params: Sequence) -> pd.DataFrame:
+    """参数网格的笛卡尔积, 例如 strategy_grid(odds_min=[2, 3], kelly_fraction=[0, 0.25])"""
+    unknown = set(params) - set(STRATEGY_PARAMS)
+    if unknown:
+        raise ValueError(f"未知的策略参数: {sorted(unknown)}")
+    names = list(STRATEGY_PARAMS)
+    values = [list(params.get(name, [STRATEGY_PARAMS[name]])) for name in names]
+    return pd.DataFrame(list(itertools.product(*values)), columns=names)
+
+
+# 决定投注哪些出赛马的参数 (凯利分数只影响注码)
+SELECTION_PARAMS = ['jockey_id', 'trainer_id', 'max_favourite_rank', 'odds_min', 'odds_max']
+
+METRIC_NAMES = ('bets', 'wins', 'staked', 'profit', 'max_drawdown')
+
+
+class Backtester:
+    """向量化投注策略回测
+
+    历史赛果按 (日期, 场次) 排列成一维数组。策略按投注条件分组, 每组只求一次
+    入选出赛马的下标 (骑师/练马师先按索引取出, 再按热门排名与赔率区间筛选),
+    只在这些下标上汇总盈亏, 回撤由逐注累计盈亏在每场最后一注处的取值求出。
+    凯利注码与凯利分数成正比, 同组策略共用一次计算再按分数缩放。
+    """
+
+    def __init__(self, history: pd.DataFrame):
+        df = history.copy()
+        df['odds'] = pd.to_numeric(df['odds'], errors='coerce')
+        df = df[df['odds'] > 1].sort_values(['race_date', 'race_id'], kind='stable')
+        df = df.reset_index(drop=True)
+
+        race_key = df['race_date'].astype(str) + '|' + df['race_id'].astype(str)
+        new_race = (race_key != race_key.shift()).to_numpy()
+        self.race_starts = np.flatnonzero(new_race)
+        self.race_index = np.cumsum(new_race) - 1
+        self.odds = df['odds'].to_numpy(dtype=np.float32)
+        self.won = (df['finish_position'] == 1).to_numpy()
+        self.favourite_rank = df.groupby(race_key, sort=False)['odds'].rank(method='first').to_numpy(dtype=np.int16)
+        self.jockey = df['jockey_id'].fillna(-2).to_numpy(dtype=np.int32) if 'jockey_id' in df else \
+            np.full(len(df), -2, dtype=np.int32)
+        self.trainer = df['trainer_id'].fillna(-2).to_numpy(dtype=np.int32) if 'trainer_id' in df else \
+            np.full(len(df), -2, dtype=np.int32)
+
+        # 凯利注码需要胜出概率, 没有模型概率时只能平注
+        if 'win_prob' in df:
+            prob = df['win_prob'].to_numpy(dtype=np.float32)
+            edge = (prob * self.odds - 1) / (self.odds - 1)
+            self.kelly = np.clip(edge, 0, None).astype(np.float64)
+        else:
+            self.kelly = None
+        self.payout = np.where(self.won, self.odds - 1, -1).astype(np.float64)
+        self._all = np.arange(len(df))
+        self._index = {}
+        logger.info(f"回测数据: {len(df)} 匹出赛马, {len(self.race_starts)} 场赛事")
+
+    def run(self, strategies: pd.DataFrame) -> pd.DataFrame:
+        """回测全部策略, 返回每个策略的 ROI / 回撤 / 命中率"""
+        params = pd.DataFrame({
+            name: strategies[name].to_numpy() if name in strategies else np.full(len(strategies), default)
+            for name, default in STRATEGY_PARAMS.items()
+        })
+        fractions = params['kelly_fraction'].to_numpy(dtype=np.float64)
+        if self.kelly is None and np.any(fractions > 0):
+            logger.warning("历史数据没有 win_prob 列, 凯利策略将不会下注")
+
+        metrics = {name: np.zeros(len(strategies)) for name in METRIC_NAMES}
+        candidates = {}
+        for key, rows in params.groupby(SELECTION_PARAMS, sort=False).indices.items():
+            jockey_id, trainer_id, max_rank, odds_min, odds_max = key
+            base = (jockey_id, trainer_id, max_rank)
+            if base not in candidates:
+                candidates[base] = self._candidates(jockey_id, trainer_id, max_rank)
+            selected = candidates[base]
+            odds = self.odds[selected]
+            selected = selected[(odds >= odds_min) & (odds <= odds_max)]
+
+            flat_rows = rows[fractions[rows] <= 0]
+            if len(flat_rows):
+                for name, value in zip(METRIC_NAMES, self._summarise(selected, None)):
+                    metrics[name][flat_rows] = value
+            kelly_rows = rows[fractions[rows] > 0]
+            if len(kelly_rows) and self.kelly is not None:
+                bets, wins, staked, profit, drawdown = self._summarise(selected, self.kelly[selected])
+                scale = fractions[kelly_rows]
+                metrics['bets'][kelly_rows] = bets
+                metrics['wins'][kelly_rows] = wins
+                metrics['staked'][kelly_rows] = staked * scale
+                metrics['profit'][kelly_rows] = profit * scale
+                metrics['max_drawdown'][kelly_rows] = drawdown * scale
+
+        result = strategies.reset_index(drop=True).copy()
+        for name, values in metrics.items():
+            result[name] = values
+        staked = result['staked'].replace(0, np.nan)
+        result['roi'] = (result['profit'] / staked * 100).fillna(0).round(2)
+        result['hit_rate'] = (result['wins'] / result['bets'].replace(0, np.nan) * 100).fillna(0).round(2)
+        return result
+
+    def _candidates(self, jockey_id: int, trainer_id: int, max_rank: int) -> np.ndarray:
+        """符合骑师 / 练马师 / 热门排名条件的出赛马下标 (按赛事顺序)"""
+        if jockey_id >= 0:
+            selected = self._index_of('jockey', self.jockey).get(jockey_id, self._all[:0])
+            if trainer_id >= 0:
+                selected = selected[self.trainer[selected] == trainer_id]
+        elif trainer_id >= 0:
+            selected = self._index_of('trainer', self.trainer).get(trainer_id, self._all[:0])
+        else:
+            selected = self._all
+        if max_rank > 0:
+            selected = selected[self.favourite_rank[selected] <= max_rank]
+        return selected
+
+    def _index_of(self, name: str, values: np.ndarray) -> Dict[int, np.ndarray]:
+        """{id: 出赛马下标}, 首次用到时建立"""
+        if name not in self._index:
+            order = np.argsort(values, kind='stable')
+            keys, starts = np.unique(values[order], return_index=True)
+            self._index[name] = dict(zip(keys.tolist(), np.split(order, starts[1:])))
+        return self._index[name]
+
+    def _summarise(self, selected: np.ndarray, stake: Optional[np.ndarray]):
+        """入选出赛马的 (投注数, 胜出数, 总注码, 盈亏, 最大回撤); stake 为空时每注 1 单位"""
+        if len(selected) == 0:
+            return 0, 0, 0.0, 0.0, 0.0
+        won = self.won[selected]
+        if stake is None:
+            profit = self.payout[selected]
+            bets, wins, staked = len(selected), int(won.sum()), float(len(selected))
+        else:
+            profit = stake * self.payout[selected]
+            placed = stake > 0
+            bets, wins, staked = int(placed.sum()), int((placed & won).sum()), float(stake.sum())
+
+        # 没有投注的场次不改变资金, 只需取每场最后一注后的累计盈亏
+        equity = np.cumsum(profit)
+        races = self.race_index[selected]
+        equity = equity[np.append(races[1:] != races[:-1], True)]
+        peak = np.maximum.accumulate(np.maximum(equity, 0))
+        return bets, wins, staked, float(equity[-1]), float((peak - equity).max())
+
+
+def run_backtest(storage, start_date: str, end_date: str, strategies: pd.DataFrame,
+                 win_prob: Optional[pd.Series] = None) -> pd.DataFrame:
+    """从数据库读取历史赛果并回测"""
+    history = storage.get_race_frame(start_date, end_date, columns=[
+        'race_id', 'race_date', 'finish_position', 'odds', 'jockey_id', 'trainer_id'
+    ])
+    if win_prob is not None:
+        history['win_prob'] = win_prob.to_numpy()
+    return Backtester(history).run(strategies)
@@ -1,13 +1,26 @@
 import asyncio
-from typing import List, Dict
+import threading
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import logging
 from tqdm import tqdm
 from src.services.scraper import RaceScraper
 from src.services.storage import DataStorage
+from src.services.feature_store import HorseFeatureStore
+from src.services.bias_cube import BiasCube
+from src.services.preprocessor import RaceDataPreprocessor
+from src.services.race_calendar import RaceCalendar
+from src.services.spool import SpoolReplayer, WriteAheadSpool
+from src.utils.exceptions import SpoolBusyError
+from src.utils import metrics
 
 logger = logging.getLogger(__name__)
 
+QUEUE_DEPTH = metrics.gauge('batch_queue_depth', "等待处理的日期数")
+IN_FLIGHT = metrics.gauge('batch_in_flight', "正在处理的日期数 (并发)")
+DATES = metrics.counter('batch_dates_total', "处理的日期数", ('outcome',))
+DATE_SECONDS = metrics.histogram('batch_date_seconds', "单个日期抓取及保存耗时 (秒)")
+
 class BatchProcessor:
     def __init__(self, scraper: RaceScraper, storage: DataStorage, config: Dict):
         self.scraper = scraper
@@ -16,10 +29,81 @@ class BatchProcessor:
         self.logger = logging.getLogger(__name__)
         self.max_concurrent = config.get('MAX_CONCURRENT', 5)  # 最大并发数
         
+        # 马匹特征库 (可选), 每批处理完成后按日期顺序增量更新
+        features_config = config.get('FEATURES') or {}
+        self.feature_store_path = features_config.get('PATH')
+        self.feature_store = None
+        if self.feature_store_path:
+            self.feature_store = HorseFeatureStore.load(
+                self.feature_store_path,
+                form_length=features_config.get('FORM_LENGTH', 6)
+            )
+        
+        # 偏差立方体 (可选), 按赛马日增量更新
+        self.cube_path = (config.get('CUBE') or {}).get('PATH')
+        self.cube = BiasCube.load(self.cube_path) if self.cube_path else None
+        self._ingested: List[Dict] = []
+        self._ingested_lock = threading.Lock()  # 回放线程亦会写入
+        
+        # 入库前的整批校验, 拒收的记录写入隔离表
+        validation_config = config.get('VALIDATION') or {}
+        self.preprocessor = RaceDataPreprocessor(validation_config) if validation_config.get('ENABLED', True) else None
+        self.quarantined = 0
+        # 本次运行中内容有变化的场次 (save_changed_races 返回的事件)
+        self.change_events: List[Dict] = []
+        
+        # 赛马日历: 只抓取已知或预测的赛马日, 并只尝试当日的马场
+        calendar_config = config.get('CALENDAR') or {}
+        self.calendar = None
+        if storage is not None and calendar_config.get('ENABLED', True):
+            self.calendar = RaceCalendar(storage, calendar_config)
+        self._courses: Dict[str, List[str]] = {}
+        
+        # 预写日志 (可选): 抓取结果先落盘, 由回放任务批量入库, 抓取不受数据库可用性影响
+        spool_config = config.get('SPOOL') or {}
+        self.spool = None
+        if storage is not None:
+            try:
+                self.spool = WriteAheadSpool.from_config(spool_config)
+            except SpoolBusyError as e:
+                logger.warning(f"{e}, 本次直接写入数据库")
+        self.replayer = None
+        self._replay_stop = None
+        self._replay_task = None
+        self.spooled = 0   # 写入预写日志的记录数
+        self.spooled_dates = 0
+        self.replayed = 0  # 回放后实际入库 (内容有变化) 的记录数
+        if self.spool is not None:
+            self.replay_interval = spool_config.get('REPLAY_INTERVAL', 2.0)
+            self.replayer = SpoolReplayer(self.spool, storage, spool_config.get('REPLAY_BATCH_ROWS', 20000),
+                                          on_saved=self._on_replayed)
+        
     async def process_date_range(self, start_date: str, end_date: str):
-        """并发处理日期范围内的数据"""
-        dates = self._generate_dates(start_date, end_date)
+        """并发处理日期范围内的数据 (按赛马日历跳过非赛马日)"""
+        if self.calendar is None:
+            await self.process_dates(self._generate_dates(start_date, end_date))
+            return
+        plan = self.calendar.plan(start_date, end_date, self._racecourses())
+        self._courses.update(plan)
+        await self.process_dates([race_date for race_date, _ in plan])
+        # 以本次入库的赛果更新日历
+        self.calendar.learn(start_date, end_date)
+
+    def _racecourses(self) -> List[str]:
+        scraper_config = self.config.get('SCRAPER') or getattr(self.scraper, 'config', None) or {}
+        return [c['code'] for c in scraper_config.get('RACECOURSES', []) if c.get('code')] or ['ST']
+
+    async def reverify(self, dates: List[str]) -> List[Dict]:
+        """重抓已入库的日期并与场次摘要比较, 只写入有变化的场次; 返回变化事件"""
+        start = len(self.change_events)
+        await self.process_dates(dates, force=True)
+        return self.change_events[start:]
+
+    async def process_dates(self, dates: List[str], force: bool = False):
+        """并发处理给定日期; force 时不跳过已入库的日期"""
         total_dates = len(dates)
+        if not total_dates:
+            return
         
         # 创建进度条
         pbar = tqdm(
@@ -31,11 +115,16 @@ class BatchProcessor:
         
         # 创建信号量控制并发
         semaphore = asyncio.Semaphore(self.max_concurrent)
+        QUEUE_DEPTH.inc(total_dates)
+        spooled, spooled_dates, replayed = self.spooled, self.spooled_dates, self.replayed
+        
+        # 回放任务与抓取并行
+        self.start_replay()
         
         # 创建所有任务
         tasks = []
         for date in dates:
-            task = self._process_single_date(date, semaphore, pbar)
+            task = self._process_single_date(date, semaphore, pbar, force)
             tasks.append(task)
         
         # 并发执行任务
@@ -54,18 +143,60 @@ class BatchProcessor:
         # 关闭进度条
         pbar.close()
         
+        # 回放剩余的预写日志
+        if await self.finish_replay():
+            # 已落盘的日期算作成功, 记录只计回放后已提交的
+            success_dates += self.spooled_dates - spooled_dates
+            total_records += self.replayed - replayed
+        
+        # 更新特征库及偏差立方体
+        self._update_precomputed()
+        
         # 显示统计信息
         logger.info(f"\n批次处理完成:")
         logger.info(f"- 总天数: {total_dates}")
         logger.info(f"- 成功天数: {success_dates}")
         logger.info(f"- 获取记录: {total_records}")
+        if self.spooled > spooled:
+            logger.info(f"- 写入预写日志: {self.spooled - spooled} (回放入库 {self.replayed - replayed})")
+        if self.quarantined:
+            logger.info(f"- 隔离记录: {self.quarantined}")
         logger.info(f"- 成功率: {(success_dates/total_dates*100):.1f}%")
+        if force:
+            logger.info(f"- 有变化的场次: {len(self.change_events)}")
         
-    async def _process_single_date(self, date: str, semaphore: asyncio.Semaphore, pbar: tqdm) -> int:
+    def start_replay(self):
+        """启用预写日志时在后台定期回放 (须在事件循环中调用)"""
+        if self.replayer is not None and self._replay_task is None:
+            self._replay_stop = asyncio.Event()
+            self._replay_task = asyncio.create_task(self.replayer.run(self._replay_stop, self.replay_interval))
+
+    async def finish_replay(self) -> bool:
+        """停止后台回放并回放剩余的记录; 未启用预写日志时返回 False"""
+        if self._replay_task is None:
+            return False
+        self._replay_stop.set()
+        await self._replay_task
+        self._replay_task = None
+        await asyncio.to_thread(self.replayer.replay_once)
+        if self.spool.pending_bytes():
+            self.spool.seal()
+            pending = self.spool.segments()
+            logger.warning(f"数据库暂不可用, {len(pending)} 个预写日志分段待回放 (下次运行或 main.py replay)")
+        return True
+
+    async def _process_single_date(self, date: str, semaphore: asyncio.Semaphore, pbar: tqdm,
+                                   force: bool = False) -> int:
         """处理单个日期的数据"""
         try:
             async with semaphore:
-                result = await self._fetch_and_save_data(date)
+                QUEUE_DEPTH.dec()
+                IN_FLIGHT.inc()
+                try:
+                    with DATE_SECONDS.time():
+                        result = await self._fetch_and_save_data(date, force)
+                finally:
+                    IN_FLIGHT.dec()
                 pbar.update(1)  # 更新进度条
                 if result > 0:
                     pbar.set_postfix({"最新": date, "记录": result})
@@ -75,27 +206,120 @@ class BatchProcessor:
             pbar.update(1)  # 即使出错也更新进度
             return 0
             
-    async def _fetch_and_save_data(self, date: str) -> int:
-        """获取并保存数据"""
+    async def _fetch_and_save_data(self, date: str, force: bool = False) -> int:
+        """获取并保存数据 (只写入内容有变化的场次), 返回写入的记录数
+
+        启用预写日志时记录由回放任务入库, 此处返回 0, 入库数见 self.replayed。
+        """
         try:
-            # 检查是否已有数据
-            existing = self.storage.get_race_results(date, date)
-            if existing:
+            # 检查是否已有数据 (启用预写日志时数据库不可用也继续抓取)
+            if not force and self._already_stored(date):
+                DATES.inc(outcome='skipped')
                 return 0
             
             # 获取数据
-            race_data = await self.scraper.scrape_race_data(date)
+            race_data = await self.scraper.scrape_race_data(date, self._courses.get(date))
             if not race_data:
+                DATES.inc(outcome='empty')
                 return 0
             
-            # 保存数据
-            self.storage.save_race_results(race_data)
-            return len(race_data)
+            outcome, saved = await self.ingest_batch(race_data)
+            if outcome == 'spooled':
+                self.spooled_dates += 1
+            DATES.inc(outcome=outcome)
+            return saved
             
         except Exception as e:
+            DATES.inc(outcome='error')
             logger.error(f"获取/保存数据时出错 ({date}): {e}")
             return 0
     
+    async def ingest_batch(self, race_data: List[Dict]) -> Tuple[str, int]:
+        """校验并保存一批已抓取的赛果 (抓取及实时模式共用), 返回 (结果, 写入的记录数)
+
+        拒收的记录写入隔离表; 启用预写日志时写入日志由回放任务入库 (返回 0,
+        入库数见 self.replayed), 否则只写入内容有变化的场次。变化的场次排队
+        等待 ingest_precomputed 写入特征库及偏差立方体。
+        """
+        # 校验及标准化, 拒收的记录写入隔离表
+        if self.preprocessor is not None:
+            race_data, rejects = self.preprocessor.process_batch(race_data)
+            if rejects:
+                if self.spool is not None:
+                    await asyncio.to_thread(self.spool.append, 'quarantine', rejects)
+                else:
+                    await asyncio.to_thread(self.storage.save_quarantine, rejects)
+                self.quarantined += len(rejects)
+            if not race_data:
+                return 'quarantined', 0
+        
+        # 先写入预写日志, 由回放任务入库
+        if self.spool is not None:
+            await asyncio.to_thread(self.spool.append, 'race_results', race_data)
+            self.spooled += len(race_data)
+            return 'spooled', 0
+        
+        # 保存数据: 与场次摘要比较, 未变的场次不写入
+        events = await asyncio.to_thread(self.storage.save_changed_races, race_data)
+        if not events:
+            return 'unchanged', 0
+        self.change_events.extend(events)
+        changed = {(e['race_date'], e['race_number']) for e in events}
+        race_data = [r for r in race_data if (r['race_date'], self.storage.race_number(r)) in changed]
+        if self.feature_store is not None or self.cube is not None:
+            with self._ingested_lock:
+                self._ingested.extend(race_data)
+        return 'saved', len(race_data)
+
+    def _already_stored(self, date: str) -> bool:
+        try:
+            return bool(self.storage.count_race_results(date))
+        except Exception as e:
+            if self.spool is None:
+                raise
+            logger.warning(f"无法查询 {date} 是否已入库, 继续抓取: {e}")
+            return False
+
+    def _on_replayed(self, rows: List[Dict], events: List[Dict]):
+        """回放入库后: 记录变化事件, 变化的场次写入特征库及偏差立方体"""
+        self.replayed += len(rows)
+        self.change_events.extend(events)
+        if self.feature_store is not None or self.cube is not None:
+            with self._ingested_lock:
+                self._ingested.extend(rows)
+
+    def ingest_precomputed(self, rows: Optional[List[Dict]] = None):
+        """把排队中及其他途径入库的赛果 (如分片回填) 写入特征库及偏差立方体"""
+        if rows and (self.feature_store is not None or self.cube is not None):
+            with self._ingested_lock:
+                self._ingested.extend(rows)
+        self._update_precomputed()
+
+    def _update_precomputed(self):
+        """把本批入库的赛果增量写入特征库及偏差立方体"""
+        with self._ingested_lock:
+            rows, self._ingested = self._ingested, []
+        if not rows:
+            return
+        # 并发抓取的日期完成顺序不定, 按日期排序后写入
+        rows.sort(key=lambda r: r.get('race_date') or '')
+        
+        if self.feature_store is not None:
+            try:
+                applied = self.feature_store.ingest_results(rows)
+                self.feature_store.save(self.feature_store_path)
+                logger.info(f"特征库已更新 {applied} 条出赛记录")
+            except Exception as e:
+                logger.error(f"更新特征库时出错: {e}")
+        
+        if self.cube is not None:
+            try:
+                races = self.cube.add_results(rows)
+                self.cube.save(self.cube_path)
+                logger.info(f"偏差立方体已更新 {races} 场")
+            except Exception as e:
+                logger.error(f"更新偏差立方体时出错: {e}")
+
     @staticmethod
     def _generate_dates(start_date: str, end_date: str) -> List[str]:
         """生成日期范围内的所有日期"""
@@ -0,0 +1,223 @@
+import itertools
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 立方体维度, 每个维度的 0 号位置是 "全部" (上卷) 汇总
+CUBE_DIMENSIONS = ('racecourse', 'distance', 'race_class', 'going', 'draw')
+MEASURES = ('starts', 'wins', 'places', 'position_sum', 'finishers')
+ALL = '*'
+
+
+def _race_number(row: Dict[str, Any]) -> int:
+    """场次 (race_number, 或由 race_id 取出数字)"""
+    if row.get('race_number') is not None:
+        return int(row['race_number'])
+    return int(''.join(filter(str.isdigit, str(row.get('race_id', '0')))) or '0')
+
+
+class BiasCube:
+    """档位/距离/马场/班次偏差的预计算立方体
+
+    每个维度都额外保留一个 "全部" 位置, 写入一条记录时同时累加到
+    2^5 个上卷单元, 因此任意切片或上卷查询都只是数组索引。各场次的
+    编码记录随立方体保存, 赛果更正时据此撤销旧的贡献。
+    """
+
+    def __init__(self):
+        self.vocab: Dict[str, List[str]] = {dim: [ALL] for dim in CUBE_DIMENSIONS}
+        self._lookup: Dict[str, Dict[str, int]] = {dim: {ALL: 0} for dim in CUBE_DIMENSIONS}
+        self.data = np.zeros((len(MEASURES),) + (8,) * len(CUBE_DIMENSIONS), dtype=np.int32)
+        self.races: Dict[str, np.ndarray] = {}  # "日期|马场|场次" -> _encode 的结果
+
+    # ---- 编码 ----
+
+    def _code(self, dim: str, value: Any) -> int:
+        """维度值 -> 位置, 新值追加到末尾 (必要时扩容)"""
+        key = '' if value is None else str(value)
+        code = self._lookup[dim].get(key)
+        if code is None:
+            code = len(self.vocab[dim])
+            self.vocab[dim].append(key)
+            self._lookup[dim][key] = code
+            axis = CUBE_DIMENSIONS.index(dim) + 1
+            if code >= self.data.shape[axis]:
+                pad = [(0, 0)] * self.data.ndim
+                pad[axis] = (0, self.data.shape[axis])
+                self.data = np.pad(self.data, pad)
+        return code
+
+    def _index(self, dim: str, value: Any):
+        """查询值 -> 位置 (列表则返回位置列表), 未出现过的值返回 None"""
+        if value is None:
+            return 0
+        if isinstance(value, (list, tuple, set)):
+            codes = [self._lookup[dim].get(str(v)) for v in value]
+            codes = [c for c in codes if c is not None]
+            return codes or None
+        return self._lookup[dim].get(str(value))
+
+    # ---- 增量写入 ----
+
+    def _encode(self, rows: List[Dict[str, Any]]) -> np.ndarray:
+        """出赛记录 -> 每行 (各维度位置..., 名次), 按行排序以便比较"""
+        encoded = np.array(
+            [[self._code(dim, row.get(dim)) for dim in CUBE_DIMENSIONS] + [int(row.get('finish_position') or 99)]
+             for row in rows],
+            dtype=np.int32
+        ).reshape(-1, len(CUBE_DIMENSIONS) + 1)
+        return encoded[np.lexsort(encoded.T[::-1])]
+
+    def _accumulate(self, encoded: np.ndarray, sign: int):
+        if not len(encoded):
+            return
+        codes = encoded[:, :-1].astype(np.int64)
+        position = encoded[:, -1].astype(np.int64)
+        # 非正常完成 (99) 计入出赛, 不计入名次
+        finished = position < 99
+        measures = np.stack([
+            np.ones(len(encoded), dtype=np.int64),
+            (position == 1).astype(np.int64),
+            (position <= 3).astype(np.int64),
+            np.where(finished, position, 0),
+            finished.astype(np.int64),
+        ]) * sign
+
+        # 每条记录累加到各维度 "取值 / 全部" 的所有组合
+        shape = self.data.shape[1:]
+        linear = np.concatenate([
+            np.ravel_multi_index(tuple(np.where(mask, codes, 0).T), shape)
+            for mask in itertools.product((False, True), repeat=len(CUBE_DIMENSIONS))
+        ])
+        size = int(np.prod(shape))
+        flat = self.data.reshape(len(MEASURES), size)
+        for m in range(len(MEASURES)):
+            weights = np.tile(measures[m], 2 ** len(CUBE_DIMENSIONS))
+            flat[m] += np.bincount(linear, weights=weights, minlength=size).astype(np.int32)
+
+    def add_rows(self, rows: Iterable[Dict[str, Any]], sign: int = 1) -> int:
+        """写入 (sign=-1 时撤销) 一批出赛记录"""
+        rows = list(rows)
+        if rows:
+            self._accumulate(self._encode(rows), sign)
+        return len(rows)
+
+    def add_race(self, key: str, rows: List[Dict[str, Any]]) -> bool:
+        """按场次写入; 已写入的场次内容不变时跳过, 有更正时先撤销旧的贡献"""
+        encoded = self._encode(rows)
+        old = self.races.get(key)
+        if old is not None:
+            if np.array_equal(old, encoded):
+                return False
+            self._accumulate(old, -1)
+        self._accumulate(encoded, 1)
+        self.races[key] = encoded
+        return True
+
+    def add_meeting(self, race_date: str, racecourse: str, rows: Iterable[Dict[str, Any]]) -> int:
+        """写入一个赛马日, 返回有变化的场次数"""
+        races: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            races.setdefault(_race_number(row), []).append(row)
+        return sum(self.add_race(f"{race_date}|{racecourse}|{number}", race_rows)
+                   for number, race_rows in sorted(races.items()))
+
+    def add_results(self, results: Iterable[Dict[str, Any]]) -> int:
+        """把 race_results 格式的赛果按赛马日及场次写入, 返回有变化的场次数"""
+        meetings: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in results:
+            meetings.setdefault((row.get('race_date'), row.get('racecourse')), []).append(row)
+        return sum(self.add_meeting(race_date, racecourse, rows)
+                   for (race_date, racecourse), rows in sorted(meetings.items(), key=lambda kv: str(kv[0])))
+
+    # ---- 查询 ----
+
+    def query(self, **filters) -> Dict[str, float]:
+        """任意切片或上卷, 例如 query(racecourse='HV', distance=1200, race_class='4', draw=1)
+
+        未指定的维度取 "全部", 列表值表示对多个取值求和。
+        """
+        index = []
+        for dim in CUBE_DIMENSIONS:
+            code = self._index(dim, filters.get(dim))
+            if code is None:
+                return self._format(np.zeros(len(MEASURES)))
+            index.append(code)
+
+        if any(isinstance(code, list) for code in index):
+            grid = np.ix_(*[code if isinstance(code, list) else [code] for code in index])
+            values = np.array([self.data[m][grid].sum() for m in range(len(MEASURES))])
+        else:
+            values = self.data[(slice(None),) + tuple(index)]
+        return self._format(values)
+
+    def breakdown(self, by: str, **filters) -> List[Dict[str, Any]]:
+        """按某一维度展开, 例如 breakdown('draw', racecourse='HV', distance=1200)"""
+        rows = []
+        for value in self.vocab[by][1:]:
+            result = self.query(**{**filters, by: value})
+            if result['starts']:
+                rows.append({by: value, **result})
+        return rows
+
+    @staticmethod
+    def _format(values: np.ndarray) -> Dict[str, float]:
+        starts, wins, places, position_sum, finishers = (int(v) for v in values)
+        return {
+            'starts': starts,
+            'wins': wins,
+            'places': places,
+            'win_rate': round(wins / starts * 100, 2) if starts else 0.0,
+            'place_rate': round(places / starts * 100, 2) if starts else 0.0,
+            'avg_position': round(position_sum / finishers, 2) if finishers else 0.0,
+        }
+
+    # ---- 持久化 ----
+
+    def save(self, path: str):
+        """以压缩 npz 保存 (只保存已使用的部分)"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        used = (slice(None),) + tuple(slice(0, len(self.vocab[dim])) for dim in CUBE_DIMENSIONS)
+        keys = sorted(self.races)
+        meta = {'vocab': self.vocab, 'races': keys}
+        races = [self.races[key] for key in keys]
+        np.savez_compressed(
+            path, data=self.data[used], meta=np.array(json.dumps(meta, ensure_ascii=False)),
+            race_rows=np.array([len(r) for r in races], dtype=np.int32),
+            race_codes=np.concatenate(races) if races else np.zeros((0, len(CUBE_DIMENSIONS) + 1), np.int32),
+        )
+        logger.info(f"偏差立方体已保存: {path} ({len(self.races)} 场)")
+
+    @classmethod
+    def load(cls, path: str) -> 'BiasCube':
+        """读取立方体, 文件不存在时返回空立方体"""
+        cube = cls()
+        if not os.path.exists(path):
+            return cube
+        with np.load(path) as stored:
+            meta = json.loads(str(stored['meta']))
+            if 'races' not in meta or stored['data'].shape[0] != len(MEASURES):
+                # 旧格式没有各场次的记录, 无法撤销更正, 名次亦含非正常完成
+                logger.warning(f"偏差立方体 {path} 为旧格式, 已忽略; 请删除后以回填重建")
+                return cube
+            cube.data = stored['data'].astype(np.int32)
+            offsets = np.cumsum(stored['race_rows'])[:-1]
+            cube.races = dict(zip(meta['races'], np.split(stored['race_codes'], offsets)))
+        cube.vocab = meta['vocab']
+        cube._lookup = {dim: {v: i for i, v in enumerate(values)} for dim, values in cube.vocab.items()}
+        logger.info(f"偏差立方体已加载: {path} ({len(cube.races)} 场)")
+        return cube
+
+    @classmethod
+    def build(cls, results: Iterable[Dict[str, Any]], path: Optional[str] = None) -> 'BiasCube':
+        """由全部历史赛果一次性构建"""
+        cube = cls()
+        cube.add_results(results)
+        if path:
+            cube.save(path)
+        return cube
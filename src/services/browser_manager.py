@@ -0,0 +1,272 @@
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import logging
+import os
+
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page
+
+from src.utils import metrics
+from src.utils.exceptions import BrowserCrashedError
+
+logger = logging.getLogger(__name__)
+
+RSS_BYTES = metrics.gauge('browser_rss_bytes', "浏览器进程树的常驻内存 (字节)")
+OPEN_PAGES = metrics.gauge('browser_open_pages', "当前打开的页面数")
+RESTARTS = metrics.counter('browser_restarts_total', "浏览器重启次数", ('reason',))
+RECYCLES = metrics.counter('browser_context_recycles_total', "浏览器上下文回收次数", ('reason',))
+
+DEFAULTS = {
+    'HEADLESS': True,
+    'MAX_PAGES_PER_CONTEXT': 200,  # 每个上下文最多打开的页面数, 之后换新上下文
+    'MAX_RSS_MB': 1500,            # 浏览器进程树内存上限 (MB), null 表示不检查
+    'RSS_CHECK_PAGES': 20,         # 每打开多少个页面检查一次内存
+    'LAUNCH_ARGS': ['--disable-dev-shm-usage'],
+}
+CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+}
+
+
+def process_tree_rss(pid: Optional[int] = None) -> Optional[int]:
+    """子进程树 (不含本进程) 的常驻内存字节数; 读取 /proc, 其他平台返回 None
+
+    Playwright 的 driver 及 Chromium 的浏览器/渲染进程都是本进程的后代。
+    """
+    pid = pid or os.getpid()
+    try:
+        children: Dict[int, List[int]] = {}
+        rss: Dict[int, int] = {}
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat', 'rb') as f:
+                    stat = f.read()
+            except OSError:
+                continue  # 进程已退出
+            # comm 字段可能含空格, 从最后一个 ')' 之后解析
+            fields = stat[stat.rindex(b')') + 2:].split()
+            children.setdefault(int(fields[1]), []).append(int(entry))
+            rss[int(entry)] = int(fields[21]) * page_size
+    except (OSError, ValueError):
+        return None
+
+    total, stack = 0, list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        total += rss.get(child, 0)
+        stack.extend(children.get(child, []))
+    return total
+
+
+class _ContextSlot:
+    """一个浏览器上下文及其页面计数; 退役后待页面全部关闭再释放"""
+
+    def __init__(self, browser: Browser, context: BrowserContext):
+        self.browser = browser
+        self.context = context
+        self.open = 0
+        self.served = 0
+        self.retired = False
+
+
+class BrowserManager:
+    """管理 Chromium 的生命周期, 使长时间回填的内存占用保持稳定
+
+    - 上下文打开 MAX_PAGES_PER_CONTEXT 个页面后换新 (旧上下文待进行中的页面关闭后释放)
+    - 每 RSS_CHECK_PAGES 个页面检查一次进程树内存, 超过 MAX_RSS_MB 先换上下文,
+      换过之后仍超出则重启浏览器
+    - 浏览器断开 (崩溃) 后, 下一次取页面时自动重启
+
+    内存、打开页面数、重启及回收次数记录于 browser_* 指标。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULTS, **(config or {})}
+        self.playwright = None
+        self.browser: Optional[Browser] = None
+        self.slot: Optional[_ContextSlot] = None
+        self._retired: List[_ContextSlot] = []
+        self._lock = asyncio.Lock()
+        self._crashed = False
+        self._rss_recycled = False  # 上次因内存换过上下文
+        self._pages_since_check = 0
+        self.restarts = 0
+        self.recycles = 0
+        self.last_rss: Optional[int] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.browser is not None and not self._crashed and self.browser.is_connected()
+
+    async def start(self):
+        """启动 Playwright 及浏览器"""
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        await self._launch()
+
+    async def close(self):
+        """关闭全部上下文、浏览器及 Playwright"""
+        async with self._lock:
+            for slot in self._retired + ([self.slot] if self.slot else []):
+                await self._close_context(slot)
+            self._retired.clear()
+            self.slot = None
+            await self._close_browser(self.browser)
+            self.browser = None
+            if self.playwright:
+                await self.playwright.stop()
+                self.playwright = None
+            OPEN_PAGES.set(0)
+
+    async def _launch(self):
+        self.browser = await self.playwright.chromium.launch(
+            headless=self.config['HEADLESS'], args=list(self.config['LAUNCH_ARGS'])
+        )
+        self.browser.on('disconnected', self._on_disconnected)
+        self._crashed = False
+        self.slot = await self._new_slot()
+        logger.info("浏览器已启动")
+
+    async def _new_slot(self) -> _ContextSlot:
+        return _ContextSlot(self.browser, await self.browser.new_context(**CONTEXT_OPTIONS))
+
+    def _on_disconnected(self, browser: Browser):
+        if browser is self.browser:
+            self._crashed = True
+            logger.warning("浏览器连接已断开, 下次取页面时重启")
+
+    async def _retire(self, slot: Optional[_ContextSlot]):
+        if slot is None:
+            return
+        slot.retired = True
+        if slot.open:
+            self._retired.append(slot)
+        else:
+            await self._close_context(slot)
+
+    async def _recycle_context(self, reason: str):
+        """换新上下文; 旧上下文待页面关闭后释放"""
+        old, self.slot = self.slot, await self._new_slot()
+        await self._retire(old)
+        self.recycles += 1
+        RECYCLES.inc(reason=reason)
+        logger.info(f"浏览器上下文已回收 ({reason})")
+
+    async def _restart(self, reason: str):
+        """重启浏览器; 崩溃时旧浏览器的页面已失效, 直接关闭"""
+        old_browser, old_slot = self.browser, self.slot
+        self.slot = None
+        if self._crashed:
+            await self._close_context(old_slot)
+            self._retired = [s for s in self._retired if s.browser is not old_browser]
+            await self._close_browser(old_browser)
+        else:
+            await self._retire(old_slot)
+            if not any(s.browser is old_browser for s in self._retired):
+                await self._close_browser(old_browser)
+        await self._launch()
+        self.restarts += 1
+        RESTARTS.inc(reason=reason)
+        logger.warning(f"浏览器已重启 ({reason})")
+
+    async def _check_memory(self):
+        self._pages_since_check = 0
+        limit = self.config.get('MAX_RSS_MB')
+        self.last_rss = await asyncio.to_thread(process_tree_rss)
+        if self.last_rss is None:
+            return
+        RSS_BYTES.set(self.last_rss)
+        if not limit or self.last_rss <= limit * 1024 * 1024:
+            self._rss_recycled = False
+            return
+        if self._rss_recycled:
+            await self._restart('rss')
+            self._rss_recycled = False
+        else:
+            await self._recycle_context('rss')
+            self._rss_recycled = True
+
+    async def _acquire(self) -> _ContextSlot:
+        async with self._lock:
+            if self.playwright is None:
+                raise BrowserCrashedError("浏览器未启动")
+            if not self.healthy:
+                await self._restart('crash')
+            elif self.slot.served >= self.config['MAX_PAGES_PER_CONTEXT']:
+                await self._recycle_context('pages')
+            elif self._pages_since_check >= self.config['RSS_CHECK_PAGES']:
+                await self._check_memory()
+            slot = self.slot
+            slot.open += 1
+            slot.served += 1
+            self._pages_since_check += 1
+            OPEN_PAGES.inc()
+            return slot
+
+    async def _release(self, slot: _ContextSlot, page: Optional[Page]):
+        if page is not None:
+            try:
+                await page.close()
+            except Exception:
+                pass  # 浏览器已崩溃或上下文已关闭
+        slot.open -= 1
+        OPEN_PAGES.dec()
+        if slot.retired and not slot.open and slot in self._retired:
+            self._retired.remove(slot)
+            await self._close_context(slot)
+            if slot.browser is not self.browser and not any(s.browser is slot.browser for s in self._retired):
+                await self._close_browser(slot.browser)
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """取得一个新页面, 离开时关闭; 浏览器崩溃时抛出 BrowserCrashedError"""
+        slot = await self._acquire()
+        page = None
+        try:
+            try:
+                page = await slot.context.new_page()
+            except Exception as e:
+                self._crashed = self._crashed or not slot.browser.is_connected()
+                raise BrowserCrashedError(f"无法打开页面: {e}") from e
+            yield page
+        except BrowserCrashedError:
+            raise
+        except Exception as e:
+            if slot.browser is self.browser and not slot.browser.is_connected():
+                self._crashed = True
+                raise BrowserCrashedError(f"浏览器已崩溃: {e}") from e
+            raise
+        finally:
+            await self._release(slot, page)
+
+    def stats(self) -> Dict[str, Any]:
+        """当前状态 (日志及调试用)"""
+        return {
+            'restarts': self.restarts,
+            'recycles': self.recycles,
+            'rss_bytes': self.last_rss,
+            'open_pages': sum(s.open for s in self._retired) + (self.slot.open if self.slot else 0),
+            'context_pages': self.slot.served if self.slot else 0,
+        }
+
+    @staticmethod
+    async def _close_context(slot: Optional[_ContextSlot]):
+        if slot is None:
+            return
+        try:
+            await slot.context.close()
+        except Exception as e:
+            logger.debug(f"关闭浏览器上下文时出错: {e}")
+
+    @staticmethod
+    async def _close_browser(browser: Optional[Browser]):
+        if browser is None:
+            return
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.debug(f"关闭浏览器时出错: {e}")
@@ -0,0 +1,257 @@
+import heapq
+import math
+from itertools import count
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from src.services.partitioned import PartialStats, compute_partial, finalize, has_jockey_ids, jockey_index
+
+
+class QuantileSketch:
+    """可合并的分位数概要 (DDSketch 形式)
+
+    正值按对数分桶, 桶 i 覆盖 (gamma^(i-1), gamma^i], 估计值的相对误差不超过
+    relative_accuracy; 桶数只随数值范围的对数增长, 与样本数无关。零值单独计数,
+    负值及 NaN 忽略。
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values) & (values >= 0)]
+        if not len(values):
+            return
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        self.count += len(values)
+        keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+        for key, n in zip(keys.tolist(), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + n
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        if other.gamma != self.gamma:
+            raise ValueError("只能合并相同精度的分位数概要")
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return float('nan')
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = self.zero_count
+        for key in sorted(self.buckets):
+            cumulative += self.buckets[key]
+            if cumulative > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class TopK:
+    """按分数保留最大的 k 条记录 (最小堆)"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: List = []
+        self._seq = count()
+
+    def push(self, score: float, record: Dict[str, Any]):
+        item = (score, next(self._seq), record)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def merge(self, other: 'TopK') -> 'TopK':
+        for score, _, record in other._heap:
+            self.push(score, record)
+        return self
+
+    def items(self) -> List[Dict[str, Any]]:
+        return [record for _, _, record in sorted(self._heap, key=lambda item: (-item[0], item[1]))]
+
+
+class _OddsSummary:
+    """赔率的总和/个数/最小/最大 (可合并)"""
+
+    def __init__(self):
+        self.total, self.count, self.min, self.max = 0.0, 0, math.inf, -math.inf
+
+    def add(self, odds: np.ndarray):
+        odds = odds[~np.isnan(odds)]
+        if len(odds):
+            self.total += float(odds.sum())
+            self.count += len(odds)
+            self.min = min(self.min, float(odds.min()))
+            self.max = max(self.max, float(odds.max()))
+
+    def merge(self, other: '_OddsSummary'):
+        self.total += other.total
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else float('nan')
+
+
+def _grow(partial: PartialStats, n: int) -> PartialStats:
+    """扩大部分聚合的骑师维度 (新骑师在后续分块才出现)"""
+    if len(partial.starts) >= n:
+        return partial
+    grown = PartialStats.empty(n)
+    size = len(partial.starts)
+    for name in ('starts', 'wins', 'position_sum', 'odds_sum', 'odds_count', 'odds_min', 'odds_max'):
+        getattr(grown, name)[:size] = getattr(partial, name)
+    grown.race_days = partial.race_days
+    return grown
+
+
+class YearlyStatsAccumulator:
+    """分块计算年度 (日期范围) 统计, 结果与 RaceAnalyzer.analyze_yearly_stats 相同口径
+
+    每个分块只更新可合并的部分聚合: 骑师维度的计数/总和、赔率摘要、获胜赔率
+    的分位数概要及赔率最高的 k 场获胜; 内存占用与分块大小及骑师人数有关,
+    与日期范围无关。爆冷门槛 (获胜赔率的 75 分位数) 由分位数概要估算。
+    分块带有代理键 jockey_id 时以其为下标, 否则按名称分配下标。
+    """
+
+    UPSET_QUANTILE = 0.75
+
+    def __init__(self, top_k: int = 5, relative_accuracy: float = 0.01, dimensions=None):
+        self.top_k = top_k
+        self.dimensions = dimensions
+        self.by_id: Optional[bool] = None
+        self.jockeys: Dict[Any, int] = {}       # 下标 -> 名称 (by_id) 或 名称 -> 下标
+        self.partial = PartialStats.empty(0)
+        self.rows = 0
+        self.race_days: Set[Any] = set()
+        self.odds = _OddsSummary()
+        self.winning_odds = _OddsSummary()
+        self.winning_sketch = QuantileSketch(relative_accuracy)
+        self.top_winners = TopK(top_k)
+
+    def add(self, chunk: pd.DataFrame) -> 'YearlyStatsAccumulator':
+        """累加一个分块 (需要 jockey / finish_position / odds / race_date 列)"""
+        if chunk.empty:
+            return self
+        by_id = has_jockey_ids(chunk)
+        if self.by_id is None:
+            self.by_id = by_id
+        elif self.by_id != by_id:
+            raise ValueError("分块须一致地带有或不带 jockey_id 列")
+        index, names = jockey_index(chunk, self.dimensions)
+        if by_id:
+            # 新出现的骑师才记录名称
+            for jockey_id in names.keys() - self.jockeys.keys():
+                self.jockeys[jockey_id] = names[jockey_id]
+            size = max(len(self.partial.starts), max(names, default=-1) + 1)
+        else:
+            # 分块内编码 -> 全局骑师序号 (只循环分块内出现的骑师)
+            mapping = np.array([self.jockeys.setdefault(name, len(self.jockeys)) for name in names.values()],
+                               dtype=np.int64)
+            index = np.where(index >= 0, mapping[index], -1) if len(mapping) else index
+            size = len(self.jockeys)
+        self.partial = _grow(self.partial, size)
+
+        position = pd.to_numeric(chunk['finish_position'], errors='coerce').fillna(99).astype(np.int64).to_numpy()
+        odds = pd.to_numeric(chunk['odds'], errors='coerce').astype(np.float64).to_numpy()
+        known = index >= 0
+        self.partial.merge(compute_partial(
+            index[known], position[known], odds[known], np.zeros(int(known.sum()), dtype=np.int32), size
+        ))
+
+        self.rows += len(chunk)
+        self.race_days.update(chunk['race_date'].unique().tolist())
+        self.odds.add(odds)
+        winners = position == 1
+        self.winning_odds.add(odds[winners])
+        self.winning_sketch.add(odds[winners])
+
+        # 每块只需保留赔率最高的 k 场获胜
+        valid_winners = winners & ~np.isnan(odds)
+        if valid_winners.any():
+            top = chunk.loc[valid_winners].assign(odds=odds[valid_winners]).nlargest(self.top_k, 'odds')
+            for record in top.to_dict('records'):
+                self.top_winners.push(record['odds'], record)
+        return self
+
+    def merge(self, other: 'YearlyStatsAccumulator') -> 'YearlyStatsAccumulator':
+        """合并另一个累加器 (例如其他进程计算的日期范围)"""
+        if self.by_id is None:
+            self.by_id = other.by_id
+        elif other.by_id is not None and other.by_id != self.by_id:
+            raise ValueError("只能合并同样以 jockey_id 或名称为下标的累加器")
+        if self.by_id:
+            # 下标即代理键, 扩大到相同长度后直接相加
+            for jockey_id, name in other.jockeys.items():
+                self.jockeys.setdefault(jockey_id, name)
+            size = max(len(self.partial.starts), len(other.partial.starts))
+            self.partial = _grow(self.partial, size)
+            self.partial.merge(_grow(other.partial, size))
+        else:
+            for name in other.jockeys:
+                self.jockeys.setdefault(name, len(self.jockeys))
+            remap = np.array([self.jockeys[name] for name in other.jockeys], dtype=np.int64)
+            self.partial = _grow(self.partial, len(self.jockeys))
+            aligned = PartialStats.empty(len(self.jockeys))
+            for name in ('starts', 'wins', 'position_sum', 'odds_sum', 'odds_count', 'odds_min', 'odds_max'):
+                getattr(aligned, name)[remap] = getattr(other.partial, name)[:len(remap)]
+            self.partial.merge(aligned)
+        self.rows += other.rows
+        self.race_days |= other.race_days
+        self.odds.merge(other.odds)
+        self.winning_odds.merge(other.winning_odds)
+        self.winning_sketch.merge(other.winning_sketch)
+        self.top_winners.merge(other.top_winners)
+        return self
+
+    def finalize(self) -> Dict[str, Any]:
+        if not self.rows:
+            return {}
+        merged = self.partial
+        merged.race_days = len(self.race_days)
+        names = self.jockeys if self.by_id else {index: name for name, index in self.jockeys.items()}
+        result = finalize(merged, names, self.rows)
+
+        threshold = self.winning_sketch.quantile(self.UPSET_QUANTILE)
+        result['summary']['avg_odds'] = self.odds.mean
+        result['summary']['avg_winning_odds'] = self.winning_odds.mean
+        result['odds_analysis'] = {
+            'overall': {
+                'avg_odds': self.odds.mean,
+                'max_odds': self.odds.max if self.odds.count else float('nan'),
+                'min_odds': self.odds.min if self.odds.count else float('nan'),
+            },
+            'winners': {
+                'avg_winning_odds': self.winning_odds.mean,
+                'highest_odds_winner': self.winning_odds.max if self.winning_odds.count else float('nan'),
+                'lowest_odds_winner': self.winning_odds.min if self.winning_odds.count else float('nan'),
+            },
+            'upset_wins': [r for r in self.top_winners.items() if r['odds'] > threshold],
+            'jockey_odds': result.pop('jockey_odds'),
+        }
+        return result
+
+
+def yearly_stats_from_chunks(chunks: Iterable[pd.DataFrame], top_k: int = 5,
+                             relative_accuracy: float = 0.01, dimensions=None) -> Dict[str, Any]:
+    """逐块累加后生成年度统计"""
+    accumulator = YearlyStatsAccumulator(top_k, relative_accuracy, dimensions)
+    for chunk in chunks:
+        accumulator.add(chunk)
+    return accumulator.finalize()
@@ -0,0 +1,229 @@
+import logging
+import re
+import threading
+import unicodedata
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from src.models.database import Horse, Jockey, NameAlias, RaceResult, Trainer
+
+if TYPE_CHECKING:  # pandas 只在解码 DataFrame 时导入
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 实体 -> (维度表, 键列)
+DIMENSIONS = {
+    'jockey': (Jockey, 'name'),
+    'trainer': (Trainer, 'name'),
+    'horse': (Horse, 'code'),
+}
+
+# 见习骑师的减磅标记, 例如 "巫顯東 (-2)"
+_CLAIM_PATTERN = re.compile(r"\s*\(-?\d+\)\s*$")
+_SPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_name(name: Any) -> str:
+    """标准化名称: 全角转半角, 合并空白, 去除减磅标记"""
+    if name is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(name))
+    text = _CLAIM_PATTERN.sub('', text)
+    return _SPACE_PATTERN.sub(' ', text).strip()
+
+
+class DimensionRegistry:
+    """骑师/练马师/马匹维度表的内存索引
+
+    名称在入库时被解析为稳定的整数代理键, 读取时再以 categorical
+    还原为名称。所有拼写变体都经由 name_aliases 表在这里统一解析。
+    """
+
+    def __init__(self, session_factory):
+        self.Session = session_factory
+        self._lock = threading.Lock()
+        self._ids: Dict[str, Dict[str, int]] = {entity: {} for entity in DIMENSIONS}
+        self._names: Dict[str, Dict[int, str]] = {entity: {} for entity in DIMENSIONS}
+        self._aliases: Dict[str, Dict[str, str]] = {entity: {} for entity in DIMENSIONS}
+        self._page_ids: Dict[int, str] = {}  # 马匹代理键 -> 资料页面 HorseId
+        self._loaded = False
+
+    def load(self):
+        """从数据库加载全部维度及别名"""
+        session = self.Session()
+        try:
+            with self._lock:
+                for entity, (model, key) in DIMENSIONS.items():
+                    ids, names = {}, {}
+                    rows = session.query(model).all()
+                    for row in rows:
+                        ids[getattr(row, key)] = row.id
+                        names[row.id] = row.name or getattr(row, key)
+                    self._ids[entity] = ids
+                    self._names[entity] = names
+                    if entity == 'horse':
+                        self._page_ids = {row.id: row.page_id for row in rows if row.page_id}
+                    self._aliases[entity] = {}
+                for alias in session.query(NameAlias).all():
+                    if alias.entity in self._aliases:
+                        self._aliases[alias.entity][alias.alias] = alias.canonical
+                self._loaded = True
+            logger.info(
+                "维度表已加载: "
+                + ", ".join(f"{entity}={len(ids)}" for entity, ids in self._ids.items())
+            )
+        finally:
+            session.close()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def resolve(self, entity: str, name: Any) -> str:
+        """把名称解析为规范写法"""
+        self._ensure_loaded()
+        normalized = normalize_name(name)
+        return self._aliases[entity].get(normalized, normalized)
+
+    def assign_ids(self, session, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """为待入库的行填充 jockey_id / trainer_id / horse_id, 缺失的维度批量新增
+
+        行中的 horse_page_id (赛果页面链接的 HorseId) 会被取出并记录到马匹维度。
+        """
+        self._ensure_loaded()
+        keys = {entity: [] for entity in DIMENSIONS}
+        page_ids = [row.pop('horse_page_id', None) for row in rows]
+        for row in rows:
+            row['jockey'] = self.resolve('jockey', row.get('jockey'))
+            row['trainer'] = self.resolve('trainer', row.get('trainer'))
+            row['horse_name'] = normalize_name(row.get('horse_name'))
+            keys['jockey'].append(row['jockey'])
+            keys['trainer'].append(row['trainer'])
+            keys['horse'].append(self.resolve('horse', row.get('horse_no') or row['horse_name']))
+
+        names = {'horse': {k: row['horse_name'] for k, row in zip(keys['horse'], rows)}}
+        for entity, values in keys.items():
+            missing = {v for v in values if v and v not in self._ids[entity]}
+            if missing:
+                self._insert(session, entity, missing, names.get(entity, {}))
+
+        for i, row in enumerate(rows):
+            for entity in DIMENSIONS:
+                row[f'{entity}_id'] = self._ids[entity].get(keys[entity][i])
+        self._record_page_ids(session, {
+            row['horse_id']: page_id for row, page_id in zip(rows, page_ids)
+            if page_id and row['horse_id'] is not None
+        })
+        return rows
+
+    def _record_page_ids(self, session, page_ids: Dict[int, str]):
+        """记录新出现或有变的马匹资料页面 HorseId (每匹马通常只写一次)"""
+        changed = {horse_id: page_id for horse_id, page_id in page_ids.items()
+                   if self._page_ids.get(horse_id) != page_id}
+        for horse_id, page_id in changed.items():
+            session.execute(update(Horse).where(Horse.id == horse_id).values(page_id=page_id))
+        with self._lock:
+            self._page_ids.update(changed)
+
+    def page_id_of(self, horse_id: Optional[int]) -> Optional[str]:
+        """马匹代理键 -> 资料页面 HorseId, 未知时返回 None"""
+        self._ensure_loaded()
+        return self._page_ids.get(horse_id)
+
+    def _insert(self, session, entity: str, keys: set, names: Dict[str, str]):
+        """新增维度记录; 其他进程并发插入同名记录时重新加载"""
+        model, key = DIMENSIONS[entity]
+        savepoint = session.begin_nested()
+        try:
+            records = [model(**{key: k, 'name': names.get(k, k)}) for k in sorted(keys)]
+            session.add_all(records)
+            session.flush()
+            savepoint.commit()
+            with self._lock:
+                for record in records:
+                    self._ids[entity][getattr(record, key)] = record.id
+                    self._names[entity][record.id] = record.name
+            logger.info(f"新增 {len(records)} 个{entity}维度记录")
+        except IntegrityError:
+            savepoint.rollback()
+            logger.warning(f"{entity} 维度并发写入冲突, 重新加载")
+            for row in session.query(model).filter(getattr(model, key).in_(keys)).all():
+                with self._lock:
+                    self._ids[entity][getattr(row, key)] = row.id
+                    self._names[entity][row.id] = row.name
+
+    def add_alias(self, entity: str, alias: str, canonical: str):
+        """登记名称异写, 并把已入库的旧代理键指向规范记录"""
+        self._ensure_loaded()
+        alias, canonical = normalize_name(alias), normalize_name(canonical)
+        session = self.Session()
+        try:
+            # (entity, alias) 唯一: 已登记的别名改指新的规范名称
+            existing = session.query(NameAlias).filter_by(entity=entity, alias=alias).one_or_none()
+            if existing is not None:
+                existing.canonical = canonical
+            else:
+                session.add(NameAlias(entity=entity, alias=alias, canonical=canonical))
+            old_id = self._ids[entity].get(alias)
+            new_id = self._ids[entity].get(canonical)
+            if old_id and new_id and old_id != new_id:
+                column = getattr(RaceResult, f'{entity}_id')
+                session.execute(update(RaceResult).where(column == old_id).values({column: new_id}))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"登记别名 {alias} -> {canonical} 时出错: {e}")
+            raise
+        finally:
+            session.close()
+        self.load()
+
+    def categories(self, entity: str) -> 'pd.Index':
+        """categorical 的类别表, 位置即代理键 (空缺的键以占位符填充)"""
+        import pandas as pd
+
+        self._ensure_loaded()
+        names = self._names[entity]
+        size = max(names, default=0) + 1
+        labels, seen = [], set()
+        for i in range(size):
+            label = names.get(i, f'#{i}')
+            if label in seen:
+                # 同名马匹以代理键区分, categorical 要求类别唯一
+                label = f'{label} #{i}'
+            seen.add(label)
+            labels.append(label)
+        return pd.Index(labels)
+
+    def decode(self, df: 'pd.DataFrame') -> 'pd.DataFrame':
+        """把代理键列转换为以名称显示的 categorical 列"""
+        import pandas as pd
+
+        targets = {'jockey': 'jockey', 'trainer': 'trainer', 'horse': 'horse_name'}
+        for entity, column in targets.items():
+            id_column = f'{entity}_id'
+            if id_column not in df:
+                continue
+            codes = df[id_column].fillna(-1).astype('int64')
+            categories = self.categories(entity)
+            if len(codes) and codes.max() >= len(categories):
+                # 其他进程新增了维度记录
+                self.load()
+                categories = self.categories(entity)
+            df[id_column] = codes.astype('int32')
+            df[column] = pd.Categorical.from_codes(codes, categories=categories)
+        return df
+
+    def id_of(self, entity: str, name: Any) -> Optional[int]:
+        """名称 (含异写) -> 代理键, 未知名称返回 None"""
+        # 须先加载: resolve() 首次调用时 load() 会替换 _ids 中的字典
+        self._ensure_loaded()
+        return self._ids[entity].get(self.resolve(entity, name))
+
+    def name_of(self, entity: str, entity_id: Optional[int]) -> str:
+        """代理键 -> 显示名称"""
+        self._ensure_loaded()
+        return self._names[entity].get(entity_id, '')
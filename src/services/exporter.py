@@ -0,0 +1,201 @@
+import bz2
+import csv
+import io
+import json
+import logging
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet 为可选格式
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+# CSV / JSONL 的流式压缩; Parquet 使用列内压缩编码
+COMPRESSIONS = ('none', 'gzip', 'bz2')
+PARQUET_CODECS = ('none', 'snappy', 'gzip', 'zstd')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def file_extension(fmt: str, compression: str = 'none') -> str:
+    """导出文件扩展名"""
+    if fmt == 'parquet' or compression == 'none':
+        return f'.{fmt}'
+    return f".{fmt}.{'gz' if compression == 'gzip' else compression}"
+
+
+def check_options(fmt: str, compression: str = 'none'):
+    """检查导出格式及压缩方式, 不支持时抛出 ValueError (在打开输出前调用)"""
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    if fmt == 'parquet':
+        if pa is None:
+            raise ValueError("导出 Parquet 需要安装 pyarrow")
+        if compression not in PARQUET_CODECS:
+            raise ValueError(f"Parquet 不支持的压缩方式: {compression} (可选 {', '.join(PARQUET_CODECS)})")
+    elif compression not in COMPRESSIONS:
+        raise ValueError(f"不支持的压缩方式: {compression} (可选 {', '.join(COMPRESSIONS)})")
+
+
+class _Compressor:
+    """流式压缩器, 每个分块压缩后立即输出"""
+
+    def __init__(self, compression: str):
+        if compression == 'gzip':
+            self._impl = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif compression == 'bz2':
+            self._impl = bz2.BZ2Compressor()
+        elif compression == 'none':
+            self._impl = None
+        else:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+
+    def compress(self, data: bytes) -> bytes:
+        return self._impl.compress(data) if self._impl else data
+
+    def flush(self) -> bytes:
+        return self._impl.flush() if self._impl else b''
+
+
+class _DrainableSink(io.RawIOBase):
+    """只追加的写入目标, 可随时取出已写入的字节 (供 ParquetWriter 流式输出)"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _csv_chunks(chunks: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    columns = None
+    for rows in chunks:
+        if not rows:
+            continue
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if columns is None:
+            columns = list(rows[0].keys())
+            writer.writerow(columns)
+        writer.writerows([row.get(c) for c in columns] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _jsonl_chunks(chunks: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    for rows in chunks:
+        if rows:
+            yield ''.join(
+                json.dumps(row, ensure_ascii=False, default=str) + '\n' for row in rows
+            ).encode('utf-8')
+
+
+def arrow_schema(model) -> 'pa.Schema':
+    """由 SQLAlchemy 模型的列类型生成 Arrow schema (不依赖首个分块的取值)"""
+    from sqlalchemy import DateTime, Float, Integer
+
+    fields = []
+    for column in model.__table__.columns:
+        if isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp('us')
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def _parquet_chunks(chunks: Iterable[List[Dict[str, Any]]], codec: str, schema=None) -> Iterator[bytes]:
+    if pa is None:
+        raise ValueError("导出 Parquet 需要安装 pyarrow")
+    sink = _DrainableSink()
+    writer = None
+    try:
+        for rows in chunks:
+            if not rows:
+                continue
+            if writer is None:
+                # 未给出 schema 时由首个分块推断 (整列为空的列会被推断为 null 类型)
+                schema = schema or pa.Table.from_pylist(rows).schema
+                writer = pq.ParquetWriter(sink, schema, compression=codec)
+            # 每个分块写成一个行组, 写完即输出
+            writer.write_table(pa.Table.from_pylist(rows, schema=writer.schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        if writer is not None:
+            writer.close()
+    tail = sink.drain()
+    if tail:
+        yield tail
+
+
+def encode_stream(chunks: Iterable[List[Dict[str, Any]]], fmt: str = 'csv',
+                  compression: str = 'none', schema=None) -> Iterator[bytes]:
+    """把分块记录编码为字节流 (生成器), 内存占用只与分块大小有关; schema 只用于 Parquet"""
+    check_options(fmt, compression)
+
+    if fmt == 'parquet':
+        yield from _parquet_chunks(chunks, compression, schema)
+        return
+
+    compressor = _Compressor(compression)
+    encoder = _csv_chunks(chunks) if fmt == 'csv' else _jsonl_chunks(chunks)
+    for data in encoder:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    tail = compressor.flush()
+    if tail:
+        yield tail
+
+
+def export_stream(storage, table: str = 'race_results', fmt: str = 'csv', compression: str = 'none',
+                  chunk_size: int = 5000, **filters) -> Iterator[bytes]:
+    """从数据库分块读取并编码 (参数错误在调用时即抛出 ValueError)"""
+    check_options(fmt, compression)
+    chunks = storage.iter_table(table, chunk_size=chunk_size, **filters)
+    model = storage.EXPORT_TABLES.get(table)
+    schema = arrow_schema(model) if fmt == 'parquet' and pa is not None and model is not None else None
+    return encode_stream(chunks, fmt, compression, schema)
+
+
+def export_to_file(storage, path: str, table: str = 'race_results', fmt: str = 'csv',
+                   compression: str = 'none', chunk_size: int = 5000, **filters) -> int:
+    """导出到文件, 返回写入字节数"""
+    # 先检查参数, 出错时不留下空文件
+    stream = export_stream(storage, table, fmt, compression, chunk_size, **filters)
+    written = 0
+    with open(path, 'wb') as f:
+        for data in stream:
+            f.write(data)
+            written += len(data)
+    logger.info(f"已导出 {table} 到 {path} ({written / 1024 / 1024:.1f} MB)")
+    return written
@@ -0,0 +1,487 @@
+import logging
+import os
+import re
+from datetime import datetime, date
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 距离分段的上界 (米), 超出最后一段的归入最后一段
+DISTANCE_BANDS = np.array([1000, 1200, 1400, 1600, 1800, 2000, 2200, 2400])
+# 马场编码
+COURSES = ('ST', 'HV')
+_COURSE_NAMES = {'沙田': 'ST', '跑馬地': 'HV', '跑马地': 'HV', 'ST': 'ST', 'HV': 'HV'}
+# 档位分段: 内档 1-4, 中档 5-8, 外档 9+
+DRAW_BANDS = np.array([4, 8])
+
+_DIGITS = re.compile(r"\d+")
+
+
+def distance_band(distance: np.ndarray) -> np.ndarray:
+    """距离 -> 距离分段编号"""
+    band = np.searchsorted(DISTANCE_BANDS, distance, side='left')
+    return np.minimum(band, len(DISTANCE_BANDS) - 1)
+
+
+def draw_band(draw: np.ndarray) -> np.ndarray:
+    """档位 -> 档位分段编号"""
+    return np.searchsorted(DRAW_BANDS, draw, side='left')
+
+
+def course_code(track: Any) -> int:
+    """马场文字 (例如 '沙田草地"A"') -> 马场编号, 未知为 -1"""
+    text = str(track or '')
+    for name, code in _COURSE_NAMES.items():
+        if text.startswith(name):
+            return COURSES.index(code)
+    return -1
+
+
+def _to_day(value: Any) -> int:
+    """日期 -> 自 1970-01-01 起的天数, 无法解析为 -1"""
+    if isinstance(value, (datetime, date)):
+        return int(np.datetime64(value, 'D').astype(np.int64))
+    text = str(value or '').strip()
+    for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%d/%m/%y", "%d/%m/%Y"):
+        try:
+            return int(np.datetime64(datetime.strptime(text, fmt).date(), 'D').astype(np.int64))
+        except ValueError:
+            continue
+    return -1
+
+
+def _to_number(value: Any, default: float = np.nan) -> float:
+    """从文字中取出第一个整数, 例如 '03' / '1105' / 'WV'"""
+    match = _DIGITS.search(str(value or ''))
+    return float(match.group()) if match else default
+
+
+def _run_key(rows: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """(马匹行号, 日期) -> 单一整数键"""
+    return (rows.astype(np.int64) << 32) | days.astype(np.int64)
+
+
+def _missing(name: str, value) -> bool:
+    """记录中没有提供的栏位 (往绩与赛果提供的栏位不同)"""
+    if name in ('rating', 'body_weight'):
+        return bool(np.isnan(value))
+    if name in ('distance', 'draw'):
+        return value <= 0
+    return name == 'course' and value < 0
+
+
+def _same(a, b) -> bool:
+    return a == b or (isinstance(a, np.floating) and np.isnan(a) and np.isnan(b))
+
+
+class HorseFeatureStore:
+    """马匹状态特征库
+
+    每个特征是一个按马匹行号索引的 numpy 数组 (列式存储), 入库时增量
+    更新。单匹马的查询是一次字典查找加数组索引, 整张排位表则以一次
+    花式索引批量取出。
+    """
+
+    def __init__(self, form_length: int = 6, capacity: int = 1024):
+        self.form_length = form_length
+        self._index: Dict[str, int] = {}
+        self._codes: List[str] = []
+        self._size = 0
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._allocate(capacity)
+        self._log: Dict[str, np.ndarray] = {}
+        self._log_size = 0
+        # 由不含出赛记录的旧文件加载时无法重算, 迟到的记录只能跳过
+        self._replayable = True
+
+    # ---- 存储布局 ----
+
+    def _schema(self) -> Dict[str, tuple]:
+        """特征列: 名称 -> (每行形状, 类型, 初始值)"""
+        n = self.form_length
+        return {
+            'last_finishes': ((n,), np.int16, -1),   # 最近 N 仗名次, 最新在前
+            'last_ratings': ((n,), np.float32, np.nan),
+            'starts': ((), np.int32, 0),
+            'wins': ((), np.int32, 0),
+            'places': ((), np.int32, 0),
+            'last_run_day': ((), np.int32, -1),
+            'last_body_weight': ((), np.float32, np.nan),
+            'prev_body_weight': ((), np.float32, np.nan),
+            'distance_starts': ((len(DISTANCE_BANDS),), np.int32, 0),
+            'distance_wins': ((len(DISTANCE_BANDS),), np.int32, 0),
+            'course_starts': ((len(COURSES),), np.int32, 0),
+            'course_wins': ((len(COURSES),), np.int32, 0),
+            'draw_starts': ((len(DRAW_BANDS) + 1,), np.int32, 0),
+            'draw_wins': ((len(DRAW_BANDS) + 1,), np.int32, 0),
+        }
+
+    def _allocate(self, capacity: int):
+        """按容量分配 (或扩容) 全部特征数组"""
+        for name, (shape, dtype, fill) in self._schema().items():
+            array = np.full((capacity,) + shape, fill, dtype=dtype)
+            if name in self._arrays:
+                array[:self._size] = self._arrays[name][:self._size]
+            self._arrays[name] = array
+
+    def _row_of(self, horse_code: str) -> int:
+        """取得 (必要时新增) 马匹的行号"""
+        row = self._index.get(horse_code)
+        if row is None:
+            if self._size == len(self._arrays['starts']):
+                self._allocate(max(1024, self._size * 2))
+            row = self._size
+            self._index[horse_code] = row
+            self._codes.append(horse_code)
+            self._size += 1
+        return row
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, horse_code: str) -> bool:
+        return horse_code in self._index
+
+    # ---- 增量更新 ----
+
+    # 出赛记录列 (每马每日一条), 迟到或更正的记录据此重算该马的特征
+    _LOG_SCHEMA = {
+        'row': (np.int32, -1), 'day': (np.int32, -1), 'finish': (np.int16, 99),
+        'distance': (np.float32, 0), 'course': (np.int8, -1), 'draw': (np.float32, 0),
+        'rating': (np.float32, np.nan), 'body_weight': (np.float32, np.nan),
+    }
+
+    def _grow_log(self, extra: int):
+        needed = self._log_size + extra
+        capacity = len(self._log['row']) if self._log else 0
+        if needed <= capacity:
+            return
+        capacity = max(4096, needed, capacity * 2)
+        for name, (dtype, fill) in self._LOG_SCHEMA.items():
+            array = np.full(capacity, fill, dtype=dtype)
+            if name in self._log:
+                array[:self._log_size] = self._log[name][:self._log_size]
+            self._log[name] = array
+
+    def _append_log(self, batch: Dict[str, np.ndarray]) -> np.ndarray:
+        """追加出赛记录, 返回其位置"""
+        n = len(batch['row'])
+        self._grow_log(n)
+        positions = np.arange(self._log_size, self._log_size + n)
+        for name in self._LOG_SCHEMA:
+            self._log[name][positions] = batch[name]
+        self._log_size += n
+        return positions
+
+    def ingest_runs(self, runs: Iterable[Dict[str, Any]]) -> int:
+        """增量写入出赛记录, 返回有变化的记录数
+
+        每条记录需包含 horse_code, race_date, finish_position, 可选
+        distance / track / draw / rating / body_weight。晚于已记录最近出赛日
+        的记录直接累加; 其余 (分片回填乱序到达、赛果更正、往绩同步补上
+        评分及体重) 与该马同日的出赛记录合并, 有变化时按日期顺序重算该马
+        的全部特征。同一马同一日以后到者为准, 缺少的栏位沿用已有记录,
+        内容不变时跳过, 因此重复写入是幂等的。
+        """
+        runs = list(runs)
+        if not runs:
+            return 0
+
+        batch = {
+            'row': np.array([self._row_of(str(r['horse_code'])) for r in runs], dtype=np.int32),
+            'day': np.array([_to_day(r.get('race_date')) for r in runs], dtype=np.int32),
+            'finish': np.array([_to_number(r.get('finish_position'), 99) for r in runs]).astype(np.int16),
+            'distance': np.array([_to_number(r.get('distance'), 0) for r in runs], dtype=np.float32),
+            'course': np.array([course_code(r.get('track')) for r in runs], dtype=np.int8),
+            'draw': np.array([_to_number(r.get('draw'), 0) for r in runs], dtype=np.float32),
+            'rating': np.array([_to_number(r.get('rating')) for r in runs], dtype=np.float32),
+            'body_weight': np.array([_to_number(r.get('body_weight')) for r in runs], dtype=np.float32),
+        }
+        # 同一批同一马同一日只取最后一条
+        keys = _run_key(batch['row'], batch['day'])
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = np.sort(len(keys) - 1 - last)
+        keep = keep[batch['day'][keep] >= 0]
+        batch = {name: values[keep] for name, values in batch.items()}
+        keys = keys[keep]
+
+        late = batch['day'] <= self._arrays['last_run_day'][batch['row']]
+        changed = int((~late).sum())
+        affected: set = set()
+        if late.any():
+            if not self._replayable:
+                logger.warning(f"特征库文件缺少出赛记录, 跳过 {int(late.sum())} 条迟到的记录 (请重建特征库)")
+            else:
+                affected, merged = self._merge_late({name: values[late] for name, values in batch.items()}, keys[late])
+                changed += merged
+
+        fresh = {name: values[~late] for name, values in batch.items()}
+        positions = self._append_log(fresh)
+        if affected:
+            positions = positions[~np.isin(fresh['row'], list(affected))]
+            self._rebuild(np.array(sorted(affected), dtype=np.int64))
+        self._apply_log(positions)
+        return changed
+
+    def _merge_late(self, late: Dict[str, np.ndarray], keys: np.ndarray) -> Tuple[set, int]:
+        """把迟到的记录并入出赛记录, 返回 (需重算的马匹行号, 有变化的记录数)"""
+        n = self._log_size
+        log_keys = _run_key(self._log['row'][:n], self._log['day'][:n]) if n else np.empty(0, np.int64)
+        order = np.argsort(log_keys, kind='stable')
+        found_at = np.searchsorted(log_keys[order], keys)
+        affected, changed, appended = set(), 0, []
+        for i, key in enumerate(keys.tolist()):
+            run = {name: late[name][i] for name in self._LOG_SCHEMA}
+            j = found_at[i]
+            if j < n and log_keys[order[j]] == key:
+                position = order[j]
+                old = {name: self._log[name][position] for name in self._LOG_SCHEMA}
+                merged = {name: run[name] if not _missing(name, run[name]) else old[name] for name in run}
+                if all(_same(merged[name], old[name]) for name in merged):
+                    continue
+                for name, value in merged.items():
+                    self._log[name][position] = value
+            else:
+                appended.append(i)
+            affected.add(int(run['row']))
+            changed += 1
+        if appended:
+            self._append_log({name: late[name][appended] for name in self._LOG_SCHEMA})
+        return affected, changed
+
+    def _rebuild(self, rows: np.ndarray):
+        """清空这些马匹的特征, 按日期顺序重放其全部出赛记录"""
+        for name, (_, _, fill) in self._schema().items():
+            self._arrays[name][rows] = fill
+        n = self._log_size
+        self._apply_log(np.flatnonzero(np.isin(self._log['row'][:n], rows)))
+
+    def _apply_log(self, positions: np.ndarray):
+        """按日期顺序写入出赛记录 (同一日每马最多一条)"""
+        if not len(positions):
+            return
+        log = self._log
+        positions = positions[np.argsort(log['day'][positions], kind='stable')]
+        days = log['day'][positions]
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(days)) + 1, [len(days)]))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            sel = positions[a:b]
+            self._apply(log['row'][sel].astype(np.int64), int(days[a]), log['finish'][sel],
+                        log['distance'][sel].astype(np.float64), log['course'][sel].astype(np.int64),
+                        log['draw'][sel].astype(np.float64), log['rating'][sel], log['body_weight'][sel])
+
+    def _apply(self, idx: np.ndarray, day: int, finish: np.ndarray, distance: np.ndarray,
+               course: np.ndarray, draw: np.ndarray, rating: np.ndarray, body_weight: np.ndarray):
+        """对一组 (互不重复的) 马匹写入同一日的出赛结果"""
+        a = self._arrays
+        won = (finish == 1).astype(np.int32)
+
+        a['last_finishes'][idx, 1:] = a['last_finishes'][idx, :-1]
+        a['last_finishes'][idx, 0] = finish
+        a['last_ratings'][idx, 1:] = a['last_ratings'][idx, :-1]
+        a['last_ratings'][idx, 0] = rating
+
+        a['starts'][idx] += 1
+        a['wins'][idx] += won
+        a['places'][idx] += (finish <= 3).astype(np.int32)
+        a['last_run_day'][idx] = day
+
+        has_weight = ~np.isnan(body_weight)
+        a['prev_body_weight'][idx[has_weight]] = a['last_body_weight'][idx[has_weight]]
+        a['last_body_weight'][idx[has_weight]] = body_weight[has_weight]
+
+        has_distance = distance > 0
+        band = distance_band(distance[has_distance])
+        a['distance_starts'][idx[has_distance], band] += 1
+        a['distance_wins'][idx[has_distance], band] += won[has_distance]
+
+        has_course = course >= 0
+        a['course_starts'][idx[has_course], course[has_course]] += 1
+        a['course_wins'][idx[has_course], course[has_course]] += won[has_course]
+
+        has_draw = draw > 0
+        dband = draw_band(draw[has_draw])
+        a['draw_starts'][idx[has_draw], dband] += 1
+        a['draw_wins'][idx[has_draw], dband] += won[has_draw]
+
+    def ingest_profile(self, horse_code: str, profile: Dict[str, Any]) -> int:
+        """写入 HorseRacingScraper.get_horse_profile 的往绩"""
+        history = (profile or {}).get('race_history') or []
+        return self.ingest_runs(
+            {
+                'horse_code': horse_code,
+                'race_date': run.get('date'),
+                'finish_position': run.get('finish_position'),
+                'distance': run.get('distance'),
+                'track': run.get('track'),
+                'draw': run.get('draw'),
+                'rating': run.get('rating'),
+                'body_weight': run.get('body_weight'),
+            }
+            for run in history
+        )
+
+    def ingest_history(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """写入 horse_history 表格式的往绩 (HorseHistorySync 同步后调用)"""
+        return self.ingest_runs(
+            {
+                'horse_code': row['horse_code'],
+                'race_date': row.get('race_date'),
+                'finish_position': row.get('finish_position'),
+                'distance': row.get('distance'),
+                'track': row.get('track'),
+                'draw': row.get('draw'),
+                'rating': row.get('rating'),
+                'body_weight': row.get('body_weight'),
+            }
+            for row in rows
+            if row.get('horse_code')
+        )
+
+    def ingest_results(self, results: Iterable[Dict[str, Any]]) -> int:
+        """写入 race_results 格式的赛果 (入库流程调用)"""
+        return self.ingest_runs(
+            {
+                'horse_code': r.get('horse_no') or r.get('horse_name'),
+                'race_date': r.get('race_date'),
+                'finish_position': r.get('finish_position'),
+                'distance': r.get('distance'),
+                'track': r.get('racecourse'),
+                'draw': r.get('draw'),
+            }
+            for r in results
+            if r.get('horse_no') or r.get('horse_name')
+        )
+
+    # ---- 查询 ----
+
+    def get(self, horse_code: str, as_of: Any = None, distance: Optional[int] = None,
+            track: Optional[str] = None, draw: Optional[int] = None) -> Dict[str, Any]:
+        """单匹马的特征 (O(1) 查找)"""
+        batch = self.get_batch([horse_code], as_of=as_of, distance=distance, track=track,
+                               draws=[draw] if draw is not None else None)
+        return batch.iloc[0].to_dict()
+
+    def get_batch(self, horse_codes: Sequence[str], as_of: Any = None,
+                  distance: Optional[int] = None, track: Optional[str] = None,
+                  draws: Optional[Sequence[int]] = None) -> pd.DataFrame:
+        """整张排位表的特征, 一次数组索引取出
+
+        distance / track / draws 给出时, 会附带该距离段、马场及档位段
+        的专项成绩。未见过的马匹返回空记录。
+        """
+        a = self._arrays
+        rows = np.array([self._index.get(code, -1) for code in horse_codes], dtype=np.int64)
+        known = rows >= 0
+        safe = np.where(known, rows, 0)
+        n = self.form_length
+
+        def take(name: str, fill):
+            values = a[name][safe]
+            mask = known.reshape((-1,) + (1,) * (values.ndim - 1))
+            return np.where(mask, values, fill)
+
+        starts = take('starts', 0)
+        wins = take('wins', 0)
+        last_run_day = take('last_run_day', -1)
+        last_finishes = take('last_finishes', -1)
+        last_ratings = take('last_ratings', np.nan).astype(np.float64)
+        last_bw = take('last_body_weight', np.nan).astype(np.float64)
+        prev_bw = take('prev_body_weight', np.nan).astype(np.float64)
+
+        as_of_day = _to_day(as_of) if as_of is not None else _to_day(datetime.now())
+        features = {
+            'horse_code': list(horse_codes),
+            'starts': starts,
+            'wins': wins,
+            'places': take('places', 0),
+            'win_rate': np.divide(wins, starts, out=np.zeros(len(rows)), where=starts > 0),
+            'days_since_last_run': np.where(last_run_day >= 0, as_of_day - last_run_day, -1),
+            'rating': last_ratings[:, 0],
+            # 评分走势: 最近一仗与 N 仗前 (有记录的最早一仗) 的差
+            'rating_trend': last_ratings[:, 0] - self._oldest(last_ratings),
+            'body_weight_change': last_bw - prev_bw,
+        }
+        for i in range(n):
+            features[f'finish_{i + 1}'] = last_finishes[:, i]
+
+        if distance is not None:
+            band = int(distance_band(np.array([distance]))[0])
+            features['distance_starts'] = take('distance_starts', 0)[:, band]
+            features['distance_wins'] = take('distance_wins', 0)[:, band]
+        if track is not None:
+            course = course_code(track)
+            if course >= 0:
+                features['course_starts'] = take('course_starts', 0)[:, course]
+                features['course_wins'] = take('course_wins', 0)[:, course]
+        if draws is not None:
+            dband = draw_band(np.asarray(draws, dtype=np.float64))
+            features['draw_starts'] = take('draw_starts', 0)[np.arange(len(rows)), dband]
+            features['draw_wins'] = take('draw_wins', 0)[np.arange(len(rows)), dband]
+
+        return pd.DataFrame(features)
+
+    @staticmethod
+    def _oldest(values: np.ndarray) -> np.ndarray:
+        """每行最后一个非 NaN 的值"""
+        valid = ~np.isnan(values)
+        last = values.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+        return np.where(valid.any(axis=1), values[np.arange(len(values)), last], np.nan)
+
+    # ---- 持久化 ----
+
+    def save(self, path: str):
+        """保存为 npz (每个特征一个数组)"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        arrays = {name: values[:self._size] for name, values in self._arrays.items()}
+        if self._replayable:
+            arrays.update({f'log_{name}': values[:self._log_size] for name, values in self._log.items()})
+        np.savez(path, codes=np.array(self._codes, dtype=object), form_length=np.int32(self.form_length), **arrays)
+        logger.info(f"特征库已保存: {path} ({self._size} 匹马)")
+
+    @classmethod
+    def load(cls, path: str, form_length: int = 6) -> 'HorseFeatureStore':
+        """读取特征库, 文件不存在时返回空库
+
+        文件的 form_length 与参数不同时按出赛记录重建; 不含出赛记录的旧文件
+        无法重建, 抛出 ValueError。
+        """
+        store = cls(form_length=form_length)
+        if not os.path.exists(path):
+            return store
+        with np.load(path, allow_pickle=True) as data:
+            codes = [str(c) for c in data['codes']]
+            if 'form_length' in data:
+                saved_length = int(data['form_length'])
+            elif 'last_finishes' in data and data['last_finishes'].ndim == 2:
+                saved_length = data['last_finishes'].shape[1]
+            else:
+                saved_length = form_length
+            resized = saved_length != form_length
+            if resized and 'log_day' not in data:
+                raise ValueError(f"特征库 {path} 的 FORM_LENGTH 为 {saved_length}, 与配置的 {form_length} 不同, "
+                                 f"且不含出赛记录无法重建, 请删除该文件后重新生成")
+            store._allocate(max(1024, len(codes) * 2))
+            if not resized:
+                for name in store._arrays:
+                    if name in data:
+                        store._arrays[name][:len(codes)] = data[name]
+            if 'log_day' in data:
+                store._grow_log(len(data['log_day']))
+                for name in store._LOG_SCHEMA:
+                    store._log[name][:len(data['log_day'])] = data[f'log_{name}']
+                store._log_size = len(data['log_day'])
+            elif codes:
+                store._replayable = False
+                logger.warning(f"特征库 {path} 不含出赛记录, 迟到或更正的赛果无法重算, 建议删除后重建")
+        store._codes = codes
+        store._index = {code: i for i, code in enumerate(codes)}
+        store._size = len(codes)
+        if resized:
+            logger.warning(f"特征库 {path} 的 FORM_LENGTH 为 {saved_length}, 按出赛记录以 {form_length} 重建")
+            store._rebuild(np.arange(store._size))
+        logger.info(f"特征库已加载: {path} ({store._size} 匹马)")
+        return store
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.services.parsing import parse_horse_profile
+
+logger = logging.getLogger(__name__)
+
+# 往绩列 -> horse_history 列
+HISTORY_FIELDS = {
+    'race_no': 'race_no', 'season': 'season', 'track': 'track', 'distance': 'distance',
+    'track_condition': 'track_condition', 'class': 'race_class', 'draw': 'draw', 'rating': 'rating',
+    'trainer': 'trainer', 'jockey': 'jockey', 'finish_position': 'finish_position',
+    'win_odds': 'win_odds', 'actual_weight': 'actual_weight', 'running_position': 'running_position',
+    'finish_time': 'finish_time', 'body_weight': 'body_weight', 'gear': 'gear',
+}
+
+
+def parse_history_date(text: str) -> Optional[str]:
+    """往绩日期 (dd/mm/yy 或 dd/mm/yyyy) -> YYYY-MM-DD"""
+    for fmt in ('%d/%m/%y', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(text.strip(), fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def row_hash(record: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(record, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def new_history_rows(horse_code: str, history: List[Dict[str, Any]],
+                     state: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """与同步进度比较, 只返回新增 (或最近一行内容有变) 的往绩行及新的同步进度
+
+    同步进度记录最近一行的日期及摘要: 更早的行已入库不再比较; 同一日期
+    的行摘要相同即未变更。页面上没有任何往绩时返回 (空, None)。
+    """
+    last_date = state['last_race_date'] if state else None
+    last_hash = state['last_row_hash'] if state else None
+
+    rows, latest = [], None
+    for record in history:
+        race_date = parse_history_date(record.get('date', ''))
+        if race_date is None:
+            continue
+        digest = row_hash(record)
+        if latest is None or race_date > latest[0]:
+            latest = (race_date, digest)
+        if last_date and (race_date < last_date or (race_date == last_date and digest == last_hash)):
+            continue
+        row = {'horse_code': horse_code, 'race_date': race_date, 'row_hash': digest}
+        row.update({column: record.get(field, '') for field, column in HISTORY_FIELDS.items()})
+        rows.append(row)
+
+    if latest is None:
+        return [], None
+    new_state = {
+        'horse_code': horse_code,
+        'last_race_date': latest[0],
+        'last_row_hash': latest[1],
+        'rows': (state['rows'] if state and state.get('rows') else 0) + len(rows),
+        'synced_at': datetime.now(),
+    }
+    return rows, new_state
+
+
+class HorseHistorySync:
+    """增量同步马匹往绩
+
+    以 race_results 中各马最近的出赛日期与同步进度比较, 只同步上次同步
+    之后再有出赛的马匹; 这些马匹的资料页面以条件请求重新验证, 解析后
+    只追加新的往绩行。给出特征库时, 新的往绩行 (含评分及体重) 一并写入。
+    """
+
+    def __init__(self, storage, scraper, batch_size: int = 200, feature_store=None):
+        self.storage = storage
+        self.scraper = scraper
+        self.batch_size = batch_size
+        self.feature_store = feature_store
+
+    def sync(self, since: Optional[str] = None, horse_codes: Optional[List[str]] = None) -> Dict[str, int]:
+        """同步到期的马匹 (或指定的马匹), 返回统计"""
+        if horse_codes is None:
+            horse_codes = [row['horse_code'] for row in self.storage.get_horses_due_for_sync(since)]
+        stats = {'horses': len(horse_codes), 'fetched': 0, 'updated': 0, 'rows': 0, 'failed': 0, 'no_page_id': 0}
+        logger.info(f"需要同步往绩的马匹: {len(horse_codes)}")
+
+        for start in range(0, len(horse_codes), self.batch_size):
+            batch = horse_codes[start:start + self.batch_size]
+            # HorseId 含马匹入口年份, 只能取自赛果页面的链接 (入库时记录)
+            known = self.storage.get_horse_page_ids(batch)
+            missing = [code for code in batch if code not in known]
+            if missing:
+                stats['no_page_id'] += len(missing)
+                logger.debug(f"未有资料页面 HorseId 的马匹 (须重新抓取其赛果): {missing}")
+            batch = [code for code in batch if code in known]
+            page_ids = {known[code]: code for code in batch}
+            pages = self.scraper.fetch_horse_pages(page_ids, revalidate=True)
+            states = self.storage.get_horse_sync_states(batch)
+
+            rows, new_states = [], []
+            for page_id, page in pages.items():
+                code = page_ids[page_id]
+                try:
+                    profile = parse_horse_profile(page)
+                except (ValueError, IndexError) as e:
+                    stats['failed'] += 1
+                    logger.warning(f"解析马匹资料失败 - {code}: {e}")
+                    continue
+                new_rows, state = new_history_rows(code, profile['race_history'], states.get(code))
+                if state is None:
+                    continue
+                rows.extend(new_rows)
+                new_states.append(state)
+                stats['updated'] += bool(new_rows)
+            stats['fetched'] += len(pages)
+            stats['failed'] += len(batch) - len(pages)
+            stats['rows'] += len(rows)
+            self.storage.save_horse_history(rows, new_states)
+            if self.feature_store is not None and rows:
+                self.feature_store.ingest_history(rows)
+
+        logger.info(f"往绩同步完成: {stats}")
+        return stats
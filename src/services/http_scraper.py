@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from src.services.parsing import parse_results_page
+from src.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# 与 RaceScraper 共用同名指标
+STAGE_SECONDS = metrics.histogram('scraper_stage_seconds', "抓取各阶段耗时 (秒)", ('stage',))
+PAGES = metrics.counter('scraper_pages_total', "打开的赛果页面数", ('outcome',))
+RECORDS = metrics.counter('scraper_records_total', "解析出的出赛记录数")
+RETRIES = metrics.counter('scraper_retries_total', "请求失败后的重试次数")
+
+RESULTS_URL = "https://racing.hkjc.com/racing/information/Chinese/Racing/LocalResults.aspx"
+
+
+class HttpRaceScraper:
+    """不经浏览器的赛果抓取 (直接请求页面并以 lxml 解析), 接口与 RaceScraper 相同
+
+    页面由服务器端渲染时可代替浏览器, 每个进程只需一个连接池。
+    """
+
+    def __init__(self, config: Dict, rate_limiter=None):
+        self.config = config
+        self.base_url = config.get('RESULTS_URL', RESULTS_URL)
+        self.timeout = config.get('TIMEOUT', 30)
+        self.max_retries = config.get('MAX_RETRIES', 3)
+        self.max_races = config.get('MAX_RACES', 12)
+        self.rate_limiter = rate_limiter
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.is_initialized = False
+
+    async def init(self):
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+        )
+        self.is_initialized = True
+        logger.info("HTTP 爬虫初始化成功")
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        self.session = None
+        self.is_initialized = False
+
+    async def _get(self, params: Dict[str, str]) -> str:
+        for attempt in range(self.max_retries):
+            if self.rate_limiter is not None:
+                with STAGE_SECONDS.time(stage='throttle'):
+                    await self.rate_limiter.acquire()
+            try:
+                with STAGE_SECONDS.time(stage='navigate'):
+                    async with self.session.get(self.base_url, params=params) as response:
+                        response.raise_for_status()
+                        return await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries - 1:
+                    PAGES.inc(outcome='error')
+                    raise
+                RETRIES.inc()
+                logger.warning(f"请求失败 ({params}), 重试: {e}")
+                await asyncio.sleep(2 ** attempt)
+        return ''
+
+    async def scrape_single_date(self, date: str, racecourse: str = "ST") -> List[Dict[str, Any]]:
+        """抓取单个日期及马场的全部场次, 某场没有赛果表格即视为当日赛事结束"""
+        race_date = date.replace('/', '-')
+        all_data = []
+        for race_no in range(1, self.max_races + 1):
+            page = await self._get({
+                'RaceDate': date.replace('-', '/'),
+                'Racecourse': racecourse,
+                'RaceNo': str(race_no),
+            })
+            with STAGE_SECONDS.time(stage='extract'):
+                records = parse_results_page(page, race_date, racecourse)
+            if not records:
+                PAGES.inc(outcome='no_race')
+                break
+            PAGES.inc(outcome='race')
+            RECORDS.inc(len(records))
+            all_data.extend(records)
+        return all_data
+
+    async def scrape_race_data(self, date: str, racecourses: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """依次尝试给定 (或配置中) 的马场 (每个赛马日只在一个马场举行)"""
+        courses = racecourses or [c['code'] for c in self.config.get('RACECOURSES', []) if c.get('code')] or ['ST']
+        for racecourse in courses:
+            try:
+                race_data = await self.scrape_single_date(date, racecourse)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"爬取 {date} 的数据时出错: {e}")
+                return []
+            if race_data:
+                return race_data
+        return []
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+import aiohttp
+import numpy as np
+
+from src.services.parsing import parse_results_page, race_content_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESULTS_URL = "https://racing.hkjc.com/racing/information/Chinese/Racing/LocalResults.aspx"
+
+# 延迟分段: 页面更新 -> 轮询发现 -> 写入数据库 -> 推送到订阅者
+LATENCY_STAGES = ('detect', 'ingest', 'deliver')
+
+
+def latency_summary(values) -> Dict[str, float]:
+    """延迟样本 (秒) 的分位数, 以毫秒表示"""
+    samples = np.asarray(list(values), dtype=np.float64)
+    if len(samples) == 0:
+        return {'count': 0}
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99]) * 1000
+    return {
+        'count': int(len(samples)),
+        'p50_ms': round(float(p50), 1),
+        'p90_ms': round(float(p90), 1),
+        'p99_ms': round(float(p99), 1),
+        'max_ms': round(float(samples.max() * 1000), 1),
+    }
+
+
+class DeltaBroadcaster:
+    """把赛果变更推送给所有订阅者 (SSE / WebSocket)
+
+    每个订阅者一个有界队列, 消费过慢时丢弃最旧的事件而不阻塞轮询;
+    最近的事件保留在回放缓冲区, 断线重连时按 Last-Event-ID 补发。
+    """
+
+    def __init__(self, queue_size: int = 100, replay_size: int = 200, latency_samples: int = 10000):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._replay: Deque[Dict[str, Any]] = deque(maxlen=replay_size)
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._latency = {stage: deque(maxlen=latency_samples) for stage in LATENCY_STAGES}
+        self._sequence = 0
+        self.dropped = 0
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """进程内的回调 (例如使响应缓存失效)"""
+        self._listeners.append(callback)
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if last_event_id is not None:
+            for event in self._replay:
+                if event['id'] > last_event_id and not queue.full():
+                    queue.put_nowait(event)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """发布事件, 返回带序号的事件"""
+        self._sequence += 1
+        event = {**event, 'id': self._sequence, 'published_at': time.time()}
+        self._replay.append(event)
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"变更回调出错: {e}")
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+        return event
+
+    def record_delivery(self, event: Dict[str, Any]):
+        """事件已写入订阅者连接, 记录各阶段延迟"""
+        delivered_at = time.time()
+        changed_at = event.get('changed_at', event['published_at'])
+        self._latency['detect'].append(event.get('detected_at', changed_at) - changed_at)
+        self._latency['ingest'].append(event.get('ingested_at', changed_at) - event.get('detected_at', changed_at))
+        self._latency['deliver'].append(delivered_at - changed_at)
+
+    def latency_report(self) -> Dict[str, Any]:
+        report = {stage: latency_summary(values) for stage, values in self._latency.items()}
+        report['subscribers'] = self.subscriber_count
+        report['dropped'] = self.dropped
+        return report
+
+    @staticmethod
+    def encode_sse(event: Dict[str, Any]) -> bytes:
+        data = json.dumps(event, ensure_ascii=False, default=str)
+        return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n".encode('utf-8')
+
+
+class LiveRaceMonitor:
+    """赛马日实时模式: 轮询当日赛果页面, 只写入并推送有变化的场次
+
+    每个场次保存上次响应的 ETag / Last-Modified, 以条件请求轮询, 未变更
+    的页面只得到 304; 页面有变化时再比较解析后赛果的摘要, 只有赛果本身
+    变化 (例如赛果正式公布或更正) 才写入并推送。写入与抓取相同, 经
+    BatchProcessor.ingest_batch: 校验及隔离、预写日志 (数据库不可用时
+    照常轮询), 其后更新特征库及偏差立方体。
+    """
+
+    def __init__(self, storage, broadcaster: DeltaBroadcaster, config: Optional[Dict] = None,
+                 race_date: Optional[str] = None, racecourse: Optional[str] = None, processor=None):
+        config = config or {}
+        self.storage = storage
+        self.broadcaster = broadcaster
+        if processor is None:
+            from src.services.batch_processor import BatchProcessor
+            processor = BatchProcessor(None, storage, {})
+        self.processor = processor
+        self.base_url = config.get('BASE_URL', DEFAULT_RESULTS_URL)
+        self.poll_interval = config.get('POLL_INTERVAL', 5.0)
+        self.max_races = config.get('MAX_RACES', 12)
+        self.timeout = config.get('TIMEOUT', 10)
+        self.race_date = (race_date or config.get('RACE_DATE') or datetime.now().strftime("%Y-%m-%d")).replace('/', '-')
+        self.racecourse = racecourse or config.get('RACECOURSE', 'ST')
+
+        self._validators: Dict[int, Dict[str, str]] = {}
+        self._hashes: Dict[int, str] = {}
+        self.stats = {'requests': 0, 'not_modified': 0, 'unchanged': 0, 'changed': 0, 'quarantined': 0,
+                      'errors': 0}
+
+    def _races_to_poll(self) -> List[int]:
+        """已公布的场次 (可能更正) 及下一场待公布的场次"""
+        pending = max(self._hashes, default=0) + 1
+        races = sorted(self._hashes)
+        if pending <= self.max_races:
+            races.append(pending)
+        return races
+
+    @staticmethod
+    def _changed_at(headers, fallback: float) -> float:
+        """页面更新时间: X-Changed-At (回放服务器) 或 Last-Modified, 否则为发现时间"""
+        if headers.get('X-Changed-At'):
+            try:
+                return float(headers['X-Changed-At'])
+            except ValueError:
+                pass
+        if headers.get('Last-Modified'):
+            try:
+                return min(parsedate_to_datetime(headers['Last-Modified']).timestamp(), fallback)
+            except (TypeError, ValueError):
+                pass
+        return fallback
+
+    async def poll_race(self, session: aiohttp.ClientSession, race_no: int) -> Optional[Dict[str, Any]]:
+        """轮询一场赛事, 赛果有变化时写入并返回推送的事件"""
+        params = {
+            'RaceDate': self.race_date.replace('-', '/'),
+            'Racecourse': self.racecourse,
+            'RaceNo': str(race_no),
+        }
+        headers = {}
+        validators = self._validators.get(race_no, {})
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        self.stats['requests'] += 1
+        async with session.get(self.base_url, params=params, headers=headers) as response:
+            if response.status == 304:
+                self.stats['not_modified'] += 1
+                return None
+            if response.status != 200:
+                self.stats['errors'] += 1
+                logger.warning(f"第 {race_no} 场赛果页面返回 {response.status}")
+                return None
+            page = await response.text()
+            detected_at = time.time()
+            changed_at = self._changed_at(response.headers, detected_at)
+            self._validators[race_no] = {
+                'etag': response.headers.get('ETag', ''),
+                'last_modified': response.headers.get('Last-Modified', ''),
+            }
+
+        records = parse_results_page(page, self.race_date, self.racecourse)
+        if not records:
+            return None
+        digest = race_content_hash(records)
+        if self._hashes.get(race_no) == digest:
+            self.stats['unchanged'] += 1
+            return None
+
+        amended = race_no in self._hashes
+        outcome, _ = await self.processor.ingest_batch(records)
+        self._hashes[race_no] = digest
+        if outcome == 'quarantined':
+            # 整场不通过校验, 已写入隔离表; 页面再有变化时重新处理
+            self.stats['quarantined'] += 1
+            logger.warning(f"{self.race_date} 第 {race_no} 场赛果未通过校验, 已隔离")
+            return None
+        self.stats['changed'] += 1
+
+        logger.info(f"{self.race_date} 第 {race_no} 场赛果{'更正' if amended else '公布'}, {len(records)} 匹")
+        return self.broadcaster.publish({
+            'type': 'race_amended' if amended else 'race_result',
+            'race_date': self.race_date,
+            'racecourse': self.racecourse,
+            'race_no': race_no,
+            'hash': digest,
+            'runners': records,
+            'changed_at': changed_at,
+            'detected_at': detected_at,
+            'ingested_at': time.time(),
+        })
+
+    async def poll_once(self, session: aiohttp.ClientSession) -> List[Dict[str, Any]]:
+        results = await asyncio.gather(
+            *(self.poll_race(session, race_no) for race_no in self._races_to_poll()),
+            return_exceptions=True
+        )
+        events = []
+        for result in results:
+            if isinstance(result, Exception):
+                self.stats['errors'] += 1
+                logger.error(f"轮询赛果时出错: {result}")
+            elif result is not None:
+                events.append(result)
+        return events
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """按固定间隔轮询, 直至 stop 被设置"""
+        stop = stop or asyncio.Event()
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        logger.info(f"实时模式: {self.race_date} {self.racecourse}, 每 {self.poll_interval} 秒轮询")
+        self.processor.start_replay()
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                while not stop.is_set():
+                    started = time.monotonic()
+                    await self.poll_once(session)
+                    # 已入库 (含回放入库) 的场次写入特征库及偏差立方体
+                    await asyncio.to_thread(self.processor.ingest_precomputed)
+                    remaining = self.poll_interval - (time.monotonic() - started)
+                    try:
+                        await asyncio.wait_for(stop.wait(), timeout=max(remaining, 0))
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            await self.processor.finish_replay()
+            await asyncio.to_thread(self.processor.ingest_precomputed)
+        logger.info(f"实时模式结束: {self.stats}")
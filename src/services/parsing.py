@@ -0,0 +1,286 @@
+import hashlib
+import json
+import logging
+import re
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # 只有 HTTP 抓取 (不经浏览器) 才需要
+    etree = None
+    lxml_html = None
+
+logger = logging.getLogger(__name__)
+
+# 班次: 第X班 / 分級賽 / 其他 (例如 四歲馬系列、新馬賽)
+_CLASS_PATTERN = re.compile(r"第([一二三四五])班")
+_GROUP_PATTERN = re.compile(r"([一二三])級賽")
+_CHINESE_DIGITS = {'一': '1', '二': '2', '三': '3', '四': '4', '五': '5'}
+
+# 非正常完成的名次标记
+NON_FINISH_MARKS = {"WV", "---", "DISQ", "DNF", "PU", "WX", ""}
+
+# 赛果表格及赛事信息 (与浏览器抓取使用的选择器一致)
+_RESULT_ROWS = (
+    "//table[contains(concat(' ', normalize-space(@class), ' '), ' table_bd ')"
+    " and contains(concat(' ', normalize-space(@class), ' '), ' draggable ')]"
+    "//tr[not(contains(@class, 'bg_blue')) and not(contains(@class, 'bg_gold'))]"
+)
+_RACE_TAB = "//*[contains(concat(' ', normalize-space(@class), ' '), ' race_tab ')]"
+# 马名单元格链接到马匹资料页面, 例如 Horse.aspx?HorseId=HK_2021_G123
+_HORSE_ID_PATTERN = re.compile(r"HorseId=([A-Za-z0-9_]+)", re.IGNORECASE)
+
+# 马匹资料页面: 标签 -> 字段 (按页面上的先后次序)
+PROFILE_LABELS = (
+    ('出生地 / 馬齡', 'origin_age'),
+    ('毛色 / 性別', 'color_sex'),
+    ('進口類別', 'import_type'),
+    ('今季獎金', 'season_stakes'),
+    ('總獎金', 'total_stakes'),
+    ('冠-亞-季-總出賽次數', 'record'),
+    ('現時評分', 'current_rating'),
+    ('季初評分', 'season_start_rating'),
+    ('外祖父', 'dam_sire'),
+    ('父系', 'sire'),
+    ('母系', 'dam'),
+)
+PROFILE_LINKS = (('Trainers', 'trainer'), ('OwnerSearch', 'owner'))
+PROFILE_FIELDS = (
+    'origin_age', 'color_sex', 'import_type', 'season_stakes', 'total_stakes', 'record',
+    'trainer', 'owner', 'current_rating', 'season_start_rating', 'sire', 'dam', 'dam_sire'
+)
+# 往绩表格的列 (前 15 列必有, 其后三列视乎页面)
+HISTORY_COLUMNS = (
+    'season', 'race_no', 'date', 'track', 'distance', 'track_condition', 'class', 'draw',
+    'rating', 'trainer', 'jockey', 'finish_position', 'win_odds', 'actual_weight',
+    'running_position', 'finish_time', 'body_weight', 'gear'
+)
+HISTORY_MIN_COLUMNS = 15
+
+if etree is not None:
+    # 预先编译, 每页只遍历一次
+    _LEAF_CELLS = etree.XPath(".//td[not(.//td)]")
+    _PROFILE_ANCHORS = etree.XPath(".//a[@href]")
+    _HORSE_LINKS = etree.XPath(".//a[contains(@href, 'HorseId=')]/@href")
+    _PERFORMANCE_ROWS = etree.XPath(
+        "//table[contains(concat(' ', normalize-space(@class), ' '), ' performance ')][1]//tr"
+    )
+
+
+def parse_race_class(info_text: str) -> str:
+    """解析班次, 例如 '第四班' -> '4', '一級賽' -> 'G1'"""
+    match = _CLASS_PATTERN.search(info_text or "")
+    if match:
+        return _CHINESE_DIGITS[match.group(1)]
+    match = _GROUP_PATTERN.search(info_text or "")
+    if match:
+        return f"G{_CHINESE_DIGITS[match.group(1)]}"
+    return ""
+
+
+def parse_finish_position(text: str) -> int:
+    """解析完赛位置, 非正常完成记为 99"""
+    if not text or text in NON_FINISH_MARKS:
+        return 99
+    try:
+        return int(text)
+    except ValueError:
+        logger.warning(f"无效名次: {text}，设置为 99")
+        return 99
+
+
+def parse_horse_page_id(href: Optional[str]) -> str:
+    """由马匹资料链接取出 HorseId, 没有时返回空字符串"""
+    match = _HORSE_ID_PATTERN.search(href or "")
+    return match.group(1) if match else ""
+
+
+def build_race_record(cells: List[str], race_info: str, race_date: str,
+                      racecourse: str = "", going: str = "") -> Optional[Dict[str, Any]]:
+    """由一行赛果单元格文字组成记录 (浏览器抓取及 HTTP 抓取共用)"""
+    if len(cells) < 12:
+        return None
+    cells = [c.strip() for c in cells]
+
+    # 提取馬匹編號和名稱
+    horse_name = cells[2]
+    horse_no = ""
+    if "(" in horse_name and ")" in horse_name:
+        horse_no = horse_name[horse_name.find("(")+1:horse_name.find(")")]
+        horse_name = horse_name[:horse_name.find("(")].strip()
+
+    # 提取檔位
+    try:
+        draw = int(cells[0])
+    except ValueError:
+        draw = 0
+
+    # 提取賽事資訊
+    if race_info:
+        # 只提取括号中的数字
+        race_id = ''.join(filter(str.isdigit, race_info.split()[2]))
+        distance = int(''.join(filter(str.isdigit, race_info.split('-')[1].strip())))
+    else:
+        race_id = "0"
+        distance = 0
+
+    # 提取賠率
+    try:
+        odds = float(cells[11].replace('---', '0'))
+    except ValueError:
+        odds = 0.0
+
+    return {
+        "race_id": race_id,
+        "race_date": race_date,
+        "horse_no": horse_no,
+        "horse_name": horse_name,
+        "draw": draw,
+        "finish_position": parse_finish_position(cells[1]),
+        "jockey": cells[3],
+        "trainer": cells[4],
+        "finish_time": cells[10],
+        "odds": odds,
+        "distance": distance,
+        "race_info": race_info,
+        "racecourse": racecourse,
+        "race_class": parse_race_class(race_info),
+        "going": going
+    }
+
+
+def parse_results_page(page: str, race_date: str, racecourse: str = "") -> List[Dict[str, Any]]:
+    """解析赛果页面 HTML (不经浏览器), 页面没有赛果表格时返回空列表"""
+    if lxml_html is None:
+        raise RuntimeError("解析赛果页面需要安装 lxml")
+    doc = lxml_html.fromstring(page)
+    rows = doc.xpath(_RESULT_ROWS)
+    if not rows:
+        return []
+
+    title, distance, going = "", "", ""
+    for tab in doc.xpath(_RACE_TAB):
+        cells = tab.xpath(".//td")
+        for i, cell in enumerate(cells):
+            text = cell.text_content().strip()
+            if not title and ('f_title' in (cell.get('class') or '') or '第' in text):
+                title = text
+            elif not distance and '米' in text:
+                distance = text
+            elif '場地狀況' in text and i + 1 < len(cells):
+                going = cells[i + 1].text_content().strip()
+    race_info = f"{title} {distance}"
+
+    records = []
+    for row in rows:
+        cells = [td.text_content() for td in row.xpath("./td")]
+        try:
+            record = build_race_record(cells, race_info, race_date, racecourse, going)
+        except (IndexError, ValueError) as e:
+            logger.debug(f"跳过无法解析的行: {e}")
+            continue
+        if record:
+            # 马匹资料页面的 HorseId (含马匹入口年份, 不能由烙号推算)
+            page_id = parse_horse_page_id(next(iter(_HORSE_LINKS(row)), None))
+            if page_id:
+                record['horse_page_id'] = page_id
+            records.append(record)
+    return records
+
+
+# 赛期表: 单元格内的马场标记 (图片 alt/src 或文字)
+_FIXTURE_COURSES = (('跑馬地', 'HV'), ('沙田', 'ST'), ('HV', 'HV'), ('ST', 'ST'))
+_FIXTURE_DAY = re.compile(r"^\s*(\d{1,2})\b")
+
+
+def parse_fixtures_page(page: str, year: int, month: int) -> List[Tuple[str, str]]:
+    """解析马会赛期表 (某年某月) 页面, 返回 [(日期, 马场)]
+
+    日历的每个单元格以日子开头, 有赛事的日子带马场图标或文字; 只取带马场
+    标记的单元格, 页面结构不符时返回空列表。
+    """
+    if lxml_html is None:
+        raise RuntimeError("解析赛期表需要安装 lxml")
+    doc = lxml_html.fromstring(page)
+    fixtures = {}
+    for cell in doc.xpath("//td[not(.//td)]"):
+        match = _FIXTURE_DAY.match(cell.text_content())
+        if not match or not 1 <= int(match.group(1)) <= 31:
+            continue
+        markers = ' '.join([cell.text_content()] + [
+            f"{img.get('alt', '')} {img.get('src', '').rsplit('/', 1)[-1].upper()}" for img in cell.xpath(".//img")
+        ])
+        course = next((code for marker, code in _FIXTURE_COURSES if marker in markers), None)
+        if course:
+            try:
+                fixtures[date(year, month, int(match.group(1))).isoformat()] = course
+            except ValueError:
+                continue
+    return sorted(fixtures.items())
+
+
+def race_content_hash(records: List[Dict[str, Any]]) -> str:
+    """一场赛事内容的摘要 (与记录顺序无关), 用于判断赛果是否有变"""
+    rows = sorted(
+        json.dumps(r, sort_keys=True, ensure_ascii=False, default=str) for r in records
+    )
+    return hashlib.sha256('\n'.join(rows).encode('utf-8')).hexdigest()
+
+
+def _profile_label(text: str) -> Optional[str]:
+    for label, field in PROFILE_LABELS:
+        if label in text:
+            return field
+    return None
+
+
+def parse_horse_profile(page: str) -> Dict[str, Any]:
+    """解析马匹资料页面 (lxml), 结构与 HorseRacingScraper 原有输出一致
+
+    基本资料表的单元格只遍历一次, 建立 标签 -> 值 的对照 (值为标签之后
+    第一个非冒号的单元格); 往绩表按列位置直接对应列名, 不再逐列查找。
+    """
+    if lxml_html is None:
+        raise RuntimeError("解析马匹资料需要安装 lxml")
+    doc = lxml_html.fromstring(page)
+    tables = doc.xpath('//table')
+    if not tables:
+        raise ValueError("页面没有资料表格")
+    info_table = tables[0]  # 第一个表格包含基本信息
+
+    basic_info = dict.fromkeys(PROFILE_FIELDS, '')
+    found = 0
+    pending = None
+    for cell in _LEAF_CELLS(info_table):
+        text = cell.text_content().strip()
+        if pending is not None:
+            if text and text != ':':
+                basic_info[pending] = text
+                found += 1
+                pending = None
+            continue
+        pending = _profile_label(text)
+    for anchor in _PROFILE_ANCHORS(info_table):
+        href = anchor.get('href')
+        for marker, field in PROFILE_LINKS:
+            if marker in href and not basic_info[field]:
+                basic_info[field] = anchor.text_content().strip()
+                found += 1
+    if not found:
+        raise ValueError("页面不是马匹资料页面")
+
+    # 往绩: 跳过表头, 每行只取直接子单元格的文字, 按列位置对应列名
+    width = len(HISTORY_COLUMNS)
+    race_history = []
+    for row in _PERFORMANCE_ROWS(doc)[1:]:
+        cells = [td.text_content().strip() for td in row.iterchildren('td')]
+        if len(cells) >= HISTORY_MIN_COLUMNS:
+            cells = cells[:width] + [''] * (width - len(cells))
+            race_history.append(dict(zip(HISTORY_COLUMNS, cells)))
+
+    return {
+        'basic_info': basic_info,
+        'race_history': race_history
+    }
@@ -0,0 +1,321 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 写入共享内存的列及其类型, 子进程按名称挂载后只读取自己分区的切片
+SHARED_COLUMNS = {
+    'jockey': np.int32,           # 骑师下标 (代理键 jockey_id, -1 表示未知)
+    'finish_position': np.int16,  # 名次
+    'odds': np.float64,           # 赔率, NaN 表示无效
+    'day': np.int32,              # 日期序号 (自 1970-01-01 起的天数)
+}
+
+PARTITION_MODES = ('season', 'month')
+
+
+@dataclass
+class PartialStats:
+    """单个分区的可合并部分聚合"""
+    starts: np.ndarray        # 每位骑师出赛次数
+    wins: np.ndarray          # 每位骑师胜场
+    position_sum: np.ndarray  # 名次总和 (整数, 合并时精确)
+    odds_sum: np.ndarray      # 有效赔率总和
+    odds_count: np.ndarray    # 有效赔率数量
+    odds_min: np.ndarray
+    odds_max: np.ndarray
+    race_days: int            # 分区内的赛事天数 (分区按日期划分, 互不重叠)
+
+    @classmethod
+    def empty(cls, n_jockeys: int) -> 'PartialStats':
+        """创建空的部分聚合"""
+        return cls(
+            starts=np.zeros(n_jockeys, dtype=np.int64),
+            wins=np.zeros(n_jockeys, dtype=np.int64),
+            position_sum=np.zeros(n_jockeys, dtype=np.int64),
+            odds_sum=np.zeros(n_jockeys, dtype=np.float64),
+            odds_count=np.zeros(n_jockeys, dtype=np.int64),
+            odds_min=np.full(n_jockeys, np.inf),
+            odds_max=np.full(n_jockeys, -np.inf),
+            race_days=0
+        )
+
+    def merge(self, other: 'PartialStats') -> 'PartialStats':
+        """合并另一个分区的部分聚合 (原地)"""
+        self.starts += other.starts
+        self.wins += other.wins
+        self.position_sum += other.position_sum
+        self.odds_sum += other.odds_sum
+        self.odds_count += other.odds_count
+        np.minimum(self.odds_min, other.odds_min, out=self.odds_min)
+        np.maximum(self.odds_max, other.odds_max, out=self.odds_max)
+        self.race_days += other.race_days
+        return self
+
+
+def compute_partial(jockey: np.ndarray, finish_position: np.ndarray,
+                    odds: np.ndarray, day: np.ndarray, n_jockeys: int) -> PartialStats:
+    """计算一个分区的部分聚合"""
+    partial = PartialStats.empty(n_jockeys)
+    if len(jockey) == 0:
+        return partial
+
+    # 骑师为空的记录 (下标为 -1) 只计入赛马日, 不计入骑师统计
+    race_days = int(np.unique(day).size)
+    known = jockey >= 0
+    if not known.all():
+        jockey, finish_position, odds = jockey[known], finish_position[known], odds[known]
+
+    partial.starts += np.bincount(jockey, minlength=n_jockeys)
+    partial.wins += np.bincount(jockey, weights=(finish_position == 1), minlength=n_jockeys).astype(np.int64)
+    partial.position_sum += np.bincount(
+        jockey, weights=finish_position.astype(np.int64), minlength=n_jockeys
+    ).astype(np.int64)
+
+    valid = ~np.isnan(odds)
+    valid_jockey = jockey[valid]
+    valid_odds = odds[valid]
+    partial.odds_sum += np.bincount(valid_jockey, weights=valid_odds, minlength=n_jockeys)
+    partial.odds_count += np.bincount(valid_jockey, minlength=n_jockeys)
+    np.minimum.at(partial.odds_min, valid_jockey, valid_odds)
+    np.maximum.at(partial.odds_max, valid_jockey, valid_odds)
+
+    partial.race_days = race_days
+    return partial
+
+
+def _partition_worker(segments: Dict[str, Tuple[str, str]], total: int,
+                      start: int, stop: int, n_jockeys: int) -> PartialStats:
+    """子进程入口: 挂载共享内存并聚合 [start, stop) 切片"""
+    handles = []
+    try:
+        views = {}
+        for column, (shm_name, dtype) in segments.items():
+            shm = shared_memory.SharedMemory(name=shm_name)
+            handles.append(shm)
+            views[column] = np.ndarray((total,), dtype=np.dtype(dtype), buffer=shm.buf)[start:stop]
+        partial = compute_partial(
+            views['jockey'], views['finish_position'], views['odds'], views['day'], n_jockeys
+        )
+        # 释放视图后才能关闭共享内存
+        del views
+        return partial
+    finally:
+        for shm in handles:
+            shm.close()
+
+
+def has_jockey_ids(df: pd.DataFrame) -> bool:
+    """记录是否带有骑师代理键 (由 storage 读取的数据)"""
+    return 'jockey_id' in df and bool(df['jockey_id'].notna().any())
+
+
+def jockey_index(df: pd.DataFrame, dimensions=None) -> Tuple[np.ndarray, Dict[int, Any]]:
+    """骑师的整数下标及 {下标: 显示名称}
+
+    由 storage 读取的数据带有代理键 jockey_id, 直接作为下标 (bincount 分组), 名称只为
+    出现过的骑师各查一次 (有 DimensionRegistry 时用 name_of); 没有代理键的记录
+    (例如字典列表) 才按名称 factorize。
+    """
+    if not has_jockey_ids(df):
+        codes, uniques = pd.factorize(df['jockey'])
+        return codes.astype(np.int64), dict(enumerate(uniques))
+
+    index = pd.to_numeric(df['jockey_id'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+    known = index[index >= 0]
+    ids = np.flatnonzero(np.bincount(known)).tolist() if len(known) else []
+    if dimensions is not None:
+        names = [dimensions.name_of('jockey', jockey_id) for jockey_id in ids]
+    elif 'jockey' in df:
+        # 同一代理键的名称相同, 每个代理键任取一行
+        row_of = np.zeros(len(ids) and ids[-1] + 1, dtype=np.int64)
+        row_of[known] = np.flatnonzero(index >= 0)
+        names = df['jockey'].iloc[row_of[ids]].tolist()
+    else:
+        names = [str(jockey_id) for jockey_id in ids]
+    return index, dict(zip(ids, names))
+
+
+def partition_keys(day: np.ndarray, partition_by: str) -> Tuple[np.ndarray, List[str]]:
+    """根据日期序号计算分区键
+
+    HKJC 马季由九月开始至翌年七月, 因此 season 模式以九月为界。
+    """
+    if partition_by not in PARTITION_MODES:
+        raise ValueError(f"不支持的分区方式: {partition_by}")
+
+    months = day.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    year = months // 12 + 1970
+    month = months % 12 + 1
+    if partition_by == 'season':
+        keys = year - (month < 9)
+        labels = [f"{k}/{(k + 1) % 100:02d}" for k in np.unique(keys)]
+    else:
+        keys = months
+        labels = [f"{k // 12 + 1970}-{k % 12 + 1:02d}" for k in np.unique(keys)]
+    return keys, labels
+
+
+class PartitionedExecutor:
+    """按马季或月份分区, 在进程池中并行计算部分聚合后精确合并"""
+
+    def __init__(self, partition_by: str = 'season', max_workers: Optional[int] = None,
+                 min_rows_for_pool: int = 50000, dimensions=None):
+        self.partition_by = partition_by
+        self.dimensions = dimensions
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # 数据量较小时进程池的启动开销大于收益, 直接在本进程计算
+        self.min_rows_for_pool = min_rows_for_pool
+
+    def run(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """执行分区分析"""
+        jockey, jockey_names = jockey_index(df, self.dimensions)
+        columns = {
+            'jockey': jockey.astype(np.int32),
+            'finish_position': pd.to_numeric(df['finish_position'], errors='coerce')
+                .fillna(99).astype(np.int16).to_numpy(),
+            'odds': pd.to_numeric(df['odds'], errors='coerce').astype(np.float64).to_numpy(),
+            'day': pd.to_datetime(df['race_date']).to_numpy()
+                .astype('datetime64[D]').astype(np.int32),
+        }
+        n_jockeys = int(jockey.max()) + 1 if len(jockey) else 0
+        # 赔率分析需要全部获胜赔率 (精确分位数), 只占记录的一小部分, 在本进程计算
+        analysis = odds_analysis(df, columns['odds'], columns['finish_position'])
+
+        keys, labels = partition_keys(columns['day'], self.partition_by)
+        order = np.argsort(keys, kind='stable')
+        columns = {name: values[order] for name, values in columns.items()}
+        keys = keys[order]
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1, [len(keys)]))
+        ranges = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        logger.info(f"分区分析: {len(df)} 条记录, {len(ranges)} 个分区 ({self.partition_by})")
+
+        if len(df) < self.min_rows_for_pool or self.max_workers <= 1 or len(ranges) <= 1:
+            partials = [
+                compute_partial(columns['jockey'][a:b], columns['finish_position'][a:b],
+                                columns['odds'][a:b], columns['day'][a:b], n_jockeys)
+                for a, b in ranges
+            ]
+        else:
+            partials = self._run_in_pool(columns, ranges, n_jockeys)
+
+        merged = PartialStats.empty(n_jockeys)
+        for partial in partials:
+            merged.merge(partial)
+
+        result = finalize(merged, jockey_names, len(df))
+        result['summary']['avg_winning_odds'] = analysis['winners']['avg_winning_odds']
+        result['odds_analysis'] = dict(analysis, jockey_odds=result.pop('jockey_odds'))
+        return {
+            'partitions': [
+                {'partition': label, 'total_races': int(b - a)}
+                for label, (a, b) in zip(labels, ranges)
+            ],
+            **result
+        }
+
+    def _run_in_pool(self, columns: Dict[str, np.ndarray], ranges: List[Tuple[int, int]],
+                     n_jockeys: int) -> List[PartialStats]:
+        """把列写入共享内存, 子进程只接收内存名称和切片范围"""
+        total = len(columns['jockey'])
+        blocks = []
+        try:
+            segments = {}
+            for name, values in columns.items():
+                shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                blocks.append(shm)
+                np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+                segments[name] = (shm.name, values.dtype.str)
+
+            workers = min(self.max_workers, len(ranges))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(_partition_worker, segments, total, start, stop, n_jockeys)
+                    for start, stop in ranges
+                ]
+                return [future.result() for future in futures]
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+
+def odds_analysis(df: pd.DataFrame, odds: np.ndarray, finish_position: np.ndarray,
+                  top_k: int = 5) -> Dict[str, Any]:
+    """整体/获胜赔率及爆冷获胜 (获胜赔率高于 75 分位数), 与 analyze_yearly_stats 相同口径"""
+    def describe(values: np.ndarray) -> Tuple[float, float, float]:
+        if not len(values):
+            return float('nan'), float('nan'), float('nan')
+        return float(values.mean()), float(values.max()), float(values.min())
+
+    winners = finish_position == 1
+    valid = ~np.isnan(odds)
+    winning = odds[winners & valid]
+    avg_odds, max_odds, min_odds = describe(odds[valid])
+    avg_winning, highest, lowest = describe(winning)
+
+    upset = winners & valid & (odds > np.quantile(winning, 0.75)) if len(winning) else np.zeros(len(odds), bool)
+    upset_wins = df.loc[upset].assign(odds=odds[upset]).sort_values('odds', ascending=False).head(top_k)
+    return {
+        'overall': {'avg_odds': avg_odds, 'max_odds': max_odds, 'min_odds': min_odds},
+        'winners': {
+            'avg_winning_odds': avg_winning,
+            'highest_odds_winner': highest,
+            'lowest_odds_winner': lowest,
+        },
+        'upset_wins': upset_wins.to_dict('records'),
+    }
+
+
+def finalize(merged: PartialStats, jockey_names: Dict[int, Any], total_rows: int) -> Dict[str, Any]:
+    """由合并后的聚合生成与 analyze_yearly_stats 相同口径的结果 (骑师下标在此换成名称)"""
+    active = merged.starts > 0
+    starts = merged.starts[active]
+    wins = merged.wins[active]
+    names = np.array([jockey_names.get(i, '') for i in np.flatnonzero(active).tolist()], dtype=object)
+    avg_position = merged.position_sum[active] / starts
+    win_rate = wins / starts * 100
+
+    odds_count = merged.odds_count[active]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        odds_mean = np.where(odds_count > 0, merged.odds_sum[active] / odds_count, np.nan)
+    odds_min = np.where(odds_count > 0, merged.odds_min[active], np.nan)
+    odds_max = np.where(odds_count > 0, merged.odds_max[active], np.nan)
+
+    jockey_stats = pd.DataFrame({
+        'jockey': names,
+        'total_races': starts,
+        'avg_position': avg_position,
+        'total_wins': wins,
+        'win_rate': win_rate,
+    }).round(2)
+    jockey_odds = pd.DataFrame({
+        'jockey': names,
+        'mean': odds_mean,
+        'min': odds_min,
+        'max': odds_max,
+        'win_rate': win_rate,
+    }).round(2)
+
+    return {
+        'summary': {
+            'total_races': total_rows,
+            'total_race_days': merged.race_days,
+            'active_jockeys': int(active.sum()),
+            'avg_races_per_day': round(total_rows / merged.race_days, 2) if merged.race_days else 0.0,
+            'avg_odds': float(merged.odds_sum.sum() / merged.odds_count.sum())
+                if merged.odds_count.sum() else float('nan'),
+        },
+        'jockey_stats': jockey_stats.to_dict('records'),
+        'jockey_odds': jockey_odds.to_dict('records'),
+        'top_jockeys': jockey_stats.nlargest(5, 'win_rate').to_dict('records'),
+        'most_active': jockey_stats.nlargest(5, 'total_races').to_dict('records'),
+    }
@@ -1,65 +1,183 @@
 import logging
 logger = logging.getLogger(__name__)
 
-from datetime import datetime
+import json
 import re
-from typing import Dict, Any, List
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.services.parsing import NON_FINISH_MARKS
+from src.utils import metrics
+
+REJECTS = metrics.counter('preprocess_rejects_total', "预处理拒收的记录数", ('reason',))
+ACCEPTED = metrics.counter('preprocess_accepted_total', "通过预处理的记录数")
+
+REQUIRED_FIELDS = ('race_id', 'race_date', 'horse_name', 'finish_position', 'jockey', 'odds', 'distance', 'draw')
+# 同一赛事同一匹马只应出现一次 (与 RaceResult.UNIQUE_KEY 一致, 场次由 race_id 得出)
+DUPLICATE_KEY = ('race_date', 'race_number', 'horse_name')
+
+# 预先编译, 整批共用
+_HORSE_CODE = re.compile(r"^(.*?)\s*\((\w+)\)\s*$")
+_DIGITS = re.compile(r"(\d+)")
+_DISTANCE = re.compile(r"^\s*(\d+)\s*(?:m|米)?\s*$")
+
+DEFAULT_LIMITS = {
+    'MAX_ODDS': 999.0,          # 赔率上限 (0 表示没有赔率)
+    'MIN_DISTANCE': 800,
+    'MAX_DISTANCE': 3300,
+    'MAX_DRAW': 16,
+    'MAX_POSITION': 16,         # 99 为非正常完成
+}
+
+
+def _to_float(values: List[Any]) -> np.ndarray:
+    """整列轉為 float (無法轉換為 NaN); 全部為數值時不經 pandas"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object).astype(str).str.strip(),
+                             errors='coerce').to_numpy(dtype=np.float64, copy=True)
+
+
+def _map_unique(values: List[Any], func) -> List[Any]:
+    """只對不同的值調用 func (同一批記錄的日期、場次高度重複)"""
+    mapping = {value: func(value) for value in set(values)}
+    return [mapping[value] for value in values]
+
+
+def _normalize_date(value: Any) -> Optional[str]:
+    try:
+        return datetime.strptime(str(value).replace('/', '-'), "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _race_number(value: Any) -> float:
+    match = _DIGITS.search(str(value))
+    return float(match.group(1)) if match else np.nan
+
+
+def _distance(value: Any) -> float:
+    match = _DISTANCE.match(str(value))
+    return float(match.group(1)) if match else np.nan
+
 
 class RaceDataPreprocessor:
-    """賽馬數據預處理器"""
-    
-    @staticmethod
-    def validate_required_fields(data: Dict[str, Any]) -> bool:
-        """驗證必要欄位"""
-        required_fields = [
-            'race_id', 'horse_no', 'finish_position',
-            'jockey', 'odds', 'race_date', 'distance', 'draw'
-        ]
-        return all(field in data for field in required_fields)
-    
-    @staticmethod
-    def clean_horse_name(name: str) -> tuple:
-        """處理馬匹名稱，分離編號"""
-        pattern = r"(.*?)\s*\((\w+)\)"
-        match = re.match(pattern, name)
-        if match:
-            return match.group(1).strip(), match.group(2)
-        return name, ""
-    
-    @staticmethod
-    def normalize_date(date_str: str) -> str:
-        """標準化日期格式"""
-        try:
-            date_obj = datetime.strptime(date_str, "%Y/%m/%d")
-            return date_obj.strftime("%Y-%m-%d")
-        except ValueError:
-            return date_str
-            
+    """賽馬數據預處理器 (整批向量化)
+
+    位於爬蟲與存儲之間: 整批標準化日期、拆分馬名中的烙號、轉換數值欄位,
+    並檢查缺欄、重複及離群值。各欄位按列以 numpy 數組處理, 高度重複的
+    文字欄位 (日期、場次) 只解析不同的值; 每條記錄只取第一個不通過的原因,
+    拒收記錄連同原因代碼交由 quarantined_records 表保存, 不逐條寫日誌。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.limits = {**DEFAULT_LIMITS, **(config or {})}
+
+    def process_batch(self, records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """返回 (通過的記錄, 拒收的記錄); 拒收記錄含 reason / detail / payload"""
+        if not records:
+            return [], []
+        n = len(records)
+        columns = {field: [record.get(field) for record in records] for field in REQUIRED_FIELDS}
+        reason = np.full(n, None, dtype=object)
+        detail = np.full(n, None, dtype=object)
+
+        def reject(mask: np.ndarray, code: str, field: str):
+            mask = mask & np.equal(reason, None)
+            for i in np.flatnonzero(mask):
+                reason[i] = code
+                detail[i] = f"{field}={columns[field][i]}"
+
+        # 缺少必要欄位
+        for field in REQUIRED_FIELDS:
+            reject(np.array([value is None or value == '' for value in columns[field]]), 'missing_field', field)
+
+        # 日期: YYYY/MM/DD 或 YYYY-MM-DD -> YYYY-MM-DD
+        dates = _map_unique(columns['race_date'], _normalize_date)
+        reject(np.array([d is None for d in dates]), 'bad_date', 'race_date')
+
+        # 馬名中的烙號, 例如 "合成0001 (A001)", 只對含括號的馬名執行正則
+        horse_names = list(columns['horse_name'])
+        horse_codes: Dict[int, str] = {}
+        for i, name in enumerate(horse_names):
+            if name and '(' in name:
+                match = _HORSE_CODE.match(name)
+                if match:
+                    horse_names[i], horse_codes[i] = match.group(1).strip(), match.group(2)
+
+        # 數值欄位
+        position = _to_float(columns['finish_position'])
+        non_finish = np.array([str(v).strip() in NON_FINISH_MARKS for v in columns['finish_position']])
+        position[non_finish] = 99
+        reject(np.isnan(position), 'bad_position', 'finish_position')
+
+        odds = _to_float(['0' if v == '---' else v for v in columns['odds']])
+        reject(np.isnan(odds), 'bad_odds', 'odds')
+
+        distance = _to_float(columns['distance'])
+        if np.isnan(distance).any():
+            distance = np.array(_map_unique(columns['distance'], _distance), dtype=np.float64)
+        reject(np.isnan(distance), 'bad_distance', 'distance')
+
+        draw = _to_float(columns['draw'])
+        reject(np.isnan(draw), 'bad_draw', 'draw')
+
+        race_number = np.array(_map_unique(columns['race_id'], _race_number), dtype=np.float64)
+        reject(np.isnan(race_number), 'bad_race_id', 'race_id')
+
+        # 離群值 (NaN 已在上面拒收, 比較結果為 False)
+        limits = self.limits
+        with np.errstate(invalid='ignore'):
+            reject((position != 99) & ((position < 1) | (position > limits['MAX_POSITION'])),
+                   'position_outlier', 'finish_position')
+            reject((odds < 0) | (odds > limits['MAX_ODDS']), 'odds_outlier', 'odds')
+            reject((distance < limits['MIN_DISTANCE']) | (distance > limits['MAX_DISTANCE']),
+                   'distance_outlier', 'distance')
+            reject((draw < 0) | (draw > limits['MAX_DRAW']), 'draw_outlier', 'draw')
+
+        # 重複 (只比較尚未拒收的記錄, 保留第一條)
+        seen = set()
+        duplicated = np.zeros(n, dtype=bool)
+        for i in np.flatnonzero(np.equal(reason, None)):
+            key = (dates[i], race_number[i], horse_names[i])
+            duplicated[i] = key in seen
+            seen.add(key)
+        reject(duplicated, 'duplicate', 'horse_name')
+
+        accepted = np.equal(reason, None)
+        clean = []
+        for i in np.flatnonzero(accepted).tolist():
+            record = dict(records[i])
+            record.update(
+                race_date=dates[i], horse_name=horse_names[i], finish_position=int(position[i]),
+                odds=float(odds[i]), distance=int(distance[i]), draw=int(draw[i]),
+            )
+            if i in horse_codes and not record.get('horse_no'):
+                record['horse_no'] = horse_codes[i]
+            clean.append(record)
+
+        rejects = []
+        for i in np.flatnonzero(~accepted).tolist():
+            record = records[i]
+            rejects.append({
+                'race_date': dates[i] or str(record.get('race_date') or '')[:10],
+                'racecourse': record.get('racecourse'),
+                'race_id': None if record.get('race_id') is None else str(record.get('race_id')),
+                'horse_name': record.get('horse_name'),
+                'reason': reason[i],
+                'detail': detail[i],
+                'payload': json.dumps(record, ensure_ascii=False, default=str),
+            })
+        if rejects:
+            for code, count in zip(*np.unique(reason[~accepted].astype(str), return_counts=True)):
+                REJECTS.inc(int(count), reason=code)
+        ACCEPTED.inc(len(clean))
+        return clean, rejects
+
     def process_race_data(self, raw_data: List[Dict]) -> List[Dict]:
-        """處理原始賽事數據"""
-        processed_data = []
-        
-        for race in raw_data:
-            try:
-                if not self.validate_required_fields(race):
-                    continue
-                    
-                # 清理和轉換數據
-                race['race_date'] = self.normalize_date(race['race_date'])
-                horse_name, horse_code = self.clean_horse_name(race['horse_name'])
-                race['horse_name'] = horse_name
-                race['horse_code'] = horse_code
-                
-                # 轉換數值型欄位
-                race['finish_position'] = int(race['finish_position']) if race['finish_position'] != 'WV' else 99
-                race['odds'] = float(race['odds']) if race['odds'] != '---' else 999.0
-                race['distance'] = int(str(race['distance']).replace('m', ''))
-                race['draw'] = int(race['draw'])
-                
-                processed_data.append(race)
-                
-            except Exception as e:
-                logger.error(f"處理數據時出錯: {e}, 數據: {race}")
-                continue
-                
-        return processed_data 
\ No newline at end of file
+        """處理原始賽事數據, 只返回通過的記錄"""
+        return self.process_batch(raw_data)[0]
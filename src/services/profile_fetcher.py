@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, Optional
+
+import aiohttp
+
+from src.utils.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_URL = "https://racing.hkjc.com/racing/information/Chinese/Horse/Horse.aspx"
+
+
+class ProfileCache:
+    """马匹资料页面缓存 (页面内容 + ETag + 抓取时间)
+
+    TTL 内直接使用缓存; 过期后以 If-None-Match 重新验证, 304 只刷新抓取
+    时间。指定目录时每匹马一个 JSON 文件, 跨次运行保留。
+    """
+
+    def __init__(self, ttl: float = 86400, directory: Optional[str] = None):
+        self.ttl = ttl
+        self.directory = directory
+        self._entries: Dict[str, Dict] = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, horse_id: str) -> str:
+        name = hashlib.sha1(horse_id.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f"{name}.json")
+
+    def get(self, horse_id: str) -> Optional[Dict]:
+        entry = self._entries.get(horse_id)
+        if entry is None and self.directory and os.path.exists(self._path(horse_id)):
+            try:
+                with open(self._path(horse_id), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                self._entries[horse_id] = entry
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取资料缓存失败 - {horse_id}: {e}")
+        return entry
+
+    def is_fresh(self, entry: Optional[Dict]) -> bool:
+        return entry is not None and time.time() - entry['fetched_at'] < self.ttl
+
+    def put(self, horse_id: str, body: str, etag: str = ''):
+        entry = {'body': body, 'etag': etag, 'fetched_at': time.time()}
+        self._entries[horse_id] = entry
+        self._write(horse_id, entry)
+
+    def touch(self, horse_id: str):
+        """服务器确认未变更 (304)"""
+        entry = self._entries[horse_id]
+        entry['fetched_at'] = time.time()
+        self._write(horse_id, entry)
+
+    def _write(self, horse_id: str, entry: Dict):
+        if not self.directory:
+            return
+        path = self._path(horse_id)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({**entry, 'horse_id': horse_id}, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+
+class ProfileFetcher:
+    """并发抓取马匹资料页面
+
+    整批马匹编号先去重, 每匹马只请求一次; 同一匹马的并发请求共享同一个
+    任务。请求共用一个连接池, 并受并发数及每秒请求数限制。
+    """
+
+    def __init__(self, config: Optional[Dict] = None, headers: Optional[Dict] = None):
+        config = config or {}
+        self.url = config.get('URL', PROFILE_URL)
+        self.concurrency = config.get('CONCURRENCY', 8)
+        self.timeout = config.get('TIMEOUT', 30)
+        self.max_retries = config.get('MAX_RETRIES', 3)
+        self.headers = headers or {}
+        self.rate_limiter = RateLimiter(config.get('RATE_LIMIT', 5.0))
+        self.cache = ProfileCache(config.get('TTL', 86400), config.get('CACHE_DIR'))
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {'cache_hits': 0, 'requests': 0, 'not_modified': 0, 'errors': 0}
+
+    async def fetch_many(self, horse_ids: Iterable[str], revalidate: bool = False) -> Dict[str, str]:
+        """抓取一批马匹资料页面, 返回 {马匹编号: 页面}, 失败的马匹不在结果中
+
+        revalidate 为真时不论缓存是否过期都以条件请求向服务器确认
+        (已知马匹有新赛绩时使用)。
+        """
+        unique = list(dict.fromkeys(h for h in horse_ids if h))
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers) as session:
+            pages = await asyncio.gather(*(self._fetch(session, semaphore, h, revalidate) for h in unique))
+        logger.info(f"马匹资料: {len(unique)} 匹, {self.stats}")
+        return {h: page for h, page in zip(unique, pages) if page is not None}
+
+    def _fetch(self, session, semaphore, horse_id: str, revalidate: bool) -> "asyncio.Task":
+        task = self._inflight.get(horse_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_one(session, semaphore, horse_id, revalidate))
+            self._inflight[horse_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(horse_id, None))
+        return task
+
+    async def _fetch_one(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                         horse_id: str, revalidate: bool = False) -> Optional[str]:
+        entry = self.cache.get(horse_id)
+        if not revalidate and self.cache.is_fresh(entry):
+            self.stats['cache_hits'] += 1
+            return entry['body']
+
+        headers = {'If-None-Match': entry['etag']} if entry and entry.get('etag') else {}
+        for attempt in range(self.max_retries):
+            try:
+                async with semaphore:
+                    await self.rate_limiter.acquire()
+                    self.stats['requests'] += 1
+                    async with session.get(self.url, params={'HorseId': horse_id}, headers=headers) as response:
+                        if response.status == 304 and entry:
+                            self.stats['not_modified'] += 1
+                            self.cache.touch(horse_id)
+                            return entry['body']
+                        response.raise_for_status()
+                        body = await response.text()
+                        self.cache.put(horse_id, body, response.headers.get('ETag', ''))
+                        return body
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries - 1:
+                    self.stats['errors'] += 1
+                    logger.error(f"获取马匹资料失败 - {horse_id}: {e}")
+                    # 过期的缓存仍比没有好
+                    return entry['body'] if entry else None
+                await asyncio.sleep(2 ** attempt)
+        return None
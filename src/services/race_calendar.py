@@ -0,0 +1,187 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from src.models.database import RaceMeeting, RaceResult
+from src.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+DAYS = metrics.counter('calendar_days_total', "赛马日历规划的日期数", ('outcome',))
+
+FIXTURES_URL = "https://racing.hkjc.com/racing/information/Chinese/Racing/Fixture.aspx"
+DEFAULTS = {
+    'ENABLED': True,
+    'HISTORY_SEASON_MEETINGS': 60,   # 已结束的马季学得这么多赛马日即用作预测依据
+    'PREDICT_THRESHOLD': 0.2,        # (月份, 星期) 的历史赛马比例达到此值才预测为赛马日
+    'COURSE_SHARE': 0.2,             # 预测马场: 历史占比达到此值的马场都会尝试
+    'HISTORY_SEASONS': 3,            # 预测所依据的最近完整马季数
+}
+
+
+def season_of(day: date) -> int:
+    """马季 (九月开始), 以开始年份表示"""
+    return day.year - (day.month < 9)
+
+
+def _parse(value: str) -> date:
+    return datetime.strptime(value.replace('/', '-'), "%Y-%m-%d").date()
+
+
+class RaceCalendar:
+    """赛马日历: 已知赛马日及马场, 供回填/核对/实时模式跳过非赛马日
+
+    赛马日来源 (race_meetings 表的 source):
+    - learned: 由已入库的赛果学得
+    - fixtures: 由马会赛期表页面导入
+    只有已导入赛期表的马季才视为完整: 不在日历中的日期即非赛马日, 不会
+    抓取。学得的赛马日只来自已入库的赛果, 抓取失败或整日被隔离的赛马日
+    不会出现, 因此其他马季 (包括已结束的) 未学得的日期按历届 (月份, 星期)
+    的赛马比例预测, 可能有赛事的日期每次都会重新尝试; 没有历史数据时每天
+    都尝试。
+    """
+
+    FIXTURES_URL = FIXTURES_URL
+
+    def __init__(self, storage, config: Optional[Dict[str, Any]] = None):
+        self.storage = storage
+        self.config = {**DEFAULTS, **(config or {})}
+        self._meetings: Optional[Dict[date, Tuple[str, str]]] = None
+
+    # --- 已知赛马日 ---
+
+    def meetings(self) -> Dict[date, Tuple[str, str]]:
+        """{日期: (马场, 来源)}"""
+        if self._meetings is None:
+            table = RaceMeeting.__table__
+            with self.storage.engine.connect() as conn:
+                rows = conn.execute(select(table.c.race_date, table.c.racecourse, table.c.source))
+                self._meetings = {_parse(d): (course, source) for d, course, source in rows}
+        return self._meetings
+
+    def learn(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> int:
+        """由已入库的赛果更新赛马日 (learned), 返回涉及的赛马日数"""
+        table = RaceResult.__table__
+        query = select(
+            table.c.race_date, table.c.racecourse, func.count(func.distinct(table.c.race_number))
+        ).group_by(table.c.race_date, table.c.racecourse)
+        if start_date and end_date:
+            query = query.where(table.c.race_date.between(start_date, end_date))
+        with self.storage.engine.connect() as conn:
+            rows = conn.execute(query).all()
+        now = datetime.now()
+        meetings = {}
+        for race_date, racecourse, races in rows:
+            # 同一日只在一个马场赛马, 取场次较多者
+            if race_date not in meetings or races > meetings[race_date]['races']:
+                meetings[race_date] = {'race_date': race_date, 'racecourse': racecourse or '',
+                                       'races': races, 'source': 'learned', 'updated_at': now}
+        self.storage.save_race_meetings(list(meetings.values()))
+        self._meetings = None
+        return len(meetings)
+
+    def seed_fixtures(self, fixtures: List[Tuple[str, str]]) -> int:
+        """导入赛期表 [(日期, 马场)], 该马季随即视为完整"""
+        now = datetime.now()
+        rows = [{'race_date': _parse(d).isoformat(), 'racecourse': course, 'races': None,
+                 'source': 'fixtures', 'updated_at': now} for d, course in fixtures]
+        self.storage.save_race_meetings(rows)
+        self._meetings = None
+        return len(rows)
+
+    def complete_seasons(self) -> set:
+        """日历已完整的马季 (已导入赛期表)"""
+        return {season_of(day) for day, (_, source) in self.meetings().items() if source == 'fixtures'}
+
+    def history_seasons(self, today: Optional[date] = None) -> set:
+        """可作预测依据的马季: 完整的马季, 及已结束且学得足够赛马日的马季"""
+        today = today or date.today()
+        counts = Counter(season_of(day) for day in self.meetings())
+        threshold = self.config['HISTORY_SEASON_MEETINGS']
+        learned = {s for s, n in counts.items() if n >= threshold and date(s + 1, 8, 31) < today}
+        return learned | self.complete_seasons()
+
+    # --- 预测 ---
+
+    def _pattern(self, history: set) -> Dict[Tuple[int, int], Tuple[float, Counter]]:
+        """最近几个可作依据的马季中 (月份, 星期) 的赛马比例及马场分布"""
+        seasons = sorted(history)[-self.config['HISTORY_SEASONS']:]
+        if not seasons:
+            return {}
+        occurrences, courses = Counter(), defaultdict(Counter)
+        for season in seasons:
+            day = date(season, 9, 1)
+            while day < date(season + 1, 9, 1):
+                occurrences[(day.month, day.weekday())] += 1
+                day += timedelta(days=1)
+        for day, (course, _) in self.meetings().items():
+            if season_of(day) in seasons:
+                courses[(day.month, day.weekday())][course] += 1
+        return {key: (sum(courses[key].values()) / n, courses[key]) for key, n in occurrences.items()}
+
+    def _predict(self, day: date, pattern) -> List[str]:
+        ratio, courses = pattern.get((day.month, day.weekday()), (0.0, Counter()))
+        if ratio < self.config['PREDICT_THRESHOLD']:
+            return []
+        total = sum(courses.values())
+        return [c for c, n in courses.most_common() if c and n / total >= self.config['COURSE_SHARE']]
+
+    # --- 规划 ---
+
+    def plan(self, start_date: str, end_date: str, racecourses: List[str],
+             today: Optional[date] = None) -> List[Tuple[str, List[str]]]:
+        """日期范围内需要抓取的 [(日期, [马场...])], 已知非赛马日不出现"""
+        meetings = self.meetings()
+        complete = self.complete_seasons()
+        pattern = self._pattern(self.history_seasons(today))
+        planned, outcomes = [], Counter()
+        day, last = _parse(start_date), _parse(end_date)
+        while day <= last:
+            if day in meetings:
+                course = meetings[day][0]
+                planned.append((day.isoformat(), [course] if course in racecourses else list(racecourses)))
+                outcomes['meeting'] += 1
+            elif season_of(day) in complete:
+                outcomes['skipped'] += 1
+            elif pattern:
+                courses = [c for c in self._predict(day, pattern) if c in racecourses]
+                if courses:
+                    planned.append((day.isoformat(), courses))
+                    outcomes['predicted'] += 1
+                else:
+                    outcomes['skipped'] += 1
+            else:
+                planned.append((day.isoformat(), list(racecourses)))
+                outcomes['unknown'] += 1
+            day += timedelta(days=1)
+        for outcome, n in outcomes.items():
+            DAYS.inc(n, outcome=outcome)
+        logger.info(f"赛马日历 {start_date} 至 {end_date}: 已知 {outcomes['meeting']} 日, "
+                    f"预测 {outcomes['predicted']} 日, 未知 {outcomes['unknown']} 日, 跳过 {outcomes['skipped']} 日")
+        return planned
+
+    def meeting_course(self, race_date: str) -> Optional[str]:
+        """已知赛马日的马场; 非赛马日或未知时为 None"""
+        meeting = self.meetings().get(_parse(race_date))
+        return meeting[0] if meeting else None
+
+    def is_non_meeting(self, race_date: str) -> bool:
+        """日期属于完整马季但不在日历中 (确定没有赛事)"""
+        day = _parse(race_date)
+        return day not in self.meetings() and season_of(day) in self.complete_seasons()
+
+
+async def fetch_fixtures(session, season: int, url: str = FIXTURES_URL) -> List[Tuple[str, str]]:
+    """抓取一个马季 (九月至翌年八月) 的赛期表页面并解析"""
+    from src.services.parsing import parse_fixtures_page
+
+    fixtures = []
+    for offset in range(12):
+        year, month = season + (8 + offset) // 12, (8 + offset) % 12 + 1
+        async with session.get(url, params={'CalYear': str(year), 'CalMonth': f"{month:02d}"}) as response:
+            response.raise_for_status()
+            fixtures.extend(parse_fixtures_page(await response.text(), year, month))
+    return fixtures
@@ -9,6 +9,7 @@ class ResourceManager:
     def __init__(self):
         self.scraper = None
         self.storage = None
+        self.metrics_server = None  # 可选的指标端点 (aiohttp AppRunner)
         
     async def cleanup(self):
         """清理资源"""
@@ -20,6 +21,9 @@ class ResourceManager:
             if self.storage:
                 logger.info('正在关闭数据库连接...')
                 self.storage.close()
+            
+            if self.metrics_server:
+                await self.metrics_server.cleanup()
                 
         except Exception as e:
             logger.error(f"清理资源时出错: {e}")
@@ -1,12 +1,21 @@
-from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 import logging
 import asyncio
 from dataclasses import dataclass
 
+from src.services.browser_manager import BrowserManager
+from src.services.parsing import build_race_record, parse_finish_position, parse_horse_page_id, parse_race_class
+from src.utils import metrics
+from src.utils.exceptions import BrowserCrashedError
+from src.utils.logger import debug_event
+
 logger = logging.getLogger(__name__)
 
+STAGE_SECONDS = metrics.histogram('scraper_stage_seconds', "抓取各阶段耗时 (秒)", ('stage',))
+PAGES = metrics.counter('scraper_pages_total', "打开的赛果页面数", ('outcome',))
+RECORDS = metrics.counter('scraper_records_total', "解析出的出赛记录数")
+
 @dataclass
 class RaceData:
     """比赛数据结构"""
@@ -22,74 +31,42 @@ class RaceData:
     odds: float
     distance: int
     race_info: str
+    racecourse: str = ""
+    race_class: str = ""
+    going: str = ""
 
 class RaceScraper:
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, rate_limiter=None):
         self.base_url = "https://racing.hkjc.com/racing/information/Chinese/Racing/LocalResults.aspx"
         self.config = config
+        self.rate_limiter = rate_limiter  # 可选, 限制每秒打开的页面数 (多进程回填时按进程分配)
         self.is_initialized = False  # 添加初始化标志
-        self._reset_browser_instances()
-
-    def _reset_browser_instances(self):
-        """重置浏览器实例"""
-        self.playwright = None
-        self.browser = None
-        self.context = None
-        self.is_initialized = False  # 重置初始化标志
+        # 浏览器及上下文由 BrowserManager 管理 (定期回收上下文, 崩溃后自动重启)
+        self.browsers = BrowserManager({'HEADLESS': config.get('HEADLESS', True), **(config.get('BROWSER') or {})})
 
     async def init(self):
         """初始化浏览器"""
         try:
-            await self._init_browser()
+            await self.browsers.start()
             self.is_initialized = True  # 设置初始化标志
             logger.info("爬虫初始化成功")
         except Exception as e:
             logger.error(f"爬虫初始化失败: {e}")
+            await self.browsers.close()
             self.is_initialized = False
             raise
 
     async def close(self):
         """关闭浏览器"""
         try:
-            await self._cleanup()
+            stats = self.browsers.stats()
+            await self.browsers.close()
             self.is_initialized = False  # 重置初始化标志
+            logger.info(f"浏览器资源已清理 (重启 {stats['restarts']} 次, 回收上下文 {stats['recycles']} 次)")
         except Exception as e:
             logger.error(f"关闭爬虫时出错: {e}")
             raise
 
-    async def _init_browser(self) -> None:
-        """初始化浏览器"""
-        try:
-            self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.chromium.launch(
-                headless=self.config.get('HEADLESS', True),
-                args=['--disable-dev-shm-usage']
-            )
-            self.context = await self.browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            )
-            logger.info("浏览器初始化成功")
-        except Exception as e:
-            logger.error(f"浏览器初始化失败: {e}")
-            await self._cleanup()
-            raise
-
-    async def _cleanup(self) -> None:
-        """清理资源"""
-        try:
-            if self.context:
-                await self.context.close()
-            if self.browser:
-                await self.browser.close()
-            if self.playwright:
-                await self.playwright.stop()
-            await asyncio.sleep(0.1)
-            self._reset_browser_instances()
-            logger.info("浏览器资源已清理")
-        except Exception as e:
-            logger.error(f"清理浏览器资源时出错: {e}")
-
     @staticmethod
     def _parse_race_info(info_text: str) -> tuple[str, int]:
         """解析比赛信息"""
@@ -100,16 +77,25 @@ class RaceScraper:
         except Exception:
             return "0", 0
 
+    @staticmethod
+    def _parse_race_class(info_text: str) -> str:
+        """解析班次, 例如 '第四班' -> '4', '一級賽' -> 'G1'"""
+        return parse_race_class(info_text)
+
+    async def _throttle(self):
+        if self.rate_limiter is not None:
+            with STAGE_SECONDS.time(stage='throttle'):
+                await self.rate_limiter.acquire()
+
+    def _racecourses(self) -> List[str]:
+        """配置中的马场编码"""
+        courses = [c['code'] for c in self.config.get('RACECOURSES', []) if c.get('code')]
+        return courses or ['ST']
+
     @staticmethod
     def _parse_finish_position(text: str) -> int:
         """解析完赛位置"""
-        if not text or text in ["WV", "---", "DISQ", "DNF", "PU", "WX", ""]:
-            return 99
-        try:
-            return int(text)
-        except ValueError:
-            logger.warning(f"无效名次: {text}，设置为 99")
-            return 99
+        return parse_finish_position(text)
 
     async def scrape_date_range(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
         """抓取指定日期范围的赛事数据"""
@@ -127,165 +113,144 @@ class RaceScraper:
             
         return all_data
 
-    async def scrape_single_date(self, date: str) -> List[Dict[str, Any]]:
-        """抓取单个日期的赛事数据"""
+    async def scrape_single_date(self, date: str, racecourse: str = "ST") -> List[Dict[str, Any]]:
+        """抓取单个日期的赛事数据; 中途浏览器崩溃时以重启后的浏览器重抓一次"""
+        for attempt in range(2):
+            try:
+                async with self.browsers.page() as page:
+                    return await self._scrape_meeting(page, date, racecourse)
+            except BrowserCrashedError as e:
+                logger.warning(f"抓取 {date} {racecourse} 时浏览器崩溃 (第 {attempt + 1} 次): {e}")
+        PAGES.inc(outcome='error')
+        return []
+
+    async def _scrape_meeting(self, page, date: str, racecourse: str) -> List[Dict[str, Any]]:
+        """以给定页面依次抓取一个赛马日的各场赛事"""
         self.current_date = date  # 保存當前日期
-        page = await self.context.new_page()
+        self.current_racecourse = racecourse
         all_data = []
         
         try:
             # 檢查該日期是否有賽事
             check_url = (
                 "https://racing.hkjc.com/racing/information/Chinese/Racing/"
-                f"LocalResults.aspx?RaceDate={date}&Racecourse=ST&RaceNo=1"
+                f"LocalResults.aspx?RaceDate={date}&Racecourse={racecourse}&RaceNo=1"
             )
-            print(f"正在检查: {check_url}")
-            
-            print(f"正在加載頁面...")
-            await page.goto(check_url, timeout=30000, wait_until='networkidle')
-            print(f"等待DOM加載完成...")
-            await page.wait_for_load_state('domcontentloaded')
-            
-            # 检查是否有赛事
-            print(f"檢查是否有賽事...")
-            has_race = await page.is_visible("table.table_bd.draggable")
+            debug_event(logger, 'check_date', date=date, racecourse=racecourse, url=check_url)
+            await self._throttle()
+            with STAGE_SECONDS.time(stage='navigate'):
+                await page.goto(check_url, timeout=30000, wait_until='networkidle')
+            with STAGE_SECONDS.time(stage='wait'):
+                await page.wait_for_load_state('domcontentloaded')
+                # 检查是否有赛事
+                has_race = await page.is_visible("table.table_bd.draggable")
             if not has_race:
-                print(f"日期 {date} 没有赛事")
+                debug_event(logger, 'no_meeting', date=date, racecourse=racecourse)
+                PAGES.inc(outcome='no_race')
                 return []
             
             # 假设每日最多12场比赛
             for race_no in range(1, 13):
                 try:
-                    print(f"\n開始處理第 {race_no} 場比賽...")
                     race_url = (
                         "https://racing.hkjc.com/racing/information/Chinese/Racing/"
-                        f"LocalResults.aspx?RaceDate={date}&Racecourse=ST&RaceNo={race_no}"
+                        f"LocalResults.aspx?RaceDate={date}&Racecourse={racecourse}&RaceNo={race_no}"
                     )
-                    print(f"訪問URL: {race_url}")
-                    await page.goto(race_url, timeout=30000)
+                    debug_event(logger, 'race_page', date=date, racecourse=racecourse, race_no=race_no)
+                    await self._throttle()
+                    with STAGE_SECONDS.time(stage='navigate'):
+                        await page.goto(race_url, timeout=30000)
                     
                     # 检查该场次是否存在
-                    print(f"檢查比賽是否存在...")
-                    if not await page.is_visible("table.table_bd.draggable"):
-                        print(f"第 {race_no} 场比赛不存在")
+                    with STAGE_SECONDS.time(stage='wait'):
+                        race_exists = await page.is_visible("table.table_bd.draggable")
+                    if not race_exists:
+                        debug_event(logger, 'race_missing', date=date, racecourse=racecourse, race_no=race_no)
+                        PAGES.inc(outcome='no_race')
                         break
-                    
-                    print(f"處理第 {race_no} 場比賽數據...")
-                    
-                    # 获取赛事信息
-                    print(f"獲取賽事信息...")
-                    race_info = await page.query_selector(".race_tab .f_title")
-                    if not race_info:
-                        print("使用備用選擇器...")
-                        race_info = await page.query_selector(".race_tab td:has-text('第')")
-                    race_info_text = await race_info.inner_text() if race_info else "N/A"
-                    
-                    # 获取赛事距离
-                    print(f"獲取賽事距離...")
-                    distance_element = await page.query_selector(".race_tab td:has-text('米')")
-                    distance = await distance_element.inner_text() if distance_element else "N/A"
-                    distance = distance.strip() if distance else "N/A"
-                    print(f"賽事距離: {distance}")
-                    
-                    # 将距离信息添加到 race_info_text
-                    race_info_text = f"{race_info_text} {distance}"
-                    print(f"完整賽事信息: {race_info_text}")
-                    
-                    self.current_race_info = race_info_text
-                    
-                    # 获取所有行
-                    rows = await page.query_selector_all("table.table_bd.draggable tr:not(.bg_blue):not(.bg_gold)")
-                    
-                    # 处理每一行数据
-                    for row in rows:
-                        race_data = await self._extract_race_data(row)
-                        if race_data:
-                            all_data.append(race_data)
+                    PAGES.inc(outcome='race')
+                    with STAGE_SECONDS.time(stage='extract'):
+                        race_data = await self._extract_race(page, race_no)
+                    all_data.extend(race_data)
+                    RECORDS.inc(len(race_data))
                             
                 except Exception as e:
-                    print(f"處理第 {race_no} 場比賽時出錯: {e}")
+                    if not self.browsers.healthy:
+                        raise BrowserCrashedError(str(e)) from e
+                    logger.warning(f"處理 {date} {racecourse} 第 {race_no} 場比賽時出錯: {e}")
+                    PAGES.inc(outcome='error')
                     continue
                 
-            print(f"成功解析 {len(all_data)} 条数据")
+            debug_event(logger, 'date_parsed', date=date, racecourse=racecourse, records=len(all_data))
             return all_data
             
+        except BrowserCrashedError:
+            raise
         except Exception as e:
-            print(f"抓取数据时出错: {e}")
+            if not self.browsers.healthy:
+                raise BrowserCrashedError(str(e)) from e
+            logger.error(f"抓取 {date} {racecourse} 数据时出错: {e}")
+            PAGES.inc(outcome='error')
             return []
-            
-        finally:
-            await page.close()
+
+    async def _extract_race(self, page, race_no: int) -> List[Dict[str, Any]]:
+        """提取当前页面一场赛事的全部出赛记录"""
+        # 获取赛事信息
+        race_info = await page.query_selector(".race_tab .f_title")
+        if not race_info:
+            debug_event(logger, 'fallback_selector', race_no=race_no)
+            race_info = await page.query_selector(".race_tab td:has-text('第')")
+        race_info_text = await race_info.inner_text() if race_info else "N/A"
+        
+        # 获取赛事距离
+        distance_element = await page.query_selector(".race_tab td:has-text('米')")
+        distance = await distance_element.inner_text() if distance_element else "N/A"
+        distance = distance.strip() if distance else "N/A"
+        
+        # 将距离信息添加到 race_info_text
+        race_info_text = f"{race_info_text} {distance}"
+        debug_event(logger, 'race_info', race_no=race_no, info=race_info_text)
+        
+        self.current_race_info = race_info_text
+        
+        # 获取场地状况
+        going_element = await page.query_selector(".race_tab td:has-text('場地狀況') + td")
+        self.current_going = (await going_element.inner_text()).strip() if going_element else ""
+        
+        # 获取所有行
+        rows = await page.query_selector_all("table.table_bd.draggable tr:not(.bg_blue):not(.bg_gold)")
+        
+        # 处理每一行数据
+        records = []
+        for row in rows:
+            race_data = await self._extract_race_data(row)
+            if race_data:
+                records.append(race_data)
+        return records
 
     async def _extract_race_data(self, row) -> Optional[Dict[str, Any]]:
         """从表格行中提取赛事数据"""
         try:
-            cols = await row.query_selector_all("td")
-            if len(cols) < 12:
-                return None
-            
-            # 提取馬匹編號和名稱
-            horse_name = (await cols[2].inner_text()).strip()
-            horse_no = ""
-            if "(" in horse_name and ")" in horse_name:
-                horse_no = horse_name[horse_name.find("(")+1:horse_name.find(")")]
-                horse_name = horse_name[:horse_name.find("(")].strip()
-            
-            # 提取名次
-            rank_text = (await cols[1].inner_text()).strip()
-            if not rank_text or rank_text in ["WV", "---", "DISQ", "DNF", "PU", "WX", ""]:
-                finish_position = 99
-            else:
-                try:
-                    finish_position = int(rank_text)
-                except ValueError:
-                    logger.warning(f"无效名次: {rank_text}，设置为 99")
-                    finish_position = 99
-            
-            # 提取檔位
-            draw = (await cols[0].inner_text()).strip()
-            try:
-                draw = int(draw)
-            except ValueError:
-                draw = 0
-            
-            # 提取賽事資訊
-            race_info = self.current_race_info
-            if race_info:
-                # 只提取括号中的数字
-                race_id = ''.join(filter(str.isdigit, race_info.split()[2]))
-                distance = int(''.join(filter(str.isdigit, race_info.split('-')[1].strip())))
-            else:
-                race_id = "0"
-                distance = 0
-            
-            # 提取賠率
-            odds_text = (await cols[11].inner_text()).strip()
-            try:
-                odds = float(odds_text.replace('---', '0'))
-            except ValueError:
-                odds = 0.0
-            
-            return {
-                "race_id": race_id,
-                "race_date": self.current_date,
-                "horse_no": horse_no,
-                "horse_name": horse_name,
-                "draw": draw,
-                "finish_position": finish_position,
-                "jockey": (await cols[3].inner_text()).strip(),
-                "trainer": (await cols[4].inner_text()).strip(),
-                "finish_time": (await cols[10].inner_text()).strip(),
-                "odds": odds,
-                "distance": distance,
-                "race_info": race_info
-            }
-            
+            # 一次取回整行文字及马匹资料链接, 避免逐个单元格往返浏览器
+            cells, href = await row.evaluate(
+                "r => [Array.from(r.querySelectorAll('td'), e => e.innerText),"
+                " (r.querySelector(\"a[href*='HorseId=']\") || {}).href || '']"
+            )
+            record = build_race_record(
+                cells, self.current_race_info, self.current_date,
+                self.current_racecourse, self.current_going
+            )
+            page_id = parse_horse_page_id(href)
+            if record and page_id:
+                record['horse_page_id'] = page_id
+            return record
+
         except Exception as e:
-            print(f"提取数据时出错: {e}")
+            debug_event(logger, 'row_error', date=self.current_date, error=e)
             return None
 
-    async def scrape_race_data(self, date: str):
-        """爬取指定日期的赛马数据"""
+    async def scrape_race_data(self, date: str, racecourses: Optional[List[str]] = None):
+        """爬取指定日期的赛马数据 (racecourses 为赛马日历给出的马场, 默认为配置中的全部马场)"""
         try:
             # 确保日期格式统一为 YYYY-MM-DD
             formatted_date = date.replace('/', '-')
@@ -293,7 +258,13 @@ class RaceScraper:
             
             # 转换为爬取用的格式 YYYY/MM/DD
             scrape_date = formatted_date.replace('-', '/')
-            race_data = await self.scrape_single_date(scrape_date)
+            
+            # 每个赛马日只在一个马场举行, 依次尝试配置中的马场
+            race_data = []
+            for racecourse in racecourses or self._racecourses():
+                race_data = await self.scrape_single_date(scrape_date, racecourse)
+                if race_data:
+                    break
             
             if race_data:
                 # 确保所有数据使用统一的日期格式
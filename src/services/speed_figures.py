@@ -0,0 +1,163 @@
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 完成时间: "1:09.45" / "59.87" / "1.09.45" (分与秒之间偶有以点号分隔)
+_TIME_PATTERN = re.compile(r"^\s*(?:(\d+)[:.])?(\d{1,2})\.(\d{1,2})\s*$")
+
+# 已解析字符串的缓存, 同一完成时间在不同批次间大量重复
+_TIME_CACHE: Dict[str, int] = {}
+_TIME_CACHE_LIMIT = 200000
+
+# 标准时间的分组层级, 由细到粗依次回退
+PAR_LEVELS = (
+    ('distance', 'racecourse', 'going'),
+    ('distance', 'racecourse'),
+    ('distance',),
+)
+
+
+def _parse_unique(values: pd.Series) -> np.ndarray:
+    """解析一组互不重复的字符串为百分之一秒, 无效值为 -1"""
+    parts = values.str.extract(_TIME_PATTERN)
+    minutes = pd.to_numeric(parts[0], errors='coerce').fillna(0)
+    seconds = pd.to_numeric(parts[1], errors='coerce')
+    hundredths = pd.to_numeric(parts[2].str.ljust(2, '0'), errors='coerce')
+    total = minutes * 6000 + seconds * 100 + hundredths
+    return total.fillna(-1).to_numpy(dtype=np.int32)
+
+
+def parse_finish_times(values) -> np.ndarray:
+    """整列完成时间 -> 百分之一秒 (int32), 无效值为 -1
+
+    先以 factorize 去重, 只解析缓存中没有的字符串。
+    """
+    series = pd.Series(values, dtype=object).fillna('').astype(str)
+    codes, uniques = pd.factorize(series, sort=False)
+    uniques = pd.Index(uniques)
+
+    missing = [u for u in uniques if u not in _TIME_CACHE]
+    if missing:
+        parsed = _parse_unique(pd.Series(missing, dtype=object))
+        if len(_TIME_CACHE) + len(missing) > _TIME_CACHE_LIMIT:
+            _TIME_CACHE.clear()
+        _TIME_CACHE.update(zip(missing, parsed.tolist()))
+
+    lookup = np.array([_TIME_CACHE.get(u, -1) for u in uniques], dtype=np.int32)
+    if len(lookup) == 0:
+        return np.full(len(series), -1, dtype=np.int32)
+    return np.where(codes >= 0, lookup[np.maximum(codes, 0)], -1).astype(np.int32)
+
+
+def parse_sectional_times(values, max_sections: int = 6) -> np.ndarray:
+    """分段时间 (以空白分隔, 例如 "13.25 21.84 22.77") -> (行数, 段数) 的百分之一秒矩阵"""
+    series = pd.Series(values, dtype=object).fillna('').astype(str)
+    split = series.str.split(expand=True)
+    result = np.full((len(series), max_sections), -1, dtype=np.int32)
+    for i in range(min(split.shape[1] if split.ndim == 2 else 0, max_sections)):
+        result[:, i] = parse_finish_times(split[i])
+    return result
+
+
+def compute_par_times(frame: pd.DataFrame) -> Dict[tuple, pd.Series]:
+    """以各条件下头马完成时间的中位数作为标准时间"""
+    winners = frame[(frame['finish_position'] == 1) & (frame['finish_time_cs'] > 0)]
+    pars = {}
+    for level in PAR_LEVELS:
+        columns = [c for c in level if c in winners]
+        if len(columns) != len(level):
+            continue
+        pars[level] = winners.groupby(list(level), observed=True)['finish_time_cs'].median()
+    return pars
+
+
+def speed_figures(frame: pd.DataFrame, pars: Optional[Dict[tuple, pd.Series]] = None) -> pd.DataFrame:
+    """计算速度指数
+
+    指数 = 100 + (标准时间 - 完成时间) / 标准时间 × 1000, 即快于标准
+    时间 1% 得 110 分。以百分比表示, 不同距离之间可直接比较; 标准时间
+    按 (距离, 马场, 场地) 分组, 样本不足时回退到较粗的分组。
+    """
+    df = frame.copy()
+    if 'finish_time_cs' not in df or df['finish_time_cs'].isna().any():
+        df['finish_time_cs'] = parse_finish_times(df['finish_time'])
+    if 'sectional_times' in df:
+        sections = parse_sectional_times(df['sectional_times'])
+        for i in range(sections.shape[1]):
+            df[f'sectional_{i + 1}_cs'] = sections[:, i]
+
+    pars = pars if pars is not None else compute_par_times(df)
+    par = pd.Series(np.nan, index=df.index)
+    for level in PAR_LEVELS:
+        if level not in pars or par.notna().all():
+            continue
+        keys = pd.MultiIndex.from_frame(df[list(level)]) if len(level) > 1 else df[level[0]]
+        values = pars[level].reindex(keys).to_numpy()
+        par = par.fillna(pd.Series(values, index=df.index))
+
+    valid = (df['finish_time_cs'] > 0) & par.notna()
+    df['par_time_cs'] = par
+    df['speed_figure'] = np.where(
+        valid, 100 + (par - df['finish_time_cs']) / par * 1000, np.nan
+    ).round(1)
+    logger.info(f"速度指数: {int(valid.sum())}/{len(df)} 匹出赛马有效")
+    return df
+
+
+def par_table(pars: Dict[tuple, pd.Series]) -> List[Dict]:
+    """最细分组的标准时间表 (用于展示)"""
+    finest = pars.get(PAR_LEVELS[0])
+    if finest is None:
+        return []
+    return finest.reset_index().rename(columns={'finish_time_cs': 'par_time_cs'}).to_dict('records')
+
+
+def par_records(pars: Dict[tuple, pd.Series]) -> List[Dict[str, Any]]:
+    """各层级的标准时间 -> 可入库的行 (较粗层级缺少的条件为空字符串)"""
+    records = []
+    for level, series in pars.items():
+        for key, par in series.items():
+            values = dict(zip(level, key if isinstance(key, tuple) else (key,)))
+            records.append({
+                'distance': int(values['distance']),
+                'racecourse': str(values.get('racecourse', '')),
+                'going': str(values.get('going', '')),
+                'par_time_cs': float(par),
+            })
+    return records
+
+
+def pars_from_records(records: List[Dict[str, Any]]) -> Dict[tuple, pd.Series]:
+    """par_records 的逆运算: 由入库的行还原各层级的标准时间"""
+    if not records:
+        return {}
+    df = pd.DataFrame(records)
+    pars = {}
+    for level in PAR_LEVELS:
+        # 行所属的层级由非空的条件决定
+        rows = df[(df['racecourse'] != '') == ('racecourse' in level)]
+        rows = rows[(rows['going'] != '') == ('going' in level)]
+        if not rows.empty:
+            pars[level] = rows.set_index(list(level))['par_time_cs'].rename('finish_time_cs')
+    return pars
+
+
+def refresh_par_times(storage, start_date: str, end_date: str) -> Dict[tuple, pd.Series]:
+    """以日期范围内的头马完成时间重新计算标准时间表并入库"""
+    frame = storage.get_race_frame(start_date, end_date, columns=[
+        'finish_position', 'finish_time_cs', 'distance', 'racecourse', 'going'
+    ])
+    pars = compute_par_times(frame)
+    storage.save_par_times(par_records(pars))
+    logger.info(f"标准时间表已更新: {sum(len(series) for series in pars.values())} 组")
+    return pars
+
+
+def load_par_times(storage) -> Dict[tuple, pd.Series]:
+    """读取已入库的标准时间表"""
+    return pars_from_records(storage.get_par_times())
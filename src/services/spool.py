@@ -0,0 +1,290 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.utils import metrics
+from src.utils.exceptions import SpoolBusyError
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+SPOOL_BYTES = metrics.gauge('spool_pending_bytes', "待回放的本地预写日志字节数")
+APPENDED = metrics.counter('spool_appended_total', "写入预写日志的记录数", ('kind',))
+REPLAYED = metrics.counter('spool_replayed_total', "回放入库的记录数", ('kind',))
+REPLAY_ERRORS = metrics.counter('spool_replay_errors_total', "回放失败次数 (数据库不可用等)")
+
+# 每条记录: 长度 (4 字节) + CRC32 (4 字节) + JSON
+_HEADER = struct.Struct('<II')
+_SEALED = '.wal'
+_ACTIVE = '.wal.open'
+_LOCK = '.lock'
+
+
+class WriteAheadSpool:
+    """本地分段预写日志 (抓取结果先落盘, 再由 SpoolReplayer 批量入库)
+
+    写入中的分段为 segment-N.wal.open, 达到 SEGMENT_MB 或回放前封存为
+    segment-N.wal。每条记录带长度及 CRC32; 进程崩溃留下的半条记录在读取时
+    按校验失败丢弃, 之前的记录不受影响。
+
+    目录以 .lock 文件独占, 直至 close: 同一目录只有一个进程写入及回放,
+    其他进程 (如抓取期间运行 main.py replay) 打开时抛出 SpoolBusyError,
+    不会封存或删除正在写入的分段。
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024, fsync: bool = True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+        self._path: Optional[str] = None
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = self._acquire(directory)
+        # 持有目录锁, 剩下的 .wal.open 都是上次运行未封存的分段 (崩溃或未正常关闭)
+        for name in os.listdir(directory):
+            if name.endswith(_ACTIVE):
+                path = os.path.join(directory, name)
+                os.replace(path, path[:-len('.open')])
+        names = self._names()
+        self._seq = int(names[-1].split('-')[1].split('.')[0]) if names else 0
+        SPOOL_BYTES.set(self.pending_bytes())
+
+    @staticmethod
+    def _acquire(directory: str):
+        """独占目录锁 (进程退出时由操作系统释放)"""
+        lock_file = open(os.path.join(directory, _LOCK), 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            raise SpoolBusyError(f"预写日志目录 {directory} 正被其他进程使用")
+        return lock_file
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> Optional['WriteAheadSpool']:
+        """按 SPOOL 配置创建, 未启用时返回 None"""
+        config = config or {}
+        if not config.get('ENABLED', False):
+            return None
+        return cls(config.get('DIR', 'data/spool'), int(config.get('SEGMENT_MB', 16) * 1024 * 1024),
+                   config.get('FSYNC', True))
+
+    def _names(self) -> List[str]:
+        return sorted(n for n in os.listdir(self.directory) if n.startswith('segment-') and n.endswith(_SEALED))
+
+    def segments(self) -> List[str]:
+        """已封存、待回放的分段 (按写入顺序)"""
+        return [os.path.join(self.directory, n) for n in self._names()]
+
+    def pending_bytes(self) -> int:
+        total = sum(os.path.getsize(path) for path in self.segments())
+        if self._path and os.path.exists(self._path):
+            total += os.path.getsize(self._path)
+        return total
+
+    def append(self, kind: str, rows: List[Dict[str, Any]]):
+        """追加一批记录 (返回时已写入磁盘)"""
+        payload = json.dumps({'kind': kind, 'rows': rows}, ensure_ascii=False, default=str).encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                self._seq += 1
+                self._path = os.path.join(self.directory, f"segment-{self._seq:012d}{_ACTIVE}")
+                self._file = open(self._path, 'ab')
+            self._file.write(_HEADER.pack(len(payload), zlib.crc32(payload)))
+            self._file.write(payload)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            if self._file.tell() >= self.segment_bytes:
+                self._seal()
+        APPENDED.inc(len(rows), kind=kind)
+        SPOOL_BYTES.inc(_HEADER.size + len(payload))
+
+    def _seal(self):
+        if self._file is None:
+            return
+        self._file.close()
+        os.replace(self._path, self._path[:-len('.open')])
+        self._file, self._path = None, None
+
+    def seal(self):
+        """封存写入中的分段, 使其可被回放"""
+        with self._lock:
+            self._seal()
+
+    def close(self):
+        """封存写入中的分段并释放目录锁"""
+        self.seal()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @staticmethod
+    def read_segment(path: str) -> Iterator[Dict[str, Any]]:
+        """依次读出分段内的记录, 遇到不完整或校验失败的记录即停止"""
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if not header:
+                    return
+                if len(header) < _HEADER.size:
+                    logger.warning(f"{os.path.basename(path)} 末尾记录不完整, 已忽略")
+                    return
+                length, crc = _HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    logger.warning(f"{os.path.basename(path)} 记录校验失败, 忽略其后内容")
+                    return
+                yield json.loads(payload)
+
+    def remove(self, path: str):
+        """回放已提交, 删除分段"""
+        size = os.path.getsize(path)
+        os.remove(path)
+        SPOOL_BYTES.dec(size)
+
+
+class SpoolReplayer:
+    """把预写日志的分段批量写入数据库, 提交后删除分段
+
+    连续的分段合并为约 BATCH_ROWS 行一批写入, 批次不拆开场次, 同一场次
+    写入多次时只回放最后一次 (save_changed_races 以场次摘要去重, 重复回放
+    不会重复写入)。数据库不可用时保留分段, 稍后重试。
+    """
+
+    def __init__(self, spool: WriteAheadSpool, storage, batch_rows: int = 20000,
+                 on_saved: Optional[Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], None]] = None):
+        self.spool = spool
+        self.storage = storage
+        self.batch_rows = batch_rows
+        self.on_saved = on_saved  # (变化的记录, 变化事件)
+        self._lock = threading.Lock()
+        self._failing = False
+
+    def _save_results(self, rows: List[Dict[str, Any]]):
+        events = self.storage.save_changed_races(rows)
+        REPLAYED.inc(len(rows), kind='race_results')
+        if events and self.on_saved is not None:
+            changed = {(e['race_date'], e['race_number']) for e in events}
+            self.on_saved([r for r in rows if (r['race_date'], self.storage.race_number(r)) in changed], events)
+
+    def _race_batches(self, rows: List[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        """按整场切分批次: 场次摘要按整场计算, 拆开的场次会被当作更正"""
+        batch, key = [], None
+        for row in rows:
+            race = (row.get('race_date'), self.storage.race_number(row))
+            if race != key and len(batch) >= self.batch_rows:
+                yield batch
+                batch = []
+            batch.append(row)
+            key = race
+        if batch:
+            yield batch
+
+    def _flush(self, kind: str, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        if kind == 'race_results':
+            for batch in self._race_batches(rows):
+                self._save_results(batch)
+        elif kind == 'quarantine':
+            self.storage.save_quarantine(rows)
+            REPLAYED.inc(len(rows), kind=kind)
+        else:
+            logger.warning(f"忽略未知类型的预写日志记录: {kind}")
+
+    def _groups(self) -> Iterator[Tuple[List[str], Dict[str, List[Dict[str, Any]]]]]:
+        """把已封存的分段按顺序合并为约 BATCH_ROWS 条记录一组: (分段, {类型: 记录})
+
+        同一场次写入多次 (重抓) 时以最后一次为准。
+        """
+        paths: List[str] = []
+        other: Dict[str, List[Dict[str, Any]]] = {}
+        races: Dict[tuple, List[Dict[str, Any]]] = {}
+        rows = 0
+        for path in self.spool.segments():
+            paths.append(path)
+            for entry in self.spool.read_segment(path):
+                rows += len(entry['rows'])
+                if entry['kind'] != 'race_results':
+                    other.setdefault(entry['kind'], []).extend(entry['rows'])
+                    continue
+                latest: Dict[tuple, List[Dict[str, Any]]] = {}
+                for row in entry['rows']:
+                    latest.setdefault((row.get('race_date'), self.storage.race_number(row)), []).append(row)
+                races.update(latest)
+            if rows >= self.batch_rows:
+                yield paths, self._batches(races, other)
+                paths, other, races, rows = [], {}, {}, 0
+        if paths:
+            yield paths, self._batches(races, other)
+
+    @staticmethod
+    def _batches(races, other) -> Dict[str, List[Dict[str, Any]]]:
+        if races:
+            other['race_results'] = [row for rows in races.values() for row in rows]
+        return other
+
+    def _replay_sealed(self) -> Tuple[int, bool]:
+        """回放已封存的分段, 返回 (入库的记录数, 是否全部成功); 数据库出错时停在出错的一组"""
+        replayed = 0
+        for group, batches in self._groups():
+            try:
+                # 赛果先写 (以场次摘要去重, 可重复回放), 隔离记录最后写
+                for kind in sorted(batches, key=lambda k: k != 'race_results'):
+                    self._flush(kind, batches[kind])
+            except Exception as e:
+                REPLAY_ERRORS.inc()
+                logger.warning(f"回放 {os.path.basename(group[0])} 等 {len(group)} 个分段失败, 稍后重试: {e}")
+                return replayed, False
+            for path in group:
+                self.spool.remove(path)
+            replayed += sum(len(rows) for rows in batches.values())
+        return replayed, True
+
+    def replay_once(self) -> int:
+        """回放全部待回放的分段, 返回入库的记录数
+
+        上次回放失败 (数据库不可用) 时不封存写入中的分段, 故障期间的记录
+        留在同一分段 (达到 SEGMENT_MB 才封存), 恢复后以大批次回放。
+        """
+        with self._lock:
+            if not self._failing:
+                self.spool.seal()
+            replayed, ok = self._replay_sealed()
+            if ok and self._failing:
+                # 故障恢复: 连同故障期间写入中的分段一并回放
+                self.spool.seal()
+                more, ok = self._replay_sealed()
+                replayed += more
+            self._failing = not ok
+            return replayed
+
+    async def run(self, stop: asyncio.Event, interval: float = 2.0, max_interval: float = 60.0):
+        """定期回放直至 stop 被设置; 失败时退避"""
+        delay = interval
+        while not stop.is_set():
+            try:
+                await asyncio.to_thread(self.replay_once)
+            except Exception as e:
+                logger.error(f"回放预写日志时出错: {e}")
+            delay = min(delay * 2, max_interval) if self._failing else interval
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
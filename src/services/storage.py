@@ -1,31 +1,120 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import UniqueConstraint, case, create_engine, event, func, inspect, text, select, update
 from sqlalchemy.orm import sessionmaker
-from typing import List, Dict, Any
-import pandas as pd
-from src.models.database import Base, RaceResult, JockeyStats
+from typing import TYPE_CHECKING, Callable, List, Dict, Any, Optional, Iterator, Sequence, Tuple
+from datetime import datetime, timedelta
+import json
+import os
+from src.models.database import (
+    Base, RaceResult, JockeyStats, DataVersion, ChartPayload, HorseHistory, HorseSyncState, WorkUnit,
+    Horse, ParTime, QuarantinedRecord, RaceHash, RaceMeeting
+)
+from src.services.dimensions import DimensionRegistry
+from src.services.parsing import race_content_hash
+from src.utils import metrics
 import logging
-from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# pandas 只在读取 DataFrame 时导入, 导入本模块 (及 main.py 各子命令) 不加载
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+TRANSACTION_SECONDS = metrics.histogram('storage_transaction_seconds', "数据库操作耗时 (秒)", ('operation',))
+ROWS_WRITTEN = metrics.counter('storage_rows_written_total', "写入的行数", ('table',))
+RACES_COMPARED = metrics.counter('storage_races_compared_total', "按内容摘要比较的场次", ('outcome',))
+
+# get_race_frame 默认读取的列 (名称列由代理键解码)
+RACE_FRAME_COLUMNS = [
+    'race_id', 'race_date', 'race_number', 'horse_no', 'draw',
+    'finish_position', 'finish_time', 'finish_time_cs', 'odds', 'distance',
+    'racecourse', 'race_class', 'going', 'jockey_id', 'trainer_id', 'horse_id'
+]
+
+def _configure_sqlite(engine):
+    """SQLite: WAL 模式供多进程并发读写; 由 SQLAlchemy 发出 BEGIN 使 SAVEPOINT 正常工作"""
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, _):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
 class DataStorage:
     def __init__(self, config):
-        """初始化數據庫連接"""
-        self.connection_string = (
-            f"mysql+{config['DRIVER']}://{config['USER']}:{config['PASSWORD']}@"
-            f"{config['HOST']}:{config['PORT']}/{config['DATABASE']}")
-        
-        self.engine = create_engine(
-            self.connection_string,
-            pool_size=config['POOL_SIZE'],
-            max_overflow=config['MAX_OVERFLOW'],
-            pool_timeout=config['POOL_TIMEOUT'],
-            echo=config['ECHO']
-        )
+        """初始化數據庫連接 (TYPE 為 mysql 或 sqlite)"""
+        self.dialect = config.get('TYPE', 'mysql')
+        if self.dialect == 'sqlite':
+            path = config['PATH']
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection_string = f"sqlite:///{path}"
+            self.engine = create_engine(
+                self.connection_string,
+                echo=config.get('ECHO', False),
+                connect_args={'timeout': config.get('BUSY_TIMEOUT', 30)}
+            )
+            _configure_sqlite(self.engine)
+        else:
+            self.connection_string = (
+                f"mysql+{config['DRIVER']}://{config['USER']}:{config['PASSWORD']}@"
+                f"{config['HOST']}:{config['PORT']}/{config['DATABASE']}")
+
+            self.engine = create_engine(
+                self.connection_string,
+                pool_size=config['POOL_SIZE'],
+                max_overflow=config['MAX_OVERFLOW'],
+                pool_timeout=config['POOL_TIMEOUT'],
+                echo=config['ECHO']
+            )
         
+        # create_all 只建立缺少的表, 已存在的旧表须以 migrate() 升级
         Base.metadata.create_all(self.engine)
+        pending = self.pending_migrations()
+        if pending:
+            logger.warning(f"数据库结构落后于模型 (缺少 {', '.join(pending)}), 请运行 python main.py migrate")
         self.Session = sessionmaker(bind=self.engine)
+        self.dimensions = DimensionRegistry(self.Session)
+        # 场次内容变化的订阅者, 以事件列表调用 (见 save_changed_races)
+        self.change_listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+
+    def _upsert(self, session, model, rows: List[Dict[str, Any]], update_columns: Sequence[str],
+                conflict_columns: Sequence[str]):
+        """按方言批量 UPSERT; update_columns 为空时已存在的行保持不变
+
+        MySQL 使用 ON DUPLICATE KEY UPDATE, SQLite 使用 ON CONFLICT DO UPDATE
+        (冲突列须为唯一约束)。
+        """
+        if not rows:
+            return
+        # SQLite 单条语句的参数个数有上限, 分块写入
+        chunk = max(1, 30000 // len(rows[0])) if self.dialect == 'sqlite' else len(rows)
+        for start in range(0, len(rows), chunk):
+            part = rows[start:start + chunk]
+            if self.dialect == 'sqlite':
+                stmt = sqlite_insert(model).values(part)
+                if update_columns:
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=list(conflict_columns),
+                        set_={name: stmt.excluded[name] for name in update_columns}
+                    )
+                else:
+                    stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict_columns))
+            else:
+                stmt = mysql_insert(model).values(part)
+                if update_columns:
+                    stmt = stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in update_columns})
+                else:
+                    stmt = stmt.prefix_with('IGNORE')
+            session.execute(stmt)
         
+    @TRANSACTION_SECONDS.timed(operation='save_race_results')
     def save_race_results(self, results: List[Dict]):
         """批量保存赛事结果"""
         if not results:
@@ -33,36 +122,10 @@ class DataStorage:
             
         session = self.Session()
         try:
-            # 准备批量插入数据
-            values = []
-            for result in results:
-                race_id = ''.join(filter(str.isdigit, str(result.get('race_id', '0'))))
-                values.append({
-                    'race_id': race_id,
-                    'race_date': result.get('race_date'),
-                    'race_number': int(race_id or '0'),
-                    'horse_no': result.get('horse_no'),
-                    'horse_name': result.get('horse_name'),
-                    'draw': result.get('draw'),
-                    'finish_position': result.get('finish_position', 99),
-                    'jockey': result.get('jockey'),
-                    'trainer': result.get('trainer'),
-                    'finish_time': result.get('finish_time'),
-                    'odds': result.get('odds', 0.0),
-                    'distance': result.get('distance', 0),
-                    'race_info': result.get('race_info')
-                })
-            
-            # 使用 UPSERT 语句
-            stmt = insert(RaceResult).values(values)
-            stmt = stmt.on_duplicate_key_update({
-                'finish_position': stmt.inserted.finish_position,
-                'odds': stmt.inserted.odds,
-                'finish_time': stmt.inserted.finish_time
-            })
-            
-            session.execute(stmt)
+            self._write_race_results(session, results)
+            self._bump_version(session)
             session.commit()
+            ROWS_WRITTEN.inc(len(results), table='race_results')
             logger.info(f"成功保存 {len(results)} 条赛事记录")
             
         except Exception as e:
@@ -71,7 +134,713 @@ class DataStorage:
             raise
         finally:
             session.close()
+
+    @staticmethod
+    def race_number(result: Dict[str, Any]) -> int:
+        return int(''.join(filter(str.isdigit, str(result.get('race_id', '0')))) or '0')
+
+    def _write_race_results(self, session, results: List[Dict]):
+        """在给定事务内 UPSERT 赛事结果 (不提交)"""
+        # 准备批量插入数据
+        values = []
+        for result in results:
+            race_id = ''.join(filter(str.isdigit, str(result.get('race_id', '0'))))
+            values.append({
+                'race_id': race_id,
+                'race_date': result.get('race_date'),
+                'race_number': int(race_id or '0'),
+                'horse_no': result.get('horse_no'),
+                'horse_name': result.get('horse_name'),
+                'draw': result.get('draw'),
+                'finish_position': result.get('finish_position', 99),
+                'jockey': result.get('jockey'),
+                'trainer': result.get('trainer'),
+                'finish_time': result.get('finish_time'),
+                'odds': result.get('odds', 0.0),
+                'distance': result.get('distance', 0),
+                'race_info': result.get('race_info'),
+                'racecourse': result.get('racecourse'),
+                'race_class': result.get('race_class'),
+                'going': result.get('going'),
+                'horse_page_id': result.get('horse_page_id')
+            })
+        
+        # 解析骑师/练马师/马匹的代理键 (horse_page_id 在此记入马匹维度并从行中移除)
+        self.dimensions.assign_ids(session, values)
+        
+        from src.services.speed_figures import parse_finish_times
+
+        # 整批解析完成时间
+        for value, cs in zip(values, parse_finish_times([v['finish_time'] for v in values])):
+            value['finish_time_cs'] = int(cs)
+        
+        # 使用 UPSERT 语句
+        self._upsert(session, RaceResult, values, (
+            'finish_position', 'odds', 'finish_time', 'finish_time_cs',
+            'jockey_id', 'trainer_id', 'horse_id'
+        ), RaceResult.UNIQUE_KEY)
+
+    @TRANSACTION_SECONDS.timed(operation='save_changed_races')
+    def save_changed_races(self, results: List[Dict]) -> List[Dict[str, Any]]:
+        """按场次比较内容摘要, 只写入摘要有变 (新公布或更正) 的场次
+
+        摘要与赛果在同一事务内写入; 全部场次未变时不写数据库, 数据版本号也
+        不递增 (依赖版本号的缓存保持有效)。返回变化场次的事件, 并通知
+        change_listeners。
+        """
+        if not results:
+            return []
+        races: Dict[Tuple[str, int], List[Dict]] = {}
+        for result in results:
+            races.setdefault((result.get('race_date'), self.race_number(result)), []).append(result)
+
+        table = RaceHash.__table__
+        dates = sorted({race_date for race_date, _ in races})
+        with self.engine.connect() as conn:
+            previous = {
+                (row.race_date, row.race_number): row.content_hash
+                for row in conn.execute(select(table.c.race_date, table.c.race_number, table.c.content_hash)
+                                        .where(table.c.race_date.in_(dates)))
+            }
+
+        events, changed = [], []
+        now = datetime.now()
+        for (race_date, race_number), records in races.items():
+            digest = race_content_hash(records)
+            old = previous.get((race_date, race_number))
+            if old == digest:
+                continue
+            changed.append(((race_date, race_number), records, digest))
+            events.append({
+                'type': 'race_amended' if old else 'race_result',
+                'race_date': race_date,
+                'racecourse': records[0].get('racecourse'),
+                'race_number': race_number,
+                'hash': digest,
+                'previous_hash': old,
+                'runners': len(records),
+            })
+        RACES_COMPARED.inc(len(races) - len(changed), outcome='unchanged')
+        if not changed:
+            return []
+        RACES_COMPARED.inc(len(changed), outcome='changed')
+
+        session = self.Session()
+        try:
+            rows = [record for _, records, _ in changed for record in records]
+            # 更正的场次: 删除新赛果中已不存在的马匹 (例如更正马名)
+            for (race_date, race_number), records, _ in changed:
+                if (race_date, race_number) in previous:
+                    session.execute(RaceResult.__table__.delete().where(
+                        RaceResult.race_date == race_date,
+                        RaceResult.race_number == race_number,
+                        RaceResult.horse_name.notin_([r.get('horse_name') for r in records])
+                    ))
+            self._write_race_results(session, rows)
+            self._upsert(session, RaceHash, [
+                {'race_date': race_date, 'race_number': race_number, 'racecourse': records[0].get('racecourse'),
+                 'content_hash': digest, 'runners': len(records), 'updated_at': now}
+                for (race_date, race_number), records, digest in changed
+            ], ('racecourse', 'content_hash', 'runners', 'updated_at'), RaceHash.UNIQUE_KEY)
+            self._bump_version(session)
+            session.commit()
+            ROWS_WRITTEN.inc(len(rows), table='race_results')
+            logger.info(f"保存 {len(changed)}/{len(races)} 场有变化的赛事, 共 {len(rows)} 条记录")
+        except Exception as e:
+            session.rollback()
+            logger.error(f"保存赛事结果时出错: {e}")
+            raise
+        finally:
+            session.close()
+
+        for listener in self.change_listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                logger.error(f"通知赛果变化时出错: {e}")
+        return events
+
+    def save_race_meetings(self, rows: List[Dict[str, Any]]):
+        """写入赛马日历 (同一日期以新内容覆盖)"""
+        if not rows:
+            return
+        session = self.Session()
+        try:
+            self._upsert(session, RaceMeeting, rows, ('racecourse', 'races', 'source', 'updated_at'), ('race_date',))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"保存赛马日历时出错: {e}")
+            raise
+        finally:
+            session.close()
+
+    def save_par_times(self, rows: List[Dict[str, Any]]):
+        """以新计算的标准时间表整体替换旧表"""
+        session = self.Session()
+        try:
+            session.query(ParTime).delete(synchronize_session=False)
+            now = datetime.now()
+            session.add_all([ParTime(**row, updated_at=now) for row in rows])
+            # 已缓存的赛事响应带有速度指数, 须随标准时间失效
+            self._bump_version(session)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"保存标准时间表时出错: {e}")
+            raise
+        finally:
+            session.close()
+
+    def get_par_times(self) -> List[Dict[str, Any]]:
+        """全部标准时间 (各层级)"""
+        table = ParTime.__table__
+        query = select(table.c.distance, table.c.racecourse, table.c.going, table.c.par_time_cs)
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(query).mappings().all()]
+
+    def recent_race_dates(self, limit: int, before: Optional[str] = None) -> List[str]:
+        """最近已入库的赛马日 (新到旧)"""
+        table = RaceResult.__table__
+        query = select(table.c.race_date).distinct().order_by(table.c.race_date.desc()).limit(limit)
+        if before:
+            query = query.where(table.c.race_date <= before)
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.execute(query)]
+            
+    def backfill_dimension_ids(self, batch_size: int = 5000) -> int:
+        """为未带代理键的旧记录补填 jockey_id / trainer_id / horse_id"""
+        session = self.Session()
+        updated = 0
+        last_id = 0
+        try:
+            while True:
+                rows = session.query(
+                    RaceResult.id, RaceResult.jockey, RaceResult.trainer,
+                    RaceResult.horse_no, RaceResult.horse_name
+                ).filter(
+                    RaceResult.id > last_id,
+                    RaceResult.jockey_id.is_(None)
+                ).order_by(RaceResult.id).limit(batch_size).all()
+                if not rows:
+                    break
+                
+                values = [dict(row._mapping) for row in rows]
+                self.dimensions.assign_ids(session, values)
+                session.bulk_update_mappings(RaceResult, [
+                    {
+                        'id': v['id'],
+                        'jockey_id': v['jockey_id'],
+                        'trainer_id': v['trainer_id'],
+                        'horse_id': v['horse_id']
+                    }
+                    for v in values
+                ])
+                session.commit()
+                updated += len(values)
+                last_id = values[-1]['id']
+            
+            if updated:
+                self._bump_version(session)
+                session.commit()
+            logger.info(f"已补填 {updated} 条记录的维度代理键")
+            return updated
+        except Exception as e:
+            session.rollback()
+            logger.error(f"补填维度代理键时出错: {e}")
+            raise
+        finally:
+            session.close()
             
+    def backfill_finish_times(self, batch_size: int = 5000) -> int:
+        """为旧记录补填 finish_time_cs (由 finish_time 解析)"""
+        session = self.Session()
+        updated = 0
+        last_id = 0
+        try:
+            while True:
+                rows = session.query(RaceResult.id, RaceResult.finish_time).filter(
+                    RaceResult.id > last_id,
+                    RaceResult.finish_time_cs.is_(None)
+                ).order_by(RaceResult.id).limit(batch_size).all()
+                if not rows:
+                    break
+                
+                from src.services.speed_figures import parse_finish_times
+
+                times = parse_finish_times([row.finish_time for row in rows])
+                session.bulk_update_mappings(RaceResult, [
+                    {'id': row.id, 'finish_time_cs': int(cs)} for row, cs in zip(rows, times)
+                ])
+                session.commit()
+                updated += len(rows)
+                last_id = rows[-1].id
+            
+            logger.info(f"已补填 {updated} 条记录的完成时间")
+            return updated
+        except Exception as e:
+            session.rollback()
+            logger.error(f"补填完成时间时出错: {e}")
+            raise
+        finally:
+            session.close()
+
+    @staticmethod
+    def _missing_unique_keys(inspector, table) -> List[Tuple[str, List[str]]]:
+        """模型声明但旧表没有的唯一键 [(名称, 列)]"""
+        existing = {tuple(sorted(c['column_names'])) for c in inspector.get_unique_constraints(table.name)}
+        existing |= {tuple(sorted(i['column_names'])) for i in inspector.get_indexes(table.name) if i.get('unique')}
+        missing = []
+        for constraint in table.constraints:
+            if not isinstance(constraint, UniqueConstraint):
+                continue
+            columns = [column.name for column in constraint.columns]
+            if tuple(sorted(columns)) not in existing:
+                missing.append((constraint.name or f"uq_{table.name}_{'_'.join(columns)}", columns))
+        return missing
+
+    def pending_migrations(self) -> List[str]:
+        """旧表缺少的列、索引及唯一键 (create_all 不会修改已存在的表)"""
+        inspector = inspect(self.engine)
+        pending = []
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            pending.extend(f"{table.name}.{column.name}" for column in table.columns if column.name not in columns)
+            pending.extend(f"{table.name}:{index.name}" for index in table.indexes if index.name not in indexes)
+            pending.extend(f"{table.name}:{name}" for name, _ in self._missing_unique_keys(inspector, table))
+        return pending
+
+    def migrate_schema(self) -> List[str]:
+        """为旧表补加缺少的列 (均可为空)、索引及唯一键, 返回已执行的步骤
+
+        补加唯一键前先删除重复的行 (同一键保留 id 最大, 即最后写入的一行),
+        否则 UPSERT 无法按冲突键去重 (MySQL 不触发 ON DUPLICATE KEY UPDATE,
+        SQLite 的 ON CONFLICT 找不到对应的唯一约束)。
+        """
+        inspector = inspect(self.engine)
+        applied = []
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                columns = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in columns:
+                        continue
+                    column_type = column.type.compile(dialect=self.engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    applied.append(f"ADD COLUMN {table.name}.{column.name}")
+                indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in indexes:
+                        index.create(conn)
+                        applied.append(f"CREATE INDEX {index.name}")
+                for name, key in self._missing_unique_keys(inspector, table):
+                    if 'id' in table.c:
+                        key_list = ', '.join(key)
+                        not_null = ' AND '.join(f"{column} IS NOT NULL" for column in key)
+                        # MySQL 不允许 DELETE 的子查询直接引用同一表, 以派生表包一层
+                        deleted = conn.execute(text(
+                            f"DELETE FROM {table.name} WHERE {not_null} AND id NOT IN ("
+                            f"SELECT id FROM (SELECT MAX(id) AS id FROM {table.name} "
+                            f"GROUP BY {key_list}) AS keep_rows)"
+                        )).rowcount
+                        if deleted:
+                            applied.append(f"DELETE {deleted} duplicate rows FROM {table.name}")
+                    conn.execute(text(f"CREATE UNIQUE INDEX {name} ON {table.name} ({', '.join(key)})"))
+                    applied.append(f"ADD UNIQUE {name}")
+        for step in applied:
+            logger.info(f"数据库升级: {step}")
+        return applied
+
+    def migrate(self) -> Dict[str, Any]:
+        """升级旧数据库: 补加列及索引, 再为旧记录补填代理键及完成时间 (可重复执行)"""
+        return {
+            'schema': self.migrate_schema(),
+            'dimension_ids': self.backfill_dimension_ids(),
+            'finish_times': self.backfill_finish_times(),
+        }
+
+    def _bump_version(self, session, name: str = 'race_results'):
+        """在同一事务内递增数据版本号"""
+        updated = session.execute(
+            update(DataVersion).where(DataVersion.name == name).values(
+                version=DataVersion.version + 1, updated_at=datetime.now()
+            )
+        )
+        if updated.rowcount == 0:
+            session.add(DataVersion(name=name, version=1, updated_at=datetime.now()))
+
+    def get_data_version(self, name: str = 'race_results') -> int:
+        """当前数据版本号 (主键查询, 开销很小)"""
+        with self.engine.connect() as conn:
+            version = conn.execute(
+                select(DataVersion.version).where(DataVersion.name == name)
+            ).scalar()
+        return int(version or 0)
+
+    # 可导出的表
+    EXPORT_TABLES = {'race_results': RaceResult, 'jockey_stats': JockeyStats}
+
+    def iter_table(self, table: str = 'race_results', chunk_size: int = 5000,
+                   start_date: Optional[str] = None, end_date: Optional[str] = None,
+                   racecourse: Optional[str] = None, **entities) -> Iterator[List[Dict[str, Any]]]:
+        """按主键 keyset 分块读取, 每次只持有一个分块
+
+        entities 可为 jockey / trainer / horse (名称) 或 jockey_id / trainer_id / horse_id。
+        """
+        model = self.EXPORT_TABLES.get(table)
+        if model is None:
+            raise ValueError(f"不支持导出的表: {table}")
+        t = model.__table__
+        date_column = t.c.race_date if 'race_date' in t.c else t.c.date
+
+        conditions = []
+        if start_date:
+            conditions.append(date_column >= start_date)
+        if end_date:
+            conditions.append(date_column <= end_date)
+        if racecourse and 'racecourse' in t.c:
+            conditions.append(t.c.racecourse == racecourse)
+        for entity in ('jockey', 'trainer', 'horse'):
+            entity_id = entities.get(f'{entity}_id')
+            name = entities.get(entity)
+            if entity_id is None and name and f'{entity}_id' in t.c:
+                # 未知名称以 -1 过滤, 结果为空
+                entity_id = self.dimensions.id_of(entity, name) or -1
+            if entity_id is not None and f'{entity}_id' in t.c:
+                conditions.append(t.c[f'{entity}_id'] == int(entity_id))
+            elif name and entity in t.c:
+                conditions.append(t.c[entity] == name)
+
+        last_id = 0
+        while True:
+            query = select(t).where(t.c.id > last_id, *conditions).order_by(t.c.id).limit(chunk_size)
+            with self.engine.connect() as conn:
+                rows = [dict(row) for row in conn.execute(query).mappings().all()]
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            yield rows
+            if len(rows) < chunk_size:
+                break
+
+    def save_chart_payload(self, name: str, version: int, payload: Dict[str, Any]):
+        """保存预渲染的图表, 只保留最近几个版本"""
+        session = self.Session()
+        try:
+            existing = session.query(ChartPayload).filter_by(name=name, data_version=version).first()
+            body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+            if existing:
+                existing.payload = body
+            else:
+                session.add(ChartPayload(name=name, data_version=version, payload=body))
+            session.query(ChartPayload).filter(
+                ChartPayload.name == name,
+                ChartPayload.data_version < version - 2
+            ).delete(synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"保存图表 {name} 时出错: {e}")
+        finally:
+            session.close()
+
+    def get_chart_payload(self, name: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """读取预渲染的图表; 未指定版本时取最新版本"""
+        session = self.Session()
+        try:
+            query = session.query(ChartPayload).filter(ChartPayload.name == name)
+            if version is not None:
+                query = query.filter(ChartPayload.data_version <= version)
+            chart = query.order_by(ChartPayload.data_version.desc()).first()
+            return json.loads(chart.payload) if chart else None
+        finally:
+            session.close()
+
+    # 实体 -> (维度表, 代理键列, 显示列)
+    _ENTITY_TABLES = {
+        'jockey': ('jockeys', 'jockey_id', 'd.name'),
+        'trainer': ('trainers', 'trainer_id', 'd.name'),
+        'horse': ('horses', 'horse_id', "COALESCE(d.name, d.code)"),
+    }
+
+    def query_entity_stats(self, entity: str, after_id: int = 0, limit: int = 50,
+                           start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按代理键分页的骑师/练马师/马匹统计 (keyset 分页)"""
+        table, id_column, name_expr = self._ENTITY_TABLES[entity]
+        query = f"""
+        SELECT
+            r.{id_column} AS id,
+            {name_expr} AS name,
+            COUNT(*) AS total_races,
+            SUM(CASE WHEN r.finish_position = 1 THEN 1 ELSE 0 END) AS wins,
+            SUM(CASE WHEN r.finish_position <= 3 THEN 1 ELSE 0 END) AS places,
+            AVG(r.finish_position) AS avg_position
+        FROM race_results r
+        JOIN {table} d ON d.id = r.{id_column}
+        WHERE r.{id_column} > :after_id
+          AND r.race_date BETWEEN :start_date AND :end_date
+        GROUP BY r.{id_column}, {name_expr}
+        ORDER BY r.{id_column}
+        LIMIT :limit
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(query), {
+                'after_id': after_id,
+                'start_date': start_date or '0000-00-00',
+                'end_date': end_date or '9999-12-31',
+                'limit': limit
+            }).mappings().all()
+        results = []
+        for row in rows:
+            total = int(row['total_races'])
+            results.append({
+                'id': int(row['id']),
+                'name': row['name'],
+                'total_races': total,
+                'wins': int(row['wins'] or 0),
+                'places': int(row['places'] or 0),
+                'win_rate': round(int(row['wins'] or 0) / total * 100, 2) if total else 0.0,
+                'avg_position': round(float(row['avg_position'] or 0), 2)
+            })
+        return results
+
+    def query_races(self, after: Optional[tuple] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """按 (日期, 场次编号) keyset 分页的赛事列表"""
+        after_date, after_race = after or ('', -1)
+        query = """
+        SELECT race_date, race_number, MAX(race_id) AS race_id, MAX(racecourse) AS racecourse,
+               MAX(distance) AS distance, MAX(race_class) AS race_class, MAX(going) AS going,
+               COUNT(*) AS runners
+        FROM race_results
+        WHERE race_date > :after_date
+           OR (race_date = :after_date AND race_number > :after_race)
+        GROUP BY race_date, race_number
+        ORDER BY race_date, race_number
+        LIMIT :limit
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(query), {
+                'after_date': after_date, 'after_race': after_race, 'limit': limit
+            }).mappings().all()
+        return [dict(row) for row in rows]
+
+    def query_race_runners(self, race_date: str, race_number: int) -> List[Dict[str, Any]]:
+        """单场赛事的全部出赛马"""
+        table = RaceResult.__table__
+        columns = ['horse_no', 'horse_name', 'draw', 'finish_position', 'jockey', 'trainer',
+                   'finish_time', 'finish_time_cs', 'odds', 'distance', 'racecourse', 'going',
+                   'jockey_id', 'trainer_id', 'horse_id']
+        query = select(*[table.c[name] for name in columns]).where(
+            table.c.race_date == race_date, table.c.race_number == race_number
+        ).order_by(table.c.finish_position)
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(query).mappings().all()]
+
+    def query_horse_runs(self, horse_id: int, after_date: str = '', limit: int = 50) -> List[Dict[str, Any]]:
+        """马匹出赛记录, 按日期 keyset 分页"""
+        table = RaceResult.__table__
+        columns = ['race_date', 'race_number', 'racecourse', 'distance', 'race_class', 'going',
+                   'draw', 'finish_position', 'jockey', 'finish_time', 'odds']
+        query = select(*[table.c[name] for name in columns]).where(
+            table.c.horse_id == horse_id, table.c.race_date > after_date
+        ).order_by(table.c.race_date).limit(limit)
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(query).mappings().all()]
+
+    def get_horses_due_for_sync(self, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """最近一次同步后再有出赛的马匹 (以已入库的赛果为准), 未曾同步的马匹亦包括在内"""
+        query = """
+        SELECT r.horse_no AS horse_code, MAX(r.race_date) AS latest_run, s.last_race_date
+        FROM race_results r
+        LEFT JOIN horse_sync_state s ON s.horse_code = r.horse_no
+        WHERE r.horse_no IS NOT NULL AND r.horse_no <> '' AND r.race_date >= :since
+        GROUP BY r.horse_no, s.last_race_date
+        HAVING s.last_race_date IS NULL OR MAX(r.race_date) > s.last_race_date
+        ORDER BY latest_run DESC
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(query), {'since': since or ''}).mappings().all()
+        return [dict(row) for row in rows]
+
+    def get_horse_page_ids(self, horse_codes: List[str]) -> Dict[str, str]:
+        """烙号 -> 马匹资料页面 HorseId (赛果页面链接中取得; 未曾取得的马匹不在结果中)"""
+        table = Horse.__table__
+        if not horse_codes:
+            return {}
+        query = select(table.c.code, table.c.page_id).where(
+            table.c.code.in_(horse_codes), table.c.page_id.isnot(None)
+        )
+        with self.engine.connect() as conn:
+            return {code: page_id for code, page_id in conn.execute(query)}
+
+    def get_horse_sync_states(self, horse_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        table = HorseSyncState.__table__
+        if not horse_codes:
+            return {}
+        query = select(table).where(table.c.horse_code.in_(horse_codes))
+        with self.engine.connect() as conn:
+            return {row['horse_code']: dict(row) for row in conn.execute(query).mappings().all()}
+
+    @TRANSACTION_SECONDS.timed(operation='save_horse_history')
+    def save_horse_history(self, rows: List[Dict[str, Any]], states: List[Dict[str, Any]]):
+        """追加往绩 (同一行已存在时以新内容覆盖) 并更新同步进度, 在同一事务内完成"""
+        if not rows and not states:
+            return
+        session = self.Session()
+        try:
+            if rows:
+                self._upsert(session, HorseHistory, rows, [
+                    name for name in rows[0] if name not in HorseHistory.UNIQUE_KEY
+                ], HorseHistory.UNIQUE_KEY)
+            self._upsert(session, HorseSyncState, states,
+                         ('last_race_date', 'last_row_hash', 'rows', 'synced_at'), ('horse_code',))
+            session.commit()
+            ROWS_WRITTEN.inc(len(rows), table='horse_history')
+        except Exception as e:
+            session.rollback()
+            logger.error(f"保存马匹往绩时出错: {e}")
+            raise
+        finally:
+            session.close()
+
+    @TRANSACTION_SECONDS.timed(operation='has_results')
+    def has_results(self) -> bool:
+        """数据库中是否已有赛果"""
+        with self.engine.connect() as conn:
+            return conn.execute(select(RaceResult.__table__.c.id).limit(1)).first() is not None
+
+    @TRANSACTION_SECONDS.timed(operation='count_race_results')
+    def count_race_results(self, race_date: str, racecourse: Optional[str] = None) -> int:
+        """某日 (某马场) 已入库的出赛记录数"""
+        table = RaceResult.__table__
+        query = select(func.count()).select_from(table).where(table.c.race_date == race_date)
+        if racecourse:
+            query = query.where(table.c.racecourse == racecourse)
+        with self.engine.connect() as conn:
+            return int(conn.execute(query).scalar() or 0)
+
+    @TRANSACTION_SECONDS.timed(operation='save_quarantine')
+    def save_quarantine(self, rows: List[Dict[str, Any]]):
+        """保存预处理拒收的记录 (原始内容及原因代码)"""
+        if not rows:
+            return
+        now = datetime.now()
+        session = self.Session()
+        try:
+            session.execute(QuarantinedRecord.__table__.insert(), [dict(row, created_at=now) for row in rows])
+            session.commit()
+            ROWS_WRITTEN.inc(len(rows), table='quarantined_records')
+        except Exception as e:
+            session.rollback()
+            logger.error(f"保存隔离记录时出错: {e}")
+            raise
+        finally:
+            session.close()
+
+    def quarantine_counts(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, int]:
+        """按原因代码统计隔离记录数"""
+        table = QuarantinedRecord.__table__
+        query = select(table.c.reason, func.count()).group_by(table.c.reason)
+        if start_date and end_date:
+            query = query.where(table.c.race_date.between(start_date, end_date))
+        with self.engine.connect() as conn:
+            return {reason: int(count) for reason, count in conn.execute(query)}
+
+    def seed_work_units(self, job: str, units: List[Tuple[str, str]]) -> int:
+        """登记工作单元 (日期, 马场), 已存在的单元保持原状态; 返回该任务的单元总数"""
+        rows = [{'job': job, 'race_date': d, 'racecourse': c, 'status': 'pending', 'attempts': 0,
+                 'updated_at': datetime.now()} for d, c in units]
+        session = self.Session()
+        try:
+            self._upsert(session, WorkUnit, rows, (), WorkUnit.UNIQUE_KEY)
+            session.commit()
+            return session.query(WorkUnit).filter(WorkUnit.job == job).count()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"登记工作单元时出错: {e}")
+            raise
+        finally:
+            session.close()
+
+    @TRANSACTION_SECONDS.timed(operation='claim_work_units')
+    def claim_work_units(self, job: str, owner: str, lease_seconds: float, limit: int = 1) -> List[Dict[str, Any]]:
+        """原子领取工作单元: 待处理或租约已过期的单元, 以条件 UPDATE 抢占
+
+        两个进程同时领取同一单元时只有一个 UPDATE 命中 (rowcount = 1),
+        因此不依赖数据库特有的锁语法, MySQL 与 SQLite 皆适用。
+        """
+        table = WorkUnit.__table__
+        now = datetime.now()
+        available = (table.c.status == 'pending') | ((table.c.status == 'leased') & (table.c.lease_expires < now))
+        claimed = []
+        with self.engine.connect() as conn:
+            candidates = conn.execute(
+                select(table.c.id).where(table.c.job == job, available)
+                .order_by(table.c.race_date, table.c.racecourse).limit(limit * 4)
+            ).scalars().all()
+        for unit_id in candidates:
+            with self.engine.begin() as conn:
+                result = conn.execute(
+                    update(table).where(table.c.id == unit_id, available).values(
+                        status='leased', owner=owner, attempts=table.c.attempts + 1,
+                        lease_expires=now + timedelta(seconds=lease_seconds), updated_at=now
+                    )
+                )
+                if result.rowcount == 1:
+                    row = conn.execute(select(table).where(table.c.id == unit_id)).mappings().one()
+                    claimed.append(dict(row))
+            if len(claimed) >= limit:
+                break
+        return claimed
+
+    def renew_work_unit(self, unit_id: int, owner: str, lease_seconds: float) -> bool:
+        """续租; 返回 False 表示租约已被其他进程接手"""
+        table = WorkUnit.__table__
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(table).where(table.c.id == unit_id, table.c.owner == owner,
+                                    table.c.status == 'leased').values(
+                    lease_expires=datetime.now() + timedelta(seconds=lease_seconds)
+                )
+            )
+        return result.rowcount == 1
+
+    def finish_work_unit(self, unit_id: int, owner: str, records: int = 0,
+                         error: Optional[str] = None, max_attempts: int = 3) -> bool:
+        """完成 (error 为空) 或交还工作单元; 失败次数达到上限后标记为 failed"""
+        table = WorkUnit.__table__
+        if error is None:
+            values = {'status': 'done', 'records': records, 'error': None}
+        else:
+            values = {'status': case((table.c.attempts >= max_attempts, 'failed'), else_='pending'),
+                      'error': error[:2000]}
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(table).where(table.c.id == unit_id, table.c.owner == owner,
+                                    table.c.status == 'leased').values(
+                    lease_expires=None, updated_at=datetime.now(), **values
+                )
+            )
+        return result.rowcount == 1
+
+    def work_unit_progress(self, job: str) -> Dict[str, int]:
+        """各状态的单元数及已入库记录数"""
+        table = WorkUnit.__table__
+        query = select(table.c.status, func.count(), func.coalesce(func.sum(table.c.records), 0)).where(
+            table.c.job == job
+        ).group_by(table.c.status)
+        progress = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0, 'records': 0}
+        with self.engine.connect() as conn:
+            for status, count, records in conn.execute(query).all():
+                progress[status] = int(count)
+                progress['records'] += int(records)
+        return progress
+
     def get_jockey_stats(self, start_date=None, end_date=None):
         """獲取騎師統計"""
         query = """
@@ -85,45 +854,55 @@ class DataStorage:
         WHERE race_date BETWEEN :start_date AND :end_date
         GROUP BY jockey
         """
+        import pandas as pd
+
         return pd.read_sql(query, self.engine, params={
             'start_date': start_date,
             'end_date': end_date
         }) 
 
+    @TRANSACTION_SECONDS.timed(operation='get_race_frame')
+    def get_race_frame(self, start_date, end_date, columns: List[str] = None) -> 'pd.DataFrame':
+        """以整数代理键读取赛事结果, 骑师/练马师/马匹以 categorical 显示名称"""
+        columns = columns or RACE_FRAME_COLUMNS
+        table = RaceResult.__table__
+        query = select(*[table.c[name] for name in columns]).where(
+            table.c.race_date.between(start_date, end_date)
+        ).order_by(table.c.race_date, table.c.id)
+        import pandas as pd
+
+        df = pd.read_sql(query, self.engine)
+        return self.dimensions.decode(df)
+
+    def iter_race_frames(self, start_date, end_date, columns: List[str] = None,
+                         chunk_size: int = 50000) -> Iterator['pd.DataFrame']:
+        """按主键 keyset 分块读取 get_race_frame 的结果, 每次只持有一个分块"""
+        columns = [name for name in (columns or RACE_FRAME_COLUMNS) if name != 'id']
+        table = RaceResult.__table__
+        import pandas as pd
+
+        last_id = 0
+        while True:
+            query = select(table.c.id, *[table.c[name] for name in columns]).where(
+                table.c.id > last_id, table.c.race_date.between(start_date, end_date)
+            ).order_by(table.c.id).limit(chunk_size)
+            df = pd.read_sql(query, self.engine)
+            if df.empty:
+                break
+            last_id = int(df['id'].iloc[-1])
+            yield self.dimensions.decode(df.drop(columns='id'))
+            if len(df) < chunk_size:
+                break
+
+    @TRANSACTION_SECONDS.timed(operation='get_race_results')
     def get_race_results(self, start_date, end_date):
         """获取指定日期范围内的赛马结果"""
         session = self.Session()
         try:
-            # 先检查数据库中是否有数据
-            total_count = session.query(RaceResult).count()
-            logger.info(f"数据库中总共有 {total_count} 条记录")
-            
-            # 检查日期格式
-            logger.info(f"查询日期格式: start_date={start_date}, end_date={end_date}")
-            
-            # 查看一些样本数据的日期格式
-            sample = session.query(RaceResult.race_date).limit(3).all()
-            logger.info(f"数据库中的日期格式样本: {[s.race_date for s in sample]}")
-            
-            # 查询指定日期范围的数据
             results = session.query(RaceResult).filter(
                 RaceResult.race_date.between(start_date, end_date)
             ).order_by(RaceResult.race_date).all()
-            
-            logger.info(f"查询到 {len(results)} 条记录")
-            
-            if results:
-                # 显示前几条记录的详细信息
-                for i, result in enumerate(results[:3]):
-                    logger.info(f"示例记录 {i+1}: "
-                              f"日期={result.race_date}, "
-                              f"骑师={result.jockey}, "
-                              f"名次={result.finish_position}")
-            else:
-                # 尝试直接查询所有记录的日期
-                all_dates = session.query(RaceResult.race_date).distinct().all()
-                logger.warning(f"未找到任何记录，数据库中存在的日期: {[d.race_date for d in all_dates]}")
-                
+            logger.debug(f"查询 {start_date} 至 {end_date}: {len(results)} 条记录")
             return results
         except Exception as e:
             logger.error(f"获取赛马结果时出错: {e}")
@@ -137,6 +916,7 @@ class DataStorage:
         if hasattr(self, 'engine'):
             self.engine.dispose() 
 
+    @TRANSACTION_SECONDS.timed(operation='save_analysis_results')
     def save_analysis_results(self, results: List[Dict[str, Any]]):
         """保存分析结果"""
         session = self.Session()
@@ -158,9 +938,10 @@ class DataStorage:
                     session.add(stats)
             
             session.commit()
+            ROWS_WRITTEN.inc(len(results), table='jockey_stats')
             logger.info(f"成功保存 {len(results)} 条分析结果")
         except Exception as e:
             session.rollback()
             logger.error(f"保存分析结果时出错: {e}")
         finally:
-            session.close() 
\ No newline at end of file
+            session.close()
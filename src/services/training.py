@@ -0,0 +1,369 @@
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.services.bias_cube import BiasCube
+from src.services.feature_store import HorseFeatureStore
+
+logger = logging.getLogger(__name__)
+
+# 每匹出赛马的特征列 (写入特征矩阵的顺序)
+FEATURE_COLUMNS = [
+    'log_odds', 'implied_prob', 'favourite_rank', 'field_size', 'draw', 'draw_ratio',
+    'log_starts', 'win_rate', 'days_since_last_run', 'last_finish', 'avg_recent_finish',
+    'rating_trend', 'body_weight_change', 'distance_win_rate', 'course_win_rate',
+    'draw_band_win_rate', 'cube_draw_win_rate',
+]
+
+_FILES = {
+    'X': ('X.f32', np.float32),
+    'y': ('y.u1', np.uint8),
+    'race_offsets': ('race_offsets.i64', np.int64),
+    'race_day': ('race_day.i32', np.int32),
+}
+
+
+class FeatureMatrixWriter:
+    """分块追加写入特征矩阵 (每行一匹出赛马, 同一场赛事的行相邻)"""
+
+    def __init__(self, directory: str, columns: List[str] = FEATURE_COLUMNS):
+        self.directory = directory
+        self.columns = list(columns)
+        os.makedirs(directory, exist_ok=True)
+        self._files = {
+            name: open(os.path.join(directory, filename), 'wb')
+            for name, (filename, _) in _FILES.items()
+        }
+        self.n_rows = 0
+        self.n_races = 0
+        # 第一个赛事的起始偏移
+        self._files['race_offsets'].write(np.zeros(1, dtype=np.int64).tobytes())
+
+    def append(self, X: np.ndarray, y: np.ndarray, race_sizes: np.ndarray, race_day: np.ndarray):
+        """写入一个分块"""
+        if len(X) == 0:
+            return
+        offsets = self.n_rows + np.cumsum(race_sizes, dtype=np.int64)
+        self._files['X'].write(np.ascontiguousarray(X, dtype=np.float32).tobytes())
+        self._files['y'].write(np.asarray(y, dtype=np.uint8).tobytes())
+        self._files['race_offsets'].write(offsets.tobytes())
+        self._files['race_day'].write(np.asarray(race_day, dtype=np.int32).tobytes())
+        self.n_rows += len(X)
+        self.n_races += len(race_sizes)
+
+    def close(self):
+        """关闭文件并写入元数据"""
+        for handle in self._files.values():
+            handle.close()
+        with open(os.path.join(self.directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'n_rows': self.n_rows,
+                'n_races': self.n_races,
+                'columns': self.columns,
+            }, f, ensure_ascii=False)
+        logger.info(f"特征矩阵已写入 {self.directory}: {self.n_races} 场赛事, {self.n_rows} 行")
+
+
+class FeatureMatrix:
+    """以内存映射只读打开的特征矩阵, 多个进程可共享同一份页缓存"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.columns = meta['columns']
+        self.n_rows = meta['n_rows']
+        self.n_races = meta['n_races']
+        shapes = {
+            'X': (self.n_rows, len(self.columns)),
+            'y': (self.n_rows,),
+            'race_offsets': (self.n_races + 1,),
+            'race_day': (self.n_races,),
+        }
+        for name, (filename, dtype) in _FILES.items():
+            path = os.path.join(directory, filename)
+            if shapes[name][0] == 0:
+                setattr(self, name, np.zeros(shapes[name], dtype=dtype))
+            else:
+                setattr(self, name, np.memmap(path, dtype=dtype, mode='r', shape=shapes[name]))
+
+    def race_chunks(self, start_race: int, stop_race: int, races_per_chunk: int):
+        """按赛事分块迭代 (X, y, 块内赛事起始偏移)"""
+        for r0 in range(start_race, stop_race, races_per_chunk):
+            r1 = min(r0 + races_per_chunk, stop_race)
+            a, b = int(self.race_offsets[r0]), int(self.race_offsets[r1])
+            starts = np.asarray(self.race_offsets[r0:r1]) - a
+            yield np.asarray(self.X[a:b], dtype=np.float64), np.asarray(self.y[a:b], dtype=np.float64), starts
+
+
+def _runner_features(day: pd.DataFrame, store: HorseFeatureStore, cube: BiasCube) -> np.ndarray:
+    """计算一个赛马日全部出赛马的特征 (只使用赛前已知信息)"""
+    n = len(day)
+    race_key = day['race_id'].astype(str).to_numpy()
+    odds = pd.to_numeric(day['odds'], errors='coerce').to_numpy(dtype=np.float64)
+    odds = np.where(odds > 1, odds, 99.0)
+    draw = pd.to_numeric(day['draw'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+    grouped = pd.Series(1.0 / odds).groupby(race_key)
+    field_size = grouped.transform('size').to_numpy(dtype=np.float64)
+    implied = (1.0 / odds) / grouped.transform('sum').to_numpy()
+    favourite_rank = pd.Series(odds).groupby(race_key).rank(method='min').to_numpy()
+
+    codes = (day['horse_no'].where(day['horse_no'].astype(bool), day['horse_name'])).astype(str).tolist()
+    race_date = day['race_date'].iloc[0]
+    features = np.empty((n, len(FEATURE_COLUMNS)), dtype=np.float64)
+    # 同一赛马日各场的距离/马场不同, 按场次批量查询特征库
+    for key in np.unique(race_key):
+        sel = np.flatnonzero(race_key == key)
+        first = day.iloc[sel[0]]
+        card = store.get_batch(
+            [codes[i] for i in sel], as_of=race_date,
+            distance=int(first.get('distance') or 0), track=first.get('racecourse'),
+            draws=draw[sel].tolist()
+        )
+        recent = card[[f'finish_{i + 1}' for i in range(store.form_length)]].to_numpy(dtype=np.float64)
+        recent = np.where(recent > 0, np.minimum(recent, 14), np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_recent = np.nanmean(recent, axis=1)
+
+        def rate(wins: str, starts: str) -> np.ndarray:
+            if starts not in card:
+                return np.zeros(len(sel))
+            s = card[starts].to_numpy(dtype=np.float64)
+            return np.divide(card[wins].to_numpy(dtype=np.float64), s, out=np.zeros(len(sel)), where=s > 0)
+
+        cube_rate = np.array([
+            cube.query(racecourse=first.get('racecourse'), distance=first.get('distance'),
+                       draw=int(d))['win_rate'] / 100 if d > 0 else 0.0
+            for d in draw[sel]
+        ])
+
+        days_since = card['days_since_last_run'].to_numpy(dtype=np.float64)
+        features[sel] = np.column_stack([
+            np.log(odds[sel]),
+            implied[sel],
+            favourite_rank[sel],
+            field_size[sel],
+            draw[sel],
+            np.divide(draw[sel], field_size[sel]),
+            np.log1p(card['starts'].to_numpy(dtype=np.float64)),
+            card['win_rate'].to_numpy(dtype=np.float64),
+            np.where(days_since >= 0, np.minimum(days_since, 365), 365) / 30.0,
+            np.nan_to_num(recent[:, 0], nan=14.0),
+            np.nan_to_num(avg_recent, nan=14.0),
+            np.nan_to_num(card['rating_trend'].to_numpy(dtype=np.float64)),
+            np.nan_to_num(card['body_weight_change'].to_numpy(dtype=np.float64)),
+            rate('distance_wins', 'distance_starts'),
+            rate('course_wins', 'course_starts'),
+            rate('draw_wins', 'draw_starts'),
+            cube_rate,
+        ])
+    return features
+
+
+def build_feature_matrix(storage, start_date: str, end_date: str, directory: str,
+                         window_days: int = 31, chunk_rows: int = 50000) -> FeatureMatrix:
+    """按时间顺序流式构建特征矩阵
+
+    每次只从数据库读取一个时间窗口, 特征库与偏差立方体在写出当日特征
+    之后才吸收当日赛果, 保证特征只使用赛前信息。
+    """
+    store = HorseFeatureStore()
+    cube = BiasCube()
+    writer = FeatureMatrixWriter(directory)
+    buffer: Dict[str, List[np.ndarray]] = {'X': [], 'y': [], 'sizes': [], 'day': []}
+    buffered = 0
+
+    def flush():
+        nonlocal buffered
+        if buffered:
+            writer.append(np.concatenate(buffer['X']), np.concatenate(buffer['y']),
+                          np.concatenate(buffer['sizes']), np.concatenate(buffer['day']))
+            for values in buffer.values():
+                values.clear()
+            buffered = 0
+
+    try:
+        window_start = datetime.strptime(start_date, "%Y-%m-%d")
+        end = datetime.strptime(end_date, "%Y-%m-%d")
+        while window_start <= end:
+            window_end = min(window_start + timedelta(days=window_days - 1), end)
+            frame = storage.get_race_frame(window_start.strftime("%Y-%m-%d"), window_end.strftime("%Y-%m-%d"))
+            for race_date, day in frame.groupby('race_date', sort=True):
+                day = day.assign(
+                    horse_name=day['horse_name'].astype(str),
+                    horse_no=day['horse_no'].fillna('').astype(str)
+                ).sort_values(['race_id', 'draw', 'horse_no'], kind='stable')  # 不以名次排序, 免得头马总在首行
+                day = day.reset_index(drop=True)
+
+                buffer['X'].append(_runner_features(day, store, cube))
+                buffer['y'].append((day['finish_position'] == 1).to_numpy(dtype=np.uint8))
+                sizes = day.groupby('race_id', sort=False).size().to_numpy()
+                buffer['sizes'].append(sizes)
+                day_number = int(np.datetime64(str(race_date), 'D').astype(np.int64))
+                buffer['day'].append(np.full(len(sizes), day_number, dtype=np.int32))
+                buffered += len(day)
+
+                # 写出特征后才吸收当日赛果
+                records = day.to_dict('records')
+                store.ingest_results(records)
+                cube.add_results(records)
+
+                if buffered >= chunk_rows:
+                    flush()
+            window_start = window_end + timedelta(days=1)
+        flush()
+    finally:
+        writer.close()
+    return FeatureMatrix(directory)
+
+
+class ConditionalLogit:
+    """条件 logit 胜出概率模型: 同场赛事内对线性得分做 softmax"""
+
+    def __init__(self, l2: float = 1e-3, learning_rate: float = 0.05, epochs: int = 5,
+                 races_per_chunk: int = 2000):
+        self.l2 = l2
+        self.learning_rate = learning_rate
+        self.epochs = epochs
+        self.races_per_chunk = races_per_chunk
+        self.weights: Optional[np.ndarray] = None
+        self.mean: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+        self.columns: List[str] = []
+
+    @staticmethod
+    def _race_softmax(scores: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        """同场赛事内 softmax (starts 为每场在块内的起始行)"""
+        scores = scores - np.repeat(np.maximum.reduceat(scores, starts), np.diff(np.append(starts, len(scores))))
+        expo = np.exp(scores)
+        totals = np.add.reduceat(expo, starts)
+        return expo / np.repeat(totals, np.diff(np.append(starts, len(scores))))
+
+    def _standardize(self, matrix: FeatureMatrix, ranges: List[Tuple[int, int]]):
+        """流式计算标准化参数"""
+        total = np.zeros(len(matrix.columns))
+        square = np.zeros(len(matrix.columns))
+        count = 0
+        for start, stop in ranges:
+            for X, _, _ in matrix.race_chunks(start, stop, self.races_per_chunk):
+                total += X.sum(axis=0)
+                square += (X ** 2).sum(axis=0)
+                count += len(X)
+        self.mean = total / max(count, 1)
+        variance = square / max(count, 1) - self.mean ** 2
+        self.scale = np.sqrt(np.maximum(variance, 1e-12))
+
+    def fit(self, matrix: FeatureMatrix, ranges: Optional[List[Tuple[int, int]]] = None) -> 'ConditionalLogit':
+        """以分块梯度下降 (Adam) 训练, ranges 为参与训练的赛事区间"""
+        ranges = ranges or [(0, matrix.n_races)]
+        self.columns = list(matrix.columns)
+        self._standardize(matrix, ranges)
+        w = np.zeros(len(self.columns))
+        m = np.zeros_like(w)
+        v = np.zeros_like(w)
+        step = 0
+        for epoch in range(self.epochs):
+            loss, races = 0.0, 0
+            for start, stop in ranges:
+                for X, y, starts in matrix.race_chunks(start, stop, self.races_per_chunk):
+                    X = (X - self.mean) / self.scale
+                    winners = np.add.reduceat(y, starts)
+                    valid = np.repeat(winners > 0, np.diff(np.append(starts, len(y))))
+                    if not valid.any():
+                        continue
+                    # 并列头马平均分配目标概率
+                    target = y / np.repeat(np.maximum(winners, 1), np.diff(np.append(starts, len(y))))
+                    prob = self._race_softmax(X @ w, starts)
+                    n_races = int((winners > 0).sum())
+                    grad = X[valid].T @ (prob[valid] - target[valid]) / n_races + self.l2 * w
+
+                    step += 1
+                    m = 0.9 * m + 0.1 * grad
+                    v = 0.999 * v + 0.001 * grad ** 2
+                    w -= self.learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+
+                    loss -= float(np.sum(target[valid] * np.log(np.maximum(prob[valid], 1e-12))))
+                    races += n_races
+            logger.info(f"第 {epoch + 1}/{self.epochs} 轮: 平均对数损失 {loss / max(races, 1):.4f}")
+        self.weights = w
+        return self
+
+    def predict(self, X: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        """预测同场各马的胜出概率"""
+        X = (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+        return self._race_softmax(X @ self.weights, starts)
+
+    def evaluate(self, matrix: FeatureMatrix, start: int, stop: int) -> Dict[str, float]:
+        """在赛事区间上评估: 对数损失及首选命中率"""
+        loss, hits, races = 0.0, 0.0, 0
+        for X, y, starts in matrix.race_chunks(start, stop, self.races_per_chunk):
+            prob = self.predict(X, starts)
+            sizes = np.diff(np.append(starts, len(y)))
+            winners = np.add.reduceat(y, starts)
+            for i, (a, size) in enumerate(zip(starts, sizes)):
+                if winners[i] == 0:
+                    continue
+                p, t = prob[a:a + size], y[a:a + size]
+                loss -= float(np.log(max(p[t > 0].sum(), 1e-12)))
+                # 并列最高概率时按随机选取的期望计算命中
+                top = p == p.max()
+                hits += float((t[top] > 0).mean())
+                races += 1
+        return {
+            'races': races,
+            'log_loss': round(loss / max(races, 1), 4),
+            'top_pick_accuracy': round(hits / max(races, 1) * 100, 2),
+        }
+
+    def save(self, path: str):
+        """保存模型参数"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, weights=self.weights, mean=self.mean, scale=self.scale,
+                 columns=np.array(self.columns))
+
+    @classmethod
+    def load(cls, path: str) -> 'ConditionalLogit':
+        """读取模型参数"""
+        model = cls()
+        with np.load(path) as data:
+            model.weights = data['weights']
+            model.mean = data['mean']
+            model.scale = data['scale']
+            model.columns = [str(c) for c in data['columns']]
+        return model
+
+
+def _fold_worker(directory: str, fold: int, folds: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    """子进程入口: 以内存映射打开同一份矩阵, 训练并评估一个折"""
+    matrix = FeatureMatrix(directory)
+    bounds = np.linspace(0, matrix.n_races, folds + 1).astype(int)
+    test = (int(bounds[fold]), int(bounds[fold + 1]))
+    train = [r for r in ((0, test[0]), (test[1], matrix.n_races)) if r[1] > r[0]]
+    model = ConditionalLogit(**params).fit(matrix, train)
+    return {'fold': fold, **model.evaluate(matrix, *test)}
+
+
+def cross_validate(directory: str, folds: int = 5, max_workers: Optional[int] = None,
+                   **params) -> List[Dict[str, Any]]:
+    """按赛事分组的 K 折交叉验证, 各折在独立进程中并行
+
+    同一场赛事的全部出赛马总在同一折; 子进程只接收矩阵目录, 以内存
+    映射读取, 不复制矩阵。
+    """
+    workers = max_workers or min(folds, os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_fold_worker, directory, k, folds, params) for k in range(folds)]
+        results = [future.result() for future in futures]
+    for result in results:
+        logger.info(
+            f"折 {result['fold'] + 1}/{folds}: {result['races']} 场, "
+            f"对数损失 {result['log_loss']}, 首选命中率 {result['top_pick_accuracy']}%"
+        )
+    return results
@@ -1,25 +1,94 @@
-import plotly.express as px
-import plotly.graph_objects as go
-from typing import Dict, List
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 预渲染的图表名称
+CHARTS = ('jockey_performance', 'odds_distribution')
 
 class RaceVisualizer:
-    def plot_jockey_performance(self, stats: Dict):
+    """在服务端聚合数据, 只输出已聚合的 Plotly 图表描述 (data + layout)"""
+
+    def plot_jockey_performance(self, stats, top_n: int = 30, min_races: int = 3) -> Dict[str, Any]:
         """繪製騎師表現圖表"""
-        fig = px.bar(
-            stats,
-            x='jockey',
-            y=['win_rate', 'place_rate'],
-            title='騎師勝率分析',
-            barmode='group'
-        )
-        return fig
+        df = pd.DataFrame(stats)
+        if df.empty:
+            return {'data': [], 'layout': {'title': '騎師勝率分析'}}
+        if 'jockey' not in df and 'name' in df:
+            df = df.rename(columns={'name': 'jockey'})
+        if 'place_rate' not in df and 'places' in df:
+            df['place_rate'] = df['places'] / df['total_races'] * 100
+        df = df[df['total_races'] >= min_races].nlargest(top_n, 'total_races')
+        df = df.sort_values('win_rate', ascending=False)
+
+        x = df['jockey'].astype(str).tolist()
+        data = [{
+            'type': 'bar', 'name': '勝率', 'x': x,
+            'y': df['win_rate'].round(2).tolist()
+        }]
+        if 'place_rate' in df:
+            data.append({
+                'type': 'bar', 'name': '上名率', 'x': x,
+                'y': df['place_rate'].round(2).tolist()
+            })
+        return {'data': data, 'layout': {'title': '騎師勝率分析', 'barmode': 'group'}}
         
-    def plot_odds_distribution(self, data: List[Dict]):
-        """繪製賠率分布圖"""
-        fig = px.histogram(
-            data,
-            x='odds',
-            nbins=50,
-            title='賠率分布'
-        )
-        return fig 
\ No newline at end of file
+    def plot_odds_distribution(self, odds, bins: int = 50, max_odds: float = 99.0) -> Dict[str, Any]:
+        """繪製賠率分布圖 (以 NumPy 分箱, 只輸出每箱計數)
+
+        賠率呈長尾分布, 以對數刻度分箱; 最後一箱為 max_odds 或以上 (標示為
+        "99+"), 各箱計數之和等於有賠率 (1 或以上) 的出賽數。
+        """
+        values = pd.to_numeric(pd.Series(odds), errors='coerce').to_numpy(dtype=np.float64)
+        values = values[values >= 1]
+        edges = np.geomspace(1.0, max_odds, bins)
+        # 溢出箱與前一箱等寬 (對數刻度)
+        edges = np.append(edges, max_odds * edges[-1] / edges[-2])
+        counts, edges = np.histogram(np.minimum(values, max_odds), bins=edges)
+        labels = [''] * (len(counts) - 1) + [f"{max_odds:g}+"]
+        return {
+            'data': [{
+                'type': 'bar',
+                'x': np.round(np.sqrt(edges[:-1] * edges[1:]), 2).tolist(),
+                'y': counts.tolist(),
+                'width': np.round(np.diff(edges), 3).tolist(),
+                'text': labels,
+                'textposition': 'outside',
+                'name': '出賽數'
+            }],
+            'layout': {
+                'title': '賠率分布',
+                'xaxis': {'type': 'log', 'title': '賠率'},
+                'yaxis': {'title': '出賽數'},
+                'bargap': 0
+            }
+        }
+
+    def render_charts(self, storage, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """在分析階段預先渲染全部圖表, 以當前數據版本保存"""
+        version = storage.get_data_version()
+        start_date = start_date or '0000-00-00'
+        end_date = end_date or '9999-12-31'
+
+        jockeys: List[Dict[str, Any]] = []
+        after = 0
+        while True:
+            page = storage.query_entity_stats('jockey', after, 500, start_date, end_date)
+            jockeys.extend(page)
+            if len(page) < 500:
+                break
+            after = page[-1]['id']
+
+        odds = storage.get_race_frame(start_date, end_date, columns=['odds'])['odds']
+        charts = {
+            'jockey_performance': self.plot_jockey_performance(jockeys),
+            'odds_distribution': self.plot_odds_distribution(odds),
+        }
+        for name, payload in charts.items():
+            storage.save_chart_payload(name, version, payload)
+        logger.info(f"已預渲染 {len(charts)} 個圖表 (數據版本 {version})")
+        return charts
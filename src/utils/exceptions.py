@@ -6,10 +6,18 @@ class NetworkError(RaceScraperError):
     """網絡相關異常"""
     pass
 
+class BrowserCrashedError(NetworkError):
+    """瀏覽器崩潰或斷開連接"""
+    pass
+
 class DataProcessError(RaceScraperError):
     """數據處理異常"""
     pass
 
 class ConfigError(RaceScraperError):
     """配置相關異常"""
-    pass 
\ No newline at end of file
+    pass 
+
+class SpoolBusyError(RaceScraperError):
+    """預寫日誌目錄正被其他進程使用"""
+    pass
@@ -1,40 +1,102 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
 from datetime import datetime
+from typing import Any, Dict, Optional
 
-def setup_logger():
-    """設置日誌系統"""
-    try:
-        # 創建logs目錄
-        log_dir = 'logs'
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-            
-        # 設置日誌文件名
-        log_file = os.path.join(
-            log_dir, 
-            f'racing_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'
-        )
-        
-        # 測試文件是否可寫
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write("Initializing log file...\n")
-        
-        # 配置日誌格式
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
-        
-        logger = logging.getLogger(__name__)
-        logger.info("Logger initialized successfully")
+DEFAULT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DEFAULT_FILE_PATH = 'logs/racing_{date}.log'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON; debug_event 的字段原样输出"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            payload.update(fields)
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def debug_event(logger: logging.Logger, event: str, **fields):
+    """热路径上的结构化调试事件: 未启用 DEBUG 时只做一次级别检查, 不格式化"""
+    if logger.isEnabledFor(logging.DEBUG):
+        text = ' '.join(f"{key}={value}" for key, value in fields.items())
+        logger.debug(f"{event} {text}" if text else event, extra={'fields': dict(fields, event=event)})
+
+
+def _make_formatter(fmt: str) -> logging.Formatter:
+    return JsonFormatter() if fmt == 'json' else logging.Formatter(fmt)
+
+
+def setup_logger(config: Optional[Dict[str, Any]] = None) -> logging.Logger:
+    """設置日誌系統 (可重複調用, 只設置一次)
+
+    各模塊的日誌經 QueueHandler 放入隊列, 格式化及文件寫入在 QueueListener
+    的後台線程完成, 不阻塞抓取。config 為配置中的 LOGGER 段:
+    LEVEL / FORMAT (或 "json") / FILE_PATH / CONSOLE / MODULES (各模塊級別)。
+    """
+    global _listener, _queue_handler
+    logger = logging.getLogger(__name__)
+    if _listener is not None:
         return logger
-        
-    except Exception as e:
-        print(f"Error setting up logger: {e}")
-        # 返回一個基本的控制台logger作為後備
-        return logging.getLogger(__name__) 
\ No newline at end of file
+
+    config = config or {}
+    formatter = _make_formatter(config.get('FORMAT', DEFAULT_FORMAT))
+    handlers = []
+    try:
+        file_path = config.get('FILE_PATH', DEFAULT_FILE_PATH)
+        if file_path:
+            log_file = file_path.format(date=datetime.now().strftime("%Y%m%d_%H%M%S"))
+            if os.path.dirname(log_file):
+                os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    except OSError as e:
+        print(f"Error setting up log file: {e}")
+    if config.get('CONSOLE', True):
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logger)
+
+    root = logging.getLogger()
+    # 移除先前 basicConfig 等加入的同步 handler
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(config.get('LEVEL', 'INFO'))
+    for name, level in (config.get('MODULES') or {}).items():
+        logging.getLogger(name).setLevel(level)
+
+    logger.info("Logger initialized successfully")
+    return logger
+
+
+def shutdown_logger():
+    """停止後台線程並寫出隊列中剩餘的日誌"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener, _queue_handler = None, None
@@ -0,0 +1,326 @@
+import asyncio
+import functools
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 默认耗时分桶 (秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _NullTimer:
+    """停用时的计时器: 不读时钟, 不加锁"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: 'Histogram', labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram._observe(self.labels, time.perf_counter() - self.started)
+        return False
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def _label_text(self, key: Tuple[str, ...], extra: str = '') -> str:
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key)]
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{self._label_text(k)} {_number(v)}" for k, v in sorted(self._values.items())]
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            ','.join(k) or 'total': {'value': v, 'per_second': round(v / elapsed, 3) if elapsed else None}
+            for k, v in sorted(self._values.items())
+        }
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            current = self._values.get(key, (0, 0))
+            self._values[key] = (value, max(current[1], value))
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            value, peak = self._values.get(key, (0, 0))
+            value += amount
+            self._values[key] = (value, max(peak, value))
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{self._label_text(k)} {_number(v[0])}" for k, v in sorted(self._values.items())]
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        return {','.join(k) or 'total': {'value': v[0], 'max': v[1]} for k, v in sorted(self._values.items())}
+
+
+class Histogram(_Metric):
+    """固定分桶直方图; 分位数按桶内线性插值估算"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, label_names, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        self._observe(self._key(labels), value)
+
+    def time(self, **labels):
+        """计时上下文: with histogram.time(stage='navigate'): ..."""
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, self._key(labels))
+
+    def timed(self, **labels):
+        """计时装饰器, 同步及协程函数均可; 停用时直接调用原函数"""
+        key = self._key(labels)
+
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.registry.enabled:
+                        return await func(*args, **kwargs)
+                    with _Timer(self, key):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.registry.enabled:
+                    return func(*args, **kwargs)
+                with _Timer(self, key):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _observe(self, key: Tuple[str, ...], value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各桶计数 (末位为 +Inf), 总和, 个数, 最大值]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+            state[3] = max(state[3], value)
+
+    def quantile(self, key: Tuple[str, ...], q: float) -> Optional[float]:
+        state = self._values.get(key)
+        if not state or not state[2]:
+            return None
+        rank = q * state[2]
+        cumulative, lower = 0, 0.0
+        for i, count in enumerate(state[0]):
+            upper = self.buckets[i] if i < len(self.buckets) else state[3]
+            if count and cumulative + count >= rank:
+                return min(lower + (upper - lower) * (rank - cumulative) / count, state[3])
+            cumulative += count
+            lower = upper
+        return state[3]
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count, _) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {count}")
+        return lines
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        result = {}
+        for key, (_, total, count, peak) in sorted(self._values.items()):
+            result[','.join(key) or 'total'] = {
+                'count': count,
+                'sum': round(total, 4),
+                'mean': round(total / count, 4) if count else None,
+                'p50': _round(self.quantile(key, 0.5)),
+                'p90': _round(self.quantile(key, 0.9)),
+                'p99': _round(self.quantile(key, 0.99)),
+                'max': round(peak, 4),
+            }
+        return result
+
+
+class MetricsRegistry:
+    """进程内的指标登记处
+
+    指标在模块载入时登记; 停用时 (默认) 各记录方法只检查一个布尔值即返回,
+    计时上下文亦不读时钟。
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.time()
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, help_text: str, labels: Iterable[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, help_text, tuple(labels), **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已登记为 {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help_text, labels, buckets=buckets)
+
+    def configure(self, config: Optional[Dict[str, Any]]):
+        """按配置中的 METRICS 段启用"""
+        self.enabled = bool((config or {}).get('ENABLED'))
+        if self.enabled:
+            self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式 (0.0.4)"""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            with metric._lock:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> Dict[str, Any]:
+        """JSON 摘要: 计数器附每秒速率, 直方图附估算分位数"""
+        elapsed = time.time() - self.started
+        metrics = {}
+        for name, metric in sorted(self._metrics.items()):
+            with metric._lock:
+                values = metric.summary(elapsed)
+            if values:
+                metrics[name] = values
+        return {'enabled': self.enabled, 'elapsed_seconds': round(elapsed, 3), 'metrics': metrics}
+
+    def write_summary(self, path: str, extra: Optional[Dict[str, Any]] = None):
+        payload = self.summary()
+        if extra:
+            payload.update(extra)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2, default=str)
+        logger.info(f"指标摘要已写入 {path}")
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 4) if value is not None else None
+
+
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+async def start_metrics_server(host: str, port: int, registry: MetricsRegistry = REGISTRY):
+    """在当前事件循环中提供 /metrics 及 /metrics.json (供长时间的回填抓取)"""
+    from aiohttp import web
+
+    async def prometheus(request):
+        return web.Response(text=registry.render_prometheus(), headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+
+    async def summary(request):
+        return web.json_response(registry.summary())
+
+    app = web.Application()
+    app.router.add_get('/metrics', prometheus)
+    app.router.add_get('/metrics.json', summary)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"指标端点: http://{host}:{port}/metrics")
+    return runner
@@ -1,27 +1,394 @@
-from flask import Flask, render_template
-from src.services.analyzer import RaceAnalyzer
-from src.services.visualizer import RaceVisualizer
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import yaml
+from aiohttp import web
+
 from src.services.storage import DataStorage
+from src.services import exporter
+from src.services.live import DeltaBroadcaster
+from src.services.visualizer import CHARTS
+from src.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+
+class ResponseCache:
+    """按 (路径, 查询参数, 数据版本) 缓存已序列化及已压缩的响应"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+
+    def get(self, key: str, version: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get((key, version))
+        if entry is not None:
+            self._entries.move_to_end((key, version))
+        return entry
+
+    def put(self, key: str, version: int, payload: Any) -> Dict[str, Any]:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        entry = {
+            'body': body,
+            'gzip': gzip.compress(body, compresslevel=6),
+            'etag': f'"{version}-{hashlib.sha1(body).hexdigest()[:16]}"',
+        }
+        self._entries[(key, version)] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+
+class DataVersionTracker:
+    """数据版本号, 在短时间内复用, 避免每个请求都访问数据库"""
+
+    def __init__(self, storage: DataStorage, ttl: float = 1.0):
+        self.storage = storage
+        self.ttl = ttl
+        self._version = 0
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def current(self) -> int:
+        if time.monotonic() - self._checked_at < self.ttl:
+            return self._version
+        async with self._lock:
+            if time.monotonic() - self._checked_at >= self.ttl:
+                self._version = await asyncio.to_thread(self.storage.get_data_version)
+                self._checked_at = time.monotonic()
+        return self._version
+
+    def invalidate(self):
+        """数据已变更, 下一个请求重新读取版本号"""
+        self._checked_at = 0.0
+
+
+def _int_param(request: web.Request, name: str, default: int, maximum: Optional[int] = None,
+               minimum: int = 0) -> int:
+    try:
+        value = int(request.query.get(name, default))
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"参数 {name} 必须是整数")
+    if value < minimum:
+        raise web.HTTPBadRequest(text=f"参数 {name} 不能小于 {minimum}")
+    return min(value, maximum) if maximum else value
+
+
+async def cached_json(request: web.Request, compute: Callable[[], Awaitable[Any]]) -> web.Response:
+    """带 ETag / If-None-Match 及 gzip 的 JSON 响应
+
+    同一数据版本内, 相同的请求只计算一次; 客户端已持有最新版本时直接
+    返回 304。
+    """
+    app = request.app
+    version = await app['versions'].current()
+    key = request.path_qs
+    entry = app['cache'].get(key, version)
+    if entry is None:
+        entry = app['cache'].put(key, version, await compute())
+
+    headers = {
+        'ETag': entry['etag'],
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+    }
+    if request.headers.get('If-None-Match') == entry['etag']:
+        return web.Response(status=304, headers=headers)
+
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        headers['Content-Encoding'] = 'gzip'
+        return web.Response(body=entry['gzip'], content_type='application/json', charset='utf-8',
+                            headers=headers)
+    return web.Response(body=entry['body'], content_type='application/json', charset='utf-8',
+                        headers=headers)
+
+
+def _page(items: list, limit: int, cursor: Callable[[Dict[str, Any]], str]) -> Dict[str, Any]:
+    """分页响应, next 为下一页的 keyset 游标"""
+    return {
+        'items': items,
+        'next': cursor(items[-1]) if items and len(items) == limit else None,
+    }
+
+
+def _entity_handler(entity: str):
+    async def handler(request: web.Request) -> web.Response:
+        app = request.app
+        limit = _int_param(request, 'limit', app['page_size'], app['max_page_size'], minimum=1)
+        after = _int_param(request, 'after', 0)
+        start_date = request.query.get('start_date')
+        end_date = request.query.get('end_date')
+
+        async def compute():
+            items = await asyncio.to_thread(
+                app['storage'].query_entity_stats, entity, after, limit, start_date, end_date
+            )
+            return _page(items, limit, lambda item: str(item['id']))
+
+        return await cached_json(request, compute)
+    return handler
+
+
+async def horse_runs(request: web.Request) -> web.Response:
+    app = request.app
+    horse_id = int(request.match_info['horse_id'])
+    limit = _int_param(request, 'limit', app['page_size'], app['max_page_size'], minimum=1)
+    after = request.query.get('after', '')
+
+    async def compute():
+        items = await asyncio.to_thread(app['storage'].query_horse_runs, horse_id, after, limit)
+        return _page(items, limit, lambda item: item['race_date'])
+
+    return await cached_json(request, compute)
+
+
+async def races(request: web.Request) -> web.Response:
+    app = request.app
+    limit = _int_param(request, 'limit', app['page_size'], app['max_page_size'], minimum=1)
+    after = request.query.get('after')
+    cursor = None
+    if after:
+        try:
+            race_date, race_number = after.split(':')
+            cursor = (race_date, int(race_number))
+        except ValueError:
+            raise web.HTTPBadRequest(text="参数 after 格式应为 YYYY-MM-DD:场次编号")
+
+    async def compute():
+        items = await asyncio.to_thread(app['storage'].query_races, cursor, limit)
+        return _page(items, limit, lambda item: f"{item['race_date']}:{item['race_number']}")
+
+    return await cached_json(request, compute)
+
+
+async def race_runners(request: web.Request) -> web.Response:
+    app = request.app
+    race_date = request.match_info['race_date']
+    race_number = int(request.match_info['race_number'])
+
+    async def compute():
+        runners = await asyncio.to_thread(app['storage'].query_race_runners, race_date, race_number)
+        if not runners:
+            raise web.HTTPNotFound(text="找不到该场赛事")
+        await asyncio.to_thread(_add_speed_figures, app['storage'], runners)
+        return {'race_date': race_date, 'race_number': race_number, 'runners': runners}
+
+    return await cached_json(request, compute)
 
-app = Flask(__name__)
-storage = DataStorage()
-analyzer = RaceAnalyzer()
-visualizer = RaceVisualizer()
-
-@app.route('/')
-def index():
-    # 獲取最新分析結果
-    stats = storage.get_jockey_stats()
-    
-    # 生成圖表
-    performance_chart = visualizer.plot_jockey_performance(stats)
-    
-    return render_template(
-        'index.html',
-        performance_chart=performance_chart,
-        stats=stats
-    )
 
-@app.route('/analysis')
-def analysis():
-    return render_template('analysis.html') 
\ No newline at end of file
+def _add_speed_figures(storage: DataStorage, runners: list):
+    """按已入库的标准时间表 (分析时更新) 为每匹马加上速度指数, 尚无标准时间时为 None"""
+    import pandas as pd
+    from src.services.speed_figures import load_par_times, speed_figures
+
+    pars = load_par_times(storage)
+    figures = speed_figures(pd.DataFrame(runners), pars)['speed_figure'] if pars else [None] * len(runners)
+    for runner, figure in zip(runners, figures):
+        runner['speed_figure'] = None if figure is None or pd.isna(figure) else float(figure)
+
+
+async def par_times(request: web.Request) -> web.Response:
+    """标准时间表 (距离 × 马场 × 场地)"""
+    app = request.app
+
+    async def compute():
+        from src.services.speed_figures import load_par_times, par_table
+
+        return {'items': par_table(await asyncio.to_thread(load_par_times, app['storage']))}
+
+    return await cached_json(request, compute)
+
+
+async def chart(request: web.Request) -> web.Response:
+    """预渲染的图表 (分析阶段生成, 这里只读取已聚合的小型载荷)"""
+    app = request.app
+    name = request.match_info['name']
+    if name not in CHARTS:
+        raise web.HTTPNotFound(text="未知的图表")
+
+    async def compute():
+        version = await app['versions'].current()
+        payload = await asyncio.to_thread(app['storage'].get_chart_payload, name, version)
+        if payload is None:
+            raise web.HTTPNotFound(text="图表尚未生成, 请先运行分析")
+        return payload
+
+    return await cached_json(request, compute)
+
+
+async def export(request: web.Request) -> web.StreamResponse:
+    """分块流式导出, 第一个分块编码完成即开始输出"""
+    table = request.match_info['table']
+    if table not in DataStorage.EXPORT_TABLES:
+        raise web.HTTPNotFound(text="不支持导出的表")
+    fmt = request.query.get('format', 'csv')
+    compression = request.query.get('compression', 'none')
+    if fmt not in exporter.FORMATS:
+        raise web.HTTPBadRequest(text=f"format 只支持 {', '.join(exporter.FORMATS)}")
+    filters = {
+        name: request.query[name]
+        for name in ('start_date', 'end_date', 'racecourse', 'jockey', 'trainer', 'horse',
+                     'jockey_id', 'trainer_id', 'horse_id')
+        if request.query.get(name)
+    }
+
+    try:
+        stream = exporter.export_stream(request.app['storage'], table, fmt, compression, **filters)
+        # 先取第一个分块, 参数错误可在响应开始前返回 400
+        first = await asyncio.to_thread(next, stream, b'')
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+
+    response = web.StreamResponse(headers={
+        'Content-Type': exporter.CONTENT_TYPES[fmt],
+        'Content-Disposition': f'attachment; filename="{table}{exporter.file_extension(fmt, compression)}"',
+    })
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    data = first
+    while data:
+        await response.write(data)
+        # 数据库读取及编码在线程中进行, 不阻塞事件循环
+        data = await asyncio.to_thread(next, stream, b'')
+    await response.write_eof()
+    return response
+
+
+async def live_stream(request: web.Request) -> web.StreamResponse:
+    """实时赛果变更 (Server-Sent Events), 支持 Last-Event-ID 断线续传"""
+    app = request.app
+    broadcaster = app['broadcaster']
+    try:
+        last_event_id = int(request.headers['Last-Event-ID']) if 'Last-Event-ID' in request.headers else None
+    except ValueError:
+        last_event_id = None
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    await response.prepare(request)
+    queue = broadcaster.subscribe(last_event_id)
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=app['heartbeat'])
+            except asyncio.TimeoutError:
+                # 心跳, 防止代理关闭空闲连接
+                await response.write(b': heartbeat\n\n')
+                continue
+            await response.write(broadcaster.encode_sse(event))
+            broadcaster.record_delivery(event)
+    except ConnectionResetError:
+        pass
+    finally:
+        broadcaster.unsubscribe(queue)
+    return response
+
+
+async def live_ws(request: web.Request) -> web.WebSocketResponse:
+    """实时赛果变更 (WebSocket)"""
+    broadcaster = request.app['broadcaster']
+    ws = web.WebSocketResponse(heartbeat=request.app['heartbeat'])
+    await ws.prepare(request)
+    queue = broadcaster.subscribe()
+
+    async def forward():
+        while True:
+            event = await queue.get()
+            await ws.send_str(json.dumps(event, ensure_ascii=False, default=str))
+            broadcaster.record_delivery(event)
+
+    sender = asyncio.create_task(forward())
+    try:
+        # 客户端消息不处理, 循环结束即连接已关闭
+        async for _ in ws:
+            pass
+    finally:
+        sender.cancel()
+        broadcaster.unsubscribe(queue)
+    return ws
+
+
+async def live_latency(request: web.Request) -> web.Response:
+    """实时模式各阶段延迟 (页面更新 -> 发现 -> 入库 -> 推送)"""
+    return web.json_response(request.app['broadcaster'].latency_report())
+
+
+async def metrics_text(request: web.Request) -> web.Response:
+    """Prometheus 文本格式的指标"""
+    return web.Response(text=metrics.REGISTRY.render_prometheus(),
+                        headers={'Content-Type': metrics.PROMETHEUS_CONTENT_TYPE})
+
+
+async def metrics_summary(request: web.Request) -> web.Response:
+    return web.json_response(metrics.REGISTRY.summary())
+
+
+async def index(request: web.Request) -> web.FileResponse:
+    return web.FileResponse(os.path.join(TEMPLATE_DIR, 'index.html'))
+
+
+async def _close_storage(app: web.Application):
+    app['storage'].close()
+
+
+def create_app(config: Dict[str, Any]) -> web.Application:
+    """创建 HTTP 服务 (数据库连接在此创建, 不在导入时)"""
+    web_config = config.get('WEB', {})
+    app = web.Application()
+    metrics.REGISTRY.configure(config.get('METRICS'))
+    app['storage'] = DataStorage(config['DATABASE'])
+    app['versions'] = DataVersionTracker(app['storage'], web_config.get('VERSION_TTL', 1.0))
+    app['cache'] = ResponseCache(web_config.get('CACHE_ENTRIES', 1024))
+    app['page_size'] = web_config.get('PAGE_SIZE', 50)
+    app['max_page_size'] = web_config.get('MAX_PAGE_SIZE', 500)
+    app['heartbeat'] = web_config.get('HEARTBEAT', 15.0)
+    app['broadcaster'] = DeltaBroadcaster(web_config.get('LIVE_QUEUE_SIZE', 100))
+    # 实时写入的赛果立即对查询可见
+    app['broadcaster'].add_listener(lambda event: app['versions'].invalidate())
+    app.on_cleanup.append(_close_storage)
+
+    app.router.add_get('/', index)
+    app.router.add_get('/api/jockeys', _entity_handler('jockey'))
+    app.router.add_get('/api/trainers', _entity_handler('trainer'))
+    app.router.add_get('/api/horses', _entity_handler('horse'))
+    app.router.add_get('/api/horses/{horse_id:\\d+}/runs', horse_runs)
+    app.router.add_get('/api/races', races)
+    app.router.add_get('/api/races/{race_date}/{race_number:\\d+}', race_runners)
+    app.router.add_get('/api/par-times', par_times)
+    app.router.add_get('/api/charts/{name}', chart)
+    app.router.add_get('/api/export/{table}', export)
+    app.router.add_get('/api/live/stream', live_stream)
+    app.router.add_get('/api/live/ws', live_ws)
+    app.router.add_get('/api/live/latency', live_latency)
+    app.router.add_get('/metrics', metrics_text)
+    app.router.add_get('/api/metrics', metrics_summary)
+    return app
+
+
+def load_config():
+    """加载配置文件"""
+    with open('config/settings.yaml', 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    config = load_config()
+    web_config = config.get('WEB', {})
+    web.run_app(
+        create_app(config),
+        host=web_config.get('HOST', '127.0.0.1'),
+        port=web_config.get('PORT', 8080)
+    )
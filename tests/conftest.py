@@ -0,0 +1,42 @@
+from typing import Any, Dict, List
+
+import pytest
+
+from src.services.storage import DataStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """临时 SQLite 数据库"""
+    storage = DataStorage({'TYPE': 'sqlite', 'PATH': str(tmp_path / 'racing.db')})
+    yield storage
+    storage.close()
+
+
+def make_race(race_date: str = '2024-01-07', race_id: str = '1', runners: int = 4,
+              racecourse: str = 'ST') -> List[Dict[str, Any]]:
+    """一场赛事的出赛记录 (与 parse_results_page 的输出格式相同)"""
+    return [{
+        'race_id': race_id,
+        'race_date': race_date,
+        'horse_no': f"A{100 + i:03d}",
+        'horse_name': f"測試馬{i:02d}",
+        'draw': i + 1,
+        'finish_position': i + 1,
+        'jockey': f"騎師{i % 3:02d}",
+        'trainer': f"練馬師{i % 2:02d}",
+        'finish_time': f"1:{9 + i * 0.2:05.2f}",
+        'odds': 2.5 + i,
+        'distance': 1200,
+        'racecourse': racecourse,
+        'race_class': '4',
+        'going': '好地',
+    } for i in range(runners)]
+
+
+@pytest.fixture(scope='session')
+def synthetic_results() -> List[Dict[str, Any]]:
+    """两个月的合成赛果 (同一种子, 结果固定)"""
+    from benchmarks.synthetic import SyntheticMeetingGenerator
+
+    return list(SyntheticMeetingGenerator(seed=7).records('2023-09-01', '2023-10-31'))
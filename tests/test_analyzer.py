@@ -0,0 +1,103 @@
+import pandas as pd
+import pytest
+
+from src.services.analyzer import RaceAnalyzer
+from src.services.partitioned import PartitionedExecutor
+
+
+@pytest.fixture(scope='module')
+def expected(synthetic_results):
+    return RaceAnalyzer().analyze_yearly_stats(synthetic_results)
+
+
+def _by_jockey(records):
+    return pd.DataFrame(records).sort_values('jockey').reset_index(drop=True)
+
+
+def assert_same_stats(result, expected):
+    """与 analyze_yearly_stats 的结果逐项比较"""
+    assert result['summary'] == pytest.approx(expected['summary'])
+    pd.testing.assert_frame_equal(_by_jockey(result['jockey_stats']), _by_jockey(expected['jockey_stats']),
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(_by_jockey(result['odds_analysis']['jockey_odds']),
+                                  _by_jockey(expected['odds_analysis']['jockey_odds']), check_dtype=False)
+    for section in ('overall', 'winners'):
+        assert result['odds_analysis'][section] == pytest.approx(expected['odds_analysis'][section])
+    assert [r['odds'] for r in result['odds_analysis']['upset_wins']] == \
+        [r['odds'] for r in expected['odds_analysis']['upset_wins']]
+    assert [r['win_rate'] for r in result['top_jockeys']] == [r['win_rate'] for r in expected['top_jockeys']]
+
+
+@pytest.mark.parametrize('partition_by', ['season', 'month'])
+def test_partitioned_matches_yearly_stats(synthetic_results, expected, partition_by):
+    frame = pd.DataFrame(synthetic_results)
+    result = RaceAnalyzer().analyze_partitioned(frame, partition_by, max_workers=1)
+    assert_same_stats(result, expected)
+    assert sum(p['total_races'] for p in result['partitions']) == len(frame)
+
+
+def test_partitioned_pool_matches_yearly_stats(synthetic_results, expected):
+    # 不设最少记录数, 强制走共享内存进程池
+    result = PartitionedExecutor('month', max_workers=2, min_rows_for_pool=0).run(pd.DataFrame(synthetic_results))
+    assert [p['partition'] for p in result['partitions']] == ['2023-09', '2023-10']
+    assert_same_stats(result, expected)
+
+
+@pytest.mark.parametrize('chunk_size', [1000, 4000, 10 ** 6])
+def test_chunked_matches_yearly_stats(synthetic_results, expected, chunk_size):
+    frame = pd.DataFrame(synthetic_results)
+    chunks = (frame.iloc[i:i + chunk_size] for i in range(0, len(frame), chunk_size))
+    assert_same_stats(RaceAnalyzer().analyze_yearly_stats_chunked(chunks), expected)
+
+
+def test_merged_accumulators_match_yearly_stats(synthetic_results, expected):
+    from src.services.chunked_stats import YearlyStatsAccumulator
+
+    frame = pd.DataFrame(synthetic_results)
+    half = len(frame) // 2
+    merged = YearlyStatsAccumulator().add(frame.iloc[:half]).merge(YearlyStatsAccumulator().add(frame.iloc[half:]))
+    assert_same_stats(merged.finalize(), expected)
+
+
+def test_quantile_sketch_relative_error():
+    import numpy as np
+
+    from src.services.chunked_stats import QuantileSketch
+
+    values = np.random.default_rng(5).lognormal(2, 1, 20000)
+    sketch = QuantileSketch(0.01)
+    for part in np.array_split(values, 7):
+        sketch.add(part)
+    for q in (0.1, 0.5, 0.75, 0.99):
+        assert sketch.quantile(q) == pytest.approx(np.quantile(values, q), rel=0.011)
+
+
+class _Registry:
+    """只提供 name_of 的维度表替身: 代理键 -> 名称"""
+
+    def __init__(self, names):
+        self.names = dict(enumerate(names))
+        self.lookups = 0
+
+    def name_of(self, entity, entity_id):
+        self.lookups += 1
+        return self.names.get(entity_id, '')
+
+
+@pytest.fixture(scope='module')
+def keyed_frame(synthetic_results):
+    """带代理键的记录 (与 get_race_frame 相同), jockey 列为空以确认名称来自维度表"""
+    frame = pd.DataFrame(synthetic_results)
+    codes, names = pd.factorize(frame['jockey'])
+    return frame.assign(jockey_id=codes, jockey=None), _Registry(list(names))
+
+
+def test_jockey_id_grouping_matches_names(keyed_frame, expected):
+    frame, registry = keyed_frame
+    analyzer = RaceAnalyzer(dimensions=registry)
+    assert_same_stats(analyzer.analyze_yearly_stats(frame.to_dict('records')), expected)
+    assert_same_stats(analyzer.analyze_partitioned(frame, 'month', max_workers=1), expected)
+    chunks = (frame.iloc[i:i + 1500] for i in range(0, len(frame), 1500))
+    assert_same_stats(analyzer.analyze_yearly_stats_chunked(chunks), expected)
+    # 名称只为出现过的骑师查找, 不按记录查找
+    assert registry.lookups < len(frame) / 10
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.services.backtester import Backtester, strategy_grid
+
+# 三场赛事 (日期, 场次, 名次, 赔率, 骑师, 练马师, 胜出概率); 退出马匹没有赔率
+HISTORY = pd.DataFrame([
+    ('2024-01-03', '1', 1, 10.0, 3, 1, 0.05),
+    ('2024-01-03', '1', 2, 2.5, 1, 1, 0.30),
+    ('2024-01-03', '1', 3, 4.5, 2, 2, 0.20),
+    ('2024-01-01', '1', 1, 2.0, 1, 1, 0.60),
+    ('2024-01-01', '1', 2, 4.0, 2, 2, 0.20),
+    ('2024-01-01', '1', 3, 6.0, 3, 1, 0.10),
+    ('2024-01-01', '1', 99, None, 2, 2, 0.00),
+    ('2024-01-02', '1', 1, 5.0, 2, 1, 0.20),
+    ('2024-01-02', '1', 2, 3.0, 1, 2, 0.50),
+    ('2024-01-02', '1', 3, 8.0, 3, 2, 0.10),
+], columns=['race_date', 'race_id', 'finish_position', 'odds', 'jockey_id', 'trainer_id', 'win_prob'])
+
+
+def _metrics(row):
+    return {k: row[k] for k in ('bets', 'wins', 'staked', 'profit', 'max_drawdown', 'roi', 'hit_rate')}
+
+
+def test_favourite_flat_stakes():
+    # 热门: 2.0 胜 (+1), 3.0 负 (-1), 2.5 负 (-1); 资金 1 -> 0 -> -1, 回撤 2
+    result = Backtester(HISTORY).run(strategy_grid(max_favourite_rank=[1]))
+    assert _metrics(result.iloc[0]) == pytest.approx({
+        'bets': 3, 'wins': 1, 'staked': 3, 'profit': -1, 'max_drawdown': 2, 'roi': -33.33, 'hit_rate': 33.33,
+    })
+
+
+def test_odds_band_drawdown_by_race():
+    # 赔率 4-6: 首场 4.0 / 6.0 皆负 (-2), 次场 5.0 胜 (+4), 末场 4.5 负 (-1)
+    # 资金按场 -2 -> 2 -> 1: 起步即回撤 2, 高位 2 之后回撤 1
+    result = Backtester(HISTORY).run(strategy_grid(odds_min=[4], odds_max=[6]))
+    assert _metrics(result.iloc[0]) == pytest.approx({
+        'bets': 4, 'wins': 1, 'staked': 4, 'profit': 1, 'max_drawdown': 2, 'roi': 25, 'hit_rate': 25,
+    })
+
+
+def test_kelly_stakes_scale_with_fraction():
+    # 热门的凯利比例: 0.2 / 0.25 / 0 (末场 2.5 倍 30% 没有优势, 不下注)
+    grid = strategy_grid(max_favourite_rank=[1], kelly_fraction=[0.5, 1.0])
+    result = Backtester(HISTORY).run(grid)
+    half, full = result.iloc[0], result.iloc[1]
+    assert _metrics(half) == pytest.approx({
+        'bets': 2, 'wins': 1, 'staked': 0.225, 'profit': -0.025, 'max_drawdown': 0.125,
+        'roi': -11.11, 'hit_rate': 50,
+    }, abs=1e-6)
+    assert full['staked'] == pytest.approx(2 * half['staked'])
+    assert full['max_drawdown'] == pytest.approx(2 * half['max_drawdown'])
+    assert full['roi'] == half['roi']
+
+
+def test_jockey_and_trainer_filters():
+    grid = strategy_grid(jockey_id=[2, 7], trainer_id=[-1, 1])
+    result = Backtester(HISTORY).run(grid).set_index(['jockey_id', 'trainer_id'])
+    # 骑师 2: 4.0 负, 5.0 胜, 4.5 负 (退出马匹不计)
+    assert result.loc[(2, -1), ['bets', 'wins', 'profit']].tolist() == [3, 1, 2]
+    assert result.loc[(2, 1), ['bets', 'wins', 'profit']].tolist() == [1, 1, 4]
+    assert result.loc[(7, -1), ['bets', 'roi', 'hit_rate', 'max_drawdown']].tolist() == [0, 0, 0, 0]
+
+
+def test_matches_per_strategy_loop():
+    rng = np.random.default_rng(3)
+    races, field = 60, 8
+    history = pd.DataFrame({
+        'race_date': np.repeat(pd.date_range('2024-01-01', periods=races).astype(str), field),
+        'race_id': '1',
+        'finish_position': np.tile(np.arange(1, field + 1), races),
+        'odds': np.round(rng.uniform(1.5, 30, races * field), 1),
+        'jockey_id': rng.integers(0, 5, races * field),
+        'trainer_id': rng.integers(0, 4, races * field),
+    })
+    grid = strategy_grid(odds_min=[1, 3], odds_max=[10, 99], max_favourite_rank=[0, 2], jockey_id=[-1, 1])
+    result = Backtester(history).run(grid)
+
+    history['rank'] = history.groupby('race_date')['odds'].rank(method='first')
+    for strategy, row in zip(grid.itertuples(), result.itertuples()):
+        bets = history[(history['odds'] >= strategy.odds_min) & (history['odds'] <= strategy.odds_max)
+                       & ((strategy.max_favourite_rank <= 0) | (history['rank'] <= strategy.max_favourite_rank))
+                       & ((strategy.jockey_id < 0) | (history['jockey_id'] == strategy.jockey_id))]
+        profit = np.where(bets['finish_position'] == 1, bets['odds'] - 1, -1)
+        equity = pd.Series(profit).groupby(bets['race_date'].to_numpy()).sum().cumsum()
+        peak = np.maximum.accumulate(np.maximum(equity.to_numpy(), 0))
+        assert row.bets == len(bets)
+        assert row.profit == pytest.approx(profit.sum(), abs=1e-4)
+        assert row.max_drawdown == pytest.approx((peak - equity.to_numpy()).max() if len(bets) else 0, abs=1e-4)
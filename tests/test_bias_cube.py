@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+from src.services.bias_cube import BiasCube
+
+
+def _expected(frame: pd.DataFrame):
+    finished = frame[frame['finish_position'] < 99]
+    return {
+        'starts': len(frame),
+        'wins': int((frame['finish_position'] == 1).sum()),
+        'places': int((frame['finish_position'] <= 3).sum()),
+        'avg_position': round(finished['finish_position'].mean(), 2) if len(finished) else 0.0,
+    }
+
+
+def _measures(result):
+    return {k: result[k] for k in ('starts', 'wins', 'places', 'avg_position')}
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'racecourse': 'HV'},
+    {'racecourse': 'ST', 'distance': 1200},
+    {'racecourse': 'ST', 'draw': 1, 'race_class': '4'},
+    {'going': ['好地', '黏地'], 'draw': [1, 2, 3]},
+])
+def test_query_matches_brute_force(synthetic_results, filters):
+    cube = BiasCube.build(synthetic_results)
+    frame = pd.DataFrame(synthetic_results)
+    mask = pd.Series(True, index=frame.index)
+    for dim, value in filters.items():
+        values = value if isinstance(value, list) else [value]
+        mask &= frame[dim].astype(str).isin([str(v) for v in values])
+    assert _measures(cube.query(**filters)) == _expected(frame[mask])
+
+
+def test_breakdown_covers_every_draw(synthetic_results):
+    cube = BiasCube.build(synthetic_results)
+    rows = cube.breakdown('draw', racecourse='HV')
+    hv = [r for r in synthetic_results if r['racecourse'] == 'HV']
+    assert sum(r['starts'] for r in rows) == len(hv)
+
+
+def test_save_load_round_trip(synthetic_results, tmp_path):
+    path = str(tmp_path / 'cube.npz')
+    half = len(synthetic_results) // 2
+    # 按赛马日切开, 以免同一场次分在两批
+    split = next(i for i in range(half, len(synthetic_results))
+                 if synthetic_results[i]['race_date'] != synthetic_results[half]['race_date'])
+    cube = BiasCube.build(synthetic_results[:split], path)
+
+    loaded = BiasCube.load(path)
+    assert loaded.races.keys() == cube.races.keys()
+    assert loaded.query(racecourse='ST', draw=2) == cube.query(racecourse='ST', draw=2)
+    # 加载后继续增量写入, 与一次性构建相同; 重复写入不计
+    assert loaded.add_results(synthetic_results[split:]) > 0
+    assert loaded.add_results(synthetic_results) == 0
+    full = BiasCube.build(synthetic_results)
+    for filters in ({}, {'racecourse': 'HV', 'distance': 1650}, {'draw': 12}):
+        assert loaded.query(**filters) == full.query(**filters)
+
+
+def test_amendment_replaces_contribution(synthetic_results):
+    race = [r for r in synthetic_results if r['race_id'] == synthetic_results[0]['race_id']]
+    cube = BiasCube.build(race)
+    amended = [dict(r, finish_position=99 if r['finish_position'] == 1 else r['finish_position']) for r in race]
+    assert cube.add_results(amended) == 1
+    assert _measures(cube.query()) == _expected(pd.DataFrame(amended))
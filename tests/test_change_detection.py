@@ -0,0 +1,56 @@
+from src.models.database import RaceResult
+
+from tests.conftest import make_race
+
+
+def _horses(storage, race_date='2024-01-07'):
+    session = storage.Session()
+    try:
+        return sorted(name for (name,) in session.query(RaceResult.horse_name)
+                      .filter(RaceResult.race_date == race_date))
+    finally:
+        session.close()
+
+
+def test_unchanged_race_is_skipped(storage):
+    rows = make_race() + make_race(race_id='2')
+    events = storage.save_changed_races(rows)
+    assert [(e['type'], e['race_number']) for e in events] == [('race_result', 1), ('race_result', 2)]
+    version = storage.get_data_version()
+
+    # 内容相同 (顺序不同) 不写入, 版本号不变
+    assert storage.save_changed_races(list(reversed(rows))) == []
+    assert storage.get_data_version() == version
+    assert storage.count_race_results('2024-01-07') == 8
+
+
+def test_amendment_replaces_stale_runners(storage):
+    storage.save_changed_races(make_race() + make_race(race_id='2'))
+    version = storage.get_data_version()
+
+    amended = make_race()
+    amended[0]['horse_name'] = '更正馬'
+    amended[1]['finish_position'], amended[2]['finish_position'] = 3, 2
+    [event] = storage.save_changed_races(amended + make_race(race_id='2'))
+    assert event['type'] == 'race_amended' and event['race_number'] == 1
+    assert event['previous_hash'] and event['previous_hash'] != event['hash']
+    assert storage.get_data_version() > version
+
+    # 更正前的马名已删除, 其他场次不受影响
+    assert storage.count_race_results('2024-01-07') == 8
+    assert '測試馬00' in _horses(storage)  # 第 2 场仍有此马
+    session = storage.Session()
+    try:
+        race1 = {r.horse_name: r.finish_position for r in session.query(RaceResult)
+                 .filter(RaceResult.race_number == 1)}
+    finally:
+        session.close()
+    assert race1 == {'更正馬': 1, '測試馬01': 3, '測試馬02': 2, '測試馬03': 4}
+
+
+def test_change_listeners_receive_events(storage):
+    received = []
+    storage.change_listeners.append(received.extend)
+    storage.save_changed_races(make_race())
+    storage.save_changed_races(make_race())
+    assert [e['type'] for e in received] == ['race_result']
@@ -0,0 +1,49 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from src.services import exporter
+
+from tests.conftest import make_race
+
+
+@pytest.fixture
+def stored(storage):
+    storage.save_changed_races(make_race(race_id='1') + make_race(race_id='2'))
+    return storage
+
+
+def test_invalid_options_leave_no_file(stored, tmp_path):
+    path = tmp_path / 'out.csv'
+    with pytest.raises(ValueError):
+        exporter.export_to_file(stored, str(path), fmt='csv', compression='zip')
+    with pytest.raises(ValueError):
+        exporter.export_to_file(stored, str(path), fmt='xml')
+    assert not path.exists()
+
+
+def test_csv_gzip_round_trip(stored, tmp_path):
+    path = tmp_path / 'out.csv.gz'
+    exporter.export_to_file(stored, str(path), fmt='csv', compression='gzip', chunk_size=3)
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 8
+    assert {r['horse_name'] for r in rows} == {f"測試馬{i:02d}" for i in range(4)}
+
+
+def test_jsonl_filters(stored):
+    data = b''.join(exporter.export_stream(stored, fmt='jsonl', jockey='騎師00'))
+    rows = [json.loads(line) for line in data.decode('utf-8').splitlines()]
+    assert len(rows) == 4 and all(r['jockey'] == '騎師00' for r in rows)
+
+
+def test_parquet_uses_model_types(stored):
+    pq = pytest.importorskip('pyarrow.parquet')
+    data = b''.join(exporter.export_stream(stored, fmt='parquet', compression='snappy', chunk_size=3))
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 8
+    assert str(table.schema.field('odds').type) == 'double'
+    assert str(table.schema.field('race_info').type) == 'string'  # 整列为空仍为字符串
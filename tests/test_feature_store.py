@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from src.services.feature_store import HorseFeatureStore
+
+
+def _runs(code, finishes, start_day=1):
+    return [{'horse_code': code, 'race_date': f"2024-01-{start_day + i:02d}", 'finish_position': f,
+             'distance': 1200, 'track': 'ST', 'draw': 3, 'rating': 60 + i, 'body_weight': 1100 + i}
+            for i, f in enumerate(finishes)]
+
+
+def _features(store, code='A001'):
+    row = store.get(code, as_of='2024-02-01', distance=1200, track='ST', draw=3)
+    return {k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in row.items()}
+
+
+def test_features_accumulate():
+    store = HorseFeatureStore(form_length=3)
+    assert store.ingest_runs(_runs('A001', [3, 1, 2, 5])) == 4
+    f = _features(store)
+    assert (f['starts'], f['wins'], f['places']) == (4, 1, 3)
+    assert [f['finish_1'], f['finish_2'], f['finish_3']] == [5, 2, 1]
+    assert (f['distance_starts'], f['course_wins'], f['draw_starts']) == (4, 1, 4)
+    assert f['days_since_last_run'] == 28
+    assert f['rating_trend'] == 2.0  # 63 - 61 (最近 3 仗)
+    assert f['body_weight_change'] == 1.0
+
+
+def test_late_run_is_replayed_in_order():
+    in_order = HorseFeatureStore(form_length=3)
+    in_order.ingest_runs(_runs('A001', [3, 1, 2, 5]))
+    shuffled = HorseFeatureStore(form_length=3)
+    runs = _runs('A001', [3, 1, 2, 5])
+    shuffled.ingest_runs(runs[2:])
+    assert shuffled.ingest_runs(runs[:2]) == 2
+    # 重复写入不变
+    assert shuffled.ingest_runs(runs) == 0
+    assert _features(shuffled) == _features(in_order)
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / 'features.npz')
+    store = HorseFeatureStore(form_length=3)
+    store.ingest_runs(_runs('A001', [3, 1, 2]) + _runs('B002', [1], start_day=5))
+    store.save(path)
+
+    loaded = HorseFeatureStore.load(path, form_length=3)
+    assert len(loaded) == 2 and 'B002' in loaded
+    assert _features(loaded) == _features(store)
+    # 加载后仍可增量写入及重算迟到的记录
+    loaded.ingest_runs(_runs('A001', [4], start_day=10) + [dict(_runs('A001', [1])[0], finish_position=2)])
+    store.ingest_runs(_runs('A001', [4], start_day=10) + [dict(_runs('A001', [1])[0], finish_position=2)])
+    assert _features(loaded) == _features(store)
+
+
+def test_load_with_different_form_length_rebuilds(tmp_path):
+    path = str(tmp_path / 'features.npz')
+    store = HorseFeatureStore(form_length=3)
+    store.ingest_runs(_runs('A001', [3, 1, 2, 5, 4]))
+    store.save(path)
+
+    longer = HorseFeatureStore.load(path, form_length=6)
+    f = _features(longer)
+    assert [f[f'finish_{i}'] for i in range(1, 7)] == [4, 5, 2, 1, 3, -1]
+    assert f['starts'] == 5
+
+
+def test_legacy_file_with_other_form_length_fails_clearly(tmp_path):
+    path = str(tmp_path / 'features.npz')
+    store = HorseFeatureStore(form_length=3)
+    store.ingest_runs(_runs('A001', [3, 1]))
+    arrays = {name: values[:len(store)] for name, values in store._arrays.items()}
+    # 旧格式: 不含 form_length 及出赛记录
+    np.savez(path, codes=np.array(store._codes, dtype=object), **arrays)
+    assert _features(HorseFeatureStore.load(path, form_length=3))['starts'] == 2
+    with pytest.raises(ValueError, match='FORM_LENGTH'):
+        HorseFeatureStore.load(path, form_length=6)
@@ -0,0 +1,59 @@
+from src.models.database import Horse
+from src.scripts.live_stub_server import render_results_page
+from src.services.horse_sync import HorseHistorySync
+from src.services.parsing import parse_horse_page_id, parse_results_page
+
+from tests.conftest import make_race
+
+
+def _with_page_ids(rows, year=2021):
+    return [dict(row, horse_page_id=f"HK_{year}_{row['horse_no']}") for row in rows]
+
+
+def _page_ids(storage):
+    session = storage.Session()
+    try:
+        return dict(session.query(Horse.code, Horse.page_id))
+    finally:
+        session.close()
+
+
+def test_results_page_link_gives_horse_id():
+    race = _with_page_ids(make_race())
+    records = parse_results_page(render_results_page(1, race), '2024-01-07', 'ST')
+    assert {r['horse_no']: r['horse_page_id'] for r in records} == {
+        r['horse_no']: r['horse_page_id'] for r in race
+    }
+    assert parse_horse_page_id('/racing/information/Chinese/Horse/Horse.aspx?HorseId=HK_2019_D123&Option=1') == \
+        'HK_2019_D123'
+    assert parse_horse_page_id('/Horse.aspx?HorseNo=D123') == ''
+
+
+def test_page_id_is_stored_on_the_horse(storage):
+    storage.save_race_results(make_race())
+    assert set(_page_ids(storage).values()) == {None}
+
+    storage.save_race_results(_with_page_ids(make_race('2024-01-14')))
+    assert _page_ids(storage) == {f"A{100 + i:03d}": f"HK_2021_A{100 + i:03d}" for i in range(4)}
+    # 没有链接的赛果不会清除已知的 HorseId
+    storage.save_race_results(make_race('2024-01-21'))
+    assert storage.get_horse_page_ids(['A100', 'A101', 'Z999']) == {'A100': 'HK_2021_A100', 'A101': 'HK_2021_A101'}
+
+
+class _Scraper:
+    """只记录请求的 HorseId, 返回没有往绩的资料页面"""
+
+    def __init__(self):
+        self.requested = []
+
+    def fetch_horse_pages(self, page_ids, revalidate=False):
+        self.requested.extend(page_ids)
+        return {}
+
+
+def test_sync_requests_stored_horse_ids(storage):
+    storage.save_race_results(_with_page_ids(make_race(runners=2), year=2020) + make_race(race_id='2', runners=3)[2:])
+    scraper = _Scraper()
+    stats = HorseHistorySync(storage, scraper).sync(horse_codes=['A100', 'A101', 'A102'])
+    assert sorted(scraper.requested) == ['HK_2020_A100', 'HK_2020_A101']
+    assert stats['no_page_id'] == 1
@@ -0,0 +1,81 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from src.scripts.live_stub_server import RESULTS_PATH, create_stub_app
+from src.services.batch_processor import BatchProcessor
+from src.services.live import DeltaBroadcaster, LiveRaceMonitor
+
+from tests.conftest import make_race
+
+RACE_DATE = '2024-01-07'
+
+
+def _races():
+    races = {n: make_race(RACE_DATE, str(n)) for n in (1, 2, 3)}
+    races[3][0]['odds'] = 5000  # 超出赔率上限, 隔离
+    return races
+
+
+async def _poll(storage, config, rounds=2, outage=None):
+    """启动回放服务器, 轮询 rounds 次后结束回放, 返回 (监视器, 推送的事件)"""
+    stub = web.AppRunner(create_stub_app(_races(), interval=0, offset=0))
+    await stub.setup()
+    site = web.TCPSite(stub, '127.0.0.1', 0)
+    await site.start()
+    port = stub.addresses[0][1]
+    processor = BatchProcessor(None, storage, config)
+    monitor = LiveRaceMonitor(storage, DeltaBroadcaster(), {'BASE_URL': f'http://127.0.0.1:{port}{RESULTS_PATH}',
+                                                            'MAX_RACES': 3},
+                              RACE_DATE, 'ST', processor=processor)
+    events = []
+    try:
+        processor.start_replay()
+        async with aiohttp.ClientSession() as session:
+            for _ in range(rounds):
+                events.extend(await monitor.poll_once(session))
+        if outage is not None:
+            outage()
+        await processor.finish_replay()
+        processor.ingest_precomputed()
+    finally:
+        await stub.cleanup()
+        if processor.spool is not None:
+            processor.spool.close()
+    return monitor, events
+
+
+def _config(tmp_path, **extra):
+    return {'SPOOL': {'ENABLED': True, 'DIR': str(tmp_path / 'spool'), 'FSYNC': False, 'REPLAY_INTERVAL': 0.05},
+            'CALENDAR': {'ENABLED': False}, **extra}
+
+
+def test_live_results_go_through_spool_and_validation(storage, tmp_path):
+    config = _config(tmp_path, CUBE={'PATH': str(tmp_path / 'cube.npz')})
+    monitor, events = asyncio.run(_poll(storage, config, rounds=4))
+
+    assert [(e['type'], e['race_no']) for e in events] == [('race_result', 1), ('race_result', 2),
+                                                           ('race_result', 3)]
+    # 第 3 场有一匹被隔离, 其余入库; 重复轮询不再写入
+    assert storage.count_race_results(RACE_DATE) == 11
+    assert storage.quarantine_counts() == {'odds_outlier': 1}
+    assert monitor.stats['changed'] == 3 and monitor.stats['not_modified'] > 0
+    assert monitor.processor.spooled == 11 and monitor.processor.replayed == 11
+
+    from src.services.bias_cube import BiasCube
+    assert BiasCube.load(config['CUBE']['PATH']).query(racecourse='ST')['starts'] == 11
+
+
+def test_live_polling_continues_while_database_is_down(storage, tmp_path, monkeypatch):
+    save = storage.save_changed_races
+
+    def unavailable(rows):
+        raise ConnectionError("数据库不可用")
+
+    monkeypatch.setattr(storage, 'save_changed_races', unavailable)
+    monitor, events = asyncio.run(_poll(storage, _config(tmp_path), rounds=4,
+                                        outage=lambda: monkeypatch.setattr(storage, 'save_changed_races', save)))
+    # 故障期间照常推送, 恢复后由预写日志回放入库
+    assert len(events) == 3 and monitor.stats['errors'] == 0
+    assert storage.count_race_results(RACE_DATE) == 11
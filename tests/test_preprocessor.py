@@ -0,0 +1,68 @@
+from src.services.preprocessor import RaceDataPreprocessor
+
+from tests.conftest import make_race
+
+
+def _reasons(rejects):
+    return {r['horse_name']: r['reason'] for r in rejects}
+
+
+def test_clean_batch_is_normalized():
+    rows = make_race(runners=3)
+    rows[0].update(race_date='2024/01/07', horse_name='測試馬00 (B123)', horse_no=None,
+                   odds='5.5', distance='1200米', finish_position='PU')
+    clean, rejects = RaceDataPreprocessor().process_batch(rows)
+    assert rejects == []
+    first = clean[0]
+    assert first['race_date'] == '2024-01-07'
+    assert (first['horse_name'], first['horse_no']) == ('測試馬00', 'B123')
+    assert (first['odds'], first['distance'], first['finish_position']) == (5.5, 1200, 99)
+
+
+def test_reason_codes():
+    rows = make_race(runners=9)
+    rows[0]['jockey'] = ''
+    rows[1]['race_date'] = '07-01-2024'
+    rows[2]['finish_position'] = 'x'
+    rows[3]['odds'] = 'abc'
+    rows[4]['distance'] = '1英里'
+    rows[5]['finish_position'] = 20
+    rows[6]['draw'] = 30
+    rows[7]['odds'] = 5000
+    rows[8]['race_id'] = 'R'
+    clean, rejects = RaceDataPreprocessor().process_batch(rows)
+    assert clean == []
+    assert _reasons(rejects) == {
+        '測試馬00': 'missing_field', '測試馬01': 'bad_date', '測試馬02': 'bad_position',
+        '測試馬03': 'bad_odds', '測試馬04': 'bad_distance', '測試馬05': 'position_outlier',
+        '測試馬06': 'draw_outlier', '測試馬07': 'odds_outlier', '測試馬08': 'bad_race_id',
+    }
+    assert rejects[0]['detail'] == 'jockey='
+    assert rejects[1]['race_date'] == '07-01-2024'
+
+
+def test_first_failure_wins_and_duplicates_keep_first():
+    rows = make_race(runners=2)
+    rows[0].update(odds='abc', distance=100)
+    duplicate = dict(rows[1], odds=9.9)
+    clean, rejects = RaceDataPreprocessor().process_batch(rows + [duplicate])
+    assert [r['odds'] for r in clean] == [3.5]
+    assert [(r['horse_name'], r['reason']) for r in rejects] == [('測試馬00', 'bad_odds'), ('測試馬01', 'duplicate')]
+
+
+def test_limits_are_configurable():
+    rows = make_race(runners=2)
+    rows[1]['distance'] = 3600
+    clean, rejects = RaceDataPreprocessor({'MAX_DISTANCE': 4000}).process_batch(rows)
+    assert len(clean) == 2 and rejects == []
+    _, rejects = RaceDataPreprocessor().process_batch(rows)
+    assert _reasons(rejects) == {'測試馬01': 'distance_outlier'}
+
+
+def test_rejects_can_be_quarantined(storage):
+    rows = make_race(runners=3)
+    rows[0]['odds'] = 'abc'
+    rows[1]['draw'] = 30
+    _, rejects = RaceDataPreprocessor().process_batch(rows)
+    storage.save_quarantine(rejects)
+    assert storage.quarantine_counts('2024-01-01', '2024-01-31') == {'bad_odds': 1, 'draw_outlier': 1}
@@ -0,0 +1,71 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from src.services.race_calendar import RaceCalendar
+
+TODAY = date(2024, 10, 1)
+
+
+def _learn(storage, start: date, end: date, skip=()):
+    """星期三跑马地、星期日沙田 (七、八月休季) 的学得赛马日"""
+    rows, day = [], start
+    while day < end:
+        if day.weekday() in (2, 6) and day.month not in (7, 8) and day not in skip:
+            rows.append({'race_date': day.isoformat(), 'racecourse': 'HV' if day.weekday() == 2 else 'ST',
+                         'races': 9, 'source': 'learned', 'updated_at': datetime.now()})
+        day += timedelta(days=1)
+    storage.save_race_meetings(rows)
+
+
+@pytest.fixture
+def calendar(storage):
+    # 2021-2023 三个马季, 2023/01/08 (星期日) 抓取失败未入库
+    _learn(storage, date(2021, 9, 1), date(2024, 9, 1), skip={date(2023, 1, 8)})
+    return RaceCalendar(storage)
+
+
+def test_without_history_every_day_is_tried(storage):
+    plan = RaceCalendar(storage).plan('2024-01-01', '2024-01-07', ['ST', 'HV'], today=TODAY)
+    assert [d for d, _ in plan] == [f"2024-01-0{i}" for i in range(1, 8)]
+    assert all(courses == ['ST', 'HV'] for _, courses in plan)
+
+
+def test_known_meetings_use_their_course(calendar):
+    plan = dict(calendar.plan('2024-01-01', '2024-01-07', ['ST', 'HV'], today=TODAY))
+    assert plan['2024-01-03'] == ['HV']
+    assert plan['2024-01-07'] == ['ST']
+
+
+def test_learned_seasons_are_not_complete(calendar):
+    assert calendar.complete_seasons() == set()
+    assert calendar.history_seasons(TODAY) == {2021, 2022, 2023}
+    # 未学得的星期日按历届比例预测, 继续尝试; 星期一不尝试
+    plan = dict(calendar.plan('2023-01-08', '2023-01-09', ['ST', 'HV'], today=TODAY))
+    assert plan == {'2023-01-08': ['ST']}
+    assert not calendar.is_non_meeting('2023-01-08')
+
+
+def test_predicted_days_follow_pattern(calendar):
+    plan = dict(calendar.plan('2024-10-07', '2024-10-13', ['ST', 'HV'], today=TODAY))
+    assert plan == {'2024-10-09': ['HV'], '2024-10-13': ['ST']}
+    # 休季月份不尝试
+    assert calendar.plan('2024-08-01', '2024-08-31', ['ST', 'HV'], today=TODAY) == []
+
+
+def test_fixtures_make_season_complete(calendar):
+    calendar.seed_fixtures([('2024/10/06', 'ST'), ('2024/10/12', 'HV')])
+    assert calendar.complete_seasons() == {2024}
+    plan = calendar.plan('2024-10-01', '2024-10-15', ['ST', 'HV'], today=TODAY)
+    assert plan == [('2024-10-06', ['ST']), ('2024-10-12', ['HV'])]
+    assert calendar.is_non_meeting('2024-10-09')
+    assert calendar.meeting_course('2024-10-12') == 'HV'
+
+
+def test_learn_from_results(storage):
+    from tests.conftest import make_race
+
+    storage.save_changed_races(make_race('2024-01-07', '1') + make_race('2024-01-07', '2'))
+    calendar = RaceCalendar(storage)
+    assert calendar.learn() == 1
+    assert calendar.meetings() == {date(2024, 1, 7): ('ST', 'learned')}
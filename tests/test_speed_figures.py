@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+from src.services.speed_figures import (
+    PAR_LEVELS, compute_par_times, load_par_times, par_records, pars_from_records, refresh_par_times, speed_figures
+)
+from tests.conftest import make_race
+
+
+def test_par_records_round_trip(synthetic_results):
+    frame = pd.DataFrame(synthetic_results)
+    frame['finish_time_cs'] = speed_figures(frame)['finish_time_cs']
+    pars = compute_par_times(frame)
+    restored = pars_from_records(par_records(pars))
+    assert set(restored) == set(PAR_LEVELS)
+    for level in PAR_LEVELS:
+        pd.testing.assert_series_equal(restored[level].sort_index(), pars[level].sort_index(), check_dtype=False)
+    # 以还原的标准时间计算的速度指数相同
+    pd.testing.assert_series_equal(speed_figures(frame, restored)['speed_figure'],
+                                   speed_figures(frame, pars)['speed_figure'])
+
+
+def test_refresh_persists_par_times(storage):
+    # 两场 1200 米好地, 头马 1:09.00 及 1:09.40
+    storage.save_race_results(make_race('2024-01-07') + make_race('2024-01-14'))
+    storage.save_race_results([dict(r, finish_time=f"1:{9.4 + i * 0.2:05.2f}")
+                               for i, r in enumerate(make_race('2024-01-21'))])
+    version = storage.get_data_version()
+    refresh_par_times(storage, '2024-01-01', '2024-01-31')
+    assert storage.get_data_version() == version + 1
+
+    pars = load_par_times(storage)
+    assert pars[('distance', 'racecourse', 'going')].to_dict() == {(1200, 'ST', '好地'): 6900.0}
+    assert pars[('distance',)].to_dict() == {1200: 6900.0}
+
+    # 再次计算时整体替换
+    refresh_par_times(storage, '2024-01-21', '2024-01-31')
+    assert storage.get_par_times() == [
+        {'distance': 1200, 'racecourse': 'ST', 'going': '好地', 'par_time_cs': 6940.0},
+        {'distance': 1200, 'racecourse': 'ST', 'going': '', 'par_time_cs': 6940.0},
+        {'distance': 1200, 'racecourse': '', 'going': '', 'par_time_cs': 6940.0},
+    ]
+
+
+def test_race_runners_carry_speed_figures(storage):
+    from src.web.app import _add_speed_figures
+
+    storage.save_race_results(make_race('2024-01-07'))
+    runners = storage.query_race_runners('2024-01-07', 1)
+    _add_speed_figures(storage, runners)
+    assert {r['speed_figure'] for r in runners} == {None}
+
+    refresh_par_times(storage, '2024-01-01', '2024-01-31')
+    runners = storage.query_race_runners('2024-01-07', 1)
+    _add_speed_figures(storage, runners)
+    # 头马等于标准时间得 100 分, 每慢 0.2 秒约少 2.9 分
+    assert [r['speed_figure'] for r in runners] == pytest.approx([100.0, 97.1, 94.2, 91.3])
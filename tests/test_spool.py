@@ -0,0 +1,168 @@
+import os
+
+import pytest
+
+from src.services.spool import SpoolReplayer, WriteAheadSpool
+from src.utils.exceptions import SpoolBusyError
+
+from tests.conftest import make_race
+
+
+@pytest.fixture
+def spool_dir(tmp_path):
+    return str(tmp_path / 'spool')
+
+
+def _crash(spool: WriteAheadSpool):
+    """模拟进程崩溃: 不封存分段, 只释放目录锁"""
+    spool._file.close()
+    spool._lock_file.close()
+
+
+def test_torn_tail_is_dropped(spool_dir):
+    spool = WriteAheadSpool(spool_dir, fsync=False)
+    spool.append('race_results', make_race(race_id='1'))
+    spool.append('race_results', make_race(race_id='2'))
+    path = spool._path
+    _crash(spool)
+    # 最后一条记录只写了一半
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 10)
+
+    spool = WriteAheadSpool(spool_dir, fsync=False)
+    [segment] = spool.segments()
+    assert segment.endswith('.wal')
+    entries = list(spool.read_segment(segment))
+    assert [e['rows'][0]['race_id'] for e in entries] == ['1']
+    spool.close()
+
+
+def test_corrupt_record_stops_reading(spool_dir):
+    spool = WriteAheadSpool(spool_dir, fsync=False)
+    for race_id in '123':
+        spool.append('race_results', make_race(race_id=race_id))
+    spool.seal()
+    [segment] = spool.segments()
+    with open(segment, 'r+b') as f:
+        data = bytearray(f.read())
+        # 第二条记录的内容被改动, CRC 不符
+        second = data.index(b'"race_id": "2"')
+        data[second + 12] ^= 0xFF
+        f.seek(0)
+        f.write(data)
+    assert len(list(spool.read_segment(segment))) == 1
+    spool.close()
+
+
+def test_replay_is_idempotent(storage, spool_dir):
+    spool = WriteAheadSpool(spool_dir, fsync=False)
+    rows = make_race(race_id='1') + make_race(race_id='2')
+    spool.append('race_results', rows)
+    spool.append('quarantine', [{'race_date': '2024-01-07', 'reason': 'bad_odds', 'detail': 'odds=x'}])
+    # 同一批赛果再写一次 (例如回放后崩溃, 删除分段前重启)
+    spool.append('race_results', rows)
+
+    saved = []
+    # 批次按整场切分, 不会把一场拆开当作更正
+    replayer = SpoolReplayer(spool, storage, batch_rows=5, on_saved=lambda r, e: saved.extend(e))
+    assert replayer.replay_once() == 9
+    assert spool.segments() == [] and spool.pending_bytes() == 0
+    assert storage.count_race_results('2024-01-07') == 8
+    assert [e['race_number'] for e in saved] == [1, 2]
+    assert storage.quarantine_counts() == {'bad_odds': 1}
+
+    spool.append('race_results', rows)
+    assert replayer.replay_once() == 8
+    assert storage.count_race_results('2024-01-07') == 8
+    assert len(saved) == 2
+    spool.close()
+
+
+def test_latest_write_of_a_race_wins(storage, spool_dir):
+    spool = WriteAheadSpool(spool_dir, fsync=False)
+    spool.append('race_results', make_race(runners=4))
+    amended = make_race(runners=3)
+    spool.append('race_results', amended)
+    assert SpoolReplayer(spool, storage).replay_once() == 3
+    assert storage.count_race_results('2024-01-07') == 3
+    spool.close()
+
+
+def test_failed_replay_keeps_segment(storage, spool_dir, monkeypatch):
+    spool = WriteAheadSpool(spool_dir, fsync=False)
+    spool.append('race_results', make_race())
+
+    def unavailable(rows):
+        raise ConnectionError("数据库不可用")
+
+    monkeypatch.setattr(storage, 'save_changed_races', unavailable)
+    assert SpoolReplayer(spool, storage).replay_once() == 0
+    assert len(spool.segments()) == 1
+    monkeypatch.undo()
+    assert SpoolReplayer(spool, storage).replay_once() == 4
+    assert spool.segments() == []
+    spool.close()
+
+
+def test_directory_is_locked(spool_dir):
+    spool = WriteAheadSpool(spool_dir, fsync=False)
+    spool.append('race_results', make_race())
+    with pytest.raises(SpoolBusyError):
+        WriteAheadSpool(spool_dir)
+    # 其他进程打开失败时写入中的分段保持原状
+    assert spool._path and os.path.exists(spool._path)
+    spool.close()
+    WriteAheadSpool(spool_dir).close()
+
+
+def _count_saves(storage, monkeypatch):
+    calls = []
+    save = storage.save_changed_races
+
+    def counted(rows):
+        calls.append(len(rows))
+        return save(rows)
+
+    monkeypatch.setattr(storage, 'save_changed_races', counted)
+    return calls
+
+
+def test_consecutive_segments_are_merged(storage, spool_dir, monkeypatch):
+    # 每次写入即封存, 模拟很多小分段
+    spool = WriteAheadSpool(spool_dir, segment_bytes=1, fsync=False)
+    for race_id in '1234':
+        spool.append('race_results', make_race(race_id=race_id))
+    assert len(spool.segments()) == 4
+    calls = _count_saves(storage, monkeypatch)
+    assert SpoolReplayer(spool, storage, batch_rows=8).replay_once() == 16
+    assert calls == [8, 8]
+    assert spool.segments() == []
+    spool.close()
+
+
+def test_outage_does_not_split_the_log(storage, spool_dir, monkeypatch):
+    spool = WriteAheadSpool(spool_dir, fsync=False)
+    replayer = SpoolReplayer(spool, storage)
+
+    def unavailable(*args):
+        raise ConnectionError("数据库不可用")
+
+    with monkeypatch.context() as outage:
+        outage.setattr(storage, 'save_changed_races', unavailable)
+        spool.append('race_results', make_race(race_id='1'))
+        assert replayer.replay_once() == 0
+        # 故障期间多次重试, 写入中的分段不再封存
+        for race_id in '234':
+            spool.append('race_results', make_race(race_id=race_id))
+            assert replayer.replay_once() == 0
+        assert len(spool.segments()) == 1
+        spool.append('race_results', make_race(race_id='5'))
+        assert replayer.replay_once() == 0
+        assert len(spool.segments()) == 1
+
+    calls = _count_saves(storage, monkeypatch)
+    assert replayer.replay_once() == 20
+    assert calls == [4, 16]
+    assert spool.segments() == [] and spool.pending_bytes() == 0
+    assert storage.count_race_results('2024-01-07') == 20
+    spool.close()
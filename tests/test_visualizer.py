@@ -0,0 +1,11 @@
+from src.services.visualizer import RaceVisualizer
+
+
+def test_odds_above_max_go_to_overflow_bin():
+    odds = [1.5, 2.0, 4.5, 12.0, 98.0, 99.0, 150.0, 250.0, 0, None, '---']
+    [trace] = RaceVisualizer().plot_odds_distribution(odds, bins=10)['data']
+    assert len(trace['y']) == 10
+    # 沒有賠率的出賽 (0 或無法解析) 不計, 其餘全部計入
+    assert sum(trace['y']) == 8
+    assert trace['y'][-1] == 3 and trace['text'][-1] == '99+'
+    assert trace['x'] == sorted(trace['x'])
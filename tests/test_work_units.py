@@ -0,0 +1,54 @@
+import time
+
+from src.models.database import WorkUnit
+
+UNITS = [('2024-01-03', 'HV'), ('2024-01-07', 'ST'), ('2024-01-10', 'HV')]
+
+
+def test_seed_is_idempotent(storage):
+    assert storage.seed_work_units('job', UNITS) == 3
+    claimed = storage.claim_work_units('job', 'w1', 60)
+    # 重新登记不会重置已领取的单元
+    assert storage.seed_work_units('job', UNITS) == 3
+    assert storage.work_unit_progress('job')['leased'] == 1
+    assert claimed[0]['race_date'] == '2024-01-03'
+
+
+def test_claim_is_exclusive(storage):
+    storage.seed_work_units('job', UNITS)
+    first = storage.claim_work_units('job', 'w1', 60, limit=2)
+    second = storage.claim_work_units('job', 'w2', 60, limit=2)
+    assert [u['race_date'] for u in first] == ['2024-01-03', '2024-01-07']
+    assert [u['race_date'] for u in second] == ['2024-01-10']
+    assert storage.claim_work_units('job', 'w3', 60) == []
+    assert all(u['owner'] == 'w1' and u['attempts'] == 1 for u in first)
+
+
+def test_expired_lease_is_reclaimed(storage):
+    storage.seed_work_units('job', UNITS[:1])
+    [unit] = storage.claim_work_units('job', 'w1', 0.05)
+    time.sleep(0.1)
+    [again] = storage.claim_work_units('job', 'w2', 60)
+    assert again['id'] == unit['id']
+    assert again['owner'] == 'w2' and again['attempts'] == 2
+    # 原持有者的租约已被接手, 不能续租或完成
+    assert not storage.renew_work_unit(unit['id'], 'w1', 60)
+    assert not storage.finish_work_unit(unit['id'], 'w1', records=10)
+    assert storage.renew_work_unit(unit['id'], 'w2', 60)
+    assert storage.finish_work_unit(unit['id'], 'w2', records=10)
+    assert storage.work_unit_progress('job') == {'pending': 0, 'leased': 0, 'done': 1, 'failed': 0, 'records': 10}
+
+
+def test_failed_unit_is_retried_then_marked_failed(storage):
+    storage.seed_work_units('job', UNITS[:1])
+    for attempt in range(1, 4):
+        [unit] = storage.claim_work_units('job', 'w1', 60)
+        assert unit['attempts'] == attempt
+        assert storage.finish_work_unit(unit['id'], 'w1', error='timeout', max_attempts=3)
+    assert storage.claim_work_units('job', 'w1', 60) == []
+    session = storage.Session()
+    try:
+        unit = session.query(WorkUnit).one()
+        assert (unit.status, unit.error) == ('failed', 'timeout')
+    finally:
+        session.close()